@@ -0,0 +1,62 @@
+# app/async_database.py
+import asyncio
+from decouple import config
+import logging
+
+from .database import db_manager
+
+logger = logging.getLogger(__name__)
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:  # pragma: no cover - motor is optional outside ASGI deployments
+    AsyncIOMotorClient = None
+
+
+class AsyncDatabaseManager:
+    """
+    Motor counterpart of `db_manager` for the async read endpoints.
+
+    Uses the same database the sync manager settled on (Atlas, or the local
+    fallback), so async reads and sync writes always hit the same data.
+    Motor clients are bound to the event loop they were created on, so one
+    client is kept per loop - a single one under uvicorn, a fresh one for
+    each `asyncio.run` in management commands.
+    """
+
+    def __init__(self):
+        self._clients = {}
+
+    def _connection_settings(self):
+        db_manager.get_database()
+        if db_manager.current_client is not None and db_manager.current_client is db_manager.local_client:
+            return (
+                config('MONGODB_LOCAL_URI', default='mongodb://localhost:27017'),
+                config('MONGODB_LOCAL_DATABASE', default='pos_system')
+            )
+        return config('MONGODB_URI'), config('MONGODB_DATABASE', default='pos_system')
+
+    def get_client(self):
+        if AsyncIOMotorClient is None:
+            raise Exception("motor is not installed; async read endpoints are unavailable")
+
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            uri, _ = self._connection_settings()
+            client = AsyncIOMotorClient(uri)
+            # Drop clients of loops that have been closed (management commands)
+            for stale_loop in [l for l in self._clients if l.is_closed()]:
+                self._clients.pop(stale_loop).close()
+            self._clients[loop] = client
+            logger.info("Created Motor client for the running event loop")
+        return client
+
+    def get_database(self, name=None):
+        """Async database handle; `name` overrides the configured database"""
+        _, database_name = self._connection_settings()
+        return self.get_client()[name or database_name]
+
+
+# Singleton instance
+async_db_manager = AsyncDatabaseManager()
@@ -0,0 +1,181 @@
+# app/bson_json.py
+"""
+Shared BSON -> JSON helpers.
+
+- `bson_to_json` converts Mongo documents in place without recursion
+  (ObjectId -> str, Decimal128/Decimal -> float, datetimes -> ISO strings).
+- `json_default` is the fallback hook for orjson / json encoders, so API
+  responses can be serialized straight from Mongo documents.
+- `dumps` encodes with orjson when installed, else the standard library
+  (strict: NaN/Infinity raise instead of producing invalid JSON).
+- `streaming_json_response` streams a large array (e.g. a cursor) as JSON
+  without materializing the full list.
+"""
+from collections.abc import Mapping
+import datetime
+import decimal
+import json
+import uuid
+
+from bson import Decimal128, ObjectId
+from django.http import StreamingHttpResponse
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+# Types that are already JSON-compatible and are skipped without a lookup
+_PASSTHROUGH = frozenset((str, int, float, bool, type(None)))
+
+ORJSON_OPTIONS = (
+    (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    if orjson else 0
+)
+
+STREAM_BATCH_SIZE = 500
+
+
+def format_datetime(value):
+    """ISO format matching DRF's encoder (millisecond precision, 'Z' for UTC)"""
+    representation = value.isoformat()
+    if value.microsecond:
+        representation = representation[:23] + representation[26:]
+    if representation.endswith('+00:00'):
+        representation = representation[:-6] + 'Z'
+    return representation
+
+
+def json_default(value):
+    """Encode the non-JSON types Mongo documents and services return"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return format_datetime(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, Decimal128):
+        return float(value.to_decimal())
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime.timedelta):
+        return str(value.total_seconds())
+    if isinstance(value, bytes):
+        return value.decode()
+    if isinstance(value, Promise):
+        # Lazy translation strings (gettext_lazy)
+        return force_str(value)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if hasattr(value, 'tolist'):
+        # numpy / pandas scalars and arrays
+        return value.tolist()
+    if isinstance(value, Mapping):
+        return dict(value)
+    if hasattr(value, '__iter__'):
+        # Generators, querysets and other iterables, as DRF's encoder does
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _convert_scalar(value, datetimes):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return format_datetime(value) if datetimes else value
+    if isinstance(value, Decimal128):
+        return float(value.to_decimal())
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if datetimes and isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def bson_to_json(value, datetimes=True):
+    """
+    Convert a document (or list of documents) to JSON-compatible values.
+
+    Dicts and lists are converted in place with an explicit stack, so deep or
+    large documents cost no recursion and no copies; the converted root is
+    returned. Pass `datetimes=False` to keep datetime objects (for callers
+    that still compare or sort on them).
+    """
+    if not isinstance(value, (dict, list, tuple)):
+        return _convert_scalar(value, datetimes)
+    if isinstance(value, tuple):
+        value = list(value)
+
+    stack = [value]
+    while stack:
+        node = stack.pop()
+        items = node.items() if isinstance(node, dict) else enumerate(node)
+        for key, item in items:
+            item_type = type(item)
+            if item_type in _PASSTHROUGH:
+                continue
+            if item_type is dict or item_type is list:
+                stack.append(item)
+            elif isinstance(item, tuple):
+                item = list(item)
+                node[key] = item
+                stack.append(item)
+            elif isinstance(item, (dict, list)):
+                stack.append(item)
+            else:
+                converted = _convert_scalar(item, datetimes)
+                if converted is not item:
+                    node[key] = converted
+    return value
+
+
+def dumps(value):
+    """Serialize to UTF-8 JSON bytes (orjson when available)"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=json_default, option=ORJSON_OPTIONS)
+        except (TypeError, orjson.JSONEncodeError):
+            # e.g. integers beyond 64 bits - let the standard library handle it
+            pass
+    return json.dumps(
+        value, default=json_default, ensure_ascii=False, allow_nan=False, separators=(',', ':')
+    ).encode('utf-8')
+
+
+def iter_json_array(items, envelope=None, key='data', transform=None, batch_size=STREAM_BATCH_SIZE):
+    """
+    Yield JSON bytes for `items` as an array, optionally nested under `key`
+    inside an `envelope` object. Items are encoded in batches as they are
+    consumed, so a cursor is never held in memory as a list.
+    """
+    if envelope is not None:
+        head = dumps(envelope)[:-1]
+        yield head + (b',' if len(head) > 1 else b'') + dumps(key) + b':['
+    else:
+        yield b'['
+
+    batch = []
+    first = True
+    for item in items:
+        batch.append(dumps(transform(item) if transform else item))
+        if len(batch) >= batch_size:
+            yield (b'' if first else b',') + b','.join(batch)
+            first = False
+            batch = []
+    if batch:
+        yield (b'' if first else b',') + b','.join(batch)
+
+    yield b']}' if envelope is not None else b']'
+
+
+def streaming_json_response(items, envelope=None, key='data', transform=None, status=200):
+    """StreamingHttpResponse wrapper around `iter_json_array`"""
+    return StreamingHttpResponse(
+        iter_json_array(items, envelope=envelope, key=key, transform=transform),
+        content_type='application/json',
+        status=status
+    )
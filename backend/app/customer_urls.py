@@ -6,12 +6,14 @@ from app.kpi_views.customer_product_views import (
     CustomerProductSearchView,
     CustomerProductByCategoryView,
     CustomerFeaturedProductsView,
+    CustomerProductFacetsView,
 )
 
 urlpatterns = [
     path('products/', CustomerProductListView.as_view(), name='customer-products'),
     path('products/search/', CustomerProductSearchView.as_view(), name='customer-products-search'),
     path('products/featured/', CustomerFeaturedProductsView.as_view(), name='customer-products-featured'),
+    path('products/facets/', CustomerProductFacetsView.as_view(), name='customer-products-facets'),
     path('products/category/<str:category_id>/', CustomerProductByCategoryView.as_view(), name='customer-products-by-category'),
     path('products/<str:product_id>/', CustomerProductDetailView.as_view(), name='customer-product-detail'),
 ]
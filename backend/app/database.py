@@ -49,6 +49,18 @@ class DatabaseManager:
             logger.error(f"Failed to connect to local MongoDB: {e}")
             return False
     
+    def get_cloud_database(self):
+        """Atlas database handle for sync, without switching the current connection"""
+        if self.cloud_client is None:
+            self.cloud_client = pymongo.MongoClient(config('MONGODB_URI'))
+        return self.cloud_client[config('MONGODB_DATABASE', default='pos_system')]
+
+    def get_local_database(self):
+        """Local database handle for sync, without switching the current connection"""
+        if self.local_client is None:
+            self.local_client = pymongo.MongoClient(config('MONGODB_LOCAL_URI', default='mongodb://localhost:27017'))
+        return self.local_client[config('MONGODB_LOCAL_DATABASE', default='pos_system')]
+
     def get_database(self):
         """Get current database connection with fallback"""
         if self.current_db is not None:  # ✅ Fixed: Compare with None
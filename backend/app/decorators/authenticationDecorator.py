@@ -1,12 +1,49 @@
 from rest_framework.response import Response
 from rest_framework import status
-from ..services.auth_services import AuthService
+from django.http import JsonResponse
+from jose import JWTError, jwt
+from ..services.auth_services import AuthService, SECRET_KEY, ALGORITHM
+from ..services.principal_cache_service import (
+    PRINCIPAL_CUSTOMER, PRINCIPAL_FIELDS, PRINCIPAL_USER, principal_cache
+)
 from ..database import db_manager
+from ..async_database import async_db_manager
 import logging
 from functools import wraps
 
 logger = logging.getLogger(__name__)
 
+PRINCIPAL_PROJECTION = {field: 1 for field in PRINCIPAL_FIELDS}
+
+_auth_service = None
+
+def _get_auth_service():
+    global _auth_service
+    if _auth_service is None:
+        _auth_service = AuthService()
+    return _auth_service
+
+def _principal_lookup_order(payload):
+    """
+    (principal type, collection) pairs to try for a token. Tokens carrying a
+    `ptype` claim go straight to their collection; older tokens keep the
+    users-then-customers fallback.
+    """
+    ptype = payload.get('ptype')
+    if ptype == PRINCIPAL_USER:
+        return [(PRINCIPAL_USER, 'users')]
+    if ptype == PRINCIPAL_CUSTOMER:
+        return [(PRINCIPAL_CUSTOMER, 'customers')]
+    return [(PRINCIPAL_USER, 'users'), (PRINCIPAL_CUSTOMER, 'customers')]
+
+def _decode_accepted_token(token):
+    """Payload of a token already checked against the blacklist, or None"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    return payload if payload.get('sub') is not None else None
+
 def get_authenticated_user_from_jwt(request):
     """Unified JWT authentication helper for all systems (users and customers)."""
     try:
@@ -20,45 +57,97 @@ def get_authenticated_user_from_jwt(request):
 
         token = authorization.split(" ", 1)[1]
 
-        auth_service = AuthService()
-        payload = auth_service.verify_token(token)
+        if principal_cache.is_token_accepted(token):
+            payload = _decode_accepted_token(token)
+        else:
+            payload = _get_auth_service().verify_token(token)
+            if payload:
+                principal_cache.accept_token(token)
         if not payload:
             return None
 
         user_id = payload.get('sub')
         role = (payload.get('role') or '').lower()
 
-        # Try admin/user collection first
-        user_doc = auth_service.user_collection.find_one({"_id": user_id}) if user_id else None
+        cached = principal_cache.get_principal(user_id)
+        if cached:
+            return _principal_from_doc(user_id, role, cached[1])
 
-        if not user_doc:
-            # Fallback to customers collection for customer tokens
-            try:
-                db = db_manager.get_database()
-                customers = db.customers
-                user_doc = customers.find_one({"_id": user_id}) if user_id else None
-            except Exception as e:
-                logger.error(f"Customer lookup failed: {e}")
-                user_doc = None
+        user_doc = None
+        try:
+            db = db_manager.get_database()
+            for principal_type, collection in _principal_lookup_order(payload):
+                user_doc = db[collection].find_one({"_id": user_id}, PRINCIPAL_PROJECTION)
+                if user_doc:
+                    principal_cache.set_principal(user_id, principal_type, user_doc)
+                    break
+        except Exception as e:
+            logger.error(f"Principal lookup failed: {e}")
+            user_doc = None
 
         if not user_doc:
             return None
 
-        username = (user_doc.get('username') or '').strip()
-        display_username = username or user_doc.get('email', 'unknown')
-
-        return {
-            "user_id": user_id,
-            "username": display_username,
-            "email": user_doc.get('email'),
-            "branch_id": user_doc.get('branch_id', 1),
-            "role": user_doc.get('role', role or 'customer')
-        }
+        return _principal_from_doc(user_id, role, user_doc)
 
     except Exception as e:
         logger.error(f"JWT authentication error: {e}")
         return None
 
+def _principal_from_doc(user_id, role, user_doc):
+    username = (user_doc.get('username') or '').strip()
+    display_username = username or user_doc.get('email', 'unknown')
+
+    return {
+        "user_id": user_id,
+        "username": display_username,
+        "email": user_doc.get('email'),
+        "branch_id": user_doc.get('branch_id', 1),
+        "role": user_doc.get('role', role or 'customer')
+    }
+
+async def async_get_authenticated_user_from_jwt(request):
+    """Motor-backed twin of get_authenticated_user_from_jwt for async views."""
+    try:
+        authorization = request.headers.get("Authorization", "")
+        if not authorization.startswith("Bearer "):
+            return None
+
+        token = authorization.split(" ", 1)[1]
+
+        payload = _decode_accepted_token(token)
+        if payload is None:
+            return None
+
+        user_id = payload.get('sub')
+        role = (payload.get('role') or '').lower()
+
+        db = async_db_manager.get_database()
+        if not principal_cache.is_token_accepted(token):
+            if await db.token_blacklist.find_one({"token": token}, {"_id": 1}):
+                return None
+            principal_cache.accept_token(token)
+
+        cached = principal_cache.get_principal(user_id)
+        if cached:
+            return _principal_from_doc(user_id, role, cached[1])
+
+        user_doc = None
+        for principal_type, collection in _principal_lookup_order(payload):
+            user_doc = await db[collection].find_one({"_id": user_id}, PRINCIPAL_PROJECTION)
+            if user_doc:
+                principal_cache.set_principal(user_id, principal_type, user_doc)
+                break
+
+        if not user_doc:
+            return None
+
+        return _principal_from_doc(user_id, role, user_doc)
+
+    except Exception as e:
+        logger.error(f"Async JWT authentication error: {e}")
+        return None
+
 def require_authentication(view_func):
     """Unified authentication decorator"""
     @wraps(view_func)
@@ -170,6 +259,23 @@ def require_permission(*allowed_roles):
         return wrapper
     return decorator
 
+def async_require_authentication(view_func):
+    """Authentication decorator for `async def` function views"""
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        current_user = await async_get_authenticated_user_from_jwt(request)
+        if not current_user:
+            return JsonResponse(
+                {"error": "Authentication required"},
+                status=status.HTTP_401_UNAUTHORIZED
+            )
+
+        request.current_user = current_user
+        request.user_context = current_user
+
+        return await view_func(request, *args, **kwargs)
+    return wrapper
+
 # Convenience aliases for different naming conventions
 jwt_required = require_authentication
 admin_required = require_admin
\ No newline at end of file
@@ -0,0 +1,283 @@
+"""
+Async (ASGI) read endpoints backed by Motor.
+
+Same parameters and payloads as the sync DRF views they mirror, served from
+`async def` views so a single ASGI worker keeps handling other requests
+while Mongo answers. Mounted under /api/v1/async/; writes stay on the sync
+endpoints. Under WSGI these views still work, but each request runs its own
+event loop and gains nothing.
+"""
+
+from datetime import date, datetime, time
+import logging
+
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import require_GET
+
+from ..bson_json import dumps
+from ..decorators.authenticationDecorator import async_require_authentication
+from ..services.async_read_service import async_read_service
+from ..services.pos.salesReport import SalesReport
+
+logger = logging.getLogger(__name__)
+
+
+def json_response(payload, status=200):
+    """Encode with the shared BSON-aware serializer"""
+    return HttpResponse(dumps(payload), content_type='application/json', status=status)
+
+
+def _include_source(source):
+    """Sales `source` query parameter -> include_source list (as the sync sales views do)"""
+    if not source or source == 'all':
+        return None
+    if source == 'manual':
+        return ['manual', 'csv']
+    if source in ['csv', 'pos']:
+        return [source]
+    return None
+
+
+def _parse_iso(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+# ================================================================
+# SALES REPORTS
+# ================================================================
+
+@require_GET
+async def sales_summary(request):
+    """Async counterpart of SalesSummaryView (period=today|week|month|year|custom, default all time)"""
+    try:
+        period = request.GET.get('period')
+        include_source = _include_source(request.GET.get('source'))
+
+        date_range = None
+        if period == 'today':
+            date_range = SalesReport._today_range()
+        elif period == 'week':
+            date_range, _ = SalesReport._week_range()
+        elif period == 'month':
+            date_range, _ = SalesReport._month_range()
+        elif period == 'year':
+            today = date.today()
+            date_range = {
+                'start': datetime.combine(date(today.year, 1, 1), time.min),
+                'end': datetime.combine(date(today.year, 12, 31), time.max)
+            }
+        elif period == 'custom' and request.GET.get('start_date') and request.GET.get('end_date'):
+            try:
+                start_dt = _parse_iso(request.GET.get('start_date'))
+                end_dt = _parse_iso(request.GET.get('end_date'))
+            except ValueError:
+                return JsonResponse({"error": "Invalid date format. Use ISO format (YYYY-MM-DD)"}, status=400)
+            # A bare end date covers the whole day
+            if end_dt.time() == time.min:
+                end_dt = datetime.combine(end_dt.date(), time.max)
+            date_range = {'start': start_dt, 'end': end_dt}
+
+        result = await async_read_service.get_sales_summary(date_range, include_source)
+        return json_response(result)
+
+    except Exception as e:
+        logger.error(f"Error getting the sales summary: {str(e)}")
+        return JsonResponse({"error": f"Error getting the sales summary: {str(e)}"}, status=500)
+
+
+@require_GET
+async def sales_transactions(request):
+    """Async counterpart of SalesTransactionsView"""
+    try:
+        limit = int(request.GET.get('limit', 100))
+        include_source = _include_source(request.GET.get('source'))
+
+        date_range = None
+        start_date = request.GET.get('start_date')
+        end_date = request.GET.get('end_date')
+        if start_date and end_date:
+            try:
+                date_range = {'start': _parse_iso(start_date), 'end': _parse_iso(end_date)}
+            except ValueError:
+                return JsonResponse({"error": "Invalid date format. Use ISO format"}, status=400)
+
+        result = await async_read_service.get_sales_transactions(date_range, include_source, limit)
+        return json_response(result)
+
+    except Exception as e:
+        logger.error(f"Error getting sales transactions: {str(e)}")
+        return JsonResponse({"error": f"Error getting sales transactions: {str(e)}"}, status=500)
+
+
+# ================================================================
+# PRODUCTS & CUSTOMERS
+# ================================================================
+
+@require_GET
+async def product_list(request):
+    """Async counterpart of ProductListView.get"""
+    try:
+        filters = {}
+        for key in ['category_id', 'subcategory_name', 'status', 'stock_level', 'search']:
+            if request.GET.get(key):
+                filters[key] = request.GET.get(key)
+
+        include_deleted = request.GET.get('include_deleted', 'false').lower() == 'true'
+
+        products = await async_read_service.get_all_products(
+            filters=filters if filters else None,
+            include_deleted=include_deleted,
+            include_images=False
+        )
+
+        return json_response({
+            'message': f'Found {len(products)} products',
+            'data': products
+        })
+
+    except Exception as e:
+        logger.error(f"Error in async product_list: {e}")
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+@require_GET
+async def customer_list(request):
+    """Async counterpart of CustomerListView.get"""
+    try:
+        min_loyalty_points = request.GET.get('min_loyalty_points')
+        max_loyalty_points = request.GET.get('max_loyalty_points')
+
+        result = await async_read_service.get_customers(
+            page=int(request.GET.get('page', 1)),
+            limit=int(request.GET.get('limit', 50)),
+            status=request.GET.get('status'),
+            min_loyalty_points=int(min_loyalty_points) if min_loyalty_points else None,
+            max_loyalty_points=int(max_loyalty_points) if max_loyalty_points else None,
+            include_deleted=request.GET.get('include_deleted', 'false').lower() == 'true',
+            sort_by=request.GET.get('sort_by'),
+            search=request.GET.get('search')
+        )
+
+        return json_response(result)
+
+    except Exception as e:
+        logger.error(f"Error getting customers: {e}")
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+@require_GET
+@async_require_authentication
+async def customer_detail(request, customer_id):
+    """Async counterpart of CustomerDetailView.get"""
+    try:
+        customer = await async_read_service.get_customer_by_id(customer_id)
+        if customer:
+            return json_response(customer)
+        return JsonResponse({"error": "Customer not found"}, status=404)
+
+    except Exception as e:
+        logger.error(f"Error getting customer {customer_id}: {e}")
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+# ================================================================
+# NOTIFICATIONS
+# ================================================================
+
+@require_GET
+async def notification_list(request):
+    """Async counterpart of notifications.views.list_notifications"""
+    try:
+        is_read = request.GET.get('is_read')
+        if is_read is not None:
+            is_read = is_read.lower() in ['true', '1', 'yes']
+
+        notifications = await async_read_service.get_notifications(
+            recipient_id=request.GET.get('recipient_id'),
+            notification_type=request.GET.get('type'),
+            is_read=is_read,
+            limit=int(request.GET.get('limit', 50))
+        )
+
+        return json_response({
+            'success': True,
+            'count': len(notifications),
+            'data': notifications
+        })
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': f'Error retrieving notifications: {str(e)}'
+        }, status=500)
+
+
+@require_GET
+async def notification_counts(request):
+    """Maintained unread/read counters for a recipient (or system-wide)"""
+    try:
+        counters = await async_read_service.get_notification_counts(request.GET.get('recipient_id'))
+        return json_response({'success': True, 'data': counters})
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': f'Error retrieving notification counts: {str(e)}'
+        }, status=500)
+
+
+# ================================================================
+# ONLINE ORDERS
+# ================================================================
+
+@require_GET
+@async_require_authentication
+async def order_detail(request, order_id):
+    """Async counterpart of GetOnlineOrderView"""
+    try:
+        order = await async_read_service.get_order_by_id(order_id)
+        if order:
+            return json_response(order)
+        return JsonResponse({"error": "Order not found"}, status=404)
+
+    except Exception as e:
+        logger.error(f"Error fetching order {order_id}: {str(e)}")
+        return JsonResponse({"error": f"Failed to fetch order: {str(e)}"}, status=500)
+
+
+@require_GET
+@async_require_authentication
+async def customer_orders(request, customer_id):
+    """Async counterpart of GetCustomerOrdersView"""
+    try:
+        orders = await async_read_service.get_customer_orders(
+            customer_id,
+            status=request.GET.get('status'),
+            limit=int(request.GET.get('limit', 50))
+        )
+        return json_response(orders)
+
+    except Exception as e:
+        logger.error(f"Error fetching customer orders: {str(e)}")
+        return JsonResponse({"error": f"Failed to fetch customer orders: {str(e)}"}, status=500)
+
+
+@require_GET
+@async_require_authentication
+async def order_list(request):
+    """Async counterpart of GetAllOrdersView"""
+    try:
+        filters = {}
+        for key in ['status', 'payment_status', 'customer_id']:
+            if request.GET.get(key):
+                filters[key] = request.GET.get(key)
+        for key in ['start_date', 'end_date']:
+            if request.GET.get(key):
+                filters[key] = datetime.fromisoformat(request.GET.get(key))
+
+        orders = await async_read_service.get_all_orders(filters=filters, limit=int(request.GET.get('limit', 100)))
+        return json_response(orders)
+
+    except Exception as e:
+        logger.error(f"Error fetching orders: {str(e)}")
+        return JsonResponse({"error": f"Failed to fetch orders: {str(e)}"}, status=500)
@@ -11,6 +11,8 @@ from datetime import datetime, timedelta
 from ..services.batch_service import BatchService
 from ..services.product_service import ProductService
 from ..services.supplier_service import SupplierService
+from ..services.inventory_valuation_service import inventory_valuation_service
+from ..services.demand_forecast_service import demand_forecast_service
 
 logger = logging.getLogger(__name__)
 
@@ -420,6 +422,193 @@ class ProductsWithExpirySummaryView(BatchView):
                 'error': str(e)
             }, status=500)
 
+@method_decorator(csrf_exempt, name='dispatch')
+class ExpiryCalendarView(BatchView):
+    def get(self, request):
+        """Get per-day expiry counts from the expiry calendar"""
+        try:
+            days_ahead = int(request.GET.get('days_ahead', 30))
+            
+            calendar = self.batch_service.expiry_calendar.get_calendar_summary(days_ahead)
+            
+            return JsonResponse({
+                'success': True,
+                'data': calendar,
+                'total_batches': sum(day['batch_count'] for day in calendar),
+                'days_ahead': days_ahead
+            })
+            
+        except Exception as e:
+            logger.error(f"Error getting expiry calendar: {str(e)}")
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            }, status=500)
+
+# ================================================================
+# INVENTORY VALUATION SNAPSHOTS
+# ================================================================
+
+def _parse_day(value):
+    """YYYY-MM-DD query parameter -> datetime (None when absent)"""
+    return datetime.strptime(value, '%Y-%m-%d') if value else None
+
+@method_decorator(csrf_exempt, name='dispatch')
+class InventoryValuationView(BatchView):
+    def get(self, request):
+        """Get the FIFO stock valuation on a date (?date=YYYY-MM-DD, default today)"""
+        try:
+            snapshot = inventory_valuation_service.get_snapshot(_parse_day(request.GET.get('date')))
+            if not snapshot:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'No valuation snapshot on or before the requested date'
+                }, status=404)
+            
+            response = {'success': True, 'data': snapshot}
+            if request.GET.get('include_lines', 'false').lower() == 'true':
+                response['lines'] = inventory_valuation_service.get_snapshot_lines(
+                    snapshot,
+                    category_id=request.GET.get('category_id'),
+                    limit=min(int(request.GET.get('limit', 100)), 1000),
+                    skip=int(request.GET.get('skip', 0))
+                )
+            return JsonResponse(response)
+            
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': f'Invalid parameter: {str(e)}'}, status=400)
+        except Exception as e:
+            logger.error(f"Error getting inventory valuation: {str(e)}")
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            }, status=500)
+    
+    def post(self, request):
+        """Take (or retake) today's valuation snapshot"""
+        try:
+            snapshot = inventory_valuation_service.take_snapshot()
+            return JsonResponse({
+                'success': True,
+                'message': f"Valuation snapshot {snapshot['_id']} stored",
+                'data': snapshot
+            }, status=201)
+            
+        except Exception as e:
+            logger.error(f"Error taking inventory valuation snapshot: {str(e)}")
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            }, status=500)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class InventoryValuationHistoryView(BatchView):
+    def get(self, request):
+        """Get daily valuation totals between two dates (?start_date=&end_date=)"""
+        try:
+            snapshots = inventory_valuation_service.list_snapshots(
+                start_date=_parse_day(request.GET.get('start_date')),
+                end_date=_parse_day(request.GET.get('end_date')),
+                limit=min(int(request.GET.get('limit', 90)), 1000)
+            )
+            return JsonResponse({
+                'success': True,
+                'data': snapshots,
+                'count': len(snapshots)
+            })
+            
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': f'Invalid parameter: {str(e)}'}, status=400)
+        except Exception as e:
+            logger.error(f"Error listing inventory valuations: {str(e)}")
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            }, status=500)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class InventoryValuationDeltaView(BatchView):
+    def get(self, request):
+        """Get the valuation change between two dates (?from_date=&to_date=, to_date defaults to today)"""
+        try:
+            from_date = _parse_day(request.GET.get('from_date'))
+            if not from_date:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'from_date is required (YYYY-MM-DD)'
+                }, status=400)
+            
+            delta = inventory_valuation_service.get_delta(
+                from_date,
+                _parse_day(request.GET.get('to_date')),
+                top_products=min(int(request.GET.get('top_products', 20)), 500)
+            )
+            if not delta:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'No valuation snapshot on or before one of the requested dates'
+                }, status=404)
+            
+            return JsonResponse({'success': True, 'data': delta})
+            
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': f'Invalid parameter: {str(e)}'}, status=400)
+        except Exception as e:
+            logger.error(f"Error getting inventory valuation delta: {str(e)}")
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            }, status=500)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ReorderSuggestionView(BatchView):
+    def get(self, request):
+        """Get the latest nightly reorder suggestions (?supplier_id=, 'unassigned' for products without one)"""
+        try:
+            run = demand_forecast_service.get_latest_run(
+                supplier_id=request.GET.get('supplier_id'),
+                limit=min(int(request.GET.get('limit', 200)), 5000),
+                skip=int(request.GET.get('skip', 0))
+            )
+            if not run:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'No reorder suggestions have been generated yet'
+                }, status=404)
+
+            return JsonResponse({'success': True, 'data': run})
+
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': f'Invalid parameter: {str(e)}'}, status=400)
+        except Exception as e:
+            logger.error(f"Error getting reorder suggestions: {str(e)}")
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            }, status=500)
+
+    def post(self, request):
+        """Recompute reorder suggestions now (?method=ses|moving_average, ?store=false to preview)"""
+        try:
+            run = demand_forecast_service.generate(
+                method=request.GET.get('method', 'ses'),
+                store=request.GET.get('store', 'true').lower() == 'true'
+            )
+            return JsonResponse({
+                'success': True,
+                'message': f"{run['reorder_count']} products to reorder",
+                'data': run
+            }, status=201)
+
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': f'Invalid parameter: {str(e)}'}, status=400)
+        except Exception as e:
+            logger.error(f"Error generating reorder suggestions: {str(e)}")
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            }, status=500)
+
 # ================================================================
 # BATCH OPERATIONS FOR SALES
 # ================================================================
@@ -3,6 +3,7 @@ from rest_framework.response import Response
 from rest_framework import status
 from ..services.category_service import CategoryService
 from ..services.product_service import ProductService
+from ..services.pos_catalog_snapshot_service import POSCatalogSnapshotService
 import logging
 
 logger = logging.getLogger(__name__)
@@ -326,4 +327,52 @@ class POSLowStockView(APIView):
             }, status=status.HTTP_200_OK)
         except Exception as e:
             logger.error(f"Error getting low stock products: {e}")
-            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class POSCatalogSnapshotView(APIView):
+    """Versioned POS catalog snapshot with ETag support"""
+    
+    def get(self, request):
+        """Get the full compact catalog, or 304 if the terminal is up to date"""
+        try:
+            snapshot_service = POSCatalogSnapshotService()
+            snapshot = snapshot_service.get_snapshot()
+            
+            client_version = snapshot_service.parse_etag(request.headers.get('If-None-Match'))
+            if client_version is not None and client_version >= snapshot['version']:
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = Response(snapshot, status=status.HTTP_200_OK)
+            
+            response['ETag'] = snapshot['etag']
+            response['Cache-Control'] = 'no-cache'
+            return response
+        except Exception as e:
+            logger.error(f"Error getting POS catalog snapshot: {e}")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class POSCatalogDeltaView(APIView):
+    """Catalog changes since a snapshot version"""
+    
+    def get(self, request):
+        """Get products/categories changed since ?since=<version>"""
+        try:
+            since = request.query_params.get('since')
+            if since is None:
+                return Response({"error": "Query parameter 'since' is required"}, status=status.HTTP_400_BAD_REQUEST)
+            
+            try:
+                since = int(since)
+            except ValueError:
+                return Response({"error": "'since' must be an integer version"}, status=status.HTTP_400_BAD_REQUEST)
+            
+            delta = POSCatalogSnapshotService().get_delta(since)
+            
+            response = Response(delta, status=status.HTTP_200_OK)
+            response['ETag'] = delta['etag']
+            response['Cache-Control'] = 'no-cache'
+            return response
+        except Exception as e:
+            logger.error(f"Error getting POS catalog delta: {e}")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
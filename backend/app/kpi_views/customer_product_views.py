@@ -3,84 +3,40 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from ..services.product_service import ProductService
-from ..services.category_service import CategoryService
+from ..services.storefront_query_service import storefront_query_service
 from bson import ObjectId
 import logging
 
 logger = logging.getLogger(__name__)
 
 class CustomerProductService:
-    """Customer-facing product service (READ-ONLY) - uses existing PANN_POS services"""
+    """Customer-facing product service (READ-ONLY) - backed by the cached storefront query layer"""
     
     def __init__(self):
-        self.product_service = ProductService()
-        self.category_service = CategoryService()
-        self.db = self.product_service.db
-        self.product_collection = self.product_service.product_collection
-        self.category_collection = self.product_service.category_collection
+        self.storefront = storefront_query_service
+        self.db = self.storefront.db
+        self.product_collection = self.storefront.product_collection
+        self.category_collection = self.storefront.category_collection
+    
+    def _format_products(self, products):
+        category_names = self.storefront.get_category_names()
+        return [self._format_product_for_customer(product, category_names) for product in products]
     
     def get_all_active_products(self, filters=None, page=1, limit=20, sort_by='product_name', sort_order='asc'):
         """Get all active products available for customers"""
         try:
-            # Base query - only active, in-stock, non-deleted products
-            # ✅ FIXED: Use total_stock instead of stock (total_stock has correct batch values)
-            query = {
-                'status': 'active',
-                'isDeleted': {'$ne': True},
-                'total_stock': {'$gt': 0}  # Use total_stock which has batch calculations
-            }
-            
-            # Apply filters
-            if filters:
-                if filters.get('category_id'):
-                    query['category_id'] = filters['category_id']
-                if filters.get('subcategory_name'):
-                    query['sub_categories'] = {'$elemMatch': {'name': filters['subcategory_name']}}
-                if filters.get('search'):
-                    search_term = filters['search']
-                    query['$or'] = [
-                        {'product_name': {'$regex': search_term, '$options': 'i'}},
-                        {'SKU': {'$regex': search_term, '$options': 'i'}}
-                    ]
-                if filters.get('min_price'):
-                    query['selling_price'] = {'$gte': float(filters['min_price'])}
-                if filters.get('max_price'):
-                    if 'selling_price' in query:
-                        query['selling_price']['$lte'] = float(filters['max_price'])
-                    else:
-                        query['selling_price'] = {'$lte': float(filters['max_price'])}
-            
-            # Build sort
-            sort_direction = 1 if sort_order == 'asc' else -1
-            sort_field = sort_by if sort_by in ['product_name', 'selling_price', 'date_received'] else 'product_name'
-            
-            # Count total
-            total = self.product_collection.count_documents(query)
-            
-            # Get products with pagination
-            skip = (page - 1) * limit
-            products_cursor = self.product_collection.find(query).sort(sort_field, sort_direction).skip(skip).limit(limit)
-            
-            products = []
-            for product in products_cursor:
-                product_data = self._format_product_for_customer(product)
-                products.append(product_data)
-            
-            # Calculate pagination
-            total_pages = (total + limit - 1) // limit
-            pagination = {
-                'current_page': page,
-                'total_pages': total_pages,
-                'total_items': total,
-                'items_per_page': limit,
-                'has_next': page < total_pages,
-                'has_previous': page > 1
-            }
+            # Only active, in-stock (total_stock), non-deleted products
+            products, pagination = self.storefront.find_products(
+                filters=filters,
+                page=page,
+                limit=limit,
+                sort_by=sort_by,
+                sort_order=sort_order
+            )
             
             return {
                 'success': True,
-                'products': products,
+                'products': self._format_products(products),
                 'pagination': pagination
             }
             
@@ -115,7 +71,7 @@ class CustomerProductService:
                     'message': 'Product not found'
                 }
             
-            product_data = self._format_product_for_customer(product)
+            product_data = self._format_product_for_customer(product, self.storefront.get_category_names())
             
             # Add promotions if any (you'll need to implement this based on your promotions system)
             # product_data['promotions'] = self._get_product_promotions(product_id)
@@ -135,37 +91,15 @@ class CustomerProductService:
     def get_products_by_category(self, category_id, page=1, limit=20):
         """Get products by category"""
         try:
-            # ✅ FIXED: Use total_stock instead of stock
-            query = {
-                'category_id': category_id,
-                'status': 'active',
-                'isDeleted': {'$ne': True},
-                'total_stock': {'$gt': 0}
-            }
-            
-            total = self.product_collection.count_documents(query)
-            skip = (page - 1) * limit
-            
-            products_cursor = self.product_collection.find(query).sort('product_name', 1).skip(skip).limit(limit)
-            
-            products = []
-            for product in products_cursor:
-                product_data = self._format_product_for_customer(product)
-                products.append(product_data)
-            
-            total_pages = (total + limit - 1) // limit
-            pagination = {
-                'current_page': page,
-                'total_pages': total_pages,
-                'total_items': total,
-                'items_per_page': limit,
-                'has_next': page < total_pages,
-                'has_previous': page > 1
-            }
+            products, pagination = self.storefront.find_products(
+                filters={'category_id': category_id},
+                page=page,
+                limit=limit
+            )
             
             return {
                 'success': True,
-                'products': products,
+                'products': self._format_products(products),
                 'pagination': pagination
             }
             
@@ -182,40 +116,15 @@ class CustomerProductService:
             if not search_term:
                 return self.get_all_active_products(page=page, limit=limit)
             
-            # ✅ FIXED: Use total_stock instead of stock
-            query = {
-                '$or': [
-                    {'product_name': {'$regex': search_term, '$options': 'i'}},
-                    {'SKU': {'$regex': search_term, '$options': 'i'}}
-                ],
-                'status': 'active',
-                'isDeleted': {'$ne': True},
-                'total_stock': {'$gt': 0}
-            }
-            
-            total = self.product_collection.count_documents(query)
-            skip = (page - 1) * limit
-            
-            products_cursor = self.product_collection.find(query).sort('product_name', 1).skip(skip).limit(limit)
-            
-            products = []
-            for product in products_cursor:
-                product_data = self._format_product_for_customer(product)
-                products.append(product_data)
-            
-            total_pages = (total + limit - 1) // limit
-            pagination = {
-                'current_page': page,
-                'total_pages': total_pages,
-                'total_items': total,
-                'items_per_page': limit,
-                'has_next': page < total_pages,
-                'has_previous': page > 1
-            }
+            products, pagination = self.storefront.find_products(
+                filters={'search': search_term},
+                page=page,
+                limit=limit
+            )
             
             return {
                 'success': True,
-                'products': products,
+                'products': self._format_products(products),
                 'pagination': pagination,
                 'search_term': search_term
             }
@@ -228,26 +137,13 @@ class CustomerProductService:
             }
     
     def get_featured_products(self, limit=10):
-        """Get featured products - you may need to adjust this based on your schema"""
+        """Get featured products - newest in-stock products for now"""
         try:
-            # ✅ FIXED: Use total_stock instead of stock
-            # Adjust this query based on how you mark featured products in your schema
-            query = {
-                'status': 'active',
-                'isDeleted': {'$ne': True},
-                'total_stock': {'$gt': 0}
-            }
-            
-            products_cursor = self.product_collection.find(query).sort('date_received', -1).limit(limit)
-            
-            products = []
-            for product in products_cursor:
-                product_data = self._format_product_for_customer(product)
-                products.append(product_data)
+            products = self.storefront.find_newest_products(limit=limit)
             
             return {
                 'success': True,
-                'products': products
+                'products': self._format_products(products)
             }
             
         except Exception as e:
@@ -257,15 +153,27 @@ class CustomerProductService:
                 'message': str(e)
             }
     
-    def _format_product_for_customer(self, product):
+    def get_product_facets(self, filters=None):
+        """Category and price-band counts for the storefront filter sidebar"""
+        try:
+            return {
+                'success': True,
+                'facets': self.storefront.get_facets(filters)
+            }
+            
+        except Exception as e:
+            logger.error(f"Error getting product facets: {e}")
+            return {
+                'success': False,
+                'message': str(e)
+            }
+    
+    def _format_product_for_customer(self, product, category_names=None):
         """Format product data for customer consumption - remove sensitive fields"""
         try:
-            # Get category name
-            category_name = "Unknown"
-            if product.get('category_id'):
-                category = self.category_collection.find_one({'_id': product['category_id']})
-                if category:
-                    category_name = category.get('category_name', 'Unknown')
+            # Category names come from the cached map instead of a lookup per product
+            category_names = category_names or {}
+            category_name = category_names.get(product.get('category_id'), 'Unknown')
             
             # ✅ FIXED: Use total_stock as primary stock value (has correct batch calculations)
             stock_value = product.get('total_stock', product.get('stock', 0))
@@ -300,13 +208,16 @@ class CustomerProductService:
             logger.error(f"Error formatting product: {e}")
             return {}
 
+# Shared by the views below; holds no per-request state
+customer_product_service = CustomerProductService()
+
 @method_decorator(csrf_exempt, name='dispatch')
 class CustomerProductListView(APIView):
     """Customer product list view - matches ramyeonsite backend API"""
     
     def get(self, request):
         try:
-            service = CustomerProductService()
+            service = customer_product_service
             
             # Extract query parameters
             page = int(request.GET.get('page', 1))
@@ -369,7 +280,7 @@ class CustomerProductDetailView(APIView):
     
     def get(self, request, product_id):
         try:
-            service = CustomerProductService()
+            service = customer_product_service
             
             result = service.get_product_by_id(product_id)
             
@@ -399,7 +310,7 @@ class CustomerProductSearchView(APIView):
     
     def get(self, request):
         try:
-            service = CustomerProductService()
+            service = customer_product_service
             
             search_term = request.GET.get('q', '')
             page = int(request.GET.get('page', 1))
@@ -435,7 +346,7 @@ class CustomerProductByCategoryView(APIView):
     
     def get(self, request, category_id):
         try:
-            service = CustomerProductService()
+            service = customer_product_service
             
             page = int(request.GET.get('page', 1))
             limit = int(request.GET.get('limit', 20))
@@ -469,7 +380,7 @@ class CustomerFeaturedProductsView(APIView):
     
     def get(self, request):
         try:
-            service = CustomerProductService()
+            service = customer_product_service
             
             limit = int(request.GET.get('limit', 10))
             
@@ -494,3 +405,42 @@ class CustomerFeaturedProductsView(APIView):
                 'success': False,
                 'message': 'Internal server error'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class CustomerProductFacetsView(APIView):
+    """Customer product facet counts (per category and price band)"""
+    
+    def get(self, request):
+        try:
+            service = customer_product_service
+            
+            filters = {}
+            for field in ('category_id', 'subcategory_name', 'search', 'min_price', 'max_price'):
+                if request.GET.get(field):
+                    filters[field] = request.GET.get(field)
+            
+            result = service.get_product_facets(filters)
+            
+            if result['success']:
+                return Response({
+                    'success': True,
+                    'data': result['facets']
+                }, status=status.HTTP_200_OK)
+            else:
+                return Response({
+                    'success': False,
+                    'message': result.get('message', 'Error retrieving product facets')
+                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                
+        except ValueError as ve:
+            logger.error(f"Invalid query parameters: {ve}")
+            return Response({
+                'success': False,
+                'message': 'Invalid query parameters'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"Error in CustomerProductFacetsView: {e}")
+            return Response({
+                'success': False,
+                'message': 'Internal server error'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -3,6 +3,7 @@ from rest_framework.response import Response
 from rest_framework import status
 from ..services.customer_service import CustomerService
 from ..services.auth_services import AuthService
+from ..services.principal_cache_service import PRINCIPAL_CUSTOMER
 from ..decorators.authenticationDecorator import require_admin, require_authentication, get_authenticated_user_from_jwt
 import logging
 
@@ -40,7 +41,8 @@ class CustomerRegisterView(APIView):
             token_data = {
                 'sub': str(customer_id),
                 'email': customer.get('email'),
-                'role': 'customer'
+                'role': 'customer',
+                'ptype': PRINCIPAL_CUSTOMER
             }
             access_token = self.auth_service.create_access_token(token_data)
             refresh_token = self.auth_service.create_refresh_token(token_data)
@@ -96,7 +98,7 @@ class CustomerLoginView(APIView):
                 return Response({"error": "Invalid email or password"}, status=status.HTTP_401_UNAUTHORIZED)
 
             customer_id = str(customer.get('_id'))
-            token_data = {"sub": customer_id, "email": customer.get('email'), "role": "customer"}
+            token_data = {"sub": customer_id, "email": customer.get('email'), "role": "customer", "ptype": PRINCIPAL_CUSTOMER}
             access_token = self.auth_service.create_access_token(token_data)
             refresh_token = self.auth_service.create_refresh_token(token_data)
 
@@ -106,6 +106,101 @@ class VoidEnhancedSaleView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class VoidAndReturnSalesView(APIView):
+    """
+    Void many enhanced POS sales and/or return some of their lines in one request
+    """
+    def post(self, request):
+        try:
+            service = SalesService()
+            requests = request.data.get('sales')
+            processed_by = request.data.get('processed_by')
+            
+            if not isinstance(requests, list) or not requests:
+                return Response(
+                    {"error": "sales must be a non-empty list of {sale_id, items (optional)}"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            if not processed_by:
+                return Response(
+                    {"error": "processed_by is required"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            result = service.void_and_return_sales(requests, processed_by, request.data.get('reason'))
+            
+            return Response(result, status=status.HTTP_200_OK)
+            
+        except ValueError as e:
+            return Response(
+                {"error": str(e)}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception as e:
+            logger.error(f"Error voiding/returning sales: {e}")
+            return Response(
+                {"error": "Internal server error"}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+class ReturnSaleItemsView(APIView):
+    """
+    Return some lines of an enhanced POS sale and restore their stock to batches
+    """
+    def post(self, request, sale_id):
+        try:
+            service = SalesService()
+            items = request.data.get('items')
+            processed_by = request.data.get('processed_by')
+            
+            if not isinstance(items, list) or not items:
+                return Response(
+                    {"error": "items must be a non-empty list of {product_id, quantity}"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            if not processed_by:
+                return Response(
+                    {"error": "processed_by is required"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            result = service.void_and_return_sales(
+                [{'sale_id': sale_id, 'items': items, 'expected_version': request.data.get('expected_version')}],
+                processed_by,
+                request.data.get('reason', 'Items returned')
+            )
+            sale_result = result['results'][0]
+            
+            if sale_result['status'] != 'applied':
+                return Response(
+                    {"error": sale_result['error']}, 
+                    status={
+                        'not_found': status.HTTP_404_NOT_FOUND,
+                        'conflict': status.HTTP_409_CONFLICT
+                    }.get(sale_result['status'], status.HTTP_400_BAD_REQUEST)
+                )
+            
+            return Response({
+                "success": True,
+                "message": "Items returned successfully",
+                "data": sale_result,
+                "audit_id": result['audit_id']
+            }, status=status.HTTP_200_OK)
+            
+        except ValueError as e:
+            return Response(
+                {"error": str(e)}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception as e:
+            logger.error(f"Error returning sale items: {e}")
+            return Response(
+                {"error": "Internal server error"}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
 class ValidatePointsRedemptionView(APIView):
     """
     Validate loyalty points redemption before sale
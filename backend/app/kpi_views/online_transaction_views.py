@@ -3,6 +3,8 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from ..services.pos.online_transactions_services import OnlineTransactionService
+from ..services.stock_reservation_service import stock_reservation_service
+from ..decorators.authenticationDecorator import require_permission
 from datetime import datetime, timedelta
 import logging
 
@@ -165,6 +167,38 @@ class UpdateOrderStatusView(OnlineTransactionServiceView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class BulkOrderTransitionView(OnlineTransactionServiceView):
+    """Move many orders to new statuses in one request (version-guarded)"""
+    
+    def post(self, request):
+        try:
+            transitions = request.data.get('transitions')
+            updated_by = request.data.get('updated_by', request.user.id)
+            
+            if not isinstance(transitions, list) or not transitions:
+                return Response(
+                    {"error": "transitions must be a non-empty list of {order_id, expected_version, target_status}"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            result = self.service.bulk_transition_orders(
+                transitions,
+                updated_by,
+                notes=request.data.get('notes', ''),
+                cancellation_reason=request.data.get('cancellation_reason')
+            )
+            
+            return Response(result, status=status.HTTP_200_OK)
+            
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"Error in bulk order transition: {str(e)}")
+            return Response(
+                {"error": f"Failed to transition orders: {str(e)}"}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
 class UpdatePaymentStatusView(OnlineTransactionServiceView):
     """Update payment status"""
     
@@ -457,6 +491,82 @@ class ValidateOrderStockView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class StockReservationView(APIView):
+    """Hold stock for the authenticated customer's cart (replaces their previous hold)"""
+    permission_classes = []
+    
+    @require_permission('customer')
+    def post(self, request):
+        try:
+            owner_id = request.current_user['user_id']
+            items = request.data.get('items', [])
+            
+            result = stock_reservation_service.reserve(owner_id, items, request.data.get('hold_minutes'))
+            
+            if result['success']:
+                return Response(result, status=status.HTTP_201_CREATED)
+            return Response(result, status=status.HTTP_409_CONFLICT)
+            
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"Error reserving stock: {str(e)}")
+            return Response(
+                {"error": f"Failed to reserve stock: {str(e)}"}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+class StockReservationDetailView(APIView):
+    """Get or release one of the authenticated customer's stock reservations"""
+    permission_classes = []
+    
+    @require_permission('customer')
+    def get(self, request, reservation_id):
+        reservation = stock_reservation_service.get_reservation(reservation_id)
+        if not reservation or reservation.get('owner_id') != request.current_user['user_id']:
+            return Response({"error": "Reservation not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(reservation, status=status.HTTP_200_OK)
+    
+    @require_permission('customer')
+    def delete(self, request, reservation_id):
+        try:
+            released = stock_reservation_service.release(
+                reservation_id,
+                request.current_user['user_id'],
+                reason='released_by_customer'
+            )
+            if not released:
+                return Response(
+                    {"error": "Reservation not found or no longer held"}, 
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            return Response({'success': True, 'message': 'Reservation released'}, status=status.HTTP_200_OK)
+            
+        except Exception as e:
+            logger.error(f"Error releasing reservation {reservation_id}: {str(e)}")
+            return Response(
+                {"error": f"Failed to release reservation: {str(e)}"}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+class StockAvailabilityView(APIView):
+    """On-hand, reserved and available quantities - ?product_ids=PROD-00001,PROD-00002"""
+    permission_classes = []
+    
+    def get(self, request):
+        product_ids = [pid for pid in request.query_params.get('product_ids', '').split(',') if pid]
+        if not product_ids:
+            return Response({"error": "product_ids is required"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            return Response(stock_reservation_service.get_availability(product_ids), status=status.HTTP_200_OK)
+        except Exception as e:
+            logger.error(f"Error getting stock availability: {str(e)}")
+            return Response(
+                {"error": f"Failed to get stock availability: {str(e)}"}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
 class ValidatePointsRedemptionView(APIView):
     """Validate loyalty points redemption - Public access for customers"""
     permission_classes = []  # Allow public access for points validation
@@ -4,6 +4,7 @@ from rest_framework import status
 from django.http import HttpResponse
 from ...services.pos.promotionCon import PromoConnection
 from ...services.pos.salesReport import SalesReport
+from ...services.stock_state_service import stock_state_service
 import logging
 
 def get_authenticated_user_from_jwt(request):
@@ -313,16 +314,11 @@ class StockAlertKPIView(APIView):
     
     def get(self, request):
         try:
-            promo_service = PromoConnection()
-            low_stock_products = promo_service.check_all_low_stock_products()
-            
-            # Calculate KPIs
-            total_products = promo_service.products_collection.count_documents({"isDeleted": {"$ne": True}})
-            out_of_stock = promo_service.products_collection.count_documents({
-                "stock": {"$lte": 0},
-                "isDeleted": {"$ne": True}
-            })
-            low_stock_count = len(low_stock_products)
+            # Calculate KPIs from the maintained stock_state counts
+            counts = stock_state_service.get_state_counts()
+            total_products = sum(counts.values())
+            out_of_stock = counts['out']
+            low_stock_count = counts['low'] + counts['out']
             
             return Response({
                 "success": True,
@@ -3,6 +3,10 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.http import HttpResponse
 from ...services.pos.salesReport import SalesReport
+from ...bson_json import streaming_json_response
+from ...services.margin_service import REPORT_SOURCES, margin_service
+from ...services.dashboard_kpi_service import dashboard_kpi_service, KPI_TTLS, DEFAULT_WAIT_SECONDS
+from ...services.report_cache_service import report_cache
 from datetime import datetime, date, timedelta, time
 import logging
 
@@ -232,8 +236,8 @@ class DashboardSummaryView(APIView):
             #        status=status.HTTP_401_UNAUTHORIZED
             #    )
 
-            sales_report = SalesReport()
-            result = sales_report.get_dashboard_summary()
+            # Period summaries are computed concurrently and cached per KPI
+            result = dashboard_kpi_service.get_sales_dashboard_summary()
 
             return Response(result, status = status.HTTP_200_OK)
         
@@ -245,6 +249,43 @@ class DashboardSummaryView(APIView):
             )
 
 
+class DashboardKpiView(APIView):
+    """
+    All dashboard KPIs in one call, fanned out concurrently with per-KPI caching.
+
+    Query params:
+        kpis: comma-separated subset of KPI names (default: all)
+        timeout: seconds to wait for uncached KPIs before returning partial data
+        refresh: 'true' to bypass the cache
+    """
+    def get(self, request):
+        try:
+            kpis = request.query_params.get('kpis')
+            names = [name.strip() for name in kpis.split(',') if name.strip()] if kpis else None
+            wait_seconds = float(request.query_params.get('timeout', DEFAULT_WAIT_SECONDS))
+            force_refresh = request.query_params.get('refresh', 'false').lower() == 'true'
+
+            result = dashboard_kpi_service.get_kpis(
+                names,
+                wait_seconds=max(wait_seconds, 0),
+                force_refresh=force_refresh
+            )
+
+            return Response(result, status=status.HTTP_200_OK)
+
+        except ValueError as e:
+            return Response(
+                {"error": str(e), "available_kpis": list(KPI_TTLS)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception as e:
+            logging.error(f"Error getting dashboard KPIs: {str(e)}")
+            return Response(
+                {"error": f"Error getting dashboard KPIs: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
 class SalesComparisonView(APIView):
     """Get sales comparison between periods"""
     def get(self, request):
@@ -278,6 +319,81 @@ class SalesComparisonView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )    
 
+class SalesMarginView(APIView):
+    """
+    Gross margin report from the COGS stored on each sale line
+    (?group_by=product|category|day&start_date=&end_date=&source=pos,online)
+    """
+    def get(self, request):
+        try:
+            group_by = request.GET.get('group_by', 'product')
+            if group_by not in ['product', 'category', 'day']:
+                return Response(
+                    {"error": "group_by must be 'product', 'category' or 'day'"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            sources = [source for source in request.GET.get('source', '').split(',') if source] or None
+            invalid = [source for source in sources or [] if source not in REPORT_SOURCES]
+            if invalid:
+                return Response(
+                    {"error": f"Invalid source(s): {', '.join(invalid)}. Use: {', '.join(REPORT_SOURCES)}"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            try:
+                start_date = request.GET.get('start_date')
+                end_date = request.GET.get('end_date')
+                start_date = datetime.fromisoformat(start_date.replace('Z', '+00:00')).replace(tzinfo=None) if start_date else None
+                end_date = datetime.fromisoformat(end_date.replace('Z', '+00:00')).replace(tzinfo=None) if end_date else None
+                # A bare end date covers that whole day
+                if end_date and end_date.time() == time.min:
+                    end_date = datetime.combine(end_date.date(), time.max)
+            except ValueError:
+                return Response(
+                    {"error": "Invalid date format. Use ISO format (YYYY-MM-DD)"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            if group_by == 'product':
+                result = margin_service.margin_by_product(
+                    start_date, end_date, sources,
+                    sort_by=request.GET.get('sort_by', 'gross_margin'),
+                    limit=int(request.GET.get('limit', 50))
+                )
+            elif group_by == 'category':
+                result = margin_service.margin_by_category(start_date, end_date, sources)
+            else:
+                result = margin_service.margin_by_day(start_date, end_date, sources)
+            
+            return Response({
+                'success': True,
+                'group_by': group_by,
+                'start_date': start_date,
+                'end_date': end_date,
+                **result
+            }, status=status.HTTP_200_OK)
+            
+        except Exception as e:
+            logging.error(f"Error getting margin report: {str(e)}")
+            return Response(
+                {"error": f"Error getting margin report: {str(e)}"}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+class ReportCacheStatsView(APIView):
+    """Report cache hit/miss counts per report (for the worker answering the request)"""
+    def get(self, request):
+        try:
+            return Response({'success': True, **report_cache.metrics()}, status=status.HTTP_200_OK)
+            
+        except Exception as e:
+            logging.error(f"Error getting report cache stats: {str(e)}")
+            return Response(
+                {"error": f"Error getting report cache stats: {str(e)}"}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
 class SalesTransactionsView(APIView):
     """
     📋 Get individual transaction records
@@ -324,6 +440,14 @@ class SalesTransactionsView(APIView):
                 elif source in ['csv', 'manual', 'pos']:
                     include_source = [source]
             
+            # Large exports: stream rows straight from the cursors instead of building the list
+            if request.GET.get('stream', 'false').lower() == 'true':
+                return streaming_json_response(
+                    sales_report.iter_transactions(date_range, include_source, limit),
+                    envelope={'filters_applied': {'date_range': date_range, 'include_source': include_source}},
+                    key='transactions'
+                )
+
             # Get transactions using clean API
             result = sales_report.get_sales_transactions(date_range, include_source, limit)
             
@@ -5,6 +5,7 @@ from rest_framework.permissions import AllowAny
 from django.http import HttpResponse
 from django.views import View  # ← ADD THIS LINE
 from ..services.product_service import ProductService
+from ..services.stock_state_service import STOCK_STATES, stock_state_service
 import logging
 import json  # ← ADD THIS LINE
 
@@ -444,6 +445,42 @@ class LowStockProductsView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class StockWatchlistView(APIView):
+    def get(self, request):
+        """Get low / out-of-stock products from the maintained stock_state index"""
+        try:
+            states = request.GET.get('state')
+            states = [state.strip() for state in states.split(',') if state.strip()] if states else None
+            invalid = [state for state in states or [] if state not in STOCK_STATES]
+            if invalid:
+                return Response(
+                    {"error": f"Invalid state(s): {', '.join(invalid)}. Use: {', '.join(STOCK_STATES)}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            watchlist = stock_state_service.get_watchlist(
+                states=states,
+                category_id=request.GET.get('category_id'),
+                limit=min(int(request.GET.get('limit', 100)), 500),
+                skip=int(request.GET.get('skip', 0))
+            )
+            return Response({
+                'message': f"Found {watchlist['total']} products on the stock watchlist",
+                'data': watchlist['products'],
+                'total': watchlist['total'],
+                'counts': watchlist['counts'],
+                'limit': watchlist['limit'],
+                'skip': watchlist['skip']
+            }, status=status.HTTP_200_OK)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"Error in StockWatchlistView.get: {e}")
+            return Response(
+                {"error": str(e)}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
 class ExpiringProductsView(APIView):
     def get(self, request):
         """Get products expiring within specified days"""
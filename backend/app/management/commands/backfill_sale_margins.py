@@ -0,0 +1,47 @@
+"""
+Django Management Command: Backfill Sale Margins
+================================================
+Computes line-level COGS and gross margin for historical POS sales and
+online orders from the `batches_used` recorded at checkout, and stores them
+with the sale totals (new sales are costed at checkout). Lines without batch
+tracking are costed at the product's current cost price and flagged
+`cogs_estimated`.
+
+Usage:
+    python manage.py backfill_sale_margins
+    python manage.py backfill_sale_margins --source pos --dry-run
+    python manage.py backfill_sale_margins --force    (re-cost already costed sales)
+"""
+
+from django.core.management.base import BaseCommand
+from app.services.margin_service import REPORT_SOURCES, margin_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Store COGS and gross margin on historical sales from their batches_used'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', type=str, action='append', choices=sorted(REPORT_SOURCES), help='Source to backfill (repeatable, default: all)')
+        parser.add_argument('--force', action='store_true', help='Re-cost sales that already have costing')
+        parser.add_argument('--dry-run', action='store_true', help='Count only, write nothing')
+
+    def handle(self, *args, **options):
+        try:
+            results = margin_service.backfill(
+                sources=options['source'], force=options['force'], dry_run=options['dry_run']
+            )
+            action = 'would be costed' if options['dry_run'] else 'costed'
+            for source, result in results.items():
+                self.stdout.write(self.style.SUCCESS(f"{source}: {result['records_costed']} sale(s) {action}"))
+                if result['lines_estimated']:
+                    self.stdout.write(self.style.WARNING(
+                        f"{source}: {result['lines_estimated']} line(s) without batches_used costed at current product cost"
+                    ))
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Margin backfill failed: {str(e)}'))
+            logger.error(f'Margin backfill error: {str(e)}', exc_info=True)
+            raise
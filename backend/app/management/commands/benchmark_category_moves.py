@@ -0,0 +1,132 @@
+"""
+Django Management Command: Benchmark Category Moves
+===================================================
+Times a bulk move of N products (default 5,000) between two subcategories
+using product-level membership (one bulk_write on products, one on the
+counters), and for comparison the old embedded-array approach (pull from
+every category, push into the target category, update the product).
+
+Runs against scratch collections (`benchmark_products`,
+`benchmark_category`, `benchmark_category_product_counts`) which are
+dropped afterwards; real products and categories are not touched.
+
+Usage:
+    python manage.py benchmark_category_moves
+    python manage.py benchmark_category_moves --products 5000 --skip-legacy
+"""
+
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from app.services.category_membership_service import CategoryMembershipService
+
+SOURCE_CATEGORY = 'CTGY-BENCH-A'
+TARGET_CATEGORY = 'CTGY-BENCH-B'
+SUBCATEGORY = 'Benchmark'
+PRODUCT_PREFIX = 'BENCH-PROD-'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark bulk product moves with normalized category membership'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=5000, help='Number of products to move')
+        parser.add_argument(
+            '--skip-legacy',
+            action='store_true',
+            help='Skip the embedded-array comparison run (one round trip set per product)'
+        )
+
+    def handle(self, *args, **options):
+        product_count = options['products']
+
+        membership_service = CategoryMembershipService()
+        db = membership_service.db
+        membership_service.product_collection = db.benchmark_products
+        membership_service.category_collection = db.benchmark_category
+        membership_service.counts_collection = db.benchmark_category_product_counts
+        membership_service._ensure_indexes()
+
+        product_ids = [f"{PRODUCT_PREFIX}{number:05d}" for number in range(1, product_count + 1)]
+
+        try:
+            self._seed(membership_service, product_ids)
+            self.stdout.write(f'Seeded {product_count} products in {SOURCE_CATEGORY} > {SUBCATEGORY}')
+
+            started = time.perf_counter()
+            result = membership_service.move_products(product_ids, TARGET_CATEGORY, SUBCATEGORY)
+            elapsed = time.perf_counter() - started
+
+            counts = membership_service.get_subcategory_counts([SOURCE_CATEGORY, TARGET_CATEGORY])
+            self.stdout.write(self.style.SUCCESS(
+                f"Normalized move: {result['moved']} products in {elapsed * 1000:.1f} ms "
+                f"(counters: source={sum(counts[SOURCE_CATEGORY].values())}, "
+                f"target={sum(counts[TARGET_CATEGORY].values())})"
+            ))
+
+            if not options['skip_legacy']:
+                elapsed = self._run_legacy_move(membership_service, product_ids)
+                self.stdout.write(self.style.WARNING(
+                    f"Embedded-array move: {product_count} products in {elapsed * 1000:.1f} ms"
+                ))
+
+        finally:
+            db.drop_collection('benchmark_products')
+            db.drop_collection('benchmark_category')
+            db.drop_collection('benchmark_category_product_counts')
+            db.change_log.delete_many({'entity': 'products', 'entity_id': {'$regex': f'^{PRODUCT_PREFIX}'}})
+
+    def _seed(self, membership_service, product_ids):
+        now = datetime.utcnow()
+        membership_service.product_collection.insert_many([
+            {
+                '_id': product_id,
+                'product_name': f'Benchmark product {product_id}',
+                'category_id': SOURCE_CATEGORY,
+                'subcategory_name': SUBCATEGORY,
+                'isDeleted': False,
+                'created_at': now
+            }
+            for product_id in product_ids
+        ], ordered=False)
+
+        membership_service.category_collection.insert_many([
+            {
+                '_id': SOURCE_CATEGORY,
+                'sub_categories': [{
+                    'name': SUBCATEGORY,
+                    'products': [
+                        {'product_id': product_id, 'product_name': f'Benchmark product {product_id}'}
+                        for product_id in product_ids
+                    ]
+                }]
+            },
+            {'_id': TARGET_CATEGORY, 'sub_categories': [{'name': SUBCATEGORY, 'products': []}]}
+        ])
+
+        membership_service.rebuild_counts()
+
+    def _run_legacy_move(self, membership_service, product_ids):
+        """Same move on the embedded arrays, one product at a time as the old code did"""
+        categories = membership_service.category_collection
+        products = membership_service.product_collection
+        categories.create_index([('sub_categories.products.product_id', 1)])
+
+        started = time.perf_counter()
+        for product_id in product_ids:
+            for category in categories.find({'sub_categories.products.product_id': product_id}, {'_id': 1}):
+                categories.update_one(
+                    {'_id': category['_id']},
+                    {'$pull': {'sub_categories.$[].products': {'product_id': product_id}}}
+                )
+            categories.update_one(
+                {'_id': TARGET_CATEGORY},
+                {'$addToSet': {'sub_categories.$[elem].products': {'product_id': product_id}}},
+                array_filters=[{'elem.name': SUBCATEGORY}]
+            )
+            products.update_one(
+                {'_id': product_id},
+                {'$set': {'category_id': TARGET_CATEGORY, 'subcategory_name': SUBCATEGORY}}
+            )
+        return time.perf_counter() - started
@@ -0,0 +1,151 @@
+"""
+Django Management Command: Benchmark JSON Rendering
+===================================================
+Times serialization of synthetic product and sale listings (default 10,000
+products and 50,000 sales, shaped like the Mongo documents the API returns)
+through:
+
+  legacy    - recursive per-service convert_object_id, then DRF's JSONRenderer
+  shared    - iterative bson_to_json, then DRF's JSONRenderer
+  orjson    - ORJSONRenderer directly on the raw documents
+  streaming - iter_json_array batches (what streaming_json_response sends)
+
+No database access; documents are generated in memory.
+
+Usage:
+    python manage.py benchmark_json_rendering
+    python manage.py benchmark_json_rendering --products 10000 --sales 50000 --repeat 3
+"""
+
+import copy
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson import Decimal128, ObjectId
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from app.bson_json import bson_to_json, iter_json_array, orjson
+from app.renderers import ORJSONRenderer
+
+
+def legacy_convert(document):
+    """The recursive convert_object_id most services carried before the shared converter"""
+    if document is None:
+        return document
+    if isinstance(document, list):
+        return [legacy_convert(item) for item in document]
+    if isinstance(document, dict):
+        converted = {}
+        for key, value in document.items():
+            if isinstance(value, ObjectId):
+                converted[key] = str(value)
+            elif isinstance(value, Decimal128):
+                converted[key] = float(value.to_decimal())
+            elif isinstance(value, (dict, list)):
+                converted[key] = legacy_convert(value)
+            else:
+                converted[key] = value
+        return converted
+    if isinstance(document, ObjectId):
+        return str(document)
+    return document
+
+
+class Command(BaseCommand):
+    help = 'Benchmark BSON-to-JSON conversion and rendering for large listings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000, help='Number of product documents')
+        parser.add_argument('--sales', type=int, default=50000, help='Number of sale documents')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per strategy (best time is reported)')
+
+    def handle(self, *args, **options):
+        random.seed(42)
+        now = datetime.utcnow()
+
+        datasets = {
+            'products': [self._product(number, now) for number in range(options['products'])],
+            'sales': [self._sale(number, now) for number in range(options['sales'])],
+        }
+
+        if orjson is None:
+            self.stdout.write(self.style.WARNING('orjson is not installed - ORJSONRenderer falls back to DRF'))
+
+        drf_renderer = JSONRenderer()
+        orjson_renderer = ORJSONRenderer()
+        strategies = {
+            'legacy': lambda docs: drf_renderer.render({'data': legacy_convert(docs)}),
+            'shared': lambda docs: drf_renderer.render({'data': bson_to_json(docs)}),
+            'orjson': lambda docs: orjson_renderer.render({'data': docs}),
+            'streaming': lambda docs: b''.join(iter_json_array(iter(docs), envelope={}, key='data')),
+        }
+
+        for name, documents in datasets.items():
+            self.stdout.write(self.style.SUCCESS(f'\n=== {len(documents)} {name} ==='))
+            baseline = None
+            for strategy, render in strategies.items():
+                best, size = None, 0
+                for _ in range(options['repeat']):
+                    # Converters mutate in place, so every run gets fresh documents
+                    docs = copy.deepcopy(documents)
+                    started = time.perf_counter()
+                    payload = render(docs)
+                    elapsed = time.perf_counter() - started
+                    best = elapsed if best is None else min(best, elapsed)
+                    size = len(payload)
+
+                baseline = baseline or best
+                self.stdout.write(
+                    f'{strategy:>10}: {best * 1000:9.1f} ms  {size / 1048576:7.2f} MiB  '
+                    f'{baseline / best:5.1f}x vs legacy'
+                )
+
+    def _product(self, number, now):
+        return {
+            '_id': f'PROD-{number:05d}',
+            'product_name': f'Benchmark Product {number}',
+            'SKU': f'SKU-{number:06d}',
+            'category_id': f'CTGY-{number % 40:03d}',
+            'subcategory_name': f'Sub {number % 7}',
+            'selling_price': round(random.uniform(5, 500), 2),
+            'cost_price': Decimal128(str(round(random.uniform(1, 300), 2))),
+            'stock': random.randint(0, 500),
+            'low_stock_threshold': 10,
+            'status': 'active',
+            'supplier_id': ObjectId(),
+            'created_at': now - timedelta(days=number % 365),
+            'updated_at': now,
+            'sync_state': {'cloud': {'synced_at': now, 'status': 'synced'}},
+            'batches': [
+                {'batch_id': ObjectId(), 'quantity_remaining': random.randint(1, 50), 'expiry_date': now + timedelta(days=90)}
+                for _ in range(2)
+            ],
+        }
+
+    def _sale(self, number, now):
+        items = [
+            {
+                'product_id': f'PROD-{random.randint(0, 9999):05d}',
+                'product_name': 'Benchmark Product',
+                'quantity': random.randint(1, 5),
+                'unit_price': round(random.uniform(5, 500), 2),
+                'subtotal': round(random.uniform(5, 2500), 2),
+                'batches_used': [{'batch_id': ObjectId(), 'quantity': 1}],
+            }
+            for _ in range(3)
+        ]
+        return {
+            '_id': ObjectId(),
+            'cashier_id': f'USER-{number % 12:04d}',
+            'customer_id': ObjectId() if number % 3 else None,
+            'transaction_date': now - timedelta(minutes=number),
+            'items': items,
+            'total_amount': round(sum(item['subtotal'] for item in items), 2),
+            'total_discount': 0,
+            'payment_method': random.choice(['cash', 'gcash', 'card']),
+            'status': 'completed',
+            'source': 'pos',
+            'created_at': now - timedelta(minutes=number),
+        }
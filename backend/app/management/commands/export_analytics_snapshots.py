@@ -0,0 +1,67 @@
+"""
+Django Management Command: Export Analytics Snapshots
+=====================================================
+Nightly export of sales history to date-partitioned Parquet files
+(transactions, sales_facts lines, products, batches) under
+ANALYTICS_SNAPSHOT_DIR. Only new closed days and days whose sales facts
+changed since the last run are written. Long-range sales summaries,
+sales-by-category and top items are then served from these files instead
+of MongoDB. Requires pyarrow; run rebuild_sales_facts once beforehand.
+
+Schedule once a day after midnight UTC, e.g. with cron:
+    15 0 * * * cd /path/to/backend && python manage.py export_analytics_snapshots
+
+Usage:
+    python manage.py export_analytics_snapshots
+    python manage.py export_analytics_snapshots --since 2025-01-01   (re-export from a day onwards)
+    python manage.py export_analytics_snapshots --dry-run            (list the days only)
+"""
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from app.services.analytics_snapshot_service import analytics_snapshot_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Export closed sales days, products and batches to Parquet snapshots'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            type=str,
+            help='Re-export every day from this date (YYYY-MM-DD)',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='List the days that would be exported')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('--since must be in YYYY-MM-DD format')
+
+        try:
+            if options['dry_run']:
+                days = analytics_snapshot_service.pending_days(since=since)
+                self.stdout.write(self.style.WARNING(f'{len(days)} day(s) would be exported'))
+                for day in days:
+                    self.stdout.write(day.strftime('%Y-%m-%d'))
+                return
+
+            result = analytics_snapshot_service.export(since=since)
+
+            self.stdout.write(self.style.SUCCESS('\n=== Export Summary ==='))
+            days = result['days']
+            self.stdout.write(f"{len(days)} day(s) exported" + (f" ({days[0]} .. {days[-1]})" if days else ''))
+            for dataset, count in result['rows'].items():
+                self.stdout.write(f'{dataset}: {count} rows')
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Analytics export failed: {str(e)}'))
+            logger.error(f'Analytics export error: {str(e)}', exc_info=True)
+            raise
@@ -16,6 +16,7 @@ Usage:
 from django.core.management.base import BaseCommand
 from app.services.product_service import ProductService
 from app.services.batch_service import BatchService
+from app.services.stock_state_service import stock_state_service
 from datetime import datetime
 import json
 import sys
@@ -390,6 +391,10 @@ class Command(BaseCommand):
                     self.stdout.write("  Live batch fix:        python manage.py fix_stock --fix-batches --live")
                     self.stdout.write("  Fix all:               python manage.py fix_stock --fix-all --live")
                     self.stdout.write("  Fix from report:       python manage.py fix_stock --from-report report.json --live")
+            
+            # Stock was rewritten directly, so reclassify low/out states without alerts
+            if not self.dry_run:
+                stock_state_service.rebuild()
         
         except Exception as e:
             self.stderr.write(self.style.ERROR(f"❌ Error: {str(e)}"))
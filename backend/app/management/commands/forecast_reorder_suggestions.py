@@ -0,0 +1,54 @@
+"""
+Django Management Command: Forecast Reorder Suggestions
+=======================================================
+Nightly demand forecast for the whole catalog from the product_sales_daily
+counters (exponential smoothing or moving average, safety stock from daily
+demand variability), netted against on-hand batches and their expiry dates.
+Products at or below their reorder point get a suggested order quantity,
+grouped per supplier, and the run is stored for GET
+/inventory/reorder-suggestions/.
+
+Schedule once a day after midnight UTC, e.g. with cron:
+    30 0 * * * cd /path/to/backend && python manage.py forecast_reorder_suggestions
+
+Usage:
+    python manage.py forecast_reorder_suggestions
+    python manage.py forecast_reorder_suggestions --method moving_average
+    python manage.py forecast_reorder_suggestions --dry-run          (print without storing)
+"""
+
+from django.core.management.base import BaseCommand
+from app.services.demand_forecast_service import FORECAST_METHODS, demand_forecast_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Forecast demand and store reorder suggestions per supplier'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--method', type=str, default='ses', choices=FORECAST_METHODS, help='Forecast method (default: ses)')
+        parser.add_argument('--dry-run', action='store_true', help='Compute and print without storing the run')
+
+    def handle(self, *args, **options):
+        try:
+            run = demand_forecast_service.generate(method=options['method'], store=not options['dry_run'])
+
+            self.stdout.write(self.style.SUCCESS('\n=== Reorder Suggestions ==='))
+            self.stdout.write(
+                f"{run['reorder_count']} of {run['product_count']} products to reorder, "
+                f"{run['total_units']} units, est. cost {run['estimated_cost']:,.2f} ({run['duration_seconds']}s)"
+            )
+            for supplier_id, supplier in sorted(run['suppliers'].items(), key=lambda item: -item[1]['estimated_cost']):
+                self.stdout.write(
+                    f"{supplier_id} {supplier['supplier_name'] or ''}: {supplier['product_count']} products, "
+                    f"{supplier['total_units']} units, {supplier['estimated_cost']:,.2f}"
+                )
+            if options['dry_run']:
+                self.stdout.write(self.style.WARNING('Dry run - nothing stored'))
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Reorder forecast failed: {str(e)}'))
+            logger.error(f'Reorder forecast error: {str(e)}', exc_info=True)
+            raise
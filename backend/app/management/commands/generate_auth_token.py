@@ -2,6 +2,7 @@ import logging
 from django.core.management.base import BaseCommand
 from app.services.user_service import UserService
 from app.services.auth_services import AuthService
+from app.services.principal_cache_service import PRINCIPAL_USER
 from bson import ObjectId
 
 logger = logging.getLogger(__name__)
@@ -47,7 +48,8 @@ class Command(BaseCommand):
             token_data = {
                 "sub": user_id,
                 "email": mongo_user['email'],
-                "role": mongo_user.get('role', 'admin')
+                "role": mongo_user.get('role', 'admin'),
+                "ptype": PRINCIPAL_USER
             }
             
             # Generate tokens
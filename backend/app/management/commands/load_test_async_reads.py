@@ -0,0 +1,108 @@
+"""
+Django Management Command: Load Test Async Reads
+================================================
+Measures how many concurrent read requests one server process sustains on
+the sync (WSGI/DRF) endpoints versus their Motor-backed async twins under
+/api/v1/async/. For each endpoint pair and concurrency level it keeps that
+many requests in flight for --duration seconds and reports throughput,
+p50/p95 latency and errors.
+
+Run it against two single-process servers on the same database, so the
+numbers are per process:
+
+    gunicorn posbackend.wsgi --workers 1 --threads 4 --bind 127.0.0.1:8000
+    uvicorn posbackend.asgi:application --workers 1 --port 8001
+
+Usage:
+    python manage.py load_test_async_reads --sync-url http://127.0.0.1:8000 --async-url http://127.0.0.1:8001
+    python manage.py load_test_async_reads --token <JWT> --concurrency 1 10 50 100 --duration 15
+    python manage.py load_test_async_reads --endpoint products --endpoint sales-summary
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import statistics
+import threading
+import time
+
+import requests
+from django.core.management.base import BaseCommand
+
+# name -> (sync path, async path); both relative to /api/v1/
+ENDPOINTS = {
+    'sales-summary': ('sales-report/summary/?period=month', 'async/sales-report/summary/?period=month'),
+    'sales-transactions': ('sales-report/transactions/?limit=100', 'async/sales-report/transactions/?limit=100'),
+    'products': ('products/', 'async/products/'),
+    'customers': ('customers/?limit=50', 'async/customers/?limit=50'),
+    'notifications': ('notifications/?limit=50', 'async/notifications/?limit=50'),
+    'orders': ('online-orders/all/?limit=100', 'async/online-orders/all/?limit=100'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare concurrent-request capacity of sync vs async read endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sync-url', type=str, default='http://127.0.0.1:8000', help='Base URL of the WSGI server')
+        parser.add_argument('--async-url', type=str, default='http://127.0.0.1:8001', help='Base URL of the ASGI server')
+        parser.add_argument('--token', type=str, help='Bearer token for authenticated endpoints (orders)')
+        parser.add_argument('--endpoint', type=str, action='append', choices=sorted(ENDPOINTS), help='Endpoint to test (repeatable, default: all)')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50], help='Concurrent requests in flight')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per run')
+
+    def handle(self, *args, **options):
+        headers = {'Authorization': f"Bearer {options['token']}"} if options['token'] else {}
+
+        for name in options['endpoint'] or ENDPOINTS:
+            sync_path, async_path = ENDPOINTS[name]
+            self.stdout.write(self.style.SUCCESS(f'\n=== {name} ==='))
+            self.stdout.write(f"{'mode':>6} {'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7}")
+
+            for concurrency in options['concurrency']:
+                for mode, base_url, path in (
+                    ('sync', options['sync_url'], sync_path),
+                    ('async', options['async_url'], async_path),
+                ):
+                    url = f"{base_url.rstrip('/')}/api/v1/{path}"
+                    result = self._run(url, headers, concurrency, options['duration'])
+                    line = (
+                        f"{mode:>6} {concurrency:>5} {result['throughput']:>9.1f} "
+                        f"{result['p50']:>9.1f} {result['p95']:>9.1f} {result['errors']:>7}"
+                    )
+                    self.stdout.write(self.style.WARNING(line) if result['errors'] else line)
+
+    def _run(self, url, headers, concurrency, duration):
+        """Keep `concurrency` requests in flight for `duration` seconds"""
+        latencies, errors = [], 0
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+
+        def worker():
+            nonlocal errors
+            session = requests.Session()
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = session.get(url, headers=headers, timeout=60)
+                    ok = response.status_code < 400
+                except requests.RequestException:
+                    ok = False
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    if ok:
+                        latencies.append(elapsed)
+                    else:
+                        errors += 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for _ in range(concurrency):
+                executor.submit(worker)
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'throughput': len(latencies) / elapsed if elapsed else 0,
+            'p50': statistics.median(latencies) if latencies else 0,
+            'p95': latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else (latencies[-1] if latencies else 0),
+            'errors': errors,
+        }
@@ -0,0 +1,67 @@
+"""
+Django Management Command: Migrate Category Memberships
+=======================================================
+Moves product membership out of the embedded `sub_categories[].products[]`
+arrays in category documents and onto the products themselves
+(`category_id` + `subcategory_name`), strips the embedded arrays and
+rebuilds the per-subcategory product counters.
+
+Usage:
+    python manage.py migrate_category_memberships --dry-run         (preview only)
+    python manage.py migrate_category_memberships                   (migrate)
+    python manage.py migrate_category_memberships --rebuild-counts  (only recompute counters)
+"""
+
+from django.core.management.base import BaseCommand
+from app.services.category_membership_service import CategoryMembershipService
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Migrate embedded subcategory product arrays to product-level membership with counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would change without saving anything',
+        )
+        parser.add_argument(
+            '--rebuild-counts',
+            action='store_true',
+            help='Only recompute category product counters from the products collection',
+        )
+
+    def handle(self, *args, **options):
+        membership_service = CategoryMembershipService()
+
+        try:
+            if options['rebuild_counts']:
+                written = membership_service.rebuild_counts()
+                self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} category product counters'))
+                return
+
+            if options['dry_run']:
+                self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be saved'))
+
+            summary = membership_service.migrate_embedded_memberships(dry_run=options['dry_run'])
+
+            self.stdout.write(self.style.SUCCESS('\n=== Migration Summary ==='))
+            self.stdout.write(f"Categories with embedded products: {summary['categories_with_embedded_products']}")
+            self.stdout.write(f"Embedded product entries: {summary['embedded_entries']}")
+            self.stdout.write(f"Duplicate entries (last one kept): {summary['duplicate_entries']}")
+            self.stdout.write(f"Entries for missing products: {summary['missing_products']}")
+            self.stdout.write(f"Conflicts (product value kept): {summary['conflicts_kept_product_value']}")
+
+            if options['dry_run']:
+                self.stdout.write(self.style.WARNING(f"Would update: {summary['products_updated']} products"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"Updated: {summary['products_updated']} products"))
+                self.stdout.write(self.style.SUCCESS(f"Counters written: {summary['counters_written']}"))
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Migration failed: {str(e)}'))
+            logger.error(f'Category membership migration error: {str(e)}', exc_info=True)
+            raise
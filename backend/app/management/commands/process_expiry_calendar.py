@@ -0,0 +1,54 @@
+"""
+Django Management Command: Process Expiry Calendar
+==================================================
+Daily expiry job. Expires batches from today's expiry calendar bucket (and any
+buckets left over from missed runs), refreshes the affected product summaries
+in bulk and sends one consolidated notification.
+
+Batches created before the calendar existed are picked up by a one-off build
+the first time the calendar is read before it was ever built; --rebuild forces a full
+rebuild (e.g. after restoring batches from a backup).
+
+Schedule once a day shortly after midnight UTC, e.g. with cron:
+    5 0 * * * cd /path/to/backend && python manage.py process_expiry_calendar
+
+Usage:
+    python manage.py process_expiry_calendar            (run the daily job)
+    python manage.py process_expiry_calendar --rebuild  (rebuild calendar from batches first)
+"""
+
+from django.core.management.base import BaseCommand
+from app.services.expiry_calendar_service import ExpiryCalendarService
+
+
+class Command(BaseCommand):
+    help = 'Expire batches due today using the expiry calendar'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Rebuild the expiry calendar from the batches collection before processing'
+        )
+
+    def handle(self, *args, **options):
+        calendar_service = ExpiryCalendarService()
+
+        if options['rebuild']:
+            rebuilt = calendar_service.rebuild_calendar()
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Calendar rebuilt: {rebuilt['batches']} batches in {rebuilt['days']} day buckets"
+                )
+            )
+
+        result = calendar_service.process_due_expiries()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Expired {result['batches_expired']} batches "
+                f"({result['buckets_processed']} buckets), "
+                f"refreshed {result['products_refreshed']} products, "
+                f"flagged {result['products_flagged']} products for expiry alert"
+            )
+        )
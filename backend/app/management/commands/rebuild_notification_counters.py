@@ -0,0 +1,31 @@
+"""
+Django Management Command: Rebuild Notification Counters
+========================================================
+Recomputes the per-recipient and system-wide `notification_counters`
+(unread/read, active/archived) used for badge counts and notification stats.
+Counters are seeded automatically on first start; run this to repair drift.
+
+Usage:
+    python manage.py rebuild_notification_counters
+"""
+
+from django.core.management.base import BaseCommand
+from notifications.services import notification_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild maintained notification unread/archived counters'
+
+    def handle(self, *args, **options):
+        try:
+            scopes = notification_service.rebuild_counters()
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt notification counters for {scopes} scopes'))
+            self.stdout.write(f"System-wide: {notification_service.get_badge_counts()}")
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Rebuild failed: {str(e)}'))
+            logger.error(f'Notification counter rebuild error: {str(e)}', exc_info=True)
+            raise
@@ -0,0 +1,50 @@
+"""
+Django Management Command: Rebuild Product Sales Counters
+=========================================================
+Recomputes the per-product, per-day `product_sales_daily` counters used for
+top-selling items from `sales`, `online_transactions` and `sales_log`.
+Run once after deploying the counters, or to repair drift.
+
+Usage:
+    python manage.py rebuild_product_sales_counters                    (all days)
+    python manage.py rebuild_product_sales_counters --since 2025-01-01 (from a day onwards)
+"""
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from app.services.product_sales_counter_service import ProductSalesCounterService
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild per-product daily sales counters for top-selling items'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            type=str,
+            help='Only rebuild days from this date (YYYY-MM-DD)',
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('--since must be in YYYY-MM-DD format')
+
+        try:
+            scanned = ProductSalesCounterService().rebuild(since=since)
+
+            self.stdout.write(self.style.SUCCESS('\n=== Rebuild Summary ==='))
+            for source, count in scanned.items():
+                self.stdout.write(f'{source}: {count} transactions scanned')
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Rebuild failed: {str(e)}'))
+            logger.error(f'Product sales counter rebuild error: {str(e)}', exc_info=True)
+            raise
@@ -0,0 +1,56 @@
+"""
+Django Management Command: Rebuild Sales Facts
+==============================================
+Regenerates the line-level `sales_facts` collection (one document per sold
+line with date, hour, source, cashier, customer, product, category, amounts,
+COGS and voided flag) from `sales`, `online_transactions` and `sales_log`.
+Run once after deploying the facts (backfill), or to repair drift.
+
+Usage:
+    python manage.py rebuild_sales_facts                             (all transactions)
+    python manage.py rebuild_sales_facts --since 2025-01-01          (from a day onwards)
+    python manage.py rebuild_sales_facts --source sales_log
+"""
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from app.services.report_cache_service import report_cache
+from app.services.sales_fact_service import SOURCE_COLLECTIONS, SOURCES, sales_fact_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the line-level sales_facts collection used by sales reports'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            type=str,
+            help='Only rebuild transactions from this date (YYYY-MM-DD)',
+        )
+        parser.add_argument('--source', type=str, action='append', choices=SOURCES, help='Source to rebuild (repeatable, default: all)')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('--since must be in YYYY-MM-DD format')
+
+        try:
+            counts = sales_fact_service.rebuild(since=since, sources=options['source'])
+            # Cached reports over the rebuilt facts (closed ranges included) recompute
+            report_cache.record_history_write([SOURCE_COLLECTIONS[source][0] for source in counts])
+
+            self.stdout.write(self.style.SUCCESS('\n=== Rebuild Summary ==='))
+            for source, count in counts.items():
+                self.stdout.write(f"{source}: {count['transactions']} transactions, {count['facts']} facts")
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Rebuild failed: {str(e)}'))
+            logger.error(f'Sales fact rebuild error: {str(e)}', exc_info=True)
+            raise
@@ -0,0 +1,35 @@
+"""
+Django Management Command: Reconcile Sales Imports
+==================================================
+Counts CSV-imported sales_log rows whose counters, facts and report caches
+were never confirmed (a worker died between the insert and the counter
+update). Jobs that are resumed reconcile themselves; run this for failed
+jobs that will not be resumed.
+
+Usage:
+    python manage.py reconcile_sales_imports
+    python manage.py reconcile_sales_imports --job-id <job id>
+"""
+
+from django.core.management.base import BaseCommand
+from app.services.sales_import_service import SalesImportService
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Reconcile aggregates of imported sales rows left unconfirmed by a crash'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job-id', type=str, default=None, help='Only this import job')
+
+    def handle(self, *args, **options):
+        try:
+            rows = SalesImportService().reconcile_aggregates(options['job_id'])
+            self.stdout.write(self.style.SUCCESS(f'Reconciled {rows} imported row(s)'))
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Reconcile failed: {str(e)}'))
+            logger.error(f'Sales import reconcile error: {str(e)}', exc_info=True)
+            raise
@@ -0,0 +1,75 @@
+"""
+Django Management Command: Reconcile Shift Totals
+=================================================
+Audits the per-session running totals in `shift_totals` against the sales
+they cover (aggregated over the (cashier_id, transaction_date) index) and
+optionally rewrites drifted totals.
+
+Usage:
+    python manage.py reconcile_shift_totals --session SESS-00042
+    python manage.py reconcile_shift_totals --since 2025-01-01 --cashier USER-0003
+    python manage.py reconcile_shift_totals --since 2025-01-01 --fix
+"""
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from app.database import db_manager
+from app.services.shift_totals_service import shift_totals_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Reconcile per-session shift running totals against sales'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--session', type=str, help='Reconcile a single session ID')
+        parser.add_argument('--since', type=str, help='Reconcile sessions that started on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--cashier', type=str, help='Only sessions of this cashier (user ID)')
+        parser.add_argument('--fix', action='store_true', help='Overwrite drifted totals with the recomputed figures')
+
+    def handle(self, *args, **options):
+        if not options['session'] and not options['since']:
+            raise CommandError('Provide --session or --since')
+
+        if options['session']:
+            session_ids = [options['session']]
+        else:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('--since must be in YYYY-MM-DD format')
+
+            query = {'login_time': {'$gte': since}}
+            if options['cashier']:
+                query['user_id'] = options['cashier']
+            session_ids = [
+                session['_id'] for session in
+                db_manager.get_database().session_logs.find(query, {'_id': 1}).sort('login_time', 1)
+            ]
+
+        try:
+            drifted = 0
+            for session_id in session_ids:
+                result = shift_totals_service.reconcile_session(session_id, fix=options['fix'])
+                if result['differences']:
+                    drifted += 1
+                    recomputed = result['recomputed']
+                    self.stdout.write(self.style.WARNING(
+                        f"{session_id}: differs on {', '.join(result['differences'])} "
+                        f"(recomputed sales={recomputed['sales_count']} gross={recomputed['gross_sales']})"
+                        f"{' - fixed' if result['fixed'] else ''}"
+                    ))
+
+            self.stdout.write(self.style.SUCCESS(
+                f'\nReconciled {len(session_ids)} session(s), {drifted} with drift'
+            ))
+
+        except ValueError as e:
+            raise CommandError(str(e))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Reconciliation failed: {str(e)}'))
+            logger.error(f'Shift totals reconciliation error: {str(e)}', exc_info=True)
+            raise
@@ -0,0 +1,43 @@
+"""
+Django Management Command: Reconcile Stock States
+=================================================
+Reclassifies every product's maintained `stock_state` (ok / low / out) from
+its current stock and low stock threshold, and corrects states that drifted
+(e.g. after a direct database edit, an import script or a failed state
+write). No alerts are sent for corrected states.
+
+Usage:
+    python manage.py reconcile_stock_states
+    python manage.py reconcile_stock_states --dry-run
+"""
+
+from django.core.management.base import BaseCommand
+from app.services.stock_state_service import stock_state_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Recompute product stock states and fix drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without rewriting it')
+
+    def handle(self, *args, **options):
+        try:
+            result = stock_state_service.rebuild(dry_run=options['dry_run'])
+            for product_id in result['drifted_product_ids']:
+                self.stdout.write(self.style.WARNING(f"{product_id}: stock state drifted"))
+
+            action = 'would be corrected' if options['dry_run'] else 'corrected'
+            self.stdout.write(self.style.SUCCESS(
+                f"Checked {result['products_checked']} product(s), "
+                f"{len(result['drifted_product_ids'])} stock state(s) {action}"
+            ))
+            self.stdout.write(str(stock_state_service.get_state_counts()))
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Stock state reconcile failed: {str(e)}'))
+            logger.error(f'Stock state reconcile error: {str(e)}', exc_info=True)
+            raise
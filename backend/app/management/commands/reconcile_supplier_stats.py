@@ -0,0 +1,45 @@
+"""
+Django Management Command: Reconcile Supplier Stats
+===================================================
+Recomputes each supplier's `batch_stats` counters (batch counts by status,
+quantities received/remaining, stock value) from the batches collection and
+overwrites the ones that drifted. Schedule it periodically (e.g. nightly
+cron) to repair drift from out-of-band batch writes.
+
+Usage:
+    python manage.py reconcile_supplier_stats
+    python manage.py reconcile_supplier_stats --supplier SUPP-001
+    python manage.py reconcile_supplier_stats --dry-run
+"""
+
+from django.core.management.base import BaseCommand
+from app.services.supplier_stats_service import supplier_stats_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Reconcile maintained supplier batch counters against batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--supplier', type=str, action='append', help='Supplier ID to reconcile (repeatable, default: all)')
+        parser.add_argument('--dry-run', action='store_true', help='Report drifted suppliers without rewriting them')
+
+    def handle(self, *args, **options):
+        try:
+            result = supplier_stats_service.rebuild(options['supplier'], dry_run=options['dry_run'])
+
+            for supplier_id in result['drifted_supplier_ids']:
+                self.stdout.write(self.style.WARNING(f'{supplier_id}: counters drifted'))
+
+            action = 'would be corrected' if options['dry_run'] else 'corrected'
+            self.stdout.write(self.style.SUCCESS(
+                f"\nChecked {result['suppliers_checked']} supplier(s), "
+                f"{len(result['drifted_supplier_ids'])} {action}"
+            ))
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Reconciliation failed: {str(e)}'))
+            logger.error(f'Supplier stats reconciliation error: {str(e)}', exc_info=True)
+            raise
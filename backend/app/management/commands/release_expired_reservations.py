@@ -0,0 +1,50 @@
+"""
+Django Management Command: Release Expired Reservations
+=======================================================
+Releases every expired cart stock reservation in bulk and returns the held
+units to availability. The online-order scheduler already does this on
+every check; schedule the command (e.g. cron every few minutes) on
+deployments that run with the scheduler disabled. With --reconcile it also
+recomputes the per-product reserved totals from the open reservations.
+
+Usage:
+    python manage.py release_expired_reservations
+    python manage.py release_expired_reservations --reconcile
+    python manage.py release_expired_reservations --reconcile --dry-run
+"""
+
+from django.core.management.base import BaseCommand
+from app.services.stock_reservation_service import stock_reservation_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Release expired stock reservations and optionally reconcile reserved totals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reconcile', action='store_true', help='Recompute reserved totals from open reservations')
+        parser.add_argument('--dry-run', action='store_true', help='With --reconcile, report drift without rewriting it')
+
+    def handle(self, *args, **options):
+        try:
+            result = stock_reservation_service.release_expired()
+            self.stdout.write(self.style.SUCCESS(
+                f"Released {result['released_count']} expired reservation(s), "
+                f"{sum(result['units_released'].values())} unit(s) across {len(result['units_released'])} product(s)"
+            ))
+
+            if options['reconcile']:
+                drifted = stock_reservation_service.rebuild_reserved_quantities(dry_run=options['dry_run'])
+                for product_id, counts in drifted.items():
+                    self.stdout.write(self.style.WARNING(
+                        f"{product_id}: reserved {counts['stored']} -> {counts['expected']}"
+                    ))
+                action = 'would be corrected' if options['dry_run'] else 'corrected'
+                self.stdout.write(self.style.SUCCESS(f"{len(drifted)} reserved total(s) {action}"))
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Reservation release failed: {str(e)}'))
+            logger.error(f'Reservation release error: {str(e)}', exc_info=True)
+            raise
@@ -0,0 +1,104 @@
+"""
+Django Management Command: Run Retention
+========================================
+Applies the retention policies in app/services/retention_service.py: ensures
+TTL and date indexes, then archives aged notifications, session logs and
+audit logs to compressed day-partitioned JSONL files before deleting them
+from the hot collections in bounded chunks, and trims change-log entries
+every sync checkpoint has read past.
+
+Usage:
+    python manage.py run_retention                                   (all policies)
+    python manage.py run_retention --collections audit_logs --dry-run
+    python manage.py run_retention --chunk-size 500 --max-chunks 20
+    python manage.py run_retention --indexes-only
+    python manage.py run_retention --status
+    python manage.py run_retention --lookup audit_logs AUD-000123
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from bson import json_util
+from app.services.retention_service import RetentionService, RETENTION_POLICIES, DEFAULT_CHUNK_SIZE
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Archive aged documents to cold storage and apply TTL retention policies'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--collections',
+            nargs='+',
+            choices=list(RETENTION_POLICIES),
+            help='Collections to process (default: all)'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Documents per archive/delete batch')
+        parser.add_argument('--max-chunks', type=int, help='Stop after this many chunks per collection')
+        parser.add_argument('--indexes-only', action='store_true', help='Only create TTL/date indexes')
+        parser.add_argument('--status', action='store_true', help='Show hot collection sizes and archive totals')
+        parser.add_argument(
+            '--lookup',
+            nargs=2,
+            metavar=('COLLECTION', 'ID'),
+            help='Find a document in the archive'
+        )
+
+    def handle(self, *args, **options):
+        service = RetentionService()
+
+        try:
+            if options['status']:
+                for entry in service.get_status():
+                    self.stdout.write(str(entry))
+                return
+
+            if options['lookup']:
+                collection_name, doc_id = options['lookup']
+                try:
+                    docs = service.find_archived(collection_name, doc_id=doc_id)
+                except ValueError as e:
+                    raise CommandError(str(e))
+                if not docs:
+                    self.stdout.write(self.style.WARNING(f'{doc_id} not found in {collection_name} archive'))
+                for doc in docs:
+                    self.stdout.write(json_util.dumps(doc, indent=2))
+                return
+
+            for collection_name, result in service.ensure_indexes().items():
+                self.stdout.write(f'{collection_name}: {result}')
+            if options['indexes_only']:
+                return
+
+            results = service.run(
+                options['collections'],
+                dry_run=options['dry_run'],
+                chunk_size=options['chunk_size'],
+                max_chunks=options['max_chunks']
+            )
+
+            self.stdout.write(self.style.SUCCESS(f"\n=== Retention {'(dry run) ' if options['dry_run'] else ''}==="))
+            for collection_name, stats in results.items():
+                if 'error' in stats:
+                    self.stdout.write(self.style.ERROR(f"{collection_name}: {stats['error']}"))
+                elif stats.get('mode') == 'ttl':
+                    self.stdout.write(f'{collection_name}: expired by TTL index')
+                elif stats.get('mode') == 'trim':
+                    self.stdout.write(
+                        f"{collection_name}: eligible={stats['eligible']} deleted={stats['deleted']} "
+                        f"lowest_checkpoint={stats['lowest_checkpoint']}"
+                    )
+                else:
+                    self.stdout.write(
+                        f"{collection_name}: eligible={stats['eligible']} archived={stats['archived']} "
+                        f"deleted={stats['deleted']} files={len(stats['files'])}"
+                    )
+
+        except CommandError:
+            raise
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Retention failed: {str(e)}'))
+            logger.error(f'Retention error: {str(e)}', exc_info=True)
+            raise
@@ -0,0 +1,94 @@
+"""
+Django Management Command: Run Sync Engine
+==========================================
+Ships changes between the local MongoDB and Atlas for products, batches,
+sales, sales_log and customers. Each collection resumes from its persisted
+checkpoint (change stream resume token, or change log version on
+standalone local nodes); the first run of a collection does a full copy.
+
+Usage:
+    python manage.py run_sync_engine                                 (local -> cloud, once)
+    python manage.py run_sync_engine --direction to_local            (cloud -> local, once)
+    python manage.py run_sync_engine --follow --interval 5           (keep tailing)
+    python manage.py run_sync_engine --collections products batches
+    python manage.py run_sync_engine --resync products               (force a full copy)
+    python manage.py run_sync_engine --status
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from app.services.sync_engine_service import SyncEngineService, SYNC_COLLECTIONS, DIRECTIONS
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Incrementally sync products, batches, sales and customers between local MongoDB and Atlas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--direction', choices=DIRECTIONS, default='to_cloud', help='Sync direction')
+        parser.add_argument(
+            '--collections',
+            nargs='+',
+            choices=list(SYNC_COLLECTIONS),
+            help='Collections to sync (default: all)'
+        )
+        parser.add_argument('--follow', action='store_true', help='Keep running and ship changes as they happen')
+        parser.add_argument('--interval', type=int, default=5, help='Seconds to wait when idle (with --follow)')
+        parser.add_argument(
+            '--no-initial-copy',
+            action='store_true',
+            help='For collections without a checkpoint, start from now instead of copying everything'
+        )
+        parser.add_argument(
+            '--resync',
+            nargs='+',
+            choices=list(SYNC_COLLECTIONS),
+            help='Force a full copy of these collections'
+        )
+        parser.add_argument('--status', action='store_true', help='Show checkpoints and exit')
+
+    def handle(self, *args, **options):
+        try:
+            engine = SyncEngineService(options['direction'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        try:
+            if options['status']:
+                for checkpoint in engine.get_status():
+                    self.stdout.write(
+                        f"{checkpoint['collection']}: mode={checkpoint['mode']} "
+                        f"version={checkpoint['version']} resume_token={checkpoint['has_resume_token']} "
+                        f"needs_resync={checkpoint['needs_resync']} last_synced_at={checkpoint['last_synced_at']} "
+                        f"last_error={checkpoint['last_error']}"
+                    )
+                return
+
+            for collection_name in options['resync'] or []:
+                stats = engine.resync_collection(collection_name)
+                self.stdout.write(self.style.SUCCESS(f"Resynced {collection_name}: {stats}"))
+
+            if options['follow']:
+                self.stdout.write(self.style.SUCCESS(f"Sync engine {options['direction']} running (Ctrl+C to stop)"))
+                engine.run_forever(options['collections'], interval_seconds=options['interval'])
+                return
+
+            results = engine.run_once(
+                options['collections'],
+                initial_copy=not options['no_initial_copy']
+            )
+
+            self.stdout.write(self.style.SUCCESS(f"\n=== Sync {options['direction']} ==="))
+            for collection_name, stats in results.items():
+                if 'error' in stats:
+                    self.stdout.write(self.style.ERROR(f"{collection_name}: {stats['error']}"))
+                else:
+                    self.stdout.write(f"{collection_name}: {stats}")
+
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Sync engine stopped'))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Sync failed: {str(e)}'))
+            logger.error(f'Sync engine error: {str(e)}', exc_info=True)
+            raise
@@ -0,0 +1,58 @@
+"""
+Django Management Command: Snapshot Inventory Valuation
+=======================================================
+Daily valuation job. Values current stock batch by batch (FIFO cost, retail
+and expiring value per product and per category) in one aggregation and
+stores it as today's snapshot. Re-running on the same day replaces it.
+
+Schedule once a day, e.g. with cron just before midnight UTC so the snapshot
+reflects the day's closing stock (month-end valuation is then a lookup):
+    55 23 * * * cd /path/to/backend && python manage.py snapshot_inventory_valuation
+
+Usage:
+    python manage.py snapshot_inventory_valuation
+    python manage.py snapshot_inventory_valuation --compare-to 2026-09-30
+"""
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from app.services.inventory_valuation_service import inventory_valuation_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Store today\'s FIFO inventory valuation snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--compare-to', type=str, help='Also print the change since this date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        try:
+            snapshot = inventory_valuation_service.take_snapshot()
+            totals = snapshot['totals']
+            self.stdout.write(self.style.SUCCESS(
+                f"Snapshot {snapshot['_id']}: {totals['product_count']} products, "
+                f"{totals['quantity']} units, cost {totals['cost_value']:,.2f}, "
+                f"retail {totals['retail_value']:,.2f}, expiring {totals['expiring_value']:,.2f}"
+            ))
+
+            if options['compare_to']:
+                delta = inventory_valuation_service.get_delta(
+                    datetime.strptime(options['compare_to'], '%Y-%m-%d'), None, top_products=0
+                )
+                if not delta:
+                    self.stdout.write(self.style.WARNING(f"No snapshot on or before {options['compare_to']}"))
+                    return
+                change = delta['change']
+                self.stdout.write(
+                    f"Since {delta['from']['snapshot_id']}: {change['quantity']:+} units, "
+                    f"cost {change['cost_value']:+,.2f}, retail {change['retail_value']:+,.2f}"
+                )
+
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Inventory valuation snapshot failed: {str(e)}'))
+            logger.error(f'Inventory valuation snapshot error: {str(e)}', exc_info=True)
+            raise
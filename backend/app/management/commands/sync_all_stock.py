@@ -12,6 +12,7 @@ Usage:
 from django.core.management.base import BaseCommand
 from app.services.product_service import ProductService
 from app.services.batch_service import BatchService
+from app.services.stock_state_service import stock_state_service
 from datetime import datetime
 
 class Command(BaseCommand):
@@ -164,6 +165,9 @@ class Command(BaseCommand):
                     errors.append({'product_id': product.get('_id'), 'error': str(e)})
                     self.stderr.write(f"   ❌ Error: {e}")
             
+            if not dry_run:
+                stock_state_service.rebuild()
+            
             # Summary
             self.stdout.write("\n" + "=" * 80)
             if dry_run:
@@ -176,7 +176,7 @@ class Category:
             '_id': ObjectId(),
             'name': name,
             'description': description,
-            'products': [],  # Array of {product_id, product_name} objects
+            # Product membership is kept on the product (category_id + subcategory_name)
             'created_at': datetime.utcnow(),
             'updated_at': datetime.utcnow()
         }
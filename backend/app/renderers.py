@@ -0,0 +1,39 @@
+# app/renderers.py
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .bson_json import ORJSON_OPTIONS, json_default, orjson
+
+
+class BSONJSONEncoder(JSONEncoder):
+    """DRF's encoder plus ObjectId/Decimal128, used when orjson is unavailable"""
+
+    def default(self, obj):
+        try:
+            return json_default(obj)
+        except TypeError:
+            return super().default(obj)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSON renderer backed by orjson, serializing Mongo documents directly
+    (ObjectId, Decimal128 and datetimes need no per-service conversion).
+
+    Falls back to DRF's renderer (with the BSON-aware encoder) when orjson
+    is not installed, when the client asks for indented output, or when
+    orjson can't encode the data (e.g. integers beyond 64 bits).
+    """
+    encoder_class = BSONJSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            return orjson.dumps(data, default=json_default, option=ORJSON_OPTIONS)
+        except (TypeError, orjson.JSONEncodeError):
+            return super().render(data, accepted_media_type, renderer_context)
@@ -0,0 +1,564 @@
+import json
+import os
+from datetime import datetime, time, timedelta, timezone
+
+from decouple import config
+from pymongo import ReadPreference
+
+from ..database import db_manager
+from .sales_fact_service import GROUP_FIELDS, SOURCE_COLLECTIONS, SalesFactService
+import logging
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow is optional
+    pa = pc = pq = None
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_ROOT = config('ANALYTICS_SNAPSHOT_DIR', default=os.path.join('exports', 'analytics'))
+MANIFEST_FILE = '_manifest.json'
+PART_FILE = 'part-0.parquet'
+
+# Collection -> sales_facts source name (transaction keys match the fact keys)
+COLLECTION_SOURCES = {collection: source for source, (collection, _) in SOURCE_COLLECTIONS.items()}
+
+# Day-partitioned datasets a report range must be fully covered by
+PARTITIONED_DATASETS = ('transactions', 'lines')
+# Dimension snapshots (one full copy per export run)
+DIMENSION_DATASETS = ('products', 'batches')
+
+if pa:
+    SCHEMAS = {
+        'transactions': pa.schema([
+            ('transaction_key', pa.string()),
+            ('transaction_id', pa.string()),
+            ('collection', pa.string()),
+            ('source', pa.string()),
+            ('transaction_date', pa.timestamp('ms')),
+            ('final_amount', pa.float64()),
+            ('total_amount', pa.float64()),
+            ('total_discount', pa.float64()),
+            ('payment_method', pa.string()),
+            ('items_count', pa.int32()),
+            ('cashier_id', pa.string()),
+            ('customer_id', pa.string()),
+            ('status', pa.string()),
+            ('sales_type', pa.string()),
+            ('promotion_applied', pa.string()),
+            ('voided', pa.bool_()),
+        ]),
+        'lines': pa.schema([
+            ('fact_id', pa.string()),
+            ('transaction_key', pa.string()),
+            ('transaction_id', pa.string()),
+            ('line_no', pa.int32()),
+            ('source', pa.string()),
+            ('transaction_date', pa.timestamp('ms')),
+            ('date', pa.timestamp('ms')),
+            ('hour', pa.int8()),
+            ('cashier_id', pa.string()),
+            ('customer_id', pa.string()),
+            ('product_key', pa.string()),
+            ('product_id', pa.string()),
+            ('product_name', pa.string()),
+            ('category_id', pa.string()),
+            ('quantity', pa.float64()),
+            ('unit_price', pa.float64()),
+            ('gross_amount', pa.float64()),
+            ('discount', pa.float64()),
+            ('net_amount', pa.float64()),
+            ('cogs', pa.float64()),
+            ('gross_margin', pa.float64()),
+            ('voided', pa.bool_()),
+        ]),
+        'products': pa.schema([
+            ('product_id', pa.string()),
+            ('product_name', pa.string()),
+            ('SKU', pa.string()),
+            ('category_id', pa.string()),
+            ('cost_price', pa.float64()),
+            ('selling_price', pa.float64()),
+            ('stock', pa.float64()),
+            ('status', pa.string()),
+            ('is_deleted', pa.bool_()),
+        ]),
+        'batches': pa.schema([
+            ('batch_id', pa.string()),
+            ('batch_number', pa.string()),
+            ('product_id', pa.string()),
+            ('supplier_id', pa.string()),
+            ('quantity_received', pa.float64()),
+            ('quantity_remaining', pa.float64()),
+            ('cost_price', pa.float64()),
+            ('expiry_date', pa.timestamp('ms')),
+            ('date_received', pa.timestamp('ms')),
+            ('status', pa.string()),
+        ]),
+    }
+else:  # pragma: no cover
+    SCHEMAS = {}
+
+
+def _naive_utc(moment):
+    """Aware datetimes (e.g. parsed from '...Z' query params) as naive UTC, like the stored dates"""
+    if moment is not None and moment.tzinfo is not None:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def _day(moment):
+    return datetime.combine(moment.date(), time.min)
+
+
+def _partition_path(root, dataset, day):
+    return os.path.join(root, dataset, f"date={day.strftime('%Y-%m-%d')}", PART_FILE)
+
+
+def _text(value):
+    return str(value) if value is not None and value != '' else None
+
+
+class AnalyticsSnapshotService:
+    """
+    Nightly export of sales history to date-partitioned Parquet files.
+
+    Layout under ANALYTICS_SNAPSHOT_DIR (hive-style partitions):
+
+      transactions/date=YYYY-MM-DD/part-0.parquet  one row per sale/invoice/order
+      lines/date=YYYY-MM-DD/part-0.parquet         the day's `sales_facts` lines
+      products/date=YYYY-MM-DD/part-0.parquet      product dimension as of that run
+      batches/date=YYYY-MM-DD/part-0.parquet       batch dimension as of that run
+
+    Only closed (past UTC) days are exported. A run exports the days after
+    the last exported one, plus earlier days whose sales facts changed since
+    the previous run (late voids, edited or imported invoices), so each night
+    writes only new or stale partitions. Days without sales still get an
+    empty partition, so coverage of a range is a file-existence check.
+    Deleted invoices don't leave a changed fact behind; re-export those days
+    with `since`.
+
+    Reads go to a secondary when the deployment has one, and every file is
+    written to a temporary name and renamed, so a report never sees a half
+    written partition.
+    """
+
+    def __init__(self, root=None):
+        self.db = db_manager.get_database()
+        self.root = root or ANALYTICS_ROOT
+
+    def _collection(self, name):
+        """Export reads prefer a secondary so checkout traffic on the primary is untouched"""
+        return self.db[name].with_options(read_preference=ReadPreference.SECONDARY_PREFERRED)
+
+    # ================================================================
+    # MANIFEST
+    # ================================================================
+
+    def read_manifest(self):
+        try:
+            with open(os.path.join(self.root, MANIFEST_FILE)) as manifest_file:
+                manifest = json.load(manifest_file)
+            for field in ('exported_through', 'last_run_at'):
+                if manifest.get(field):
+                    manifest[field] = datetime.fromisoformat(manifest[field])
+            return manifest
+        except FileNotFoundError:
+            return {}
+
+    def _write_manifest(self, manifest):
+        path = os.path.join(self.root, MANIFEST_FILE)
+        with open(f"{path}.tmp", 'w') as manifest_file:
+            json.dump({
+                field: value.isoformat() if isinstance(value, datetime) else value
+                for field, value in manifest.items()
+            }, manifest_file, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+    # ================================================================
+    # ROWS
+    # ================================================================
+
+    @staticmethod
+    def _transaction_row(document, collection_name):
+        source = COLLECTION_SOURCES[collection_name]
+        sales_log = source == 'sales_log'
+        number = SalesFactService._number
+        items = document.get('item_list' if sales_log else 'items') or []
+        return {
+            'transaction_key': f"{source}:{document['_id']}",
+            'transaction_id': str(document['_id']),
+            'collection': collection_name,
+            'source': 'online' if source == 'online' else _text(document.get('source')),
+            'transaction_date': SalesFactService._as_datetime(document.get('transaction_date')),
+            'final_amount': number(document['final_amount']) if document.get('final_amount') is not None else None,
+            'total_amount': number(document.get('total_amount')),
+            'total_discount': number(document.get('total_discount')),
+            'payment_method': _text(document.get('payment_method')),
+            'items_count': len(items) if isinstance(items, list) else 1,
+            'cashier_id': _text(document.get('user_id') if sales_log else document.get('cashier_id')),
+            'customer_id': _text(document.get('customer_id')),
+            'status': _text(document.get('order_status') if source == 'online' else document.get('status')),
+            'sales_type': _text(document.get('sales_type')),
+            'promotion_applied': _text(document.get('promotion_applied')),
+            'voided': SalesFactService.is_voided(document, source),
+        }
+
+    @staticmethod
+    def _line_row(fact):
+        row = {field: fact.get(field) for field in SCHEMAS['lines'].names}
+        row['fact_id'] = fact['_id']
+        row['transaction_key'] = f"{fact['source']}:{fact['transaction_id']}"
+        return row
+
+    @staticmethod
+    def _product_row(product):
+        number = SalesFactService._number
+        return {
+            'product_id': str(product['_id']),
+            'product_name': _text(product.get('product_name')),
+            'SKU': _text(product.get('SKU')),
+            'category_id': _text(product.get('category_id')),
+            'cost_price': number(product.get('cost_price')),
+            'selling_price': number(product.get('selling_price')),
+            'stock': number(product.get('stock')),
+            'status': _text(product.get('status')),
+            'is_deleted': bool(product.get('isDeleted')),
+        }
+
+    @staticmethod
+    def _batch_row(batch):
+        number = SalesFactService._number
+        return {
+            'batch_id': str(batch['_id']),
+            'batch_number': _text(batch.get('batch_number')),
+            'product_id': _text(batch.get('product_id')),
+            'supplier_id': _text(batch.get('supplier_id')),
+            'quantity_received': number(batch.get('quantity_received')),
+            'quantity_remaining': number(batch.get('quantity_remaining')),
+            'cost_price': number(batch.get('cost_price')),
+            'expiry_date': SalesFactService._as_datetime(batch.get('expiry_date')),
+            'date_received': SalesFactService._as_datetime(batch.get('date_received')),
+            'status': _text(batch.get('status')),
+        }
+
+    def _write_partition(self, dataset, day, rows):
+        path = _partition_path(self.root, dataset, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = pa.Table.from_pylist(rows, schema=SCHEMAS[dataset])
+        pq.write_table(table, f"{path}.tmp", compression='zstd')
+        os.replace(f"{path}.tmp", path)
+        return len(rows)
+
+    # ================================================================
+    # EXPORT
+    # ================================================================
+
+    def export_day(self, day):
+        """Write the transactions and lines partitions of one UTC day"""
+        day = _day(day)
+        day_range = {'transaction_date': {'$gte': day, '$lt': day + timedelta(days=1)}}
+
+        transactions = [
+            self._transaction_row(document, collection_name)
+            for collection_name in COLLECTION_SOURCES
+            for document in self._collection(collection_name).find(day_range)
+        ]
+        lines = [self._line_row(fact) for fact in self._collection('sales_facts').find({'date': day})]
+
+        return {
+            'transactions': self._write_partition('transactions', day, transactions),
+            'lines': self._write_partition('lines', day, lines),
+        }
+
+    def export_dimensions(self, day):
+        """Full product and batch snapshots, partitioned by the export day"""
+        return {
+            'products': self._write_partition(
+                'products', day, [self._product_row(product) for product in self._collection('products').find({})]
+            ),
+            'batches': self._write_partition(
+                'batches', day, [self._batch_row(batch) for batch in self._collection('batches').find({})]
+            ),
+        }
+
+    def _first_sales_day(self):
+        first = self._collection('sales_facts').find_one({}, {'date': 1}, sort=[('date', 1)])
+        return first['date'] if first else None
+
+    def pending_days(self, since=None, now=None):
+        """
+        Days the next run would (re-)export.
+
+        Returns:
+            list: new closed days after the last exported one (or from
+            `since` / the first sale), plus earlier days whose facts changed
+            since the last run
+        """
+        today = _day(now or datetime.utcnow())
+        manifest = self.read_manifest()
+
+        days = set()
+        if since:
+            start = _day(since)
+        elif manifest.get('exported_through'):
+            start = manifest['exported_through'] + timedelta(days=1)
+        else:
+            start = self._first_sales_day()
+
+        if start:
+            day = _day(start)
+            while day < today:
+                days.add(day)
+                day += timedelta(days=1)
+
+        if manifest.get('last_run_at') and not since:
+            days.update(
+                _day(day) for day in self._collection('sales_facts').distinct(
+                    'date', {'updated_at': {'$gte': manifest['last_run_at']}, 'date': {'$lt': today}}
+                )
+            )
+        return sorted(days)
+
+    def export(self, since=None, now=None):
+        """
+        Incremental export run.
+
+        Args:
+            since: re-export every day from this date (default: only new and stale days)
+
+        Returns:
+            dict: days exported and row counts per dataset
+        """
+        if pa is None:
+            raise Exception("Analytics snapshots need pyarrow (pip install pyarrow)")
+        try:
+            run_started_at = datetime.utcnow()
+            today = _day(now or run_started_at)
+            manifest = self.read_manifest()
+            days = self.pending_days(since=since, now=today)
+
+            rows = {dataset: 0 for dataset in PARTITIONED_DATASETS + DIMENSION_DATASETS}
+            for day in days:
+                for dataset, count in self.export_day(day).items():
+                    rows[dataset] += count
+
+            last_closed_day = today - timedelta(days=1)
+            rows.update(self.export_dimensions(last_closed_day))
+
+            exported_through = manifest.get('exported_through')
+            if days and (not exported_through or days[-1] > exported_through):
+                exported_through = days[-1]
+            self._write_manifest({
+                'exported_through': exported_through,
+                # Facts changed while this run was reading are picked up by the next one
+                'last_run_at': run_started_at,
+                'dimensions_date': last_closed_day.strftime('%Y-%m-%d'),
+            })
+
+            logger.info(f"Analytics export: {len(days)} day(s), rows {rows}")
+            return {'days': [day.strftime('%Y-%m-%d') for day in days], 'rows': rows}
+
+        except Exception as e:
+            logger.error(f"Error exporting analytics snapshots: {str(e)}")
+            raise Exception(f"Error exporting analytics snapshots: {str(e)}")
+
+
+class SnapshotReportEngine:
+    """
+    Answers historical report queries from the Parquet snapshots.
+
+    Partitions are memory-mapped Arrow tables; filters and group-bys run
+    vectorized in Arrow compute. `covers` tells callers whether a range can
+    be served offline (pyarrow installed and every day of a closed range has
+    its partitions); otherwise they keep querying MongoDB. Results use the
+    same shapes as the live services.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or ANALYTICS_ROOT
+
+    def covers(self, start_date, end_date, datasets=PARTITIONED_DATASETS):
+        """True when [start_date, end_date] is closed and fully exported"""
+        start_date, end_date = _naive_utc(start_date), _naive_utc(end_date)
+        if pa is None or not start_date or not end_date or start_date > end_date:
+            return False
+        if end_date >= _day(datetime.utcnow()):
+            return False
+        day = _day(start_date)
+        while day <= end_date:
+            if not all(os.path.exists(_partition_path(self.root, dataset, day)) for dataset in datasets):
+                return False
+            day += timedelta(days=1)
+        return True
+
+    def covers_range(self, date_range, datasets=PARTITIONED_DATASETS):
+        """`covers` for a {'start', 'end'} date range dict (None = all time, not covered)"""
+        return bool(date_range) and self.covers(date_range.get('start'), date_range.get('end'), datasets)
+
+    def _read(self, dataset, start_date, end_date, columns=None):
+        """The range's partitions as one table, filtered to the exact timestamps"""
+        start_date, end_date = _naive_utc(start_date), _naive_utc(end_date)
+        tables = []
+        day = _day(start_date)
+        while day <= end_date:
+            tables.append(pq.read_table(_partition_path(self.root, dataset, day), columns=columns, memory_map=True))
+            day += timedelta(days=1)
+        table = pa.concat_tables(tables) if tables else SCHEMAS[dataset].empty_table()
+        timestamp = pa.timestamp('ms')
+        mask = pc.and_(
+            pc.greater_equal(table['transaction_date'], pa.scalar(start_date, type=timestamp)),
+            pc.less_equal(table['transaction_date'], pa.scalar(end_date, type=timestamp))
+        )
+        return table.filter(mask)
+
+    @staticmethod
+    def _filter(table, conditions):
+        """Apply simple Mongo-style conditions: value, {'$in': [...]}, {'$ne': value}"""
+        for field, condition in conditions.items():
+            column = table[field]
+            if isinstance(condition, dict) and '$in' in condition:
+                mask = pc.is_in(column, value_set=pa.array(list(condition['$in']), type=column.type))
+            elif isinstance(condition, dict) and '$ne' in condition:
+                if condition['$ne'] is None:
+                    mask = pc.is_valid(column)
+                else:
+                    mask = pc.fill_null(pc.not_equal(column, condition['$ne']), True)
+            elif condition is None:
+                mask = pc.is_null(column)
+            else:
+                mask = pc.fill_null(pc.equal(column, condition), False)
+            table = table.filter(mask)
+        return table
+
+    @staticmethod
+    def _sum(table, field):
+        return pc.sum(pc.fill_null(table[field], 0)).as_py() or 0
+
+    # ================================================================
+    # REPORTS
+    # ================================================================
+
+    def summarize_by(self, group_by, start_date=None, end_date=None, sources=None, include_voided=False,
+                     sort_by='net_amount', limit=None, **filters):
+        """Same contract and rows as SalesFactService.summarize_by, from the lines snapshots"""
+        try:
+            field = GROUP_FIELDS[group_by]
+            conditions = {field: value for field, value in filters.items() if value is not None}
+            if not include_voided:
+                conditions['voided'] = False
+            if sources:
+                conditions['source'] = {'$in': list(sources)}
+            table = self._filter(self._read('lines', start_date, end_date), conditions)
+
+            grouped = table.group_by(field).aggregate([
+                ('quantity', 'sum'),
+                ('gross_amount', 'sum'),
+                ('discount', 'sum'),
+                ('net_amount', 'sum'),
+                ('cogs', 'sum'),
+                ('fact_id', 'count'),
+                ('product_key', 'count_distinct'),
+                ('transaction_key', 'count_distinct'),
+                ('product_name', 'max'),
+                ('product_id', 'max'),
+                ('category_id', 'max'),
+            ])
+
+            rows = []
+            for row in grouped.to_pylist():
+                net_amount = round(row['net_amount_sum'] or 0, 2)
+                cogs = round(row['cogs_sum'] or 0, 2)
+                rows.append({
+                    group_by: row[field],
+                    'product_id': row['product_id_max'],
+                    'product_name': row['product_name_max'],
+                    'category_id': row['category_id_max'],
+                    'quantity': round(row['quantity_sum'] or 0, 2),
+                    'gross_amount': round(row['gross_amount_sum'] or 0, 2),
+                    'discount': round(row['discount_sum'] or 0, 2),
+                    'net_amount': net_amount,
+                    'cogs': cogs,
+                    'gross_margin': round(net_amount - cogs, 2),
+                    'line_count': row['fact_id_count'],
+                    'product_count': row['product_key_count_distinct'],
+                    'transaction_count': row['transaction_key_count_distinct']
+                })
+
+            rows.sort(key=lambda row: row.get(sort_by) or 0, reverse=True)
+            return rows[:limit] if limit else rows
+
+        except Exception as e:
+            logger.error(f"Error summarizing sales snapshots by {group_by}: {str(e)}")
+            raise Exception(f"Error summarizing sales snapshots by {group_by}: {str(e)}")
+
+    def sales_totals(self, date_range, include_source=None, preview=10):
+        """
+        POS (`sales`) and sales_log totals for SalesReport's summary.
+
+        Returns:
+            dict: 'pos' and 'log' totals in SalesReport's `_calculate_*_totals`
+            shape, and 'recent' - the latest `preview` transactions of each
+        """
+        try:
+            table = self._read('transactions', date_range['start'], date_range['end'])
+            if include_source:
+                table = self._filter(table, {'source': {'$in': list(include_source)}})
+
+            pos = self._filter(table, {'collection': 'sales'})
+            # Fully returned sales stay in the preview but are not revenue
+            kept = self._filter(pos, {'status': {'$ne': 'returned'}})
+            log = self._filter(table, {'collection': 'sales_log'})
+            log_revenue = self._sum(log, 'total_amount')
+
+            recent = []
+            for collection_table, collection_name in ((pos, 'sales'), (log, 'sales_log')):
+                latest = collection_table.sort_by([('transaction_date', 'descending')]).slice(0, preview)
+                for row in latest.to_pylist():
+                    recent.append(self._preview_row(row, collection_name))
+
+            return {
+                'pos': {
+                    'count': kept.num_rows,
+                    'revenue': self._sum(kept, 'final_amount'),
+                    'gross': self._sum(kept, 'total_amount'),
+                    'discounts': self._sum(kept, 'total_discount'),
+                },
+                'log': {'count': log.num_rows, 'revenue': log_revenue, 'gross': log_revenue},
+                'recent': recent,
+            }
+
+        except Exception as e:
+            logger.error(f"Error getting sales totals from snapshots: {str(e)}")
+            raise Exception(f"Error getting sales totals from snapshots: {str(e)}")
+
+    @staticmethod
+    def _preview_row(row, collection_name):
+        """Transaction preview in SalesReport's `_normalize_*_transaction` format"""
+        if collection_name == 'sales':
+            return {
+                '_id': row['transaction_id'],
+                'transaction_date': row['transaction_date'],
+                'total_amount': row['final_amount'] or 0,
+                'source': 'pos',
+                'payment_method': row['payment_method'] or 'cash',
+                'items_count': row['items_count'],
+                'cashier_id': row['cashier_id'],
+                'promotion_applied': row['promotion_applied']
+            }
+        return {
+            '_id': row['transaction_id'],
+            'transaction_date': row['transaction_date'],
+            'total_amount': row['total_amount'],
+            'source': row['source'] or 'manual',
+            'payment_method': row['payment_method'] or 'cash',
+            'items_count': row['items_count'],
+            'user_id': row['cashier_id'],
+            'sales_type': row['sales_type'] or 'retail'
+        }
+
+
+analytics_snapshot_service = AnalyticsSnapshotService()
+analytics_engine = SnapshotReportEngine()
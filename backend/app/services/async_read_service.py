@@ -0,0 +1,210 @@
+import asyncio
+from datetime import datetime
+import logging
+
+from ..async_database import async_db_manager
+from .customer_service import CustomerService
+from .product_service import ProductService
+from .pos.online_transactions_services import OnlineTransactionService
+from .pos.salesReport import SalesReport
+from notifications.services import NotificationService
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncReadService:
+    """
+    Motor-backed versions of the read-heavy service methods, for the async
+    views served under ASGI.
+
+    Each method issues the same queries as its sync counterpart - the filter,
+    projection and result shaping are the sync services' own static helpers -
+    but awaits the driver instead of blocking a worker thread, so one process
+    keeps serving other requests while Mongo answers. Writes stay on the sync
+    services.
+    """
+
+    @property
+    def db(self):
+        # Resolved per call: Motor handles are bound to the running event loop
+        return async_db_manager.get_database()
+
+    # ================================================================
+    # SALES REPORTS
+    # ================================================================
+
+    @property
+    def sales_db(self):
+        # SalesReport always reads the pos_system database
+        return async_db_manager.get_database('pos_system')
+
+    async def get_sales_summary(self, date_range=None, include_source=None):
+        """Async SalesReport.get_sales_summary; both collections are read concurrently"""
+        try:
+            query = SalesReport._build_match(date_range, include_source)
+            pos_sales, log_sales = await asyncio.gather(
+                self.sales_db.sales.find(query).to_list(length=None),
+                self.sales_db.sales_log.find(query).to_list(length=None)
+            )
+            return SalesReport._summarize(pos_sales, log_sales, date_range, include_source)
+
+        except Exception as e:
+            raise Exception(f"Error getting sales summary: {str(e)}")
+
+    async def get_sales_transactions(self, date_range=None, include_source=None, limit=100):
+        """Async SalesReport.get_sales_transactions"""
+        try:
+            query = SalesReport._build_match(date_range, include_source)
+            pos_sales, log_sales = await asyncio.gather(
+                self.sales_db.sales.find(query).to_list(length=None),
+                self.sales_db.sales_log.find(query).to_list(length=None)
+            )
+            transactions = SalesReport._unify_transactions(pos_sales, log_sales)
+            if limit:
+                transactions = transactions[:limit]
+            return SalesReport._transactions_result(transactions, date_range, include_source, limit)
+
+        except Exception as e:
+            raise Exception(f"Error getting sales transactions: {str(e)}")
+
+    async def get_todays_sales(self):
+        return await self.get_sales_summary(SalesReport._today_range())
+
+    async def get_weekly_sales(self):
+        date_range, week_info = SalesReport._week_range()
+        result = await self.get_sales_summary(date_range)
+        result['week_info'] = week_info
+        return result
+
+    async def get_monthly_sales(self):
+        date_range, month_info = SalesReport._month_range()
+        result = await self.get_sales_summary(date_range)
+        result['month_info'] = month_info
+        return result
+
+    # ================================================================
+    # PRODUCTS
+    # ================================================================
+
+    async def get_all_products(self, filters=None, include_deleted=False, include_images=True):
+        """Async ProductService.get_all_products"""
+        try:
+            query = ProductService._products_query(filters, include_deleted)
+            projection = ProductService._products_projection(include_images)
+
+            products = await self.db.products.find(query, projection).sort('product_name', 1).to_list(length=None)
+
+            now = datetime.utcnow()
+            all_batches = await self.db.batches.find({
+                'product_id': {'$in': [p['_id'] for p in products]},
+                'status': 'active',
+                'quantity_remaining': {'$gt': 0}
+            }).to_list(length=None)
+
+            return ProductService._apply_batch_stock(products, all_batches, now)
+
+        except Exception as e:
+            raise Exception(f"Error getting products: {str(e)}")
+
+    # ================================================================
+    # CUSTOMERS
+    # ================================================================
+
+    async def get_customers(self, page=1, limit=50, status=None, min_loyalty_points=None, max_loyalty_points=None, include_deleted=False, sort_by=None, search=None):
+        """Async CustomerService.get_customers; the page and the count run concurrently"""
+        try:
+            query = CustomerService._customers_query(status, min_loyalty_points, max_loyalty_points, include_deleted, search)
+            sort_options = CustomerService._customers_sort(sort_by)
+            skip = (page - 1) * limit
+
+            customers, total = await asyncio.gather(
+                self.db.customers.find(query).sort(sort_options).skip(skip).limit(limit).to_list(length=None),
+                self.db.customers.count_documents(query)
+            )
+
+            return {
+                'customers': customers,
+                'total': total,
+                'page': page,
+                'limit': limit,
+                'has_more': skip + limit < total,
+                'filters_applied': {
+                    'status': status,
+                    'min_loyalty_points': min_loyalty_points,
+                    'max_loyalty_points': max_loyalty_points,
+                    'include_deleted': include_deleted,
+                    'search': search
+                }
+            }
+
+        except Exception as e:
+            raise Exception(f"Error getting customers: {str(e)}")
+
+    async def get_customer_by_id(self, customer_id, include_deleted=False):
+        """Async CustomerService.get_customer_by_id"""
+        try:
+            if not customer_id:
+                return None
+
+            query = {'_id': customer_id}
+            if not include_deleted:
+                query['isDeleted'] = {'$ne': True}
+
+            return await self.db.customers.find_one(query)
+
+        except Exception as e:
+            raise Exception(f"Error getting customer: {str(e)}")
+
+    # ================================================================
+    # NOTIFICATIONS
+    # ================================================================
+
+    async def get_notifications(self, recipient_id=None, notification_type=None, is_read=None, limit=50, include_archived=False):
+        """Async NotificationService.get_notifications"""
+        query = NotificationService._notifications_query(recipient_id, notification_type, is_read, include_archived)
+        notifications = await self.db.notifications.find(query).sort('created_at', -1).limit(limit).to_list(length=None)
+        return NotificationService._format_notifications(notifications)
+
+    async def get_notification_counts(self, recipient_id=None):
+        """Async NotificationService.get_counters (maintained counters, one document read)"""
+        doc = await self.db.notification_counters.find_one({'_id': NotificationService._counter_scope(recipient_id)}) or {}
+        return NotificationService._counters_from_doc(doc)
+
+    # ================================================================
+    # ONLINE ORDERS
+    # ================================================================
+
+    async def get_order_by_id(self, order_id):
+        """Async OnlineTransactionService.get_order_by_id"""
+        try:
+            return await self.db.online_transactions.find_one({'_id': order_id})
+
+        except Exception as e:
+            logger.error(f"Error fetching order: {str(e)}")
+            return None
+
+    async def get_customer_orders(self, customer_id, status=None, limit=50):
+        """Async OnlineTransactionService.get_customer_orders"""
+        try:
+            query = {'customer_id': customer_id}
+            if status:
+                query['order_status'] = status
+
+            return await self.db.online_transactions.find(query).sort('transaction_date', -1).limit(limit).to_list(length=None)
+
+        except Exception as e:
+            logger.error(f"Error fetching customer orders: {str(e)}")
+            return []
+
+    async def get_all_orders(self, filters=None, limit=100):
+        """Async OnlineTransactionService.get_all_orders"""
+        try:
+            query = OnlineTransactionService._orders_query(filters)
+            return await self.db.online_transactions.find(query).sort('transaction_date', -1).limit(limit).to_list(length=None)
+
+        except Exception as e:
+            logger.error(f"Error fetching orders: {str(e)}")
+            return []
+
+
+async_read_service = AsyncReadService()
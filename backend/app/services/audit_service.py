@@ -549,6 +549,29 @@ class AuditLogService:
             }
         )
 
+    def log_sale_reversals(self, user_data, operation_id, results, stock_restored, points_refunded):
+        """Log one void/return request - every sale it touched, stock and points put back - as a single entry"""
+        applied = [result for result in results if result.get('status') == 'applied']
+        return self._create_audit_log(
+            event_type="sale_void_return",
+            user_data=user_data,
+            target_data={
+                "type": "sale",
+                "id": operation_id,
+                "name": f"Void/Return - {len(applied)} sale(s)"
+            },
+            metadata={
+                "action": "sale_void_return",
+                "module": "sales",
+                "success_count": len(applied),
+                "failure_count": len(results) - len(applied),
+                "refund_amount": round(sum(result.get('refund_amount', 0) for result in applied), 2),
+                "results": results,
+                "stock_restored": stock_restored,
+                "points_refunded": points_refunded
+            }
+        )
+
     # ========================================
     # QUERY & REPORTING METHODS
     # ========================================
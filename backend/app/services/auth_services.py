@@ -4,6 +4,7 @@ import bcrypt
 from decouple import config
 from django.conf import settings
 from ..database import db_manager
+from .principal_cache_service import PRINCIPAL_USER, principal_cache
 
 
 def _resolve_secret_key():
@@ -138,7 +139,7 @@ class AuthService:
             
             # Create tokens
             print(f"🎫 Creating JWT tokens...")
-            token_data = {"sub": user_id, "email": user["email"], "role": user["role"]}
+            token_data = {"sub": user_id, "email": user["email"], "role": user["role"], "ptype": PRINCIPAL_USER}
             print(f"🎫 Token data: {token_data}")
             
             access_token = self.create_access_token(token_data)
@@ -223,6 +224,7 @@ class AuthService:
                 "token": clean_token,
                 "blacklisted_at": datetime.utcnow()
             })
+            principal_cache.revoke_token(clean_token)
             
             return {"message": "Successfully logged out"}
         except Exception as e:
@@ -285,7 +287,7 @@ class AuthService:
                 raise Exception("User not found")
             
             # Create new access token
-            token_data = {"sub": user_id, "email": user["email"], "role": user["role"]}
+            token_data = {"sub": user_id, "email": user["email"], "role": user["role"], "ptype": PRINCIPAL_USER}
             new_access_token = self.create_access_token(token_data)
             
             return {
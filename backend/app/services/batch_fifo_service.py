@@ -1,5 +1,6 @@
-from datetime import datetime, timedelta
 from ..database import db_manager
+from .expiry_calendar_service import ExpiryCalendarService
+from .supplier_stats_service import supplier_stats_service
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,6 +16,7 @@ class BatchFIFOService:
         self.db = db_manager.get_database()
         self.batches_collection = self.db.batches  # ✅ Note: batches_collection with 's'
         self.products_collection = self.db.products
+        self.expiry_calendar = ExpiryCalendarService()
     
     # ================================================================
     # FIFO STOCK DEDUCTION (Main POS Function)
@@ -71,6 +73,7 @@ class BatchFIFOService:
                 )
             
             batch_deductions = []
+            stats_changes = []
             remaining_quantity = quantity_needed
             
             for batch in batches:
@@ -100,19 +103,21 @@ class BatchFIFOService:
                 }
                 
                 # ✅ FIXED: Changed batch_collection to batches_collection
+                batch_updates = {
+                    'quantity_remaining': new_quantity,
+                    'status': 'depleted' if new_quantity == 0 else 'active',
+                    'updated_at': transaction_date
+                }
                 self.batches_collection.update_one(
                     {'_id': batch['_id']},
                     {
-                        '$set': {
-                            'quantity_remaining': new_quantity,
-                            'status': 'depleted' if new_quantity == 0 else 'active',
-                            'updated_at': transaction_date
-                        },
+                        '$set': batch_updates,
                         '$push': {
                             'usage_history': usage_entry
                         }
                     }
                 )
+                stats_changes.append((batch, {**batch, **batch_updates}))
                 
                 # Track batch usage for transaction record
                 batch_deductions.append({
@@ -130,6 +135,9 @@ class BatchFIFOService:
                 else:
                     print(f"      ✅ Updated\n")
             
+            self.expiry_calendar.sync_batches([d['batch_id'] for d in batch_deductions])
+            supplier_stats_service.record_batch_changes(stats_changes)
+            
             print(f"{'='*60}")
             print(f"✅ FIFO deduction complete")
             print(f"   Used {len(batch_deductions)} batches")
@@ -209,6 +217,7 @@ class BatchFIFOService:
                 print(f"   Reason: {transaction_info.get('reason', 'N/A')}")
             print(f"{'='*60}\n")
             
+            stats_changes = []
             for batch_info in batches_used:
                 batch_id = batch_info['batch_id']
                 quantity_to_restore = batch_info['quantity_deducted']
@@ -241,22 +250,27 @@ class BatchFIFOService:
                 }
                 
                 # ✅ FIXED: Changed batch_collection to batches_collection
+                batch_updates = {
+                    'quantity_remaining': new_quantity,
+                    'status': 'active',  # Reactivate if was depleted
+                    'updated_at': transaction_date
+                }
                 self.batches_collection.update_one(
                     {'_id': batch_id},
                     {
-                        '$set': {
-                            'quantity_remaining': new_quantity,
-                            'status': 'active',  # Reactivate if was depleted
-                            'updated_at': transaction_date
-                        },
+                        '$set': batch_updates,
                         '$push': {
                             'usage_history': usage_entry
                         }
                     }
                 )
+                stats_changes.append((batch, {**batch, **batch_updates}))
                 
                 print(f"      ✅ Restored\n")
             
+            self.expiry_calendar.sync_batches([b['batch_id'] for b in batches_used])
+            supplier_stats_service.record_batch_changes(stats_changes)
+            
             print(f"{'='*60}")
             print(f"✅ Stock restoration complete")
             print(f"{'='*60}\n")
@@ -300,15 +314,19 @@ class BatchFIFOService:
             List of batches near expiry
         """
         try:
-            threshold_date = datetime.utcnow() + timedelta(days=days_threshold)
+            # Includes overdue batches the daily expiry job has not processed yet
+            entries = self.expiry_calendar.get_calendar_entries(days_threshold, include_overdue=True)
+            if not entries:
+                return []
             
-            batches = list(self.batches_collection.find({
-                'status': 'active',
-                'quantity_remaining': {'$gt': 0},
-                'expiry_date': {'$lte': threshold_date}
-            }).sort('expiry_date', 1))
+            batches_by_id = {
+                batch['_id']: batch
+                for batch in self.batches_collection.find({
+                    '_id': {'$in': [entry['batch_id'] for entry in entries]}
+                })
+            }
             
-            return batches
+            return [batches_by_id[entry['batch_id']] for entry in entries if entry['batch_id'] in batches_by_id]
             
         except Exception as e:
             logger.error(f"❌ Get near-expiry batches failed: {str(e)}")
@@ -1,6 +1,10 @@
 from datetime import datetime, timedelta
+from pymongo import UpdateOne
 from ..database import db_manager
 from notifications.services import notification_service
+from .expiry_calendar_service import ExpiryCalendarService
+from .change_log_service import change_log_service
+from .supplier_stats_service import supplier_stats_service
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,6 +17,7 @@ class BatchService:
         self.supplier_collection = self.db.suppliers
         # ✅ Enhanced: Add products_collection for FIFO operations
         self.products_collection = self.db.products
+        self.expiry_calendar = ExpiryCalendarService()
         
     def validate_foreign_keys(self, batch_data):
         """Validate that foreign key references exist"""
@@ -261,6 +266,9 @@ class BatchService:
             
             # Insert batch
             self.batch_collection.insert_one(batch_document)
+            self.expiry_calendar.sync_batches([batch_id])
+            change_log_service.record_changes('batches', [batch_id])
+            supplier_stats_service.record_batch_created(batch_document)
             
             # Update product's simplified expiry tracking (only counts active batches)
             self.update_product_expiry_summary(batch_data['product_id'])
@@ -310,71 +318,7 @@ class BatchService:
     def update_product_expiry_summary(self, product_id):
         """Update product's simplified expiry tracking fields"""
         try:
-            # Get active batches for this product
-            active_batches = list(self.batch_collection.find({
-                'product_id': product_id,
-                'status': 'active',
-                'quantity_remaining': {'$gt': 0}
-            }).sort('expiry_date', 1))
-            
-            # Filter out expired batches based on expiry_date
-            now = datetime.utcnow()
-            non_expired_batches = []
-            for batch in active_batches:
-                if batch.get('expiry_date'):
-                    # Skip if expired
-                    if batch['expiry_date'] < now:
-                        continue
-                non_expired_batches.append(batch)
-            
-            # Calculate summary fields
-            update_data = {}
-            
-            if non_expired_batches:
-                # Get expiry dates (filter out None values)
-                expiry_dates = [batch['expiry_date'] for batch in non_expired_batches if batch.get('expiry_date')]
-
-                if expiry_dates:
-                    update_data['oldest_batch_expiry'] = min(expiry_dates)
-                    update_data['newest_batch_expiry'] = max(expiry_dates)
-
-                    # Check if any batch is expiring within 30 days
-                    warning_date = datetime.utcnow() + timedelta(days=30)
-                    update_data['expiry_alert'] = any(exp_date <= warning_date for exp_date in expiry_dates)
-                else:
-                    # No expiry dates available
-                    update_data['oldest_batch_expiry'] = None
-                    update_data['newest_batch_expiry'] = None
-                    update_data['expiry_alert'] = False
-
-                # Calculate total stock from non-expired active batches
-                total_stock = sum(batch['quantity_remaining'] for batch in non_expired_batches)
-                update_data['total_stock'] = total_stock
-                update_data['stock'] = total_stock  # Sync stock field with total_stock
-
-                # Update cost_price from oldest non-expired batch (FIFO)
-                # non_expired_batches is already sorted by expiry_date (oldest first)
-                oldest_batch = non_expired_batches[0]
-                update_data['cost_price'] = oldest_batch.get('cost_price', 0)
-            else:
-                # No active non-expired batches
-                update_data.update({
-                    'oldest_batch_expiry': None,
-                    'newest_batch_expiry': None,
-                    'expiry_alert': False,
-                    'total_stock': 0,
-                    'stock': 0,
-                    'cost_price': 0
-                })
-            
-            update_data['updated_at'] = datetime.utcnow()
-            
-            # Update product
-            self.product_collection.update_one(
-                {'_id': product_id},
-                {'$set': update_data}
-            )
-            
+            self.expiry_calendar.refresh_product_summaries([product_id])
             return True
         
         except Exception as e:
@@ -382,52 +326,33 @@ class BatchService:
             return False
 
     def get_expiring_batches(self, days_ahead=30):
-        """Get batches expiring within specified days"""
+        """Get batches expiring within specified days (read from the expiry calendar)"""
         try:
             current_time = datetime.utcnow()
-            future_date = current_time + timedelta(days=days_ahead)
             
-            logger.info(f"Checking for batches expiring between {current_time} and {future_date}")
+            entries = self.expiry_calendar.get_calendar_entries(days_ahead, now=current_time)
+            if not entries:
+                return []
             
-            # First, let's get all active batches and filter in Python to debug
-            all_active_batches = list(self.batch_collection.find({
-                'status': 'active',
-                'quantity_remaining': {'$gt': 0},
-                'expiry_date': {'$exists': True, '$ne': None}
-            }))
+            batch_ids = [entry['batch_id'] for entry in entries]
+            batches_by_id = {
+                batch['_id']: batch
+                for batch in self.batch_collection.find({'_id': {'$in': batch_ids}})
+            }
             
-            logger.info(f"Found {len(all_active_batches)} active batches with expiry dates")
+            product_ids = list({entry['product_id'] for entry in entries})
+            products_by_id = {
+                product['_id']: product
+                for product in self.product_collection.find({'_id': {'$in': product_ids}})
+            }
             
             expiring_batches = []
-            
-            for batch in all_active_batches:
-                try:
-                    expiry_date = batch.get('expiry_date')
-                    if not expiry_date:
-                        continue
-                    
-                    # Convert string dates to datetime for comparison
-                    if isinstance(expiry_date, str):
-                        from dateutil import parser
-                        expiry_date = parser.parse(expiry_date)
-                    
-                    # Check if batch expires within the timeframe
-                    if current_time < expiry_date <= future_date:
-                        # Get product info
-                        product = self.product_collection.find_one({'_id': batch['product_id']})
-                        if product:
-                            batch['product_info'] = product
-                            expiring_batches.append(batch)
-                            logger.info(f"Batch {batch['_id']} expires {expiry_date}, adding to results")
-                    else:
-                        logger.info(f"Batch {batch['_id']} expires {expiry_date}, outside timeframe")
-                        
-                except Exception as batch_error:
-                    logger.error(f"Error processing batch {batch.get('_id')}: {str(batch_error)}")
-                    continue
-            
-            # Sort by expiry date
-            expiring_batches.sort(key=lambda x: x.get('expiry_date'))
+            for entry in entries:
+                batch = batches_by_id.get(entry['batch_id'])
+                product = products_by_id.get(entry['product_id'])
+                if batch and product:
+                    batch['product_info'] = product
+                    expiring_batches.append(batch)
             
             logger.info(f"Found {len(expiring_batches)} expiring batches")
             return expiring_batches
@@ -761,6 +686,9 @@ class BatchService:
             )
             
             if result.modified_count > 0:
+                self.expiry_calendar.sync_batches([batch_id])
+                change_log_service.record_changes('batches', [batch_id])
+                supplier_stats_service.record_batch_updated(batch, {'quantity_remaining': new_quantity, 'status': new_status})
                 self.update_product_expiry_summary(batch['product_id'])
                 
                 # Send notification if batch is depleted
@@ -892,6 +820,10 @@ class BatchService:
             )
             
             if result.modified_count > 0:
+                self.expiry_calendar.sync_batches([batch_id])
+                change_log_service.record_changes('batches', [batch_id])
+                supplier_stats_service.record_batch_updated(batch, updates)
+                
                 # Update product expiry summary if expiry date changed
                 if 'expiry_date' in updates:
                     self.update_product_expiry_summary(batch['product_id'])
@@ -1023,35 +955,10 @@ class BatchService:
     # ================================================================
     
     def mark_expired_batches(self):
-        """Mark expired batches as expired"""
+        """Mark expired batches as expired (runs the expiry calendar job)"""
         try:
-            current_time = datetime.utcnow()
-            
-            result = self.batch_collection.update_many(
-                {
-                    'status': 'active',
-                    'expiry_date': {'$lt': current_time}
-                },
-                {
-                    '$set': {
-                        'status': 'expired',
-                        'updated_at': current_time
-                    }
-                }
-            )
-            
-            # Update product expiry summaries for affected products
-            expired_batches = list(self.batch_collection.find({
-                'status': 'expired',
-                'updated_at': current_time
-            }))
-            
-            affected_products = set(batch['product_id'] for batch in expired_batches)
-            
-            for product_id in affected_products:
-                self.update_product_expiry_summary(product_id)
-            
-            return result.modified_count
+            result = self.expiry_calendar.process_due_expiries()
+            return result['batches_expired']
         
         except Exception as e:
             raise Exception(f"Error marking expired batches: {str(e)}")
@@ -1131,6 +1038,10 @@ class BatchService:
             )
             
             if result.modified_count > 0:
+                self.expiry_calendar.sync_batches([batch['_id']])
+                change_log_service.record_changes('batches', [batch['_id']])
+                supplier_stats_service.record_batch_updated(batch, update_data)
+                
                 # Update product stock
                 product = self.product_collection.find_one({'_id': product_id})
                 if product:
@@ -1222,6 +1133,7 @@ class BatchService:
                 )
             
             batch_deductions = []
+            stats_changes = []
             remaining_quantity = quantity_needed
             
             for batch in batches:
@@ -1251,19 +1163,21 @@ class BatchService:
                 }
                 
                 # Update batch with usage history
+                batch_updates = {
+                    'quantity_remaining': new_quantity,
+                    'status': 'depleted' if new_quantity == 0 else 'active',
+                    'updated_at': transaction_date
+                }
                 self.batch_collection.update_one(
                     {'_id': batch['_id']},
                     {
-                        '$set': {
-                            'quantity_remaining': new_quantity,
-                            'status': 'depleted' if new_quantity == 0 else 'active',
-                            'updated_at': transaction_date
-                        },
+                        '$set': batch_updates,
                         '$push': {
                             'usage_history': usage_entry
                         }
                     }
                 )
+                stats_changes.append((batch, {**batch, **batch_updates}))
                 
                 # Track batch usage for transaction record
                 batch_deductions.append({
@@ -1281,6 +1195,10 @@ class BatchService:
                 else:
                     print(f"      ✅ Updated\n")
             
+            self.expiry_calendar.sync_batches([d['batch_id'] for d in batch_deductions])
+            change_log_service.record_changes('batches', [d['batch_id'] for d in batch_deductions])
+            supplier_stats_service.record_batch_changes(stats_changes)
+            
             print(f"{'='*60}")
             print(f"✅ FIFO deduction complete")
             print(f"   Used {len(batch_deductions)} batches")
@@ -1334,42 +1252,46 @@ class BatchService:
         """
         Restore stock to batches (for cancellations/voids) with usage_history tracking
         
+        All batches are read with one query and written with one unordered
+        bulk_write of `$inc` updates, so concurrent sales drawing from the same
+        batches are never overwritten and voiding many sales stays one round trip.
+        
         Args:
-            batches_used: List of batch deductions to restore
+            batches_used: List of batch deductions to restore (a batch may appear more than once)
             transaction_date: Restoration timestamp
             transaction_info: Optional dict with {
                 'transaction_id': str,
                 'adjusted_by': str,
                 'reason': str
             }
+        
+        Returns:
+            dict: batch_id -> quantity restored (missing batches are skipped)
         """
         try:
-            print(f"\n{'='*60}")
-            print(f"🔄 Restoring Stock to Batches")
-            if transaction_info:
-                print(f"   Transaction: {transaction_info.get('transaction_id', 'N/A')}")
-                print(f"   Reason: {transaction_info.get('reason', 'N/A')}")
-            print(f"{'='*60}\n")
-            
+            quantities = {}
             for batch_info in batches_used:
-                batch_id = batch_info['batch_id']
-                quantity_to_restore = batch_info['quantity_deducted']
-                
-                print(f"   Restoring to batch {batch_info['batch_number']}:")
-                print(f"      Quantity: +{quantity_to_restore}")
-                
-                batch = self.batch_collection.find_one({'_id': batch_id})
-                
+                if batch_info.get('quantity_deducted', 0) > 0:
+                    quantities[batch_info['batch_id']] = quantities.get(batch_info['batch_id'], 0) + batch_info['quantity_deducted']
+            if not quantities:
+                return {}
+            
+            batches = {
+                batch['_id']: batch
+                for batch in self.batch_collection.find({'_id': {'$in': list(quantities)}})
+            }
+            
+            operations = []
+            stats_changes = []
+            restored = {}
+            for batch_id, quantity_to_restore in quantities.items():
+                batch = batches.get(batch_id)
                 if not batch:
-                    logger.warning(f"      ⚠️  Batch {batch_id} not found, skipping")
+                    logger.warning(f"Batch {batch_id} not found, skipping restoration")
                     continue
                 
+                # remaining_after is informational; the $inc itself is atomic
                 new_quantity = batch['quantity_remaining'] + quantity_to_restore
-                
-                print(f"      Before: {batch['quantity_remaining']}")
-                print(f"      After: {new_quantity}")
-                
-                # ✅ CREATE USAGE_HISTORY ENTRY FOR RESTORATION
                 usage_entry = {
                     'timestamp': transaction_date,
                     'quantity_used': -quantity_to_restore,  # Negative = restoration
@@ -1381,26 +1303,32 @@ class BatchService:
                     'source': 'restoration'
                 }
                 
-                # Update batch with restoration
-                self.batch_collection.update_one(
+                batch_updates = {
+                    'status': 'active',  # Reactivate if was depleted
+                    'updated_at': transaction_date
+                }
+                operations.append(UpdateOne(
                     {'_id': batch_id},
                     {
-                        '$set': {
-                            'quantity_remaining': new_quantity,
-                            'status': 'active',  # Reactivate if was depleted
-                            'updated_at': transaction_date
-                        },
-                        '$push': {
-                            'usage_history': usage_entry
-                        }
+                        '$inc': {'quantity_remaining': quantity_to_restore},
+                        '$set': batch_updates,
+                        '$push': {'usage_history': usage_entry}
                     }
-                )
-                
-                print(f"      ✅ Restored\n")
-            
-            print(f"{'='*60}")
-            print(f"✅ Stock restoration complete")
-            print(f"{'='*60}\n")
+                ))
+                stats_changes.append((batch, {**batch, **batch_updates, 'quantity_remaining': new_quantity}))
+                restored[batch_id] = quantity_to_restore
+            
+            if operations:
+                self.batch_collection.bulk_write(operations, ordered=False)
+                self.expiry_calendar.sync_batches(list(restored))
+                change_log_service.record_changes('batches', list(restored))
+                supplier_stats_service.record_batch_changes(stats_changes)
+            
+            logger.info(
+                f"Restored {sum(restored.values())} units to {len(restored)} batches"
+                + (f" ({transaction_info.get('transaction_id')})" if transaction_info else '')
+            )
+            return restored
             
         except Exception as e:
             logger.error(f"❌ Stock restoration failed: {str(e)}")
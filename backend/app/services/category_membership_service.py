@@ -0,0 +1,408 @@
+from collections import defaultdict
+from datetime import datetime
+import logging
+
+from pymongo import DeleteMany, ReplaceOne, UpdateOne
+
+from ..database import db_manager
+from .change_log_service import change_log_service
+
+logger = logging.getLogger(__name__)
+
+
+class CategoryMembershipService:
+    """
+    Product-to-subcategory membership.
+
+    Membership is stored on the product document only (`category_id` +
+    `subcategory_name`); category documents no longer embed product arrays.
+    Per-subcategory product counts (non-deleted products) are kept as
+    counters in `category_product_counts`, one document per
+    (category_id, subcategory_name), so listings and stats never have to
+    count or scan products.
+    """
+
+    def __init__(self):
+        self.db = db_manager.get_database()
+        self.product_collection = self.db.products
+        self.category_collection = self.db.category
+        self.counts_collection = self.db.category_product_counts
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        """Create indexes for membership lookups and counters"""
+        try:
+            self.product_collection.create_index(
+                [("category_id", 1), ("subcategory_name", 1), ("isDeleted", 1)],
+                background=True
+            )
+            self.counts_collection.create_index([("category_id", 1)], background=True)
+        except Exception as e:
+            logger.warning(f"Could not create category membership indexes: {e}")
+
+    @staticmethod
+    def _counter_id(category_id, subcategory_name):
+        return f"{category_id}::{subcategory_name or ''}"
+
+    # ================================================================
+    # COUNTERS
+    # ================================================================
+
+    def apply_count_deltas(self, deltas):
+        """
+        Apply {(category_id, subcategory_name): delta} to the counters in
+        one bulk_write. Uncategorized entries and zero deltas are skipped.
+        """
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {'_id': self._counter_id(category_id, subcategory_name)},
+                {
+                    '$inc': {'count': delta},
+                    '$set': {
+                        'category_id': category_id,
+                        'subcategory_name': subcategory_name or '',
+                        'updated_at': now
+                    }
+                },
+                upsert=True
+            )
+            for (category_id, subcategory_name), delta in deltas.items()
+            if category_id and delta
+        ]
+
+        if operations:
+            self.counts_collection.bulk_write(operations, ordered=False)
+
+    def record_added(self, category_id, subcategory_name, count=1):
+        self.apply_count_deltas({(category_id, subcategory_name): count})
+
+    def record_removed(self, category_id, subcategory_name, count=1):
+        self.apply_count_deltas({(category_id, subcategory_name): -count})
+
+    def record_moved(self, old_category_id, old_subcategory_name, new_category_id, new_subcategory_name):
+        if (old_category_id, old_subcategory_name) == (new_category_id, new_subcategory_name):
+            return
+        deltas = defaultdict(int)
+        deltas[(old_category_id, old_subcategory_name)] -= 1
+        deltas[(new_category_id, new_subcategory_name)] += 1
+        self.apply_count_deltas(deltas)
+
+    def rebuild_counts(self, category_ids=None):
+        """
+        Recompute counters from the products collection, for all categories
+        or only `category_ids`. Returns the number of counter documents written.
+        """
+        try:
+            match = {'isDeleted': {'$ne': True}, 'category_id': {'$nin': [None, '']}}
+            scope = {}
+            if category_ids is not None:
+                category_ids = [category_id for category_id in category_ids if category_id]
+                if not category_ids:
+                    return 0
+                match['category_id'] = {'$in': category_ids}
+                scope = {'category_id': {'$in': category_ids}}
+
+            grouped = self.product_collection.aggregate([
+                {'$match': match},
+                {
+                    '$group': {
+                        '_id': {'category_id': '$category_id', 'subcategory_name': '$subcategory_name'},
+                        'count': {'$sum': 1}
+                    }
+                }
+            ])
+
+            now = datetime.utcnow()
+            operations = []
+            counter_ids = []
+            for group in grouped:
+                category_id = group['_id']['category_id']
+                subcategory_name = group['_id'].get('subcategory_name') or ''
+                counter_id = self._counter_id(category_id, subcategory_name)
+                counter_ids.append(counter_id)
+                operations.append(ReplaceOne(
+                    {'_id': counter_id},
+                    {
+                        'category_id': category_id,
+                        'subcategory_name': subcategory_name,
+                        'count': group['count'],
+                        'updated_at': now
+                    },
+                    upsert=True
+                ))
+
+            # Drop counters for memberships that no longer have products
+            operations.append(DeleteMany({**scope, '_id': {'$nin': counter_ids}}))
+            self.counts_collection.bulk_write(operations, ordered=False)
+
+            return len(counter_ids)
+
+        except Exception as e:
+            logger.error(f"Error rebuilding category product counts: {e}")
+            raise Exception(f"Error rebuilding category product counts: {str(e)}")
+
+    def get_subcategory_counts(self, category_ids):
+        """{category_id: {subcategory_name: count}} for the given categories (one query)"""
+        counts = defaultdict(dict)
+        category_ids = [category_id for category_id in category_ids if category_id]
+        if not category_ids:
+            return counts
+
+        for counter in self.counts_collection.find({'category_id': {'$in': category_ids}}):
+            counts[counter['category_id']][counter.get('subcategory_name', '')] = max(counter.get('count', 0), 0)
+        return counts
+
+    def get_category_count(self, category_id):
+        return sum(self.get_subcategory_counts([category_id]).get(category_id, {}).values())
+
+    def get_subcategory_count(self, category_id, subcategory_name):
+        return self.get_subcategory_counts([category_id]).get(category_id, {}).get(subcategory_name or '', 0)
+
+    def get_total_products(self):
+        """Categorized, non-deleted products across all categories"""
+        result = list(self.counts_collection.aggregate([
+            {'$group': {'_id': None, 'total': {'$sum': '$count'}}}
+        ]))
+        return result[0]['total'] if result else 0
+
+    # ================================================================
+    # MEMBERSHIP
+    # ================================================================
+
+    def get_subcategory_products(self, category_id, subcategory_name, include_deleted=False):
+        """[{product_id, product_name}] for one subcategory, from the products index"""
+        query = {'category_id': category_id, 'subcategory_name': subcategory_name}
+        if not include_deleted:
+            query['isDeleted'] = {'$ne': True}
+
+        return [
+            {
+                'product_id': product['_id'],
+                'product_name': product.get('product_name', '')
+            }
+            for product in self.product_collection.find(query, {'product_name': 1}).sort('product_name', 1)
+        ]
+
+    def get_subcategory_product_ids(self, category_id, subcategory_name):
+        return [
+            product['product_id']
+            for product in self.get_subcategory_products(category_id, subcategory_name)
+        ]
+
+    def move_products(self, product_ids, category_id, subcategory_name):
+        """
+        Move products to (category_id, subcategory_name) with one bulk_write on
+        products and one on the counters.
+
+        Each update is guarded on the membership read just before, so a product
+        moved concurrently by someone else is not counted twice; if any guard
+        misses, the counters of the affected categories are recomputed instead.
+        """
+        try:
+            product_ids = list(dict.fromkeys(product_ids or []))
+            if not product_ids:
+                return {'moved': 0, 'product_ids': []}
+
+            current_memberships = self.product_collection.find(
+                {'_id': {'$in': product_ids}, 'isDeleted': {'$ne': True}},
+                {'category_id': 1, 'subcategory_name': 1}
+            )
+
+            now = datetime.utcnow()
+            operations = []
+            moved_ids = []
+            deltas = defaultdict(int)
+
+            for product in current_memberships:
+                old_category_id = product.get('category_id')
+                old_subcategory_name = product.get('subcategory_name')
+                if (old_category_id, old_subcategory_name) == (category_id, subcategory_name):
+                    continue
+
+                operations.append(UpdateOne(
+                    {
+                        '_id': product['_id'],
+                        'category_id': old_category_id,
+                        'subcategory_name': old_subcategory_name
+                    },
+                    {
+                        '$set': {
+                            'category_id': category_id,
+                            'subcategory_name': subcategory_name,
+                            'updated_at': now,
+                            'last_updated': now
+                        }
+                    }
+                ))
+                moved_ids.append(product['_id'])
+                deltas[(old_category_id, old_subcategory_name)] -= 1
+                deltas[(category_id, subcategory_name)] += 1
+
+            if not operations:
+                return {'moved': 0, 'product_ids': []}
+
+            result = self.product_collection.bulk_write(operations, ordered=False)
+
+            if result.modified_count == len(operations):
+                self.apply_count_deltas(deltas)
+            else:
+                logger.warning(
+                    f"{len(operations) - result.modified_count} of {len(operations)} products changed "
+                    f"membership concurrently; recounting affected categories"
+                )
+                self.rebuild_counts({affected_category_id for affected_category_id, _ in deltas})
+
+            change_log_service.record_changes('products', moved_ids)
+
+            return {'moved': result.modified_count, 'product_ids': moved_ids}
+
+        except Exception as e:
+            logger.error(f"Error moving products to {category_id} > {subcategory_name}: {e}")
+            raise Exception(f"Error moving products: {str(e)}")
+
+    def remove_products(self, product_ids, category_id=None, subcategory_name=None):
+        """
+        Clear the category membership of products (optionally only those
+        currently in the given category/subcategory). Returns the number removed.
+        """
+        try:
+            product_ids = list(dict.fromkeys(product_ids or []))
+            if not product_ids:
+                return 0
+
+            query = {'_id': {'$in': product_ids}, 'isDeleted': {'$ne': True}}
+            if category_id:
+                query['category_id'] = category_id
+            if subcategory_name:
+                query['subcategory_name'] = subcategory_name
+
+            members = list(self.product_collection.find(query, {'category_id': 1, 'subcategory_name': 1}))
+            if not members:
+                return 0
+
+            now = datetime.utcnow()
+            operations = []
+            deltas = defaultdict(int)
+            for product in members:
+                operations.append(UpdateOne(
+                    {
+                        '_id': product['_id'],
+                        'category_id': product.get('category_id'),
+                        'subcategory_name': product.get('subcategory_name')
+                    },
+                    {
+                        '$unset': {'category_id': '', 'subcategory_name': ''},
+                        '$set': {'updated_at': now}
+                    }
+                ))
+                deltas[(product.get('category_id'), product.get('subcategory_name'))] -= 1
+
+            result = self.product_collection.bulk_write(operations, ordered=False)
+
+            if result.modified_count == len(operations):
+                self.apply_count_deltas(deltas)
+            else:
+                self.rebuild_counts({affected_category_id for affected_category_id, _ in deltas})
+
+            change_log_service.record_changes('products', [product['_id'] for product in members])
+
+            return result.modified_count
+
+        except Exception as e:
+            logger.error(f"Error removing products from categories: {e}")
+            raise Exception(f"Error removing products from categories: {str(e)}")
+
+    # ================================================================
+    # MIGRATION FROM EMBEDDED sub_categories[].products[]
+    # ================================================================
+
+    def migrate_embedded_memberships(self, dry_run=False):
+        """
+        Move memberships out of `sub_categories[].products[]` into product
+        documents, strip the embedded arrays and rebuild the counters.
+
+        The product document wins when it already names a category; the
+        embedded entry is only used for products that have none.
+        """
+        try:
+            embedded = {}
+            duplicates = 0
+            categories_with_products = []
+
+            for category in self.category_collection.find(
+                {'sub_categories.products.0': {'$exists': True}},
+                {'sub_categories.name': 1, 'sub_categories.products': 1}
+            ):
+                categories_with_products.append(category['_id'])
+                for subcategory in category.get('sub_categories', []):
+                    for entry in subcategory.get('products', []) or []:
+                        product_id = entry.get('product_id') if isinstance(entry, dict) else entry
+                        if not product_id:
+                            continue
+                        if product_id in embedded:
+                            duplicates += 1
+                        embedded[product_id] = (category['_id'], subcategory.get('name'))
+
+            products = {
+                product['_id']: product
+                for product in self.product_collection.find(
+                    {'_id': {'$in': list(embedded.keys())}},
+                    {'category_id': 1, 'subcategory_name': 1}
+                )
+            } if embedded else {}
+
+            now = datetime.utcnow()
+            operations = []
+            updated_ids = []
+            conflicts = 0
+            for product_id, (category_id, subcategory_name) in embedded.items():
+                product = products.get(product_id)
+                if not product:
+                    continue
+                if product.get('category_id'):
+                    if (product.get('category_id'), product.get('subcategory_name')) != (category_id, subcategory_name):
+                        conflicts += 1
+                    continue
+                operations.append(UpdateOne(
+                    {'_id': product_id},
+                    {'$set': {'category_id': category_id, 'subcategory_name': subcategory_name, 'updated_at': now}}
+                ))
+                updated_ids.append(product_id)
+
+            summary = {
+                'categories_with_embedded_products': len(categories_with_products),
+                'embedded_entries': len(embedded),
+                'duplicate_entries': duplicates,
+                'missing_products': len(embedded) - len(products),
+                'conflicts_kept_product_value': conflicts,
+                'products_updated': len(operations),
+                'counters_written': 0,
+                'dry_run': dry_run
+            }
+
+            if dry_run:
+                return summary
+
+            if operations:
+                self.product_collection.bulk_write(operations, ordered=False)
+                change_log_service.record_changes('products', updated_ids)
+
+            if categories_with_products:
+                self.category_collection.update_many(
+                    {'_id': {'$in': categories_with_products}},
+                    {'$unset': {'sub_categories.$[].products': ''}, '$set': {'last_updated': now}}
+                )
+                change_log_service.record_changes('category', categories_with_products)
+
+            try:
+                self.category_collection.drop_index('sub_categories.products.product_id_1')
+            except Exception:
+                pass
+
+            summary['counters_written'] = self.rebuild_counts()
+            return summary
+
+        except Exception as e:
+            logger.error(f"Category membership migration failed: {e}")
+            raise Exception(f"Category membership migration failed: {str(e)}")
@@ -4,6 +4,8 @@ from ..models import Category
 import logging
 import re
 from .audit_service import AuditLogService
+from .change_log_service import change_log_service
+from .category_membership_service import CategoryMembershipService
 from notifications.services import notification_service
 
 logger = logging.getLogger(__name__)
@@ -19,6 +21,7 @@ class CategoryService:
         self.collection = self.db.category
         self.product_collection = self.db.products  
         self.audit_service = AuditLogService()
+        self.membership = CategoryMembershipService()
         self._ensure_indexes()
 
         self.ensure_uncategorized_category_exists()
@@ -41,7 +44,6 @@ class CategoryService:
                 'subcategory_id': self.generate_subcategory_id(),
                 'name': subcategory_name,
                 'description': f'Default {subcategory_name} subcategory',
-                'products': [],
                 'status': 'active',
                 'created_at': datetime.utcnow().isoformat()
             }
@@ -53,6 +55,7 @@ class CategoryService:
                     '$set': {'last_updated': datetime.utcnow().isoformat()}
                 }
             )
+            change_log_service.record_change('category', category_id)
 
             category_doc.setdefault('sub_categories', []).append(subcategory)
 
@@ -88,7 +91,6 @@ class CategoryService:
                     'subcategory_id': 'SUBCAT-00001',
                     'name': self.DEFAULT_SUBCATEGORY_NAME,
                     'description': 'Default holding subcategory for uncategorized products',
-                    'products': [],
                     'created_at': now.isoformat(),
                     'status': 'active'
                 }],
@@ -224,7 +226,6 @@ class CategoryService:
                 [("category_id", 1), ("isDeleted", 1)],
                 [("category_name", 1), ("isDeleted", 1)],
                 [("status", 1), ("isDeleted", 1)],
-                [("sub_categories.products.product_id", 1)],
                 [("sub_categories.name", 1)]
             ]
             
@@ -293,7 +294,6 @@ class CategoryService:
                 'subcategory_id': subcategory_id,
                 'name': subcategory.get('name', ''),
                 'description': subcategory.get('description', ''),
-                'products': [],
                 'created_at': datetime.utcnow().isoformat(),
                 'status': 'active'
             }
@@ -451,6 +451,7 @@ class CategoryService:
             
             # ✅ FIXED: Insert dict directly instead of using Category model
             self.collection.insert_one(category_kwargs)
+            change_log_service.record_change('category', category_id)
             
             # Send notification
             self._send_category_notification('created', category_name, category_id)
@@ -493,26 +494,27 @@ class CategoryService:
             categories = list(cursor)
 
             # Add product counts for each category's subcategories
-            for category in categories:
-                for subcategory in category.get('sub_categories', []):
-                    subcategory['product_count'] = self.get_subcategory_product_count(
-                        category['_id'],
-                        subcategory['name']
-                    )
+            self._attach_product_counts(categories)
 
             return categories
         except Exception as e:
             logger.error(f"Error getting categories: {e}")
             raise Exception(f"Error getting categories: {str(e)}")
 
+    def _attach_product_counts(self, categories):
+        """Set product_count on every category and subcategory from the membership counters (one query)"""
+        counts = self.membership.get_subcategory_counts([category['_id'] for category in categories])
+        for category in categories:
+            category_counts = counts.get(category['_id'], {})
+            category['product_count'] = sum(category_counts.values())
+            for subcategory in category.get('sub_categories', []):
+                subcategory['product_count'] = category_counts.get(subcategory.get('name'), 0)
+        return categories
+
     def get_category_product_count(self, category_id):
         """Get total number of products in a category"""
         try:
-            count = self.product_collection.count_documents({
-                'category_id': category_id,
-                'isDeleted': {'$ne': True}
-            })
-            return count
+            return self.membership.get_category_count(category_id)
         except Exception as e:
             logger.error(f"Error getting category product count: {e}")
             return 0
@@ -520,12 +522,7 @@ class CategoryService:
     def get_subcategory_product_count(self, category_id, subcategory_name):
         """Get number of products in a specific subcategory"""
         try:
-            count = self.product_collection.count_documents({
-                'category_id': category_id,
-                'subcategory_name': subcategory_name,
-                'isDeleted': {'$ne': True}
-            })
-            return count
+            return self.membership.get_subcategory_count(category_id, subcategory_name)
         except Exception as e:
             logger.error(f"Error getting subcategory product count: {e}")
             return 0
@@ -544,11 +541,7 @@ class CategoryService:
 
             # Add product counts for subcategories
             if category:
-                for subcategory in category.get('sub_categories', []):
-                    subcategory['product_count'] = self.get_subcategory_product_count(
-                        category['_id'],
-                        subcategory['name']
-                    )
+                self._attach_product_counts([category])
 
             return category
         except Exception as e:
@@ -603,6 +596,8 @@ class CategoryService:
             if result.modified_count == 0:
                 return None
 
+            change_log_service.record_change('category', category_id)
+
             # Get updated category using _id
             updated_category = self.collection.find_one({'_id': category_id})
             
@@ -670,6 +665,8 @@ class CategoryService:
             )
             
             if result.modified_count > 0:
+                change_log_service.record_change('category', category_id)
+                
                 # Send notification
                 self._send_category_notification('soft_deleted', category_to_delete['category_name'], category_id)
                 
@@ -737,6 +734,7 @@ class CategoryService:
             )
             
             if result.modified_count > 0:
+                change_log_service.record_change('category', category_id)
                 restored_category = self.collection.find_one({'category_id': category_id})
                 
                 # Send notification
@@ -780,6 +778,8 @@ class CategoryService:
             result = self.collection.delete_one({'_id': category_id})
             
             if result.deleted_count > 0:
+                change_log_service.record_change('category', category_id, 'delete')
+                
                 # Send critical notification with enhanced metadata
                 self._send_category_notification('hard_deleted', category_name, category_id, {
                     "warning": "PERMANENT_DELETION",
@@ -812,12 +812,7 @@ class CategoryService:
             categories = list(self.collection.find({'isDeleted': True}))
 
             # Add product counts for each category's subcategories
-            for category in categories:
-                for subcategory in category.get('sub_categories', []):
-                    subcategory['product_count'] = self.get_subcategory_product_count(
-                        category['_id'],
-                        subcategory['name']
-                    )
+            self._attach_product_counts(categories)
 
             return categories
         except Exception as e:
@@ -837,7 +832,7 @@ class CategoryService:
             if isinstance(product_identifier, str):
                 if product_identifier.startswith('PROD-'):
                     # Direct lookup by string ID
-                    product = self.product_collection.find_one({'product_id': product_identifier})
+                    product = self.product_collection.find_one({'_id': product_identifier})
                 else:
                     # Try as product name (case-insensitive)
                     product = self.product_collection.find_one({
@@ -848,7 +843,7 @@ class CategoryService:
             elif isinstance(product_identifier, dict):
                 if 'product_id' in product_identifier:
                     product_id = product_identifier['product_id']
-                    product = self.product_collection.find_one({'product_id': product_id})
+                    product = self.product_collection.find_one({'_id': product_id})
                 elif 'product_name' in product_identifier:
                     product = self.product_collection.find_one({
                         'product_name': product_identifier['product_name']
@@ -858,8 +853,10 @@ class CategoryService:
                 raise ValueError(f"Product not found: {product_identifier}")
             
             return {
-                'id': product['product_id'],  # Now returns string ID
-                'name': product['product_name']
+                'id': product['_id'],  # String ID: PROD-#####
+                'name': product['product_name'],
+                'category_id': product.get('category_id'),
+                'subcategory_name': product.get('subcategory_name')
             }
             
         except Exception as e:
@@ -900,53 +897,17 @@ class CategoryService:
             product_name = product_data['name']
             
             # Check if product already exists in this subcategory
-            for subcategory in category.get('sub_categories', []):
-                if subcategory['name'] == subcategory_name:
-                    products = subcategory.get('products', [])
-                    if products and isinstance(products[0], dict):
-                        existing_product_ids = [p['product_id'] for p in products]
-                        if product_id in existing_product_ids:
-                            return {
-                                'success': True,
-                                'action': 'no_change',
-                                'message': f"Product '{product_name}' already exists in subcategory '{subcategory_name}'"
-                            }
-                                    
-            # Remove product from any other subcategory first
-            self._remove_product_from_all_subcategories(product_id)
+            if (product_data['category_id'], product_data['subcategory_name']) == (category_id, subcategory_name):
+                return {
+                    'success': True,
+                    'action': 'no_change',
+                    'message': f"Product '{product_name}' already exists in subcategory '{subcategory_name}'"
+                }
             
-            # Add to subcategory with combined format using string IDs
-            result = self.collection.update_one(
-                {'_id': category_id},
-                {
-                    '$addToSet': {
-                        'sub_categories.$[elem].products': {
-                            'product_id': product_id,        # String: PROD-#####
-                            'product_name': product_name,    # String: Product Name
-                            'added_at': datetime.utcnow()    # Datetime (serializable)
-                        }
-                    },
-                    '$set': {
-                        'sub_categories.$[elem].updated_at': datetime.utcnow(),
-                        'last_updated': datetime.utcnow()
-                    }
-                },
-                array_filters=[{'elem.name': subcategory_name}]
-            )
+            # Membership lives on the product document: moving it replaces the old one
+            result = self.membership.move_products([product_id], category_id, subcategory_name)
             
-            if result.modified_count > 0:
-                # Update product document with category reference using string IDs
-                self.product_collection.update_one(
-                    {'product_id': product_id},
-                    {
-                        '$set': {
-                            'category_id': category_id,  # String category ID
-                            'subcategory_name': subcategory_name,
-                            'updated_at': datetime.utcnow()
-                        }
-                    }
-                )
-                
+            if result['moved'] > 0:
                 logger.info(f"Successfully added product '{product_name}' to subcategory '{subcategory_name}'")
                 
                 return {
@@ -965,30 +926,6 @@ class CategoryService:
             logger.error(f"Error adding product to subcategory: {e}")
             raise Exception(f"Error adding product to subcategory: {str(e)}")
 
-    def _remove_product_from_all_subcategories(self, product_id):
-        """Remove product from all subcategories using string ID"""
-        try:
-            categories_with_product = self.collection.find({
-                'sub_categories.products.product_id': product_id,
-                'isDeleted': {'$ne': True}
-            })
-            
-            for category in categories_with_product:
-                self.collection.update_one(
-                    {'category_id': category['category_id']},  # Use string ID
-                    {
-                        '$pull': {
-                            'sub_categories.$[].products': {'product_id': product_id}
-                        },
-                        '$set': {'last_updated': datetime.utcnow()}
-                    }
-                )
-            
-            logger.info(f"Removed product {product_id} from all subcategories")
-            
-        except Exception as e:
-            logger.error(f"Error removing product from all subcategories: {e}")
-
     def remove_product_from_subcategory(self, category_id, subcategory_name, product_identifier, current_user=None):
         """Remove product from subcategory using string IDs"""
         try:
@@ -1014,36 +951,10 @@ class CategoryService:
             product_id = product_data['id']
             product_name = product_data['name']
             
-            # Remove from subcategory using string IDs
-            result = self.collection.update_one(
-                {'category_id': category_id},
-                {
-                    '$pull': {
-                        'sub_categories.$[elem].products': {'product_id': product_id}
-                    },
-                    '$set': {
-                        'sub_categories.$[elem].updated_at': datetime.utcnow(),
-                        'last_updated': datetime.utcnow()
-                    }
-                },
-                array_filters=[{'elem.name': subcategory_name}]
-            )
+            # Clear the membership only if the product is in this subcategory
+            removed = self.membership.remove_products([product_id], category_id, subcategory_name)
             
-            if result.modified_count > 0:
-                # Update product document to remove category reference
-                self.product_collection.update_one(
-                    {'product_id': product_id},
-                    {
-                        '$unset': {
-                            'category_id': "",
-                            'subcategory_name': ""
-                        },
-                        '$set': {
-                            'updated_at': datetime.utcnow()
-                        }
-                    }
-                )
-                
+            if removed > 0:
                 logger.info(f"Successfully removed product '{product_name}' from subcategory '{subcategory_name}'")
                 
                 return {
@@ -1072,12 +983,7 @@ class CategoryService:
             categories = list(self.collection.find(query))
 
             # Add product counts for each category's subcategories
-            for category in categories:
-                for subcategory in category.get('sub_categories', []):
-                    subcategory['product_count'] = self.get_subcategory_product_count(
-                        category['_id'],
-                        subcategory['name']
-                    )
+            self._attach_product_counts(categories)
 
             return categories
         except Exception as e:
@@ -1106,12 +1012,7 @@ class CategoryService:
             categories = list(self.collection.find(query).limit(limit))
 
             # Add product counts for each category's subcategories
-            for category in categories:
-                for subcategory in category.get('sub_categories', []):
-                    subcategory['product_count'] = self.get_subcategory_product_count(
-                        category['_id'],
-                        subcategory['name']
-                    )
+            self._attach_product_counts(categories)
 
             return categories
         except Exception as e:
@@ -1149,8 +1050,7 @@ class CategoryService:
                 raise ValueError(f"Subcategory '{subcategory_data.get('name')}' already exists")
             
             # Ensure required fields
-            if 'products' not in subcategory_data:
-                subcategory_data['products'] = []
+            subcategory_data.pop('products', None)
             if 'created_at' not in subcategory_data:
                 subcategory_data['created_at'] = datetime.utcnow().isoformat()  # Use ISO string
             
@@ -1164,6 +1064,8 @@ class CategoryService:
             )
             
             if result.modified_count > 0:
+                change_log_service.record_change('category', category_id)
+                
                 # Send notification
                 self._send_category_notification('subcategory_added', category.get('category_name', 'Unknown'), category_id, {
                     "subcategory_name": subcategory_data.get('name', 'Unknown'),
@@ -1210,7 +1112,7 @@ class CategoryService:
                 raise ValueError(f"Subcategory '{subcategory_name}' not found")
             
             # Check if subcategory has products
-            if subcategory_to_remove.get('products', []):
+            if self.membership.get_subcategory_count(category_id, subcategory_name) > 0:
                 raise ValueError(f"Cannot remove subcategory '{subcategory_name}' - it contains products")
             
             # Remove subcategory
@@ -1223,6 +1125,7 @@ class CategoryService:
             )
             
             if result.modified_count > 0:
+                change_log_service.record_change('category', category_id)
                 self._send_category_notification('subcategory_removed', category.get('category_name', 'Unknown'), category_id, {
                     "subcategory_name": subcategory_name,
                     "action_type": "subcategory_removed"
@@ -1265,26 +1168,8 @@ class CategoryService:
         try:
             if not self._is_valid_category_id(category_id):
                 return []
-                
-            category = self.collection.find_one({'category_id': category_id})
-            if not category:
-                return []
             
-            for subcategory in category.get('sub_categories', []):
-                if subcategory['name'] == subcategory_name:
-                    products = subcategory.get('products', [])
-                    
-                    # Return combined format with both ID and Name
-                    if products and isinstance(products[0], dict):
-                        return [
-                            {
-                                'product_id': p['product_id'],    # String ID: PROD-#####
-                                'product_name': p['product_name'] # Product name
-                            } 
-                            for p in products
-                        ]
-            
-            return []
+            return self.membership.get_subcategory_products(category_id, subcategory_name)
             
         except Exception as e:
             logger.error(f"Error getting subcategory products: {e}")
@@ -1314,30 +1199,20 @@ class CategoryService:
                         },
                         'total_subcategories': {
                             '$sum': {'$size': {'$ifNull': ['$sub_categories', []]}}
-                        },
-                        'total_products': {
-                            '$sum': {
-                                '$sum': {
-                                    '$map': {
-                                        'input': {'$ifNull': ['$sub_categories', []]},
-                                        'as': 'sub',
-                                        'in': {'$size': {'$ifNull': ['$$sub.products', []]}}
-                                    }
-                                }
-                            }
                         }
                     }
                 }
             ]
             
             result = list(self.collection.aggregate(pipeline))
-            return result[0] if result else {
+            stats = result[0] if result else {
                 'total_categories': 0,
                 'active_categories': 0,
                 'deleted_categories': 0,
-                'total_subcategories': 0,
-                'total_products': 0
+                'total_subcategories': 0
             }
+            stats['total_products'] = self.membership.get_total_products()
+            return stats
             
         except Exception as e:
             logger.error(f"Error getting category stats: {e}")
@@ -1361,10 +1236,7 @@ class CategoryService:
             
             # Count subcategories and products
             subcategories_count = len(category.get('sub_categories', []))
-            products_count = 0
-            
-            for subcategory in category.get('sub_categories', []):
-                products_count += len(subcategory.get('products', []))
+            products_count = self.membership.get_category_count(category['_id'])
             
             return {
                 'category_id': category['category_id'],
@@ -1453,6 +1325,7 @@ class CategoryService:
             
             # Send bulk notification
             if result.modified_count > 0:
+                change_log_service.record_changes('category', valid_ids)
                 self._send_category_notification('bulk_updated', f"{result.modified_count} categories", None, {
                     "updated_count": result.modified_count,
                     "new_status": new_status,
@@ -1478,20 +1351,8 @@ class CategoryService:
         try:
             if not self._is_valid_category_id(category_id):
                 return []
-                
-            category = self.collection.find_one({'category_id': category_id})
-            if not category:
-                return []
             
-            for subcategory in category.get('sub_categories', []):
-                if subcategory['name'] == subcategory_name:
-                    products = subcategory.get('products', [])
-                    # Handle combined format only (ID + Name)
-                    if products and isinstance(products[0], dict):
-                        return [p['product_id'] for p in products]
-                    return []
-            
-            return []
+            return self.membership.get_subcategory_product_ids(category_id, subcategory_name)
         except Exception as e:
             logger.error(f"Error getting subcategory products: {e}")
             return []
@@ -1505,15 +1366,12 @@ class CategoryService:
                 raise ValueError("Invalid product or category ID format")
             
             # Get product details
-            product = self.product_collection.find_one({'product_id': product_id})
+            product = self.product_collection.find_one({'_id': product_id})
             if not product:
                 raise ValueError(f"Product {product_id} not found")
             
             product_name = product.get('product_name')
             
-            # Remove from current subcategory
-            self._remove_product_from_all_subcategories(product_id)
-            
             # Ensure subcategory exists
             category = self.collection.find_one({'category_id': category_id})
             if not category:
@@ -1521,34 +1379,10 @@ class CategoryService:
 
             self._ensure_subcategory_present(category_id, category, self.DEFAULT_SUBCATEGORY_NAME)
 
-            # Add to default subcategory
-            result = self.collection.update_one(
-                {'category_id': category_id},
-                {
-                    '$addToSet': {
-                        'sub_categories.$[elem].products': {
-                            'product_id': product_id,
-                            'product_name': product_name
-                        }
-                    },
-                    '$set': {'last_updated': datetime.utcnow()}
-                },
-                array_filters=[{'elem.name': self.DEFAULT_SUBCATEGORY_NAME}]
-            )
+            # Move to default subcategory (replaces the current membership)
+            result = self.membership.move_products([product_id], category_id, self.DEFAULT_SUBCATEGORY_NAME)
             
-            if result.modified_count > 0:
-                # Update product document
-                self.product_collection.update_one(
-                    {'product_id': product_id},
-                    {
-                        '$set': {
-                            'category_id': category_id,
-                            'subcategory_name': 'None',
-                            'updated_at': datetime.utcnow()
-                        }
-                    }
-                )
-                
+            if result['moved'] > 0:
                 logger.info(f"Product moved to '{self.DEFAULT_SUBCATEGORY_NAME}' subcategory successfully")
                 return {
                     'success': True,
@@ -1658,23 +1492,9 @@ class CategoryService:
                 else:
                     raise ValueError(f"Subcategory '{new_subcategory_name}' not found in category {new_category_id}")
             
-            # Bulk update products directly in database
-            result = self.product_collection.update_many(
-                {
-                    '_id': {'$in': product_ids},
-                    'isDeleted': {'$ne': True}
-                },
-                {
-                    '$set': {
-                        'category_id': new_category_id,
-                        'subcategory_name': new_subcategory_name,
-                        'updated_at': datetime.utcnow(),
-                        'last_updated': datetime.utcnow()
-                    }
-                }
-            )
-            
-            moved_count = result.modified_count
+            # Single bulk_write on products plus one on the membership counters
+            result = self.membership.move_products(product_ids, new_category_id, new_subcategory_name)
+            moved_count = result['moved']
             
             if moved_count > 0:
                 logger.info(f"Bulk moved {moved_count} products to category {new_category_id} > {new_subcategory_name}")
@@ -0,0 +1,267 @@
+from datetime import datetime, timedelta
+import time
+from pymongo import ReturnDocument
+from ..database import db_manager
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A version allocated this long before a later entry was written and still
+# missing from the log is treated as a failed write rather than one in flight
+GAP_SETTLE_SECONDS = 30
+
+
+class ChangeLogService:
+    """
+    Append-only change log with a global, monotonically increasing version.
+
+    Write paths call `record_changes(entity, ids)` after they modify documents;
+    readers (catalog snapshots, caches) compare `current_version()` against the
+    version they last saw and fetch `get_changes_since(version)` to catch up.
+    Versions are allocated from the `counters` collection, so every process
+    sharing the database sees the same sequence. Each entity also keeps the
+    latest version that touched it (`entity_versions()`), for caches that
+    only depend on a few entities.
+
+    Pass `db` to write another database's log (the sync engine records what
+    it ships into the target's log so caches there refresh).
+    """
+
+    COUNTER_ID = 'change_log_version'
+
+    def __init__(self, db=None):
+        self.db = db if db is not None else db_manager.get_database()
+        self.collection = self.db.change_log
+        self.counters_collection = self.db.counters
+        self._cached_version = None
+        self._cached_version_at = 0.0
+        self._cached_entity_versions = {}
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        """Create indexes for change log lookups"""
+        try:
+            self.collection.create_index([("entity", 1), ("version", 1)], background=True)
+            self.collection.create_index([("changed_at", 1)], background=True)
+        except Exception as e:
+            logger.warning(f"Could not create change log indexes: {e}")
+
+    def _allocate_versions(self, count):
+        """Reserve `count` consecutive versions and return the first one"""
+        counter = self.counters_collection.find_one_and_update(
+            {'_id': self.COUNTER_ID},
+            {'$inc': {'seq': count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return counter['seq'] - count + 1
+
+    def _entity_counter_id(self, entity):
+        return f'{self.COUNTER_ID}:{entity}'
+
+    # ================================================================
+    # WRITING
+    # ================================================================
+
+    def record_changes(self, entity, entity_ids, operation='upsert', origin=None):
+        """
+        Record that documents of `entity` were created/updated ('upsert') or
+        removed ('delete'). Returns the latest version written, or None.
+
+        `origin='sync'` marks writes applied by the sync engine, which it
+        skips when reading the log so shipped changes are not echoed back.
+
+        Failures are logged and swallowed - the change log must never break
+        the write that triggered it.
+        """
+        try:
+            entity_ids = [entity_id for entity_id in dict.fromkeys(entity_ids) if entity_id]
+            if not entity_ids:
+                return None
+
+            first_version = self._allocate_versions(len(entity_ids))
+            now = datetime.utcnow()
+
+            entries = [
+                {
+                    '_id': first_version + offset,
+                    'version': first_version + offset,
+                    'entity': entity,
+                    'entity_id': entity_id,
+                    'operation': operation,
+                    'changed_at': now
+                }
+                for offset, entity_id in enumerate(entity_ids)
+            ]
+            if origin:
+                for entry in entries:
+                    entry['origin'] = origin
+            self.collection.insert_many(entries, ordered=False)
+
+            latest_version = entries[-1]['version']
+            self.counters_collection.update_one(
+                {'_id': self._entity_counter_id(entity)},
+                {'$max': {'seq': latest_version}},
+                upsert=True
+            )
+            if self._cached_version is None or latest_version > self._cached_version:
+                self._cached_version = latest_version
+            cached_entity = self._cached_entity_versions.get(entity)
+            if cached_entity and latest_version > cached_entity[0]:
+                self._cached_entity_versions[entity] = (latest_version, cached_entity[1])
+            return latest_version
+
+        except Exception as e:
+            logger.error(f"Error recording {entity} changes: {str(e)}")
+            return None
+
+    def record_change(self, entity, entity_id, operation='upsert'):
+        return self.record_changes(entity, [entity_id], operation)
+
+    # ================================================================
+    # READING
+    # ================================================================
+
+    def current_version(self):
+        """Latest allocated version (0 when nothing has been recorded)"""
+        counter = self.counters_collection.find_one({'_id': self.COUNTER_ID})
+        version = counter['seq'] if counter else 0
+        self._cached_version = version
+        self._cached_version_at = time.monotonic()
+        return version
+
+    def current_version_cached(self, max_age_seconds=5):
+        """
+        `current_version()` re-read at most every `max_age_seconds`.
+
+        Used by read caches on hot paths: a change made in this process is
+        seen immediately (record_changes bumps the cached value), changes
+        from other processes within `max_age_seconds`.
+        """
+        if (self._cached_version is not None
+                and time.monotonic() - self._cached_version_at < max_age_seconds):
+            return self._cached_version
+        return self.current_version()
+
+    def entity_versions(self, entities, max_age_seconds=5):
+        """
+        Latest version recorded for each entity, as a tuple in `entities`
+        order (0 for entities never recorded).
+
+        Re-read at most every `max_age_seconds` per entity, like
+        `current_version_cached()`; changes made in this process are seen
+        immediately.
+        """
+        now = time.monotonic()
+        stale = [
+            entity for entity in entities
+            if entity not in self._cached_entity_versions
+            or now - self._cached_entity_versions[entity][1] >= max_age_seconds
+        ]
+        if stale:
+            found = {
+                counter['_id']: counter.get('seq', 0)
+                for counter in self.counters_collection.find(
+                    {'_id': {'$in': [self._entity_counter_id(entity) for entity in stale]}}
+                )
+            }
+            for entity in stale:
+                self._cached_entity_versions[entity] = (found.get(self._entity_counter_id(entity), 0), now)
+        return tuple(self._cached_entity_versions[entity][0] for entity in entities)
+
+    def oldest_version(self):
+        """Oldest version still retained in the log (0 when empty)"""
+        oldest = self.collection.find_one({}, {'version': 1}, sort=[('_id', 1)])
+        return oldest['version'] if oldest else 0
+
+    def committed_version(self, version, limit=None):
+        """
+        Highest version V > `version` such that every entry up to V is in the
+        log (`version` itself when none is).
+
+        Versions are allocated before their entries are inserted, so a later
+        entry can be readable while an earlier one is still being written;
+        readers that advance a checkpoint must stop before such a gap or they
+        skip the late entry for good. Gaps older than GAP_SETTLE_SECONDS are
+        failed writes and are stepped over.
+
+        Returns (version, more) - `more` is True when `limit` entries were
+        scanned and the log may continue past the returned version.
+        """
+        try:
+            through = int(version)
+            settled_before = datetime.utcnow() - timedelta(seconds=GAP_SETTLE_SECONDS)
+            cursor = self.collection.find({'_id': {'$gt': through}}, {'changed_at': 1}).sort('_id', 1)
+            if limit:
+                cursor = cursor.limit(limit)
+
+            scanned = 0
+            for entry in cursor:
+                scanned += 1
+                if entry['_id'] != through + 1 and entry.get('changed_at', settled_before) > settled_before:
+                    return through, False
+                through = entry['_id']
+
+            return through, bool(limit) and scanned >= limit
+
+        except Exception as e:
+            logger.error(f"Error reading change log: {str(e)}")
+            raise Exception(f"Error reading change log: {str(e)}")
+
+    def count_changes(self, version, up_to, entities=None, limit=None):
+        """Raw (uncollapsed) entries with `version` < version <= `up_to`"""
+        query = {'version': {'$gt': int(version), '$lte': int(up_to)}}
+        if entities:
+            query['entity'] = {'$in': list(entities)}
+        options = {'limit': limit} if limit else {}
+        return self.collection.count_documents(query, **options)
+
+    def get_changes_since(self, version, entities=None, limit=None, up_to=None):
+        """
+        Changes with version > `version` (and <= `up_to`), oldest first,
+        collapsed so each (entity, entity_id) appears once with its latest
+        operation.
+        """
+        try:
+            query = {'_id': {'$gt': int(version)}}
+            if up_to is not None:
+                query['_id']['$lte'] = int(up_to)
+            if entities:
+                query['entity'] = {'$in': list(entities)}
+
+            cursor = self.collection.find(query).sort('_id', 1)
+            if limit:
+                cursor = cursor.limit(limit)
+
+            latest = {}
+            for change in cursor:
+                key = (change['entity'], change['entity_id'])
+                latest.pop(key, None)
+                latest[key] = change
+
+            return list(latest.values())
+
+        except Exception as e:
+            logger.error(f"Error reading change log: {str(e)}")
+            raise Exception(f"Error reading change log: {str(e)}")
+
+    def trim_before(self, cutoff_date, max_version=None, dry_run=False):
+        """
+        Drop log entries older than `cutoff_date`, and with `max_version` only
+        those at or below it. Returns the number of entries (to be) removed.
+        """
+        try:
+            query = {'changed_at': {'$lt': cutoff_date}}
+            if max_version is not None:
+                query['version'] = {'$lte': max_version}
+            if dry_run:
+                return self.collection.count_documents(query)
+            result = self.collection.delete_many(query)
+            return result.deleted_count
+        except Exception as e:
+            logger.error(f"Error trimming change log: {str(e)}")
+            raise Exception(f"Error trimming change log: {str(e)}")
+
+
+# Singleton instance
+change_log_service = ChangeLogService()
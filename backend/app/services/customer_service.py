@@ -4,6 +4,8 @@ from ..database import db_manager
 import bcrypt
 import logging
 from .audit_service import AuditLogService
+from .change_log_service import change_log_service
+from .principal_cache_service import principal_cache
 import csv
 import io
 
@@ -40,51 +42,61 @@ class CustomerService:
     # CRUD OPERATIONS
     # ================================================================
     
-    def get_customers(self, page=1, limit=50, status=None, min_loyalty_points=None, max_loyalty_points=None, include_deleted=False, sort_by=None, search=None):
-        """Get customers with pagination, search, and loyalty point range filtering"""
-        try:
-            query = {}
-
-            # ----------------------------------------------------
-            # BASIC FILTERS
-            # ----------------------------------------------------
-            if not include_deleted:
-                query['isDeleted'] = {'$ne': True}
+    @staticmethod
+    def _customers_query(status=None, min_loyalty_points=None, max_loyalty_points=None, include_deleted=False, search=None):
+        """Customer-list filter (shared with the async read path)"""
+        query = {}
+
+        # ----------------------------------------------------
+        # BASIC FILTERS
+        # ----------------------------------------------------
+        if not include_deleted:
+            query['isDeleted'] = {'$ne': True}
+
+        if status: 
+            query['status'] = status
+
+        # ----------------------------------------------------
+        # LOYALTY POINT FILTERS (min / max)
+        # ----------------------------------------------------
+        if min_loyalty_points is not None:
+            query['loyalty_points'] = {'$gte': min_loyalty_points}
+
+        if max_loyalty_points is not None:
+            query.setdefault('loyalty_points', {})
+            query['loyalty_points']['$lte'] = max_loyalty_points
+
+        # ----------------------------------------------------
+        # SEARCH FILTER
+        # ----------------------------------------------------
+        if search:
+            search_regex = {'$regex': search, '$options': 'i'}
+            query['$or'] = [
+                {'full_name': search_regex},
+                {'email': search_regex},
+                {'username': search_regex},
+                {'phone': search_regex},
+            ]
 
-            if status: 
-                query['status'] = status
+        return query
 
-            # ----------------------------------------------------
-            # LOYALTY POINT FILTERS (min / max)
-            # ----------------------------------------------------
-            if min_loyalty_points is not None:
-                query['loyalty_points'] = {'$gte': min_loyalty_points}
+    @staticmethod
+    def _customers_sort(sort_by=None):
+        """Sort spec for the customer list"""
+        if sort_by == 'loyalty_desc':
+            sort_options = [('loyalty_points', -1)]
+        elif sort_by == 'date_asc':
+            sort_options = [('date_created', 1)]
+        else:
+            sort_options = [('date_created', -1)]  # default
 
-            if max_loyalty_points is not None:
-                query.setdefault('loyalty_points', {})
-                query['loyalty_points']['$lte'] = max_loyalty_points
+        return sort_options
 
-            # ----------------------------------------------------
-            # SEARCH FILTER
-            # ----------------------------------------------------
-            if search:
-                search_regex = {'$regex': search, '$options': 'i'}
-                query['$or'] = [
-                    {'full_name': search_regex},
-                    {'email': search_regex},
-                    {'username': search_regex},
-                    {'phone': search_regex},
-                ]
-
-            # ----------------------------------------------------
-            # SORTING
-            # ----------------------------------------------------
-            if sort_by == 'loyalty_desc':
-                sort_options = [('loyalty_points', -1)]
-            elif sort_by == 'date_asc':
-                sort_options = [('date_created', 1)]
-            else:
-                sort_options = [('date_created', -1)]  # default
+    def get_customers(self, page=1, limit=50, status=None, min_loyalty_points=None, max_loyalty_points=None, include_deleted=False, sort_by=None, search=None):
+        """Get customers with pagination, search, and loyalty point range filtering"""
+        try:
+            query = self._customers_query(status, min_loyalty_points, max_loyalty_points, include_deleted, search)
+            sort_options = self._customers_sort(sort_by)
 
             # ----------------------------------------------------
             # PAGINATION
@@ -192,6 +204,7 @@ class CustomerService:
             }
             
             self.customer_collection.insert_one(customer_record)
+            change_log_service.record_change('customers', customer_id)
             
             if current_user and self.audit_service:
                 try:
@@ -317,6 +330,8 @@ class CustomerService:
             if result.modified_count == 0:
                 return old_customer
 
+            change_log_service.record_change('customers', customer_id)
+            principal_cache.invalidate(customer_id)
             updated_customer = self.customer_collection.find_one({'_id': customer_id})
 
             if current_user and self.audit_service:
@@ -361,6 +376,9 @@ class CustomerService:
             )
             
             success = result.modified_count > 0
+            if success:
+                change_log_service.record_change('customers', customer_id)
+                principal_cache.invalidate(customer_id)
             
             if success and current_user and self.audit_service:
                 try:
@@ -401,6 +419,9 @@ class CustomerService:
             )
             
             success = result.modified_count > 0
+            if success:
+                change_log_service.record_change('customers', customer_id)
+                principal_cache.invalidate(customer_id)
             
             if success and current_user and self.audit_service:
                 try:
@@ -459,6 +480,9 @@ class CustomerService:
             # Delete the customer record
             result = self.customer_collection.delete_one({'_id': customer_id})
             success = result.deleted_count > 0
+            if success:
+                change_log_service.record_change('customers', customer_id, 'delete')
+                principal_cache.invalidate(customer_id)
             
             # Audit logging
             if success and current_user and self.audit_service:
@@ -538,6 +562,9 @@ class CustomerService:
                 }
             )
             
+            if result.modified_count > 0:
+                change_log_service.record_change('customers', customer_id)
+            
             return result.modified_count > 0
             
         except Exception as e:
@@ -609,6 +636,7 @@ class CustomerService:
             if result.modified_count == 0:
                 return None
             
+            change_log_service.record_change('customers', customer_id)
             return self.customer_collection.find_one({'_id': customer_id})
             
         except Exception as e:
@@ -643,6 +671,7 @@ class CustomerService:
             if result.modified_count == 0:
                 return None
             
+            change_log_service.record_change('customers', customer_id)
             return self.customer_collection.find_one({'_id': customer_id})
             
         except Exception as e:
@@ -752,6 +781,9 @@ class CustomerService:
                 }
             )
             
+            if result.modified_count > 0:
+                change_log_service.record_change('customers', customer_id)
+            
             return result.modified_count > 0
             
         except Exception as e:
@@ -875,6 +907,7 @@ class CustomerService:
                     }
 
                     self.customer_collection.insert_one(new_customer)
+                    change_log_service.record_change('customers', customer_id)
                     imported_count += 1
 
             # Log import action
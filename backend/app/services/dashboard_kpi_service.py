@@ -0,0 +1,232 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+import logging
+import threading
+import time
+
+from decouple import config
+
+logger = logging.getLogger(__name__)
+
+# Bounded pool shared by every request, so a burst of page loads cannot open
+# an unbounded number of concurrent database scans
+DASHBOARD_MAX_WORKERS = config('DASHBOARD_KPI_WORKERS', default=6, cast=int)
+
+# How long a request waits for uncached KPIs before answering with what it has
+DEFAULT_WAIT_SECONDS = config('DASHBOARD_KPI_WAIT_SECONDS', default=3.0, cast=float)
+
+# KPI name -> (fresh TTL seconds, max stale seconds). Within the stale window a
+# cached value is served immediately and refreshed in the background.
+KPI_TTLS = {
+    'sales_today': (30, 600),
+    'sales_this_week': (120, 1800),
+    'sales_this_month': (300, 3600),
+    'sales_week_comparison': (300, 3600),
+    'online_orders': (15, 300),
+    'customers': (300, 3600),
+    'categories': (600, 7200),
+    'notifications': (15, 300),
+}
+
+SALES_KPIS = ('sales_today', 'sales_this_week', 'sales_this_month', 'sales_week_comparison')
+
+_executor = ThreadPoolExecutor(max_workers=DASHBOARD_MAX_WORKERS, thread_name_prefix='dashboard-kpi')
+_cache = {}
+_in_flight = {}
+_lock = threading.Lock()
+
+
+class DashboardKpiService:
+    """
+    Dashboard KPIs computed concurrently with stale-while-revalidate caching.
+
+    Each KPI is an independent loader with its own TTL. A request returns
+    fresh cached values as-is, serves stale ones immediately while a single
+    background refresh runs, and computes missing ones on the shared pool -
+    waiting at most `wait_seconds` overall. KPIs still computing past the
+    budget are reported as pending (their result lands in the cache for the
+    next load), so page latency is bounded by the slowest uncached KPI rather
+    than the sum of all of them.
+    """
+
+    _sources = None
+    _sources_lock = threading.Lock()
+
+    # ================================================================
+    # LOADERS
+    # ================================================================
+
+    @classmethod
+    def _get_sources(cls):
+        """Create the underlying services once; they are safe to share across threads"""
+        with cls._sources_lock:
+            if cls._sources is None:
+                from .pos.salesReport import SalesReport
+                from .pos.online_transactions_services import OnlineTransactionService
+                from .customer_service import CustomerService
+                from .category_service import CategoryService
+                from notifications.services import notification_service
+
+                cls._sources = {
+                    'sales_report': SalesReport(),
+                    'online': OnlineTransactionService(),
+                    'customers': CustomerService(),
+                    'categories': CategoryService(),
+                    'notifications': notification_service,
+                }
+            return cls._sources
+
+    def _loaders(self):
+        sources = self._get_sources()
+        sales_report = sources['sales_report']
+        return {
+            'sales_today': lambda: self._sales_period(sales_report.get_todays_sales(), with_breakdown=True),
+            'sales_this_week': lambda: self._sales_period(sales_report.get_weekly_sales()),
+            'sales_this_month': lambda: self._sales_period(sales_report.get_monthly_sales()),
+            'sales_week_comparison': lambda: sales_report.get_sales_comparison('week')['comparison'],
+            'online_orders': sources['online'].get_order_statistics,
+            'customers': sources['customers'].get_customer_statistics,
+            'categories': sources['categories'].get_category_stats,
+            'notifications': sources['notifications'].get_notification_stats,
+        }
+
+    @staticmethod
+    def _sales_period(result, with_breakdown=False):
+        value = {'summary': result['summary']}
+        if with_breakdown:
+            value['source_breakdown'] = result['source_breakdown']
+        return value
+
+    # ================================================================
+    # CACHE AND SCHEDULING
+    # ================================================================
+
+    def _submit(self, name, loader):
+        """Start computing a KPI unless a computation is already running (single flight)"""
+        with _lock:
+            future = _in_flight.get(name)
+            if future is not None:
+                return future
+            future = _executor.submit(self._compute, name, loader)
+            _in_flight[name] = future
+            return future
+
+    def _compute(self, name, loader):
+        started = time.monotonic()
+        try:
+            value = loader()
+            with _lock:
+                _cache[name] = {
+                    'value': value,
+                    'computed_at': datetime.utcnow(),
+                    'computed_monotonic': time.monotonic(),
+                    'duration_ms': round((time.monotonic() - started) * 1000, 1),
+                }
+            return value
+        except Exception as e:
+            logger.error(f"Dashboard KPI '{name}' failed: {str(e)}")
+            raise
+        finally:
+            with _lock:
+                _in_flight.pop(name, None)
+
+    def _meta(self, name, entry, status):
+        meta = {'status': status, 'ttl_seconds': KPI_TTLS[name][0]}
+        if entry:
+            meta['computed_at'] = entry['computed_at'].isoformat()
+            meta['age_seconds'] = round(time.monotonic() - entry['computed_monotonic'], 1)
+            meta['duration_ms'] = entry['duration_ms']
+        return meta
+
+    # ================================================================
+    # PUBLIC API
+    # ================================================================
+
+    def get_kpis(self, names=None, wait_seconds=DEFAULT_WAIT_SECONDS, force_refresh=False):
+        """
+        Get dashboard KPIs.
+
+        Args:
+            names: KPI names to return (default: all in KPI_TTLS)
+            wait_seconds: Overall budget for uncached KPIs (None waits for all)
+            force_refresh: Recompute every requested KPI, ignoring the cache
+
+        Returns:
+            dict: data (name -> value or None), meta (name -> status/age), complete flag
+        """
+        names = list(names or KPI_TTLS)
+        unknown = [name for name in names if name not in KPI_TTLS]
+        if unknown:
+            raise ValueError(f"Unknown KPI(s): {', '.join(unknown)}")
+
+        loaders = self._loaders()
+        now = time.monotonic()
+        data, meta, waiting = {}, {}, {}
+
+        for name in names:
+            fresh_ttl, stale_ttl = KPI_TTLS[name]
+            with _lock:
+                entry = _cache.get(name)
+            age = now - entry['computed_monotonic'] if entry else None
+
+            if entry and not force_refresh and age <= fresh_ttl:
+                data[name] = entry['value']
+                meta[name] = self._meta(name, entry, 'fresh')
+            elif entry and not force_refresh and age <= stale_ttl:
+                # Serve stale now, revalidate in the background
+                self._submit(name, loaders[name])
+                data[name] = entry['value']
+                meta[name] = self._meta(name, entry, 'stale')
+            else:
+                waiting[name] = self._submit(name, loaders[name])
+
+        if waiting:
+            wait(list(waiting.values()), timeout=wait_seconds)
+
+        for name, future in waiting.items():
+            with _lock:
+                entry = _cache.get(name)
+
+            if future.done() and future.exception() is None:
+                data[name] = future.result()
+                meta[name] = self._meta(name, entry, 'fresh')
+            elif future.done():
+                data[name] = entry['value'] if entry else None
+                meta[name] = {**self._meta(name, entry, 'stale' if entry else 'error'), 'error': str(future.exception())}
+            else:
+                # Still computing - hand back the expired value if any, else nothing yet
+                data[name] = entry['value'] if entry else None
+                meta[name] = self._meta(name, entry, 'stale' if entry else 'pending')
+
+        return {
+            'data': data,
+            'meta': meta,
+            'complete': all(item['status'] in ('fresh', 'stale') for item in meta.values()),
+            'generated_at': datetime.utcnow().isoformat()
+        }
+
+    def get_sales_dashboard_summary(self):
+        """The SalesReport.get_dashboard_summary payload, assembled from cached, concurrent KPIs"""
+        result = self.get_kpis(SALES_KPIS, wait_seconds=None)
+        failed = [name for name in SALES_KPIS if result['data'].get(name) is None]
+        if failed:
+            raise Exception(f"Error getting dashboard summary: {', '.join(failed)} unavailable")
+
+        data = result['data']
+        return {
+            'today': data['sales_today']['summary'],
+            'this_week': data['sales_this_week']['summary'],
+            'this_month': data['sales_this_month']['summary'],
+            'week_vs_last_week': data['sales_week_comparison'],
+            'source_breakdown_today': data['sales_today']['source_breakdown'],
+            'generated_at': datetime.now().isoformat(),
+            'kpi_meta': result['meta']
+        }
+
+    @staticmethod
+    def clear_cache():
+        with _lock:
+            _cache.clear()
+
+
+dashboard_kpi_service = DashboardKpiService()
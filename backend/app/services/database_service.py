@@ -1,6 +1,7 @@
 from pymongo import MongoClient
 from django.conf import settings
 from bson import ObjectId
+from ..bson_json import bson_to_json
 
 class DatabaseService:
     def __init__(self):
@@ -12,10 +13,8 @@ class DatabaseService:
     
     def convert_object_id(self, document):
         """Convert ObjectId to string for JSON serialization"""
-        if document and '_id' in document:
-            document['_id'] = str(document['_id'])
-        return document
+        return bson_to_json(document, datetimes=False)
     
     def convert_object_ids(self, documents):
         """Convert ObjectIds to strings for a list of documents"""
-        return [self.convert_object_id(doc) for doc in documents]
\ No newline at end of file
+        return bson_to_json(list(documents), datetimes=False)
\ No newline at end of file
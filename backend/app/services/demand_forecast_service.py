@@ -0,0 +1,362 @@
+from datetime import datetime, time, timedelta
+import logging
+from statistics import NormalDist
+
+from decouple import config
+import numpy as np
+from pymongo import DESCENDING, InsertOne
+
+from ..database import db_manager
+
+logger = logging.getLogger(__name__)
+
+# Days of daily sales history the forecast is fitted on
+HISTORY_DAYS = config('FORECAST_HISTORY_DAYS', default=730, cast=int)
+# Trailing window for the moving average and the demand variability
+MOVING_AVERAGE_DAYS = config('FORECAST_MOVING_AVERAGE_DAYS', default=28, cast=int)
+SMOOTHING_ALPHA = config('FORECAST_SMOOTHING_ALPHA', default=0.1, cast=float)
+SERVICE_LEVEL = config('FORECAST_SERVICE_LEVEL', default=0.95, cast=float)
+# Days from ordering to stock on the shelf, unless the product sets `lead_time_days`
+DEFAULT_LEAD_TIME_DAYS = config('FORECAST_LEAD_TIME_DAYS', default=7, cast=int)
+# Days between purchasing runs; orders cover lead time plus one review period
+REVIEW_PERIOD_DAYS = config('FORECAST_REVIEW_PERIOD_DAYS', default=7, cast=int)
+
+FORECAST_METHODS = ('ses', 'moving_average')
+LINE_WRITE_CHUNK = 1000
+
+PRODUCT_PROJECTION = {
+    'product_name': 1, 'SKU': 1, 'unit': 1, 'category_id': 1, 'supplier_id': 1,
+    'cost_price': 1, 'lead_time_days': 1
+}
+
+
+class DemandForecastService:
+    """
+    Catalog-wide demand forecasts and reorder suggestions.
+
+    Daily unit sales come from the `product_sales_daily` counters (POS,
+    online and sales_log lines, voids already netted out) and are laid out as
+    one products x days NumPy matrix. Every figure is then computed for the
+    whole catalog at once:
+
+      - forecast daily demand: simple exponential smoothing (a single
+        matrix-vector product with the smoothing weights) or the trailing
+        moving average,
+      - safety stock: z(service level) x daily std dev x sqrt(lead time),
+      - usable stock: on-hand batch quantity minus what is expected to
+        expire unsold, selling the earliest-expiring batches first at the
+        forecast rate,
+      - reorder point (lead-time demand + safety stock) and an order-up-to
+        level covering lead time plus one review period.
+
+    Products at or below their reorder point get a suggested quantity,
+    grouped per supplier (the product's supplier, else its latest batch's).
+    Each run is stored as one summary document plus one line per product to
+    reorder, like the valuation snapshots.
+    """
+
+    def __init__(self):
+        self.db = db_manager.get_database()
+        self.counter_collection = self.db.product_sales_daily
+        self.product_collection = self.db.products
+        self.batch_collection = self.db.batches
+        self.supplier_collection = self.db.suppliers
+        self.run_collection = self.db.reorder_suggestion_runs
+        self.line_collection = self.db.reorder_suggestion_lines
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        """Indexes for the history load and for reading runs back"""
+        try:
+            self.counter_collection.create_index([("date", 1), ("product_id", 1)], background=True)
+            self.run_collection.create_index([("generated_at", DESCENDING)], background=True)
+            self.line_collection.create_index([("run_id", 1), ("supplier_id", 1)], background=True)
+            self.line_collection.create_index([("run_id", 1), ("product_id", 1)], background=True)
+        except Exception as e:
+            logger.warning(f"Could not create demand forecast indexes: {e}")
+
+    # ================================================================
+    # DATA LOADING
+    # ================================================================
+
+    def _load_products(self):
+        products = list(self.product_collection.find(
+            {'status': 'active', 'isDeleted': {'$ne': True}}, PRODUCT_PROJECTION
+        ))
+        return products, {product['_id']: index for index, product in enumerate(products)}
+
+    def _load_history(self, product_index, start_day, days):
+        """products x days matrix of units sold per UTC day"""
+        rows, columns, quantities = [], [], []
+        cursor = self.counter_collection.find(
+            {'date': {'$gte': start_day}, 'product_id': {'$ne': None}},
+            {'_id': 0, 'product_id': 1, 'date': 1, 'quantity': 1}
+        ).batch_size(10000)
+        for counter in cursor:
+            row = product_index.get(counter['product_id'])
+            column = (counter['date'] - start_day).days
+            if row is None or not 0 <= column < days:
+                continue
+            rows.append(row)
+            columns.append(column)
+            quantities.append(counter.get('quantity') or 0)
+
+        size = len(product_index) * days
+        flat = np.bincount(
+            np.asarray(rows, dtype=np.int64) * days + np.asarray(columns, dtype=np.int64),
+            weights=np.asarray(quantities, dtype=np.float64),
+            minlength=size
+        ) if rows else np.zeros(size)
+        # Net-negative days (voids of earlier sales) are not negative demand
+        return np.clip(flat.reshape(len(product_index), days), 0, None)
+
+    def _load_batches(self, product_index, now):
+        """Active batch quantities per product, with days until each batch expires"""
+        rows, quantities, days_left, latest_supplier = [], [], [], {}
+        cursor = self.batch_collection.find(
+            {'status': 'active', 'quantity_remaining': {'$gt': 0}},
+            {'product_id': 1, 'quantity_remaining': 1, 'expiry_date': 1, 'supplier_id': 1, 'date_received': 1}
+        )
+        for batch in cursor:
+            row = product_index.get(batch.get('product_id'))
+            if row is None:
+                continue
+            expiry_date = batch.get('expiry_date')
+            rows.append(row)
+            quantities.append(batch['quantity_remaining'])
+            days_left.append(
+                max((expiry_date - now).total_seconds() / 86400, 0) if isinstance(expiry_date, datetime) else np.inf
+            )
+            received = batch.get('date_received')
+            if batch.get('supplier_id') and isinstance(received, datetime):
+                if row not in latest_supplier or received > latest_supplier[row][0]:
+                    latest_supplier[row] = (received, batch['supplier_id'])
+        return (
+            np.asarray(rows, dtype=np.int64),
+            np.asarray(quantities, dtype=np.float64),
+            np.asarray(days_left, dtype=np.float64),
+            {row: supplier_id for row, (_, supplier_id) in latest_supplier.items()}
+        )
+
+    # ================================================================
+    # VECTORIZED MODEL
+    # ================================================================
+
+    @staticmethod
+    def smoothing_weights(days, alpha):
+        """Weights w with history @ w == the SES level after the last day (first day seeds the level)"""
+        exponents = np.arange(days - 1, -1, -1, dtype=np.float64)
+        weights = alpha * (1 - alpha) ** exponents
+        weights[0] = (1 - alpha) ** (days - 1)
+        return weights
+
+    @staticmethod
+    def expected_waste(rows, quantities, days_left, rates, product_count):
+        """
+        Units per product expected to expire unsold.
+
+        Selling the earliest-expiring batches first at a constant daily rate,
+        the units lost are max over batches of (stock expiring by that batch's
+        expiry - demand until then), one grouped max over all batches.
+        """
+        waste = np.zeros(product_count)
+        if not len(rows):
+            return waste
+        order = np.lexsort((days_left, rows))
+        rows, quantities, days_left = rows[order], quantities[order], days_left[order]
+
+        cumulative = np.cumsum(quantities)
+        group_starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        offsets = np.repeat(np.r_[0, cumulative[group_starts[1:] - 1]], np.diff(np.r_[group_starts, len(rows)]))
+        prefix_stock = cumulative - offsets
+
+        with np.errstate(invalid='ignore'):
+            shortfall = prefix_stock - rates[rows] * days_left
+        shortfall = np.nan_to_num(shortfall, nan=0.0, neginf=0.0)
+        np.maximum.at(waste, rows, np.maximum(shortfall, 0))
+        return waste
+
+    def compute(self, method='ses', now=None):
+        """
+        Forecast and reorder figures for every active product.
+
+        Returns:
+            tuple: (products, dict of per-product NumPy arrays, latest batch supplier per row)
+        """
+        if method not in FORECAST_METHODS:
+            raise ValueError(f"method must be one of {', '.join(FORECAST_METHODS)}")
+
+        now = now or datetime.utcnow()
+        today = datetime.combine(now.date(), time.min)
+        start_day = today - timedelta(days=HISTORY_DAYS)
+
+        products, product_index = self._load_products()
+        history = self._load_history(product_index, start_day, HISTORY_DAYS)
+        batch_rows, batch_quantities, batch_days_left, batch_suppliers = self._load_batches(product_index, now)
+
+        window = history[:, -MOVING_AVERAGE_DAYS:]
+        moving_average = window.mean(axis=1) if len(products) else np.zeros(0)
+        smoothed = history @ self.smoothing_weights(HISTORY_DAYS, SMOOTHING_ALPHA)
+        rates = smoothed if method == 'ses' else moving_average
+        daily_std = window.std(axis=1, ddof=1) if MOVING_AVERAGE_DAYS > 1 and len(products) else np.zeros(len(products))
+
+        lead_times = np.array(
+            [product.get('lead_time_days') or DEFAULT_LEAD_TIME_DAYS for product in products], dtype=np.float64
+        )
+        z = NormalDist().inv_cdf(SERVICE_LEVEL)
+        safety_stock = z * daily_std * np.sqrt(lead_times)
+        reorder_point = rates * lead_times + safety_stock
+        order_up_to = rates * (lead_times + REVIEW_PERIOD_DAYS) + safety_stock
+
+        on_hand = np.bincount(batch_rows, weights=batch_quantities, minlength=len(products)) \
+            if len(batch_rows) else np.zeros(len(products))
+        waste = self.expected_waste(batch_rows, batch_quantities, batch_days_left, rates, len(products))
+        usable = np.maximum(on_hand - waste, 0)
+
+        # Residual smoothed demand below one unit per cover period is not worth an order line
+        needs_reorder = (order_up_to >= 1) & (usable <= reorder_point)
+        suggested = np.where(needs_reorder, np.ceil(np.maximum(order_up_to - usable, 0)), 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            days_of_cover = np.where(rates > 0, usable / rates, np.inf)
+
+        figures = {
+            'forecast_daily': rates,
+            'moving_average_daily': moving_average,
+            'smoothed_daily': smoothed,
+            'daily_std': daily_std,
+            'sold_last_window': window.sum(axis=1),
+            'lead_time_days': lead_times,
+            'safety_stock': safety_stock,
+            'reorder_point': reorder_point,
+            'order_up_to': order_up_to,
+            'on_hand': on_hand,
+            'expected_waste': waste,
+            'usable_stock': usable,
+            'days_of_cover': days_of_cover,
+            'suggested_quantity': suggested,
+        }
+        return products, figures, batch_suppliers
+
+    # ================================================================
+    # RUNS
+    # ================================================================
+
+    def generate(self, method='ses', now=None, store=True):
+        """
+        Compute reorder suggestions for the catalog, grouped per supplier.
+
+        Args:
+            method: 'ses' (exponential smoothing) or 'moving_average'
+            store: save the run (the nightly job); False just returns it
+
+        Returns:
+            dict: run summary with per-supplier totals, and its `lines`
+        """
+        try:
+            now = now or datetime.utcnow()
+            started = datetime.utcnow()
+            products, figures, batch_suppliers = self.compute(method, now)
+
+            run_id = now.strftime('%Y-%m-%dT%H%M%S')
+            columns = {name: values.tolist() for name, values in figures.items()}
+            lines = []
+            for row in np.flatnonzero(figures['suggested_quantity'] > 0).tolist():
+                product = products[row]
+                cost_price = product.get('cost_price') or 0
+                quantity = columns['suggested_quantity'][row]
+                days_of_cover = columns['days_of_cover'][row]
+                lines.append({
+                    'run_id': run_id,
+                    'product_id': product['_id'],
+                    'product_name': product.get('product_name'),
+                    'SKU': product.get('SKU'),
+                    'unit': product.get('unit'),
+                    'category_id': product.get('category_id'),
+                    'supplier_id': product.get('supplier_id') or batch_suppliers.get(row),
+                    'suggested_quantity': int(quantity),
+                    'estimated_cost': round(quantity * cost_price, 2),
+                    'days_of_cover': round(days_of_cover, 1),
+                    **{
+                        name: round(columns[name][row], 2)
+                        for name in ('forecast_daily', 'moving_average_daily', 'smoothed_daily', 'daily_std',
+                                     'sold_last_window', 'lead_time_days', 'safety_stock', 'reorder_point',
+                                     'order_up_to', 'on_hand', 'expected_waste', 'usable_stock')
+                    }
+                })
+            lines.sort(key=lambda line: line['days_of_cover'])
+
+            suppliers = {}
+            for line in lines:
+                supplier = suppliers.setdefault(line['supplier_id'] or 'unassigned', {
+                    'product_count': 0, 'total_units': 0, 'estimated_cost': 0.0
+                })
+                supplier['product_count'] += 1
+                supplier['total_units'] += line['suggested_quantity']
+                supplier['estimated_cost'] = round(supplier['estimated_cost'] + line['estimated_cost'], 2)
+            names = {
+                supplier['_id']: supplier.get('supplier_name')
+                for supplier in self.supplier_collection.find({'_id': {'$in': list(suppliers)}}, {'supplier_name': 1})
+            }
+            for supplier_id, supplier in suppliers.items():
+                supplier['supplier_name'] = names.get(supplier_id, 'Unassigned' if supplier_id == 'unassigned' else None)
+
+            run = {
+                '_id': run_id,
+                'generated_at': now,
+                'method': method,
+                'parameters': {
+                    'history_days': HISTORY_DAYS,
+                    'moving_average_days': MOVING_AVERAGE_DAYS,
+                    'smoothing_alpha': SMOOTHING_ALPHA,
+                    'service_level': SERVICE_LEVEL,
+                    'default_lead_time_days': DEFAULT_LEAD_TIME_DAYS,
+                    'review_period_days': REVIEW_PERIOD_DAYS
+                },
+                'product_count': len(products),
+                'reorder_count': len(lines),
+                'total_units': sum(line['suggested_quantity'] for line in lines),
+                'estimated_cost': round(sum(line['estimated_cost'] for line in lines), 2),
+                'suppliers': suppliers,
+                'duration_seconds': round((datetime.utcnow() - started).total_seconds(), 2)
+            }
+
+            if store:
+                # Lines first: a run document only exists once its lines are complete
+                operations = [InsertOne(line) for line in lines]
+                for start in range(0, len(operations), LINE_WRITE_CHUNK):
+                    self.line_collection.bulk_write(operations[start:start + LINE_WRITE_CHUNK], ordered=False)
+                self.run_collection.replace_one({'_id': run_id}, run, upsert=True)
+
+            logger.info(
+                f"Reorder suggestions {run_id}: {len(lines)} of {len(products)} products, "
+                f"{run['total_units']} units, {run['duration_seconds']}s"
+            )
+            return {**run, 'lines': lines}
+
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Error generating reorder suggestions: {str(e)}")
+            raise Exception(f"Error generating reorder suggestions: {str(e)}")
+
+    def get_latest_run(self, supplier_id=None, limit=200, skip=0):
+        """Latest stored run and its lines (optionally one supplier's), most urgent first"""
+        try:
+            run = self.run_collection.find_one({}, sort=[('generated_at', DESCENDING)])
+            if not run:
+                return None
+            query = {'run_id': run['_id']}
+            if supplier_id:
+                query['supplier_id'] = None if supplier_id == 'unassigned' else supplier_id
+            run['lines'] = list(
+                self.line_collection.find(query, {'_id': 0}).sort('days_of_cover', 1).skip(skip).limit(limit)
+            )
+            run['line_total'] = self.line_collection.count_documents(query)
+            return run
+
+        except Exception as e:
+            logger.error(f"Error getting reorder suggestions: {str(e)}")
+            raise Exception(f"Error getting reorder suggestions: {str(e)}")
+
+
+demand_forecast_service = DemandForecastService()
@@ -0,0 +1,519 @@
+from datetime import datetime, timedelta, timezone
+from pymongo import UpdateMany, UpdateOne
+from ..database import db_manager
+from .change_log_service import change_log_service
+from .stock_state_service import stock_state_service
+from .supplier_stats_service import BATCH_STATS_PROJECTION, supplier_stats_service
+from notifications.services import notification_service
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Products get flagged with expiry_alert when a batch expires within this window
+EXPIRY_ALERT_DAYS = 30
+
+# Set once this process has seen a populated calendar (or built one)
+_calendar_ready = False
+_calendar_ready_lock = threading.Lock()
+
+
+class ExpiryCalendarService:
+    """
+    Precomputed expiry calendar for batches.
+
+    Every active batch with stock and an expiry date is listed in exactly one
+    bucket document of the `expiry_calendar` collection, keyed by its expiry
+    day ('YYYY-MM-DD'). Buckets are maintained whenever a batch is created,
+    updated, depleted or restored, so expiry dashboards read a handful of
+    day buckets instead of scanning the batches collection, and the daily
+    job only has to look at buckets that are due.
+    """
+
+    def __init__(self):
+        self.db = db_manager.get_database()
+        self.calendar_collection = self.db.expiry_calendar
+        self.calendar_state_collection = self.db.expiry_calendar_state
+        self.batch_collection = self.db.batches
+        self.product_collection = self.db.products
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        """Create indexes used by calendar maintenance"""
+        try:
+            self.calendar_collection.create_index([("batches.batch_id", 1)], background=True)
+            self.calendar_collection.create_index([("batches.product_id", 1)], background=True)
+        except Exception as e:
+            logger.warning(f"Could not create expiry calendar indexes: {e}")
+
+    # ================================================================
+    # HELPERS
+    # ================================================================
+
+    def _normalize_expiry(self, expiry_date):
+        """Return expiry_date as a naive UTC datetime, or None"""
+        if not expiry_date:
+            return None
+
+        if isinstance(expiry_date, str):
+            try:
+                from dateutil import parser
+                expiry_date = parser.parse(expiry_date)
+            except Exception:
+                return None
+
+        if not isinstance(expiry_date, datetime):
+            return None
+
+        if expiry_date.tzinfo is not None:
+            expiry_date = expiry_date.astimezone(timezone.utc).replace(tzinfo=None)
+
+        return expiry_date
+
+    def _day_key(self, day):
+        """Bucket key for a date/datetime"""
+        return day.strftime('%Y-%m-%d')
+
+    def _is_tracked(self, batch):
+        """Only active batches with stock and an expiry date live in the calendar"""
+        return (
+            batch.get('status') == 'active'
+            and batch.get('quantity_remaining', 0) > 0
+            and self._normalize_expiry(batch.get('expiry_date')) is not None
+        )
+
+    def _calendar_entry(self, batch):
+        return {
+            'batch_id': batch['_id'],
+            'product_id': batch.get('product_id'),
+            'supplier_id': batch.get('supplier_id'),
+            'batch_number': batch.get('batch_number'),
+            'expiry_date': self._normalize_expiry(batch.get('expiry_date')),
+            'quantity_remaining': batch.get('quantity_remaining', 0)
+        }
+
+    # ================================================================
+    # CALENDAR MAINTENANCE
+    # ================================================================
+
+    def sync_batches(self, batch_ids):
+        """
+        Re-index the given batches in the calendar.
+
+        Called after any write that can change a batch's status, quantity or
+        expiry date. Old entries are pulled (indexed on batches.batch_id) and
+        tracked batches are pushed into their current day bucket, all in one
+        ordered bulk_write.
+        """
+        try:
+            batch_ids = list({batch_id for batch_id in batch_ids if batch_id})
+            if not batch_ids:
+                return 0
+
+            batches = self.batch_collection.find(
+                {'_id': {'$in': batch_ids}},
+                {
+                    'product_id': 1, 'supplier_id': 1, 'batch_number': 1,
+                    'expiry_date': 1, 'quantity_remaining': 1, 'status': 1
+                }
+            )
+
+            operations = [
+                UpdateMany(
+                    {'batches.batch_id': {'$in': batch_ids}},
+                    {'$pull': {'batches': {'batch_id': {'$in': batch_ids}}}}
+                )
+            ]
+
+            for batch in batches:
+                if not self._is_tracked(batch):
+                    continue
+
+                entry = self._calendar_entry(batch)
+                expiry_day = entry['expiry_date'].replace(hour=0, minute=0, second=0, microsecond=0)
+                operations.append(UpdateOne(
+                    {'_id': self._day_key(expiry_day)},
+                    {
+                        '$push': {'batches': entry},
+                        '$setOnInsert': {'date': expiry_day}
+                    },
+                    upsert=True
+                ))
+
+            self.calendar_collection.bulk_write(operations, ordered=True)
+            return len(operations) - 1
+
+        except Exception as e:
+            # Calendar maintenance must never break the batch write that triggered it
+            logger.error(f"Error syncing expiry calendar for batches {batch_ids}: {str(e)}")
+            return 0
+
+    def rebuild_calendar(self):
+        """Rebuild the whole calendar from the batches collection"""
+        try:
+            pipeline = [
+                {
+                    '$match': {
+                        'status': 'active',
+                        'quantity_remaining': {'$gt': 0},
+                        'expiry_date': {'$type': 'date'}
+                    }
+                },
+                {
+                    '$group': {
+                        '_id': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$expiry_date'}},
+                        'date': {'$min': {'$dateTrunc': {'date': '$expiry_date', 'unit': 'day'}}},
+                        'batches': {
+                            '$push': {
+                                'batch_id': '$_id',
+                                'product_id': '$product_id',
+                                'supplier_id': '$supplier_id',
+                                'batch_number': '$batch_number',
+                                'expiry_date': '$expiry_date',
+                                'quantity_remaining': '$quantity_remaining'
+                            }
+                        }
+                    }
+                }
+            ]
+
+            buckets = list(self.batch_collection.aggregate(pipeline, allowDiskUse=True))
+
+            self.calendar_collection.delete_many({})
+            if buckets:
+                self.calendar_collection.insert_many(buckets, ordered=False)
+
+            # Legacy batches with string expiry dates go through the normal path
+            legacy_ids = [
+                batch['_id'] for batch in self.batch_collection.find(
+                    {
+                        'status': 'active',
+                        'quantity_remaining': {'$gt': 0},
+                        'expiry_date': {'$type': 'string'}
+                    },
+                    {'_id': 1}
+                )
+            ]
+            if legacy_ids:
+                self.sync_batches(legacy_ids)
+
+            total_batches = sum(len(bucket['batches']) for bucket in buckets) + len(legacy_ids)
+            self.calendar_state_collection.update_one(
+                {'_id': 'calendar'},
+                {'$set': {'built_at': datetime.utcnow(), 'days': len(buckets), 'batches': total_batches}},
+                upsert=True
+            )
+            logger.info(f"Expiry calendar rebuilt: {len(buckets)} days, {total_batches} batches")
+
+            return {
+                'days': len(buckets),
+                'batches': total_batches
+            }
+
+        except Exception as e:
+            logger.error(f"Error rebuilding expiry calendar: {str(e)}")
+            raise Exception(f"Error rebuilding expiry calendar: {str(e)}")
+
+    def ensure_calendar(self):
+        """
+        Build the calendar from the batches collection if it was never built.
+
+        Batch writes only index the batches they touch, so batches that existed
+        before the calendar was introduced reach it through a full build only;
+        readers call this first so dashboards and the daily job don't silently
+        miss them on an existing deployment. Checked once per process.
+        """
+        global _calendar_ready
+        if _calendar_ready:
+            return
+        with _calendar_ready_lock:
+            if _calendar_ready:
+                return
+            try:
+                if self.calendar_state_collection.find_one({'_id': 'calendar'}, {'_id': 1}) is None:
+                    logger.info("Expiry calendar was never built - building it from batches")
+                    self.rebuild_calendar()
+                _calendar_ready = True
+            except Exception as e:
+                logger.warning(f"Could not backfill expiry calendar: {e}")
+
+    # ================================================================
+    # PRODUCT EXPIRY SUMMARIES
+    # ================================================================
+
+    def refresh_product_summaries(self, product_ids):
+        """
+        Recompute expiry/stock summary fields for many products at once.
+
+        One aggregation over the (product_id-indexed) active batches of the
+        given products, followed by a single bulk_write on products.
+        """
+        try:
+            product_ids = list({product_id for product_id in product_ids if product_id})
+            if not product_ids:
+                return 0
+
+            now = datetime.utcnow()
+            warning_date = now + timedelta(days=EXPIRY_ALERT_DAYS)
+
+            pipeline = [
+                {
+                    '$match': {
+                        'product_id': {'$in': product_ids},
+                        'status': 'active',
+                        'quantity_remaining': {'$gt': 0}
+                    }
+                },
+                # Legacy batches store expiry_date as an ISO string
+                {
+                    '$addFields': {
+                        'expiry_on': {
+                            '$convert': {'input': '$expiry_date', 'to': 'date', 'onError': None, 'onNull': None}
+                        }
+                    }
+                },
+                {
+                    '$match': {
+                        '$or': [
+                            {'expiry_on': None},
+                            {'expiry_on': {'$gte': now}}
+                        ]
+                    }
+                },
+                {'$sort': {'expiry_on': 1}},
+                {
+                    '$group': {
+                        '_id': '$product_id',
+                        'oldest_batch_expiry': {'$min': '$expiry_on'},
+                        'newest_batch_expiry': {'$max': '$expiry_on'},
+                        'total_stock': {'$sum': '$quantity_remaining'},
+                        'cost_price': {'$first': '$cost_price'}
+                    }
+                }
+            ]
+
+            summaries = {
+                summary['_id']: summary
+                for summary in self.batch_collection.aggregate(pipeline)
+            }
+
+            operations = []
+            for product_id in product_ids:
+                summary = summaries.get(product_id)
+
+                if summary:
+                    oldest_expiry = summary.get('oldest_batch_expiry')
+                    update_data = {
+                        'oldest_batch_expiry': oldest_expiry,
+                        'newest_batch_expiry': summary.get('newest_batch_expiry'),
+                        'expiry_alert': bool(oldest_expiry and oldest_expiry <= warning_date),
+                        'total_stock': summary['total_stock'],
+                        'stock': summary['total_stock'],
+                        'cost_price': summary.get('cost_price') or 0
+                    }
+                else:
+                    update_data = {
+                        'oldest_batch_expiry': None,
+                        'newest_batch_expiry': None,
+                        'expiry_alert': False,
+                        'total_stock': 0,
+                        'stock': 0,
+                        'cost_price': 0
+                    }
+
+                update_data['updated_at'] = now
+                operations.append(UpdateOne({'_id': product_id}, {'$set': update_data}))
+
+            self.product_collection.bulk_write(operations, ordered=False)
+            change_log_service.record_changes('products', product_ids)
+            stock_state_service.refresh(product_ids, context={'source': 'batch_expiry'})
+            return len(operations)
+
+        except Exception as e:
+            logger.error(f"Error refreshing product expiry summaries: {str(e)}")
+            raise Exception(f"Error refreshing product expiry summaries: {str(e)}")
+
+    # ================================================================
+    # DAILY EXPIRY JOB
+    # ================================================================
+
+    def process_due_expiries(self, as_of=None):
+        """
+        Daily job: expire batches from due buckets only.
+
+        Reads buckets up to today (normally just today's, plus any left over
+        from missed runs), marks their past-expiry batches as expired, pulls
+        them from the calendar, refreshes the affected product summaries in
+        bulk and emits one consolidated notification. Products whose batches
+        entered the alert window are flagged without touching their batches.
+        """
+        try:
+            self.ensure_calendar()
+            now = as_of or datetime.utcnow()
+            today_key = self._day_key(now)
+
+            due_buckets = list(self.calendar_collection.find({'_id': {'$lte': today_key}}))
+
+            expired_entries = [
+                entry
+                for bucket in due_buckets
+                for entry in bucket.get('batches', [])
+                if entry.get('expiry_date') and entry['expiry_date'] < now
+            ]
+            expired_ids = [entry['batch_id'] for entry in expired_entries]
+
+            batches_expired = 0
+            if expired_ids:
+                # Read what is about to expire so supplier counters can move it
+                expiring = list(self.batch_collection.find(
+                    {'_id': {'$in': expired_ids}, 'status': 'active'}, BATCH_STATS_PROJECTION
+                ))
+                result = self.batch_collection.update_many(
+                    {'_id': {'$in': [batch['_id'] for batch in expiring]}, 'status': 'active'},
+                    {'$set': {'status': 'expired', 'updated_at': now}}
+                )
+                batches_expired = result.modified_count
+                change_log_service.record_changes('batches', expired_ids)
+
+                if batches_expired == len(expiring):
+                    supplier_stats_service.record_batch_changes(
+                        (batch, {**batch, 'status': 'expired'}) for batch in expiring
+                    )
+                else:
+                    # A concurrent write changed some of them - recount instead of guessing
+                    supplier_stats_service.rebuild({batch['supplier_id'] for batch in expiring if batch.get('supplier_id')})
+
+                self.calendar_collection.update_many(
+                    {'_id': {'$lte': today_key}},
+                    {'$pull': {'batches': {'batch_id': {'$in': expired_ids}}}}
+                )
+
+            # Due buckets with nothing left in them are done
+            self.calendar_collection.delete_many({'_id': {'$lte': today_key}, 'batches': {'$size': 0}})
+
+            affected_products = {entry['product_id'] for entry in expired_entries}
+            products_refreshed = self.refresh_product_summaries(affected_products) if affected_products else 0
+
+            products_flagged = self._flag_products_entering_alert_window(now)
+
+            if expired_entries:
+                self._send_expiry_summary_notification(expired_entries, len(affected_products), now)
+
+            logger.info(
+                f"Expiry job: {batches_expired} batches expired, "
+                f"{products_refreshed} products refreshed, {products_flagged} products flagged"
+            )
+
+            return {
+                'batches_expired': batches_expired,
+                'products_refreshed': products_refreshed,
+                'products_flagged': products_flagged,
+                'buckets_processed': len(due_buckets)
+            }
+
+        except Exception as e:
+            logger.error(f"Error processing due expiries: {str(e)}")
+            raise Exception(f"Error processing due expiries: {str(e)}")
+
+    def _flag_products_entering_alert_window(self, now):
+        """Set expiry_alert on products with a batch expiring within the alert window"""
+        window_end = self._day_key(now + timedelta(days=EXPIRY_ALERT_DAYS))
+        product_ids = self.calendar_collection.distinct(
+            'batches.product_id',
+            {'_id': {'$gt': self._day_key(now), '$lte': window_end}}
+        )
+        if not product_ids:
+            return 0
+
+        result = self.product_collection.update_many(
+            {'_id': {'$in': product_ids}, 'expiry_alert': {'$ne': True}},
+            {'$set': {'expiry_alert': True, 'updated_at': now}}
+        )
+        if result.modified_count:
+            change_log_service.record_changes('products', product_ids)
+        return result.modified_count
+
+    def _send_expiry_summary_notification(self, expired_entries, product_count, now):
+        """One notification for the whole run instead of one per batch"""
+        try:
+            total_quantity = sum(entry.get('quantity_remaining', 0) for entry in expired_entries)
+
+            notification_service.create_notification(
+                title="Batches Expired",
+                message=f"{len(expired_entries)} batch(es) across {product_count} product(s) expired today",
+                priority="high",
+                notification_type="alert",
+                metadata={
+                    "action_type": "batch_expired_summary",
+                    "run_date": self._day_key(now),
+                    "batch_count": len(expired_entries),
+                    "product_count": product_count,
+                    "total_quantity": total_quantity,
+                    "batch_ids": [entry['batch_id'] for entry in expired_entries[:100]]
+                }
+            )
+        except Exception as e:
+            logger.error(f"Failed to send expiry summary notification: {e}")
+
+    # ================================================================
+    # CALENDAR QUERIES (DASHBOARDS)
+    # ================================================================
+
+    def get_calendar_entries(self, days_ahead=30, include_overdue=False, now=None):
+        """
+        Return calendar entries expiring after `now` and up to `days_ahead` days.
+
+        Cost is proportional to the number of day buckets in range.
+        """
+        try:
+            self.ensure_calendar()
+            now = now or datetime.utcnow()
+            end_time = now + timedelta(days=days_ahead)
+
+            key_range = {'$lte': self._day_key(end_time)}
+            if not include_overdue:
+                key_range['$gte'] = self._day_key(now)
+
+            entries = []
+            for bucket in self.calendar_collection.find({'_id': key_range}).sort('_id', 1):
+                for entry in bucket.get('batches', []):
+                    expiry_date = entry.get('expiry_date')
+                    if not expiry_date or expiry_date > end_time:
+                        continue
+                    if not include_overdue and expiry_date <= now:
+                        continue
+                    entries.append(entry)
+
+            entries.sort(key=lambda entry: entry['expiry_date'])
+            return entries
+
+        except Exception as e:
+            logger.error(f"Error reading expiry calendar: {str(e)}")
+            raise Exception(f"Error reading expiry calendar: {str(e)}")
+
+    def get_calendar_summary(self, days_ahead=30):
+        """Per-day counts for the expiry dashboard"""
+        try:
+            self.ensure_calendar()
+            today_key = self._day_key(datetime.utcnow())
+            end_key = self._day_key(datetime.utcnow() + timedelta(days=days_ahead))
+
+            pipeline = [
+                {'$match': {'_id': {'$gte': today_key, '$lte': end_key}}},
+                {
+                    '$project': {
+                        '_id': 0,
+                        'day': '$_id',
+                        'batch_count': {'$size': '$batches'},
+                        'product_count': {'$size': {'$setUnion': ['$batches.product_id', []]}},
+                        'total_quantity': {'$sum': '$batches.quantity_remaining'}
+                    }
+                },
+                {'$sort': {'day': 1}}
+            ]
+
+            return list(self.calendar_collection.aggregate(pipeline))
+
+        except Exception as e:
+            logger.error(f"Error getting expiry calendar summary: {str(e)}")
+            raise Exception(f"Error getting expiry calendar summary: {str(e)}")
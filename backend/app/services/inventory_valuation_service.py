@@ -0,0 +1,330 @@
+from datetime import datetime, timedelta
+import logging
+import uuid
+
+from pymongo import DESCENDING, InsertOne
+
+from ..database import db_manager
+from .expiry_calendar_service import EXPIRY_ALERT_DAYS
+
+logger = logging.getLogger(__name__)
+
+VALUE_FIELDS = ('quantity', 'cost_value', 'retail_value', 'expiring_quantity', 'expiring_value', 'batch_count')
+LINE_WRITE_CHUNK = 1000
+
+
+class InventoryValuationService:
+    """
+    Daily FIFO inventory valuation snapshots.
+
+    Stock is valued batch by batch: every active batch contributes its
+    `quantity_remaining` at its own `cost_price`, which is the FIFO value
+    because sales deduct the oldest batches first. One aggregation over the
+    batches computes the per-product figures for the day; they are stored as
+
+      - `inventory_valuation_snapshots`: one compact document per day with
+        the totals and per-category figures (month-end valuation is a single
+        `_id` lookup), and
+      - `inventory_valuation_lines`: one document per product per day, for
+        product-level history and deltas.
+
+    Past stock can't be reconstructed from batch state, so snapshots are only
+    taken for "now"; a date without a snapshot resolves to the latest one
+    taken on or before it.
+    """
+
+    def __init__(self):
+        self.db = db_manager.get_database()
+        self.batch_collection = self.db.batches
+        self.category_collection = self.db.category
+        self.snapshot_collection = self.db.inventory_valuation_snapshots
+        self.line_collection = self.db.inventory_valuation_lines
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        """Indexes for the valuation aggregation and snapshot lookups"""
+        try:
+            self.batch_collection.create_index([("status", 1), ("quantity_remaining", 1)], background=True)
+            self.snapshot_collection.create_index([("snapshot_date", DESCENDING)], background=True)
+            self.line_collection.create_index([("snapshot_id", 1), ("run_id", 1), ("product_id", 1)], unique=True, background=True)
+            self.line_collection.create_index([("product_id", 1), ("snapshot_date", DESCENDING)], background=True)
+        except Exception as e:
+            logger.warning(f"Could not create inventory valuation indexes: {e}")
+
+    @staticmethod
+    def _day_key(moment):
+        return moment.strftime('%Y-%m-%d')
+
+    @staticmethod
+    def _empty_values():
+        return {field: 0 for field in VALUE_FIELDS}
+
+    # ================================================================
+    # SNAPSHOT JOB
+    # ================================================================
+
+    def _valuation_pipeline(self, expiring_before):
+        """Active batches -> one row per product with FIFO cost, retail and expiring value"""
+        batch_cost = {'$multiply': ['$quantity_remaining', {'$ifNull': ['$cost_price', 0]}]}
+        is_expiring = {'$and': [
+            {'$ne': [{'$ifNull': ['$expiry_date', None]}, None]},
+            {'$lte': ['$expiry_date', expiring_before]}
+        ]}
+        return [
+            {'$match': {'status': 'active', 'quantity_remaining': {'$gt': 0}}},
+            {'$group': {
+                '_id': '$product_id',
+                'quantity': {'$sum': '$quantity_remaining'},
+                'cost_value': {'$sum': batch_cost},
+                'expiring_quantity': {'$sum': {'$cond': [is_expiring, '$quantity_remaining', 0]}},
+                'expiring_value': {'$sum': {'$cond': [is_expiring, batch_cost, 0]}},
+                'batch_count': {'$sum': 1}
+            }},
+            {'$lookup': {
+                'from': 'products',
+                'localField': '_id',
+                'foreignField': '_id',
+                'as': 'product'
+            }},
+            {'$unwind': {'path': '$product', 'preserveNullAndEmptyArrays': True}},
+            {'$project': {
+                'product_id': '$_id',
+                '_id': 0,
+                'product_name': '$product.product_name',
+                'SKU': '$product.SKU',
+                'category_id': '$product.category_id',
+                'quantity': 1,
+                'cost_value': 1,
+                'retail_value': {'$multiply': ['$quantity', {'$ifNull': ['$product.selling_price', 0]}]},
+                'expiring_quantity': 1,
+                'expiring_value': 1,
+                'batch_count': 1
+            }}
+        ]
+
+    def take_snapshot(self, now=None):
+        """
+        Value current stock and store it as today's snapshot.
+
+        Re-running on the same day replaces that day's snapshot.
+
+        Returns:
+            dict: the snapshot document (totals and categories)
+        """
+        try:
+            now = now or datetime.utcnow()
+            snapshot_id = self._day_key(now)
+            snapshot_date = datetime.strptime(snapshot_id, '%Y-%m-%d')
+            expiring_before = now + timedelta(days=EXPIRY_ALERT_DAYS)
+
+            lines = list(self.batch_collection.aggregate(self._valuation_pipeline(expiring_before), allowDiskUse=True))
+
+            totals = self._empty_values()
+            categories = {}
+            for line in lines:
+                for field in ('cost_value', 'retail_value', 'expiring_value'):
+                    line[field] = round(line.get(field) or 0, 2)
+                line['category_id'] = line.get('category_id') or 'uncategorized'
+                category = categories.setdefault(line['category_id'], {**self._empty_values(), 'product_count': 0})
+                category['product_count'] += 1
+                for field in VALUE_FIELDS:
+                    category[field] += line[field]
+                    totals[field] += line[field]
+
+            names = {
+                category['_id']: category.get('category_name')
+                for category in self.category_collection.find(
+                    {'_id': {'$in': list(categories)}}, {'category_name': 1}
+                )
+            }
+            for category_id, category in categories.items():
+                category['category_name'] = names.get(category_id, 'Uncategorized')
+                for field in ('cost_value', 'retail_value', 'expiring_value'):
+                    category[field] = round(category[field], 2)
+            for field in ('cost_value', 'retail_value', 'expiring_value'):
+                totals[field] = round(totals[field], 2)
+            totals['product_count'] = len(lines)
+
+            run_id = uuid.uuid4().hex
+            snapshot = {
+                '_id': snapshot_id,
+                'run_id': run_id,
+                'snapshot_date': snapshot_date,
+                'taken_at': now,
+                'valuation_method': 'fifo',
+                'expiry_window_days': EXPIRY_ALERT_DAYS,
+                'totals': totals,
+                'categories': categories
+            }
+
+            # New lines go in under this run's ID before the snapshot document
+            # points at them, so a same-day re-run never exposes a snapshot
+            # with missing lines; the previous run's lines are dropped after
+            operations = [
+                InsertOne({**line, 'snapshot_id': snapshot_id, 'run_id': run_id, 'snapshot_date': snapshot_date})
+                for line in lines
+            ]
+            for start in range(0, len(operations), LINE_WRITE_CHUNK):
+                self.line_collection.bulk_write(operations[start:start + LINE_WRITE_CHUNK], ordered=False)
+            self.snapshot_collection.replace_one({'_id': snapshot_id}, snapshot, upsert=True)
+            self.line_collection.delete_many({'snapshot_id': snapshot_id, 'run_id': {'$ne': run_id}})
+
+            logger.info(
+                f"Inventory valuation {snapshot_id}: {len(lines)} products, "
+                f"cost {totals['cost_value']}, retail {totals['retail_value']}"
+            )
+            return snapshot
+
+        except Exception as e:
+            logger.error(f"Error taking inventory valuation snapshot: {str(e)}")
+            raise Exception(f"Error taking inventory valuation snapshot: {str(e)}")
+
+    # ================================================================
+    # POINT-IN-TIME QUERIES
+    # ================================================================
+
+    def get_snapshot(self, as_of=None):
+        """
+        Valuation on a date: that day's snapshot, else the latest one before it.
+
+        Args:
+            as_of: datetime (default: now)
+
+        Returns:
+            dict | None: snapshot document plus `requested_date` and `exact`
+        """
+        try:
+            as_of = as_of or datetime.utcnow()
+            requested_id = self._day_key(as_of)
+            snapshot = self.snapshot_collection.find_one({'_id': requested_id})
+            if not snapshot:
+                snapshot = self.snapshot_collection.find_one(
+                    {'snapshot_date': {'$lte': datetime.strptime(requested_id, '%Y-%m-%d')}},
+                    sort=[('snapshot_date', DESCENDING)]
+                )
+            if not snapshot:
+                return None
+            snapshot['requested_date'] = requested_id
+            snapshot['exact'] = snapshot['_id'] == requested_id
+            return snapshot
+
+        except Exception as e:
+            logger.error(f"Error getting inventory valuation: {str(e)}")
+            raise Exception(f"Error getting inventory valuation: {str(e)}")
+
+    def list_snapshots(self, start_date=None, end_date=None, limit=90):
+        """Snapshot totals (without categories) newest first, e.g. for a value trend"""
+        try:
+            query = {}
+            if start_date or end_date:
+                query['snapshot_date'] = {}
+                if start_date:
+                    query['snapshot_date']['$gte'] = start_date
+                if end_date:
+                    query['snapshot_date']['$lte'] = end_date
+            return list(
+                self.snapshot_collection.find(query, {'categories': 0})
+                .sort('snapshot_date', DESCENDING)
+                .limit(limit)
+            )
+
+        except Exception as e:
+            logger.error(f"Error listing inventory valuations: {str(e)}")
+            raise Exception(f"Error listing inventory valuations: {str(e)}")
+
+    @staticmethod
+    def _line_query(snapshot):
+        """Lines written by the run the snapshot document currently points at"""
+        return {'snapshot_id': snapshot['_id'], 'run_id': snapshot.get('run_id')}
+
+    def get_snapshot_lines(self, snapshot, category_id=None, limit=100, skip=0):
+        """Per-product valuation lines of one snapshot, highest cost value first"""
+        try:
+            query = self._line_query(snapshot)
+            if category_id:
+                query['category_id'] = category_id
+            lines = list(
+                self.line_collection.find(query, {'_id': 0})
+                .sort('cost_value', DESCENDING)
+                .skip(skip)
+                .limit(limit)
+            )
+            return {'lines': lines, 'total': self.line_collection.count_documents(query)}
+
+        except Exception as e:
+            logger.error(f"Error getting inventory valuation lines: {str(e)}")
+            raise Exception(f"Error getting inventory valuation lines: {str(e)}")
+
+    # ================================================================
+    # DELTA BETWEEN DATES
+    # ================================================================
+
+    @staticmethod
+    def _diff(start, end, fields):
+        start, end = start or {}, end or {}
+        return {field: round((end.get(field) or 0) - (start.get(field) or 0), 2) for field in fields}
+
+    def get_delta(self, from_date, to_date, top_products=20):
+        """
+        Valuation change between the snapshots covering two dates.
+
+        Returns:
+            dict | None: both snapshots' dates and totals, the total and
+            per-category change, and the products whose cost value moved
+            most (None when either date has no snapshot)
+        """
+        try:
+            start = self.get_snapshot(from_date)
+            end = self.get_snapshot(to_date)
+            if not start or not end:
+                return None
+
+            category_fields = VALUE_FIELDS + ('product_count',)
+            categories = {}
+            for category_id in set(start['categories']) | set(end['categories']):
+                before = start['categories'].get(category_id)
+                after = end['categories'].get(category_id)
+                categories[category_id] = {
+                    'category_name': (after or before).get('category_name'),
+                    **self._diff(before, after, category_fields)
+                }
+
+            product_changes = []
+            if top_products:
+                line_projection = {'_id': 0, 'product_id': 1, 'product_name': 1, 'category_id': 1,
+                                   'quantity': 1, 'cost_value': 1, 'retail_value': 1}
+                before_lines = {
+                    line['product_id']: line
+                    for line in self.line_collection.find(self._line_query(start), line_projection)
+                }
+                for line in self.line_collection.find(self._line_query(end), line_projection):
+                    before = before_lines.pop(line['product_id'], None)
+                    product_changes.append({
+                        'product_id': line['product_id'],
+                        'product_name': line.get('product_name'),
+                        'category_id': line.get('category_id'),
+                        **self._diff(before, line, ('quantity', 'cost_value', 'retail_value'))
+                    })
+                for before in before_lines.values():
+                    product_changes.append({
+                        'product_id': before['product_id'],
+                        'product_name': before.get('product_name'),
+                        'category_id': before.get('category_id'),
+                        **self._diff(before, None, ('quantity', 'cost_value', 'retail_value'))
+                    })
+                product_changes.sort(key=lambda change: abs(change['cost_value']), reverse=True)
+
+            return {
+                'from': {'snapshot_id': start['_id'], 'requested_date': start['requested_date'], 'totals': start['totals']},
+                'to': {'snapshot_id': end['_id'], 'requested_date': end['requested_date'], 'totals': end['totals']},
+                'change': self._diff(start['totals'], end['totals'], category_fields),
+                'categories': categories,
+                'top_product_changes': product_changes[:top_products]
+            }
+
+        except Exception as e:
+            logger.error(f"Error getting inventory valuation delta: {str(e)}")
+            raise Exception(f"Error getting inventory valuation delta: {str(e)}")
+
+
+inventory_valuation_service = InventoryValuationService()
@@ -0,0 +1,355 @@
+from datetime import datetime
+import logging
+
+from pymongo import UpdateOne
+
+from ..database import db_manager
+
+logger = logging.getLogger(__name__)
+
+# Report source -> (collection, filter excluding transactions that did not happen)
+REPORT_SOURCES = {
+    'pos': ('sales', {'status': {'$nin': ['voided', 'returned']}}),
+    'online': ('online_transactions', {'is_cancelled': {'$ne': True}}),
+}
+
+BACKFILL_CHUNK = 500
+
+
+class MarginService:
+    """
+    Line-level cost of goods and gross margin.
+
+    COGS is computed once at checkout from the batches FIFO deduction
+    actually used (`batches_used[].quantity_deducted * cost_price`) and
+    stored on every line together with the line's net revenue (its share of
+    the merchandise total after points discounts; fees are not merchandise)
+    and gross margin, plus the totals on the sale. Margin reports are then
+    aggregations over these stored fields on a `transaction_date` range
+    instead of unwinding every sale and batch.
+
+    Lines sold without batch tracking (legacy sales) are costed at the
+    product's current `cost_price` by the backfill and flagged
+    `cogs_estimated`.
+    """
+
+    def __init__(self):
+        self.db = db_manager.get_database()
+        self.product_collection = self.db.products
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        """Date-range indexes for the margin report aggregations"""
+        try:
+            for collection_name, _ in REPORT_SOURCES.values():
+                self.db[collection_name].create_index([("transaction_date", 1)], background=True)
+        except Exception as e:
+            logger.warning(f"Could not create margin report indexes: {e}")
+
+    # ================================================================
+    # COSTING
+    # ================================================================
+
+    @staticmethod
+    def _margin_pct(margin, revenue):
+        return round(margin / revenue * 100, 2) if revenue else 0
+
+    @classmethod
+    def line_costing(cls, item, revenue_ratio=1, fallback_cost=None):
+        """
+        Costing fields for one line.
+
+        Args:
+            item: sale/order line with quantity, subtotal and batches_used
+            revenue_ratio: merchandise total after discounts / before
+            fallback_cost: unit cost for lines without batches_used
+
+        Returns:
+            dict: cogs, net_amount, gross_margin, margin_pct (+ cogs_estimated)
+        """
+        batches_used = item.get('batches_used')
+        if batches_used:
+            cogs = sum(
+                (batch.get('quantity_deducted') or 0) * (batch.get('cost_price') or 0)
+                for batch in batches_used
+            )
+            estimated = False
+        else:
+            cogs = (item.get('quantity') or 0) * (fallback_cost or 0)
+            estimated = True
+
+        subtotal = item.get('subtotal')
+        if subtotal is None:
+            subtotal = (item.get('unit_price', item.get('price', 0)) or 0) * (item.get('quantity') or 0)
+
+        net_amount = round(subtotal * revenue_ratio, 2)
+        cogs = round(cogs, 2)
+        costing = {
+            'cogs': cogs,
+            'net_amount': net_amount,
+            'gross_margin': round(net_amount - cogs, 2),
+            'margin_pct': cls._margin_pct(net_amount - cogs, net_amount)
+        }
+        if estimated:
+            costing['cogs_estimated'] = True
+        return costing
+
+    @classmethod
+    def deduct_return(cls, item, net_amount, cogs):
+        """Costing fields of a costed line after units worth `net_amount` / `cogs` came back"""
+        net_amount = round(max((item.get('net_amount') or 0) - net_amount, 0), 2)
+        cogs = round(max((item.get('cogs') or 0) - cogs, 0), 2)
+        return {
+            'cogs': cogs,
+            'net_amount': net_amount,
+            'gross_margin': round(net_amount - cogs, 2),
+            'margin_pct': cls._margin_pct(net_amount - cogs, net_amount)
+        }
+
+    @staticmethod
+    def revenue_ratio(record):
+        """Share of each line's subtotal that remains after sale-level discounts"""
+        subtotal = record.get('subtotal') or 0
+        after_discount = record.get('subtotal_after_discount', subtotal)
+        return (after_discount / subtotal) if subtotal else 1
+
+    @classmethod
+    def sale_totals(cls, items):
+        """Sale-level costing from costed lines"""
+        total_cogs = round(sum(item.get('cogs', 0) for item in items), 2)
+        net_sales = round(sum(item.get('net_amount', 0) for item in items), 2)
+        return {
+            'total_cogs': total_cogs,
+            'net_sales': net_sales,
+            'gross_margin': round(net_sales - total_cogs, 2),
+            'margin_pct': cls._margin_pct(net_sales - total_cogs, net_sales),
+            'costed_at': datetime.utcnow()
+        }
+
+    @classmethod
+    def apply_costing(cls, record):
+        """
+        Cost every line of a sale/order being created (after FIFO deduction,
+        before insert) and set the sale totals, in place.
+        """
+        ratio = cls.revenue_ratio(record)
+        for item in record.get('items', []):
+            item.update(cls.line_costing(item, ratio))
+        record.update(cls.sale_totals(record.get('items', [])))
+        return record
+
+    # ================================================================
+    # BACKFILL
+    # ================================================================
+
+    def backfill(self, sources=None, force=False, dry_run=False):
+        """
+        Cost historical sales/orders from their stored batches_used.
+
+        Args:
+            sources: report sources to backfill (default: all)
+            force: re-cost records that already have costing
+            dry_run: count only
+
+        Returns:
+            dict: per source, records costed and lines estimated
+        """
+        try:
+            product_cache = {}
+
+            def product_info(product_id):
+                if product_id not in product_cache:
+                    product = self.product_collection.find_one(
+                        {'_id': product_id}, {'cost_price': 1, 'category_id': 1}
+                    ) or {}
+                    product_cache[product_id] = product
+                return product_cache[product_id]
+
+            results = {}
+            for source in sources or REPORT_SOURCES:
+                collection_name, _ = REPORT_SOURCES[source]
+                collection = self.db[collection_name]
+                query = {} if force else {'total_cogs': {'$exists': False}}
+                projection = {'items': 1, 'subtotal': 1, 'subtotal_after_discount': 1}
+
+                costed, estimated, operations = 0, 0, []
+                for record in collection.find(query, projection):
+                    ratio = self.revenue_ratio(record)
+                    updates = {}
+                    items = record.get('items') or []
+                    for index, item in enumerate(items):
+                        product = product_info(item.get('product_id')) if item.get('product_id') else {}
+                        costing = self.line_costing(item, ratio, fallback_cost=product.get('cost_price'))
+                        if costing.get('cogs_estimated'):
+                            estimated += 1
+                        if not item.get('category_id') and product.get('category_id'):
+                            costing['category_id'] = product['category_id']
+                        item.update(costing)
+                        for field, value in costing.items():
+                            updates[f'items.{index}.{field}'] = value
+                    updates.update(self.sale_totals(items))
+
+                    costed += 1
+                    operations.append(UpdateOne({'_id': record['_id']}, {'$set': updates}))
+                    if len(operations) >= BACKFILL_CHUNK:
+                        if not dry_run:
+                            collection.bulk_write(operations, ordered=False)
+                        operations = []
+
+                if operations and not dry_run:
+                    collection.bulk_write(operations, ordered=False)
+
+                results[source] = {'records_costed': costed, 'lines_estimated': estimated}
+                logger.info(f"Margin backfill {source}: {costed} records, {estimated} estimated lines{' (dry run)' if dry_run else ''}")
+
+            return results
+
+        except Exception as e:
+            logger.error(f"Error backfilling margins: {str(e)}")
+            raise Exception(f"Error backfilling margins: {str(e)}")
+
+    # ================================================================
+    # REPORTS
+    # ================================================================
+
+    @staticmethod
+    def _match(base_filter, start_date=None, end_date=None):
+        match = {**base_filter, 'total_cogs': {'$exists': True}}
+        if start_date or end_date:
+            match['transaction_date'] = {}
+            if start_date:
+                match['transaction_date']['$gte'] = start_date
+            if end_date:
+                match['transaction_date']['$lte'] = end_date
+        return match
+
+    def _aggregate(self, line_level, group_id, extra_fields, start_date, end_date, sources):
+        """Run the grouping on every source collection and merge by group key"""
+        prefix = '$items.' if line_level else '$'
+        sum_fields = {
+            'net_sales': f'{prefix}net_amount' if line_level else '$net_sales',
+            'cogs': f'{prefix}cogs' if line_level else '$total_cogs',
+            'gross_margin': f'{prefix}gross_margin',
+        }
+        if line_level:
+            sum_fields['quantity'] = '$items.quantity'
+
+        merged = {}
+        for source in sources or REPORT_SOURCES:
+            collection_name, base_filter = REPORT_SOURCES[source]
+            pipeline = [{'$match': self._match(base_filter, start_date, end_date)}]
+            if line_level:
+                # Lines are summed per sale first, so a product on two lines
+                # of one sale still counts as one transaction
+                pipeline += [
+                    {'$unwind': '$items'},
+                    {'$group': {
+                        '_id': {'key': group_id, 'sale': '$_id'},
+                        **{field: {'$sum': value} for field, value in sum_fields.items()},
+                        **{field: {'$last': value} for field, value in extra_fields.items()}
+                    }},
+                    {'$group': {
+                        '_id': '$_id.key',
+                        **{field: {'$sum': f'${field}'} for field in sum_fields},
+                        **{field: {'$last': f'${field}'} for field in extra_fields},
+                        'transactions': {'$sum': 1}
+                    }}
+                ]
+            else:
+                pipeline.append({'$group': {
+                    '_id': group_id,
+                    **{field: {'$sum': value} for field, value in sum_fields.items()},
+                    **{field: {'$last': value} for field, value in extra_fields.items()},
+                    'transactions': {'$sum': 1}
+                }})
+
+            for row in self.db[collection_name].aggregate(pipeline, allowDiskUse=True):
+                entry = merged.setdefault(row['_id'], {
+                    'key': row['_id'],
+                    **{field: 0 for field in sum_fields},
+                    'transactions': 0
+                })
+                for field in list(sum_fields) + ['transactions']:
+                    entry[field] += row.get(field) or 0
+                for field in extra_fields:
+                    if row.get(field) is not None:
+                        entry[field] = row[field]
+
+        rows = list(merged.values())
+        for row in rows:
+            for field in ('net_sales', 'cogs', 'gross_margin'):
+                row[field] = round(row[field], 2)
+            row['margin_pct'] = self._margin_pct(row['gross_margin'], row['net_sales'])
+        return rows
+
+    @staticmethod
+    def _with_totals(rows):
+        net_sales = round(sum(row['net_sales'] for row in rows), 2)
+        cogs = round(sum(row['cogs'] for row in rows), 2)
+        return {
+            'rows': rows,
+            'totals': {
+                'net_sales': net_sales,
+                'cogs': cogs,
+                'gross_margin': round(net_sales - cogs, 2),
+                'margin_pct': MarginService._margin_pct(net_sales - cogs, net_sales)
+            }
+        }
+
+    def margin_by_product(self, start_date=None, end_date=None, sources=None, sort_by='gross_margin', limit=50):
+        """Per-product net sales, COGS and gross margin, best first"""
+        try:
+            rows = self._aggregate(
+                True, '$items.product_id',
+                {'product_name': '$items.product_name', 'category_id': '$items.category_id'},
+                start_date, end_date, sources
+            )
+            for row in rows:
+                row['product_id'] = row.pop('key')
+            result = self._with_totals(rows)
+            result['rows'] = sorted(rows, key=lambda row: row.get(sort_by) or 0, reverse=True)[:limit]
+            return result
+
+        except Exception as e:
+            logger.error(f"Error getting margin by product: {str(e)}")
+            raise Exception(f"Error getting margin by product: {str(e)}")
+
+    def margin_by_category(self, start_date=None, end_date=None, sources=None):
+        """Per-category net sales, COGS and gross margin"""
+        try:
+            rows = self._aggregate(True, '$items.category_id', {}, start_date, end_date, sources)
+            names = {
+                category['_id']: category.get('category_name')
+                for category in self.db.category.find(
+                    {'_id': {'$in': [row['key'] for row in rows if row['key']]}},
+                    {'category_name': 1}
+                )
+            }
+            for row in rows:
+                row['category_id'] = row.pop('key') or 'uncategorized'
+                row['category_name'] = names.get(row['category_id'], 'Uncategorized')
+            rows.sort(key=lambda row: row['gross_margin'], reverse=True)
+            return self._with_totals(rows)
+
+        except Exception as e:
+            logger.error(f"Error getting margin by category: {str(e)}")
+            raise Exception(f"Error getting margin by category: {str(e)}")
+
+    def margin_by_day(self, start_date=None, end_date=None, sources=None):
+        """Per-day (UTC) net sales, COGS and gross margin from the sale totals"""
+        try:
+            rows = self._aggregate(
+                False, {'$dateToString': {'format': '%Y-%m-%d', 'date': '$transaction_date'}}, {},
+                start_date, end_date, sources
+            )
+            for row in rows:
+                row['date'] = row.pop('key')
+            rows.sort(key=lambda row: row['date'])
+            return self._with_totals(rows)
+
+        except Exception as e:
+            logger.error(f"Error getting margin by day: {str(e)}")
+            raise Exception(f"Error getting margin by day: {str(e)}")
+
+
+margin_service = MarginService()
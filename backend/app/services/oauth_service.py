@@ -12,6 +12,7 @@ from requests_oauthlib import OAuth2Session
 from ..database import db_manager
 from .auth_services import AuthService, ACCESS_TOKEN_EXPIRE_MINUTES
 from .customer_service import CustomerService
+from .principal_cache_service import PRINCIPAL_CUSTOMER
 
 
 class OAuthService:
@@ -359,6 +360,7 @@ class OAuthService:
             "sub": user_id,
             "email": customer.get("email"),
             "role": "customer",
+            "ptype": PRINCIPAL_CUSTOMER,
         }
 
         access_token = auth_service.create_access_token(token_data)
@@ -1,5 +1,7 @@
 from datetime import datetime, timedelta
 from ..database import db_manager
+from .sales_fact_service import sales_fact_service
+from .report_cache_service import report_cache
 
 
 class OnlineTransactionService:
@@ -123,6 +125,8 @@ class OnlineTransactionService:
         }
 
         self.online_transactions.insert_one(order_record)
+        sales_fact_service.record_transaction(order_record, 'online')
+        report_cache.record_write('online_transactions', order_record.get('transaction_date'))
         doc = order_record
 
         return {
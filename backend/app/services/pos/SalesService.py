@@ -1,14 +1,30 @@
+from collections import Counter, defaultdict
+import copy
 from datetime import datetime
+import uuid
 from bson import ObjectId
+from pymongo import UpdateOne
 from ...database import db_manager
+from ...bson_json import bson_to_json
 from notifications.services import notification_service
 from .promotionCon import PromoConnection
 from ..batch_service import BatchService
 from ..product_service import ProductService
+from ..change_log_service import change_log_service
+from ..product_sales_counter_service import ProductSalesCounterService
+from ..shift_totals_service import shift_totals_service
+from ..stock_state_service import stock_state_service
+from ..margin_service import MarginService
+from ..sales_fact_service import sales_fact_service
+from ..report_cache_service import report_cache
+from ..audit_service import AuditLogService
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Sales per void/return request
+BULK_VOID_LIMIT = 200
+
 class SalesService:
     """
     Unified service that combines POS transactions and sales logging
@@ -27,30 +43,12 @@ class SalesService:
         # ✅ Enhanced services for FIFO and loyalty points
         self.batch_service = BatchService()
         self.product_service = ProductService()
+        self.sales_counters = ProductSalesCounterService()
+        self.shift_totals = shift_totals_service
 
     def convert_object_id(self, document):
-        """Convert ObjectId to string for JSON serialization - Enhanced version"""
-        if document is None:
-            return document
-        
-        if isinstance(document, list):
-            return [self.convert_object_id(item) for item in document]
-        
-        if isinstance(document, dict):
-            converted = {}
-            for key, value in document.items():
-                if isinstance(value, ObjectId):
-                    converted[key] = str(value)
-                elif isinstance(value, (dict, list)):
-                    converted[key] = self.convert_object_id(value)
-                else:
-                    converted[key] = value
-            return converted
-        
-        if isinstance(document, ObjectId):
-            return str(document)
-        
-        return document
+        """Convert ObjectId to string for JSON serialization (shared iterative converter)"""
+        return bson_to_json(document, datetimes=False)
     
     def create_unified_sale(self, sale_data, source='pos'):
         """
@@ -83,6 +81,7 @@ class SalesService:
                 'promotion_applied': sale_data.get('promotion_applied', None),
                 'payment_method': sale_data.get('payment_method', 'cash'),
                 'cashier_id': sale_data.get('cashier_id', None),
+                'session_id': self.shift_totals.get_open_session_id(sale_data.get('cashier_id')),
                 'customer_id': sale_data.get('customer_id', None),
                 'transaction_date': datetime.utcnow(),
                 'status': 'completed',
@@ -93,6 +92,11 @@ class SalesService:
 
             result = self.sales_collection.insert_one(sales_record)
             sales_record['_id'] = str(result.inserted_id)
+            self.sales_counters.record_sale(sales_record, source='pos')
+            sales_fact_service.record_transaction(sales_record, 'pos')
+            report_cache.record_write('sales', sales_record['transaction_date'])
+            self.shift_totals.record_sale(sales_record)
+            change_log_service.record_change('sales', result.inserted_id)
 
             # Send notification
             self._send_sale_notification(sales_record, 'pos_sale_created')
@@ -146,6 +150,10 @@ class SalesService:
 
             result = self.sales_log_collection.insert_one(sales_log_record)
             sales_log_record['_id'] = str(result.inserted_id)
+            self.sales_counters.record_sales_log(sales_log_record)
+            sales_fact_service.record_transaction(sales_log_record, 'sales_log')
+            report_cache.record_write('sales_log', sales_log_record.get('transaction_date'))
+            change_log_service.record_change('sales_log', result.inserted_id)
 
             # Send notification
             self._send_sale_notification(sales_log_record, f'{source}_sale_created')
@@ -280,12 +288,23 @@ class SalesService:
             # Remove _id from update_data if present
             update_data.pop('_id', None)
             
+            previous = self.sales_log_collection.find_one({"_id": log_id})
+            
             result = self.sales_log_collection.update_one(
                 {"_id": log_id},
                 {"$set": update_data}
             )
             
             if result.modified_count > 0:
+                if previous and {'item_list', 'transaction_date', 'status'} & set(update_data):
+                    current = self.sales_log_collection.find_one({"_id": log_id})
+                    self.sales_counters.record_sales_log(previous, sign=-1)
+                    self.sales_counters.record_sales_log(current)
+                    sales_fact_service.record_transaction(current, 'sales_log')
+                report_cache.record_write(
+                    'sales_log', [(previous or {}).get('transaction_date'), update_data.get('transaction_date')]
+                )
+                change_log_service.record_change('sales_log', log_id)
                 return self.get_sales_log_by_id(log_id)
             else:
                 return None
@@ -301,8 +320,15 @@ class SalesService:
             if isinstance(log_id, str):
                 log_id = ObjectId(log_id)
             
+            previous = self.sales_log_collection.find_one({"_id": log_id})
             result = self.sales_log_collection.delete_one({"_id": log_id})
             
+            if result.deleted_count > 0 and previous:
+                self.sales_counters.record_sales_log(previous, sign=-1)
+                sales_fact_service.remove_transaction('sales_log', log_id)
+                report_cache.record_write('sales_log', previous.get('transaction_date'))
+                change_log_service.record_change('sales_log', log_id, 'delete')
+            
             return result.deleted_count > 0
             
         except Exception as e:
@@ -619,10 +645,11 @@ class SalesService:
             self.customers_collection.update_one(
                 {'_id': customer_id},
                 {
-                    '$set': {'loyalty_points': new_balance},
+                    '$set': {'loyalty_points': new_balance, 'last_updated': datetime.utcnow()},
                     '$push': {'points_transactions': points_transaction}
                 }
             )
+            change_log_service.record_change('customers', customer_id)
             
             logger.info(f"Deducted {points_to_deduct} points from {customer_id}")
             
@@ -672,11 +699,13 @@ class SalesService:
                 {
                     '$set': {
                         'loyalty_points': new_balance,
-                        'last_purchase': datetime.utcnow()
+                        'last_purchase': datetime.utcnow(),
+                        'last_updated': datetime.utcnow()
                     },
                     '$push': {'points_transactions': points_transaction}
                 }
             )
+            change_log_service.record_change('customers', customer_id)
             
             logger.info(f"Awarded {points_to_award} points to {customer_id}")
             
@@ -736,7 +765,8 @@ class SalesService:
                     'quantity': quantity,
                     'unit_price': unit_price,
                     'subtotal': item_subtotal,
-                    'is_taxable': product.get('is_taxable', True)
+                    'is_taxable': product.get('is_taxable', True),
+                    'category_id': product.get('category_id')
                 })
                 
                 subtotal += item_subtotal
@@ -780,6 +810,7 @@ class SalesService:
             sale_record = {
                 '_id': sale_id,
                 'cashier_id': cashier_id,
+                'session_id': self.shift_totals.get_open_session_id(cashier_id),
                 'customer_id': customer_id,
                 'customer_name': customer.get('full_name') if customer else None,
                 'transaction_date': transaction_date,
@@ -853,11 +884,22 @@ class SalesService:
                         }
                     }
                 )
+                change_log_service.record_change('products', product_id)
+                stock_state_service.record_stock_levels(
+                    [{**product, 'stock': new_total_stock}],
+                    context={'source': 'pos_sale', 'transaction_id': sale_id, 'cashier_id': cashier_id}
+                )
                 
                 print(f"   ✅ Stock updated: {product.get('stock')} → {new_total_stock}\n")
             
-            # Step 6: Insert sale record
+            # Step 6: Insert sale record with line COGS/margin from the batches just deducted
+            MarginService.apply_costing(sale_record)
             self.sales_collection.insert_one(sale_record)
+            self.sales_counters.record_sale(sale_record, source='pos')
+            sales_fact_service.record_transaction(sale_record, 'pos')
+            report_cache.record_write('sales', sale_record['transaction_date'])
+            self.shift_totals.record_sale(sale_record)
+            change_log_service.record_change('sales', sale_id)
             
             # Step 7: Award loyalty points to customer
             if customer_id and loyalty_points_earned > 0:
@@ -873,7 +915,7 @@ class SalesService:
                 # Mark points as awarded
                 self.sales_collection.update_one(
                     {'_id': sale_id},
-                    {'$set': {'points_awarded': True}}
+                    {'$set': {'points_awarded': True, 'updated_at': datetime.utcnow()}}
                 )
                 
                 print("✅ Points awarded\n")
@@ -914,120 +956,479 @@ class SalesService:
             Updated sale document
         """
         try:
-            print(f"\n{'='*60}")
-            print(f"🚫 Voiding Enhanced Sale: {sale_id}")
-            print(f"   Voided by: {voided_by}")
-            print(f"   Reason: {reason}")
-            print(f"{'='*60}\n")
-            
-            # Get sale
-            sale = self.sales_collection.find_one({'_id': sale_id})
-            
-            if not sale:
-                raise ValueError(f"Sale {sale_id} not found")
-            
-            if sale.get('is_voided'):
-                raise ValueError(f"Sale {sale_id} is already voided")
+            result = self.void_and_return_sales([{'sale_id': sale_id}], voided_by, reason)['results'][0]
+            if result['status'] != 'applied':
+                raise ValueError(result['error'])
             
-            print("✅ Sale validation passed\n")
+            return self.sales_collection.find_one({'_id': sale_id})
             
-            # ✅ PREPARE TRANSACTION INFO FOR RESTORATION
-            transaction_info = {
-                'transaction_id': f"{sale_id}-VOID",
-                'adjusted_by': voided_by,
-                'reason': f"Sale voided: {reason}"
+        except Exception as e:
+            logger.error(f"❌ Void sale failed: {str(e)}")
+            raise
+
+    # ================================================================
+    # BULK VOIDS AND RETURNS
+    # ================================================================
+    
+    def void_and_return_sales(self, requests, processed_by, reason=None):
+        """
+        Void many POS sales and/or return some of their lines in one request
+        
+        Every request is planned from one read of all the sales: which lines
+        and batch deductions go back (returns put back the batches FIFO drew
+        from last first), how much stock per product and how many points per
+        customer. The sale updates are applied with a single unordered
+        bulk_write guarded by each sale's `version`, then stock is restored
+        for the sales whose write landed only: batches and product stock
+        with one `$inc` bulk_write each, redeemed points with one atomic
+        update per customer. One audit entry records the whole request.
+        
+        A request without `items` voids the sale; a sale that already had
+        lines returned is closed out by returning everything left instead.
+        Redeemed points go back on a void or once every line is returned.
+        
+        Args:
+            requests: list of {
+                'sale_id': str,
+                'items': [{'product_id': str, 'quantity': number}] (optional, partial return),
+                'reason': str (optional, defaults to `reason`),
+                'expected_version': int (optional, reject if the sale changed since)
             }
-            
-            # Step 1: Restore stock to batches
-            print("Step 1: Restoring stock to batches...\n")
-            
-            for item in sale.get('items', []):
-                if 'batches_used' in item:
-                    print(f"   Restoring: {item['product_name']} x{item['quantity']}")
-                    
-                    # ✅ Restore to batches using batch service with tracking
-                    self.batch_service.restore_stock_to_batches(
-                        item['batches_used'],
-                        datetime.utcnow(),
-                        transaction_info=transaction_info
+            processed_by: Staff user ID
+            reason: Default void/return reason
+        
+        Returns:
+            dict: per-sale results (in request order), a summary, stock and
+            points put back, and the audit entry ID
+        """
+        try:
+            requests = requests or []
+            if len(requests) > BULK_VOID_LIMIT:
+                raise ValueError(f"At most {BULK_VOID_LIMIT} sales per void/return request")
+            
+            results = []
+            requested = {}
+            
+            for request_item in requests:
+                sale_id = request_item.get('sale_id')
+                expected_version = request_item.get('expected_version')
+                result = {'sale_id': sale_id}
+                results.append(result)
+                
+                if not sale_id:
+                    self._reject_reversal(result, 'invalid', "sale_id is required")
+                elif sale_id in requested:
+                    self._reject_reversal(result, 'invalid', "Sale appears more than once in the request")
+                elif expected_version is not None and (not isinstance(expected_version, int) or isinstance(expected_version, bool)):
+                    self._reject_reversal(result, 'invalid', "expected_version must be an integer")
+                elif request_item.get('items') is not None and not isinstance(request_item['items'], list):
+                    self._reject_reversal(result, 'invalid', "items must be a list of {product_id, quantity}")
+                else:
+                    requested[sale_id] = (request_item, result)
+            
+            sales = {
+                sale['_id']: sale
+                for sale in self.sales_collection.find({'_id': {'$in': list(requested)}})
+            } if requested else {}
+            
+            # Step 1: Plan each reversal against the sale as stored
+            token = uuid.uuid4().hex
+            now = datetime.utcnow()
+            candidates = []
+            for sale_id, (request_item, result) in requested.items():
+                sale = sales.get(sale_id)
+                if not sale:
+                    self._reject_reversal(result, 'not_found', f"Sale {sale_id} not found")
+                    continue
+                
+                current_version = sale.get('version', 0)
+                result['current_version'] = current_version
+                expected_version = request_item.get('expected_version')
+                
+                if sale.get('is_voided') or sale.get('status') == 'voided':
+                    self._reject_reversal(result, 'invalid', f"Sale {sale_id} is already voided")
+                elif expected_version is not None and expected_version != current_version:
+                    self._reject_reversal(
+                        result, 'conflict',
+                        f"Sale changed since version {expected_version} (now {current_version})"
                     )
-                    
-                    # Update product total stock
-                    product = self.products_collection.find_one({'_id': item['product_id']})
-                    
-                    if product:
-                        new_stock = product.get('stock', 0) + item['quantity']
-                        
-                        self.products_collection.update_one(
-                            {'_id': item['product_id']},
-                            {
-                                '$set': {
-                                    'stock': new_stock,
-                                    'updated_at': datetime.utcnow()
-                                }
-                            }
-                        )
-                        
-                        print(f"      Stock restored: {product.get('stock')} → {new_stock}")
-            
-            print("\n✅ Stock restored to batches\n")
+                else:
+                    try:
+                        plan = self._plan_reversal(sale, request_item.get('items'))
+                    except ValueError as e:
+                        self._reject_reversal(result, 'invalid', str(e))
+                        continue
+                    plan['reason'] = request_item.get('reason') or reason or (
+                        'Sale voided' if plan['action'] == 'voided' else 'Items returned'
+                    )
+                    candidates.append((sale, plan, result))
+            
+            # Step 2: One guarded bulk_write; the token identifies writes that landed
+            operations = []
+            for sale, plan, result in candidates:
+                update = self._reversal_update(sale, plan, processed_by, now)
+                update['$set']['last_reversal_token'] = token
+                operations.append(UpdateOne(
+                    {'_id': sale['_id'], 'is_voided': {'$ne': True}, **self._version_guard(sale.get('version', 0))},
+                    update
+                ))
+            
+            applied = {}
+            if operations:
+                self.sales_collection.bulk_write(operations, ordered=False)
+                applied = {
+                    sale['_id']: sale
+                    for sale in self.sales_collection.find({
+                        '_id': {'$in': [sale['_id'] for sale, _, _ in candidates]},
+                        'last_reversal_token': token
+                    })
+                }
             
-            # Step 2: Refund loyalty points if used
-            if sale.get('loyalty_points_used', 0) > 0 and sale.get('customer_id'):
-                print(f"Step 2: Refunding {sale['loyalty_points_used']} loyalty points...")
-                
-                # Refund points (add them back)
-                customer = self.customers_collection.find_one({'_id': sale['customer_id']})
-                if customer:
-                    current_balance = customer.get('loyalty_points', 0)
-                    new_balance = current_balance + sale['loyalty_points_used']
-                    
-                    # Create refund transaction
-                    refund_transaction = {
-                        'transaction_id': f"{sale_id}-VOID",
-                        'transaction_type': 'refunded',
-                        'points': sale['loyalty_points_used'],
-                        'balance_before': current_balance,
-                        'balance_after': new_balance,
-                        'description': f"Refunded {sale['loyalty_points_used']} points from voided sale {sale_id}",
-                        'created_at': datetime.utcnow()
-                    }
-                    
-                    self.customers_collection.update_one(
-                        {'_id': sale['customer_id']},
-                        {
-                            '$set': {'loyalty_points': new_balance},
-                            '$push': {'points_transactions': refund_transaction}
-                        }
+            landed = []
+            for sale, plan, result in candidates:
+                updated_sale = applied.get(sale['_id'])
+                if updated_sale is None:
+                    self._reject_reversal(result, 'conflict', "Sale was modified concurrently")
+                    continue
+                result.update({
+                    'status': 'applied',
+                    'action': plan['action'],
+                    'version': updated_sale.get('version'),
+                    'refund_amount': plan['refund_amount'],
+                    'points_refunded': plan['points_refund'],
+                    'items': plan['lines']
+                })
+                if plan['action'] == 'returned':
+                    result['fully_returned'] = plan['fully_returned']
+                landed.append((sale, updated_sale, plan))
+            
+            # Step 3: Stock, points, counters and reports for the sales that changed
+            stock_restored, points_refunded = {}, {}
+            if landed:
+                stock_restored, points_refunded = self._finish_reversals(landed, processed_by, token, now)
+            
+            summary = Counter(result['status'] for result in results)
+            operation_id = f"VOID-{token[:12]}"
+            audit_id = None
+            if landed:
+                try:
+                    audit = AuditLogService().log_sale_reversals(
+                        {'user_id': processed_by}, operation_id, results, stock_restored, points_refunded
                     )
-                
-                print("✅ Points refunded\n")
+                    audit_id = audit['_id']
+                except Exception as e:
+                    logger.error(f"Error logging sale voids/returns {operation_id}: {str(e)}")
+            
+            logger.info(
+                f"Void/return by {processed_by}: {summary.get('applied', 0)} applied, "
+                f"{summary.get('conflict', 0)} conflicts, "
+                f"{len(results) - summary.get('applied', 0) - summary.get('conflict', 0)} rejected"
+            )
             
-            # Step 3: Update sale to voided
-            print("Step 3: Updating sale status...")
+            return {
+                'operation_id': operation_id,
+                'audit_id': audit_id,
+                'results': results,
+                'summary': {
+                    'requested': len(results),
+                    'applied': summary.get('applied', 0),
+                    'conflicts': summary.get('conflict', 0),
+                    'rejected': len(results) - summary.get('applied', 0) - summary.get('conflict', 0),
+                    'refund_amount': round(sum(plan['refund_amount'] for _, _, plan in landed), 2)
+                },
+                'stock_restored': stock_restored,
+                'points_refunded': points_refunded
+            }
             
-            self.sales_collection.update_one(
-                {'_id': sale_id},
-                {
-                    '$set': {
-                        'is_voided': True,
-                        'status': 'voided',
-                        'voided_by': voided_by,
-                        'voided_at': datetime.utcnow(),
-                        'void_reason': reason,
-                        'updated_at': datetime.utcnow()
-                    }
+        except Exception as e:
+            logger.error(f"❌ Sale void/return failed: {str(e)}")
+            raise
+    
+    @staticmethod
+    def _reject_reversal(result, status, error):
+        result.update({'status': status, 'error': error})
+    
+    @staticmethod
+    def _version_guard(expected_version):
+        """Filter matching a sale still at `expected_version` (sales created before versioning are 0)"""
+        if expected_version == 0:
+            return {'$or': [{'version': 0}, {'version': {'$exists': False}}]}
+        return {'version': expected_version}
+    
+    @staticmethod
+    def _plan_reversal(sale, return_items=None):
+        """
+        What a void (no `return_items`) or partial return puts back
+        
+        Returns:
+            dict: action ('voided'/'returned'), the sale's items with returned
+            quantities applied, returned lines, batch restorations, product
+            stock deltas, refund amount and points to refund
+        
+        Raises:
+            ValueError: malformed items, or more than the sale still holds
+        """
+        items = copy.deepcopy(sale.get('items', []))
+        previously_returned = any(item.get('returned_quantity') for item in items)
+        
+        wanted = None
+        if return_items is not None:
+            wanted = defaultdict(int)
+            for entry in return_items:
+                quantity = entry.get('quantity') if isinstance(entry, dict) else None
+                if (not isinstance(entry, dict) or not entry.get('product_id')
+                        or not isinstance(quantity, (int, float)) or isinstance(quantity, bool) or quantity <= 0):
+                    raise ValueError("Each returned item needs a product_id and a positive quantity")
+                wanted[entry['product_id']] += quantity
+        
+        ratio = MarginService.revenue_ratio(sale)
+        lines, batches = [], []
+        product_quantities = defaultdict(int)
+        for item in items:
+            quantity = item.get('quantity', 0) or 0
+            remaining = quantity - (item.get('returned_quantity', 0) or 0)
+            take = remaining if wanted is None else min(remaining, wanted.get(item.get('product_id'), 0))
+            if take <= 0:
+                continue
+            if wanted is not None:
+                wanted[item['product_id']] -= take
+            item['returned_quantity'] = (item.get('returned_quantity', 0) or 0) + take
+            
+            # Put back into the batches FIFO drew from last first
+            left, returned_cogs = take, 0
+            for batch in reversed(item.get('batches_used') or []):
+                put_back = min(batch['quantity_deducted'] - batch.get('quantity_returned', 0), left)
+                if put_back <= 0:
+                    continue
+                batch['quantity_returned'] = batch.get('quantity_returned', 0) + put_back
+                batches.append({'batch_id': batch['batch_id'], 'batch_number': batch.get('batch_number'), 'quantity_deducted': put_back})
+                returned_cogs += put_back * (batch.get('cost_price') or 0)
+                left -= put_back
+                if left <= 0:
+                    break
+            
+            # Lines sold without batch tracking never moved product stock either
+            if 'batches_used' in item:
+                product_quantities[item['product_id']] += take
+            
+            # Stored costing covers the units still on the line (returns scale it down)
+            unit_price = item.get('unit_price', item.get('price', 0)) or 0
+            net_amount = item.get('net_amount')
+            if net_amount is None:
+                subtotal = item.get('subtotal')
+                net_amount = (subtotal if subtotal is not None else unit_price * quantity) * ratio * remaining / quantity
+            amount = round(net_amount * take / remaining, 2)
+            if 'cogs' in item:
+                if take >= remaining or not item.get('batches_used'):
+                    returned_cogs = (item.get('cogs') or 0) * take / remaining
+                item.update(MarginService.deduct_return(item, amount, returned_cogs))
+            lines.append({
+                'product_id': item.get('product_id'),
+                'product_name': item.get('product_name'),
+                'quantity': take,
+                'unit_price': unit_price,
+                'subtotal': round(unit_price * take, 2),
+                'amount': amount
+            })
+        
+        if wanted is not None:
+            over = sorted(product_id for product_id, quantity in wanted.items() if quantity > 0)
+            if over:
+                raise ValueError(f"Return exceeds the quantity left on the sale for {', '.join(over)}")
+        if not lines:
+            raise ValueError(f"Nothing left to return on sale {sale['_id']}")
+        
+        action = 'voided' if wanted is None and not previously_returned else 'returned'
+        fully_returned = all(
+            (item.get('returned_quantity', 0) or 0) >= (item.get('quantity', 0) or 0) for item in items
+        )
+        points_refund = 0
+        if sale.get('customer_id') and (action == 'voided' or fully_returned):
+            points_refund = sale.get('loyalty_points_used', 0) or 0
+        
+        return {
+            'action': action,
+            'items': items,
+            'lines': lines,
+            'batches': batches,
+            'product_quantities': dict(product_quantities),
+            'refund_amount': round(sum(line['amount'] for line in lines), 2),
+            'fully_returned': fully_returned,
+            'points_refund': points_refund,
+            'costing': MarginService.sale_totals(items) if sale.get('total_cogs') is not None else {}
+        }
+    
+    @staticmethod
+    def _closed_products(items):
+        """Products with no units left on the sale after returns"""
+        kept = defaultdict(int)
+        for item in items:
+            kept[item.get('product_id')] += (item.get('quantity', 0) or 0) - (item.get('returned_quantity', 0) or 0)
+        return [product_id for product_id, quantity in kept.items() if product_id and quantity <= 0]
+    
+    @staticmethod
+    def _reversal_update(sale, plan, processed_by, now):
+        """Update document for one planned void/return (mirrors the single-sale void)"""
+        if plan['action'] == 'voided':
+            return {
+                '$set': {
+                    'is_voided': True,
+                    'status': 'voided',
+                    'voided_by': processed_by,
+                    'voided_at': now,
+                    'void_reason': plan['reason'],
+                    'updated_at': now
+                },
+                '$inc': {'version': 1}
+            }
+        
+        plan['return_id'] = f"{sale['_id']}-RET{len(sale.get('returns', [])) + 1}"
+        fields = {
+            'items': plan['items'],
+            'is_fully_returned': plan['fully_returned'],
+            'updated_at': now,
+            **plan['costing']
+        }
+        if plan['fully_returned']:
+            # Reports skip 'returned' sales like voided ones
+            fields['status'] = 'returned'
+        return {
+            '$set': fields,
+            '$inc': {'version': 1, 'returned_amount': plan['refund_amount']},
+            '$push': {'returns': {
+                'return_id': plan['return_id'],
+                'items': plan['lines'],
+                'amount': plan['refund_amount'],
+                'points_refunded': plan['points_refund'],
+                'processed_by': processed_by,
+                'reason': plan['reason'],
+                'processed_at': now
+            }}
+        }
+    
+    def _finish_reversals(self, landed, processed_by, token, now):
+        """
+        Restore stock and points and update counters/reports for the voids
+        and returns that were written
+        
+        Returns:
+            tuple: (product_id -> units restored, customer_id -> points refunded)
+        """
+        batches = [batch for _, _, plan in landed for batch in plan['batches']]
+        product_quantities = defaultdict(int)
+        for _, _, plan in landed:
+            for product_id, quantity in plan['product_quantities'].items():
+                product_quantities[product_id] += quantity
+        
+        if len(landed) == 1:
+            sale, _, plan = landed[0]
+            transaction_id = plan.get('return_id') or f"{sale['_id']}-VOID"
+        else:
+            transaction_id = f"BULK-VOID-{token[:8]}"
+        
+        if batches:
+            self.batch_service.restore_stock_to_batches(
+                batches,
+                now,
+                transaction_info={
+                    'transaction_id': transaction_id,
+                    'adjusted_by': processed_by,
+                    'reason': '; '.join(
+                        f"Sale {plan['action']}: {sale['_id']} ({plan['reason']})" for sale, _, plan in landed
+                    )
                 }
             )
-            
-            print("✅ Sale voided successfully\n")
-            
-            print(f"{'='*60}")
-            print(f"✅ Sale {sale_id} voided successfully")
-            print(f"{'='*60}\n")
-            
-            return self.sales_collection.find_one({'_id': sale_id})
-            
+        
+        if product_quantities:
+            self.products_collection.bulk_write([
+                UpdateOne({'_id': product_id}, {'$inc': {'stock': quantity}, '$set': {'updated_at': now}})
+                for product_id, quantity in product_quantities.items()
+            ], ordered=False)
+            change_log_service.record_changes('products', list(product_quantities))
+            stock_state_service.refresh(list(product_quantities), context={'source': 'pos_void', 'transaction_id': transaction_id})
+        
+        refunds = [
+            (sale['customer_id'], plan['points_refund'], sale['_id'], plan.get('return_id') or f"{sale['_id']}-VOID", plan['action'])
+            for sale, _, plan in landed if plan['points_refund'] > 0
+        ]
+        points_refunded = self._refund_points(refunds, now) if refunds else {}
+        
+        voided = [sale for sale, _, plan in landed if plan['action'] == 'voided']
+        returned = [(sale, updated_sale, plan) for sale, updated_sale, plan in landed if plan['action'] == 'returned']
+        
+        self.sales_counters.record_sales(
+            voided + [
+                {
+                    'transaction_date': sale.get('transaction_date'),
+                    'items': plan['lines'],
+                    'closed_product_ids': self._closed_products(plan['items'])
+                }
+                for sale, _, plan in returned
+            ],
+            source='pos',
+            sign=-1
+        )
+        if voided:
+            sales_fact_service.set_voided('pos', [sale['_id'] for sale in voided])
+        if returned:
+            sales_fact_service.record_transactions([updated_sale for _, updated_sale, _ in returned], 'pos')
+        report_cache.record_write('sales', [sale.get('transaction_date') for sale, _, _ in landed])
+        
+        for sale in voided:
+            self.shift_totals.record_void(sale)
+        for sale, _, plan in returned:
+            self.shift_totals.record_return(sale, plan['refund_amount'])
+        change_log_service.record_changes('sales', [sale['_id'] for sale, _, _ in landed])
+        
+        return dict(product_quantities), points_refunded
+    
+    def _refund_points(self, refunds, now):
+        """
+        Give redeemed points back with one pipeline update per customer
+        
+        The new balance and the history entries' before/after balances are
+        computed by the server from the stored balance, so a redemption
+        landing at the same time is never overwritten.
+        
+        Args:
+            refunds: list of (customer_id, points, sale_id, transaction_id, action)
+        
+        Returns:
+            dict: customer_id -> points refunded
+        """
+        per_customer = defaultdict(list)
+        for customer_id, points, sale_id, transaction_id, action in refunds:
+            per_customer[customer_id].append((points, sale_id, transaction_id, action))
+        
+        balance = {'$ifNull': ['$loyalty_points', 0]}
+        operations = []
+        for customer_id, entries in per_customer.items():
+            history, refunded = [], 0
+            for points, sale_id, transaction_id, action in entries:
+                history.append({
+                    'transaction_id': transaction_id,
+                    'transaction_type': 'refunded',
+                    'points': points,
+                    'balance_before': {'$add': [balance, refunded]},
+                    'balance_after': {'$add': [balance, refunded + points]},
+                    'description': f"Refunded {points} points from {action} sale {sale_id}",
+                    'created_at': now
+                })
+                refunded += points
+            operations.append(UpdateOne({'_id': customer_id}, [{'$set': {
+                'loyalty_points': {'$add': [balance, refunded]},
+                'last_updated': now,
+                'points_transactions': {'$concatArrays': [{'$ifNull': ['$points_transactions', []]}, history]}
+            }}]))
+        
+        try:
+            self.customers_collection.bulk_write(operations, ordered=False)
+            change_log_service.record_changes('customers', list(per_customer))
         except Exception as e:
-            logger.error(f"❌ Void sale failed: {str(e)}")
-            raise
\ No newline at end of file
+            # The voids/returns are committed; the audit entry lists the refunds owed
+            logger.error(f"Error refunding loyalty points: {str(e)}")
+        
+        return {
+            customer_id: sum(points for points, _, _, _ in entries)
+            for customer_id, entries in per_customer.items()
+        }
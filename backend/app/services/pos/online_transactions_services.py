@@ -1,16 +1,41 @@
+from collections import Counter, defaultdict
 from datetime import datetime, timedelta
+from pymongo import ReturnDocument, UpdateOne
 from ...database import db_manager
 from ..product_service import ProductService
 from ..batch_service import BatchService
+from ..change_log_service import change_log_service
+from ..product_sales_counter_service import ProductSalesCounterService
+from ..stock_reservation_service import stock_reservation_service
+from ..stock_state_service import stock_state_service
+from ..margin_service import MarginService
+from ..sales_fact_service import sales_fact_service
+from ..report_cache_service import report_cache
 from notifications.services import notification_service
 import logging
 import math
 import threading
 import time
 from typing import Optional
+import uuid
 
 logger = logging.getLogger(__name__)
 
+# Order state machine: current status -> statuses it may move to
+ORDER_TRANSITIONS = {
+    'pending': ['confirmed', 'cancelled'],
+    'confirmed': ['processing', 'cancelled'],
+    'processing': ['on_the_way'],
+    'on_the_way': ['completed'],
+    'completed': [],
+    'cancelled': []
+}
+
+# Most orders one bulk transition request may carry
+BULK_TRANSITION_LIMIT = 200
+
+ORDER_COUNTERS_ID = 'order_status'
+
 
 class OnlineTransactionService:
     """
@@ -25,6 +50,10 @@ class OnlineTransactionService:
         self.customers_collection = self.db.customers
         self.product_service = ProductService()
         self.batch_service = BatchService()
+        self.sales_counters = ProductSalesCounterService()
+        self.order_counters = self.db.online_order_counters
+        self.reservations = stock_reservation_service
+        self._ensure_indexes()
         
         # Auto-cancellation settings
         self.auto_cancel_enabled = True
@@ -37,6 +66,13 @@ class OnlineTransactionService:
         # Start auto-cancellation scheduler
         self._start_auto_cancellation_scheduler()
     
+    def _ensure_indexes(self):
+        """Create indexes for status queues and at-risk statistics"""
+        try:
+            self.online_transactions.create_index([("order_status", 1), ("created_at", 1)], background=True)
+        except Exception as e:
+            logger.warning(f"Could not create online order indexes: {e}")
+    
     # ================================================================
     # AUTO-CANCELLATION SCHEDULER
     # ================================================================
@@ -69,6 +105,7 @@ class OnlineTransactionService:
             try:
                 # Run the check
                 self.auto_cancel_expired_orders(self.expiry_minutes)
+                self._release_expired_reservations()
                 self._last_check_time = datetime.utcnow()
                 
                 # Wait for next check
@@ -79,6 +116,15 @@ class OnlineTransactionService:
                 # Wait before retrying
                 time.sleep(60)  # 1 minute before retry
     
+    def _release_expired_reservations(self):
+        """Bulk-release expired cart holds on every scheduler tick"""
+        try:
+            result = self.reservations.release_expired()
+            if result['released_count']:
+                logger.info(f"Released {result['released_count']} expired stock reservation(s)")
+        except Exception as e:
+            logger.error(f"Error releasing expired reservations: {str(e)}")
+    
     def stop_auto_cancellation(self):
         """Stop the automatic cancellation scheduler"""
         self._stop_scheduler = True
@@ -326,16 +372,10 @@ class OnlineTransactionService:
             thirty_minutes_ago = now - timedelta(minutes=30)
             one_hour_ago = now - timedelta(hours=1)
             
-            # Count orders by status
-            pending_count = self.online_transactions.count_documents({
-                'order_status': 'pending',
-                'is_cancelled': False
-            })
-            
-            confirmed_count = self.online_transactions.count_documents({
-                'order_status': 'confirmed', 
-                'is_cancelled': False
-            })
+            # Count orders by status (maintained counters)
+            status_counts = self.get_order_status_counts()
+            pending_count = status_counts.get('pending', 0)
+            confirmed_count = status_counts.get('confirmed', 0)
             
             # Count orders at risk of expiration
             pending_at_risk = self.online_transactions.count_documents({
@@ -371,6 +411,7 @@ class OnlineTransactionService:
             return {
                 'total_pending': pending_count,
                 'total_confirmed': confirmed_count,
+                'by_status': status_counts,
                 'pending_at_risk': pending_at_risk,
                 'confirmed_at_risk': confirmed_at_risk,
                 'recent_orders_1h': recent_orders,
@@ -634,7 +675,8 @@ class OnlineTransactionService:
     
     def validate_order_stock(self, items):
         """
-        Validate stock availability for all items before order creation
+        Validate stock availability for all items before order creation.
+        Stock held by open cart reservations is not available.
         
         Args:
             items: list of {'product_id': str, 'quantity': int}
@@ -649,6 +691,7 @@ class OnlineTransactionService:
         try:
             errors = []
             stock_details = {}
+            reserved = self.reservations.get_reserved([item['product_id'] for item in items])
             
             for item in items:
                 product_id = item['product_id']
@@ -667,17 +710,19 @@ class OnlineTransactionService:
                     quantity
                 )
                 
+                available = max(batch_check['total_stock'] - reserved.get(product_id, 0), 0)
                 stock_details[product_id] = {
                     'product_name': product.get('product_name', 'Unknown'),
                     'requested': quantity,
-                    'available': batch_check['total_stock'],
-                    'sufficient': batch_check['available']
+                    'available': available,
+                    'reserved': reserved.get(product_id, 0),
+                    'sufficient': available >= quantity
                 }
                 
-                if not batch_check['available']:
+                if available < quantity:
                     errors.append(
                         f"Insufficient stock for {product.get('product_name')}. "
-                        f"Available: {batch_check['total_stock']}, Requested: {quantity}"
+                        f"Available: {available}, Requested: {quantity}"
                     )
             
             return {
@@ -786,10 +831,11 @@ class OnlineTransactionService:
             self.customers_collection.update_one(
                 {'_id': customer_id},
                 {
-                    '$set': {'loyalty_points': new_balance},
+                    '$set': {'loyalty_points': new_balance, 'last_updated': datetime.utcnow()},
                     '$push': {'points_transactions': points_transaction}
                 }
             )
+            change_log_service.record_change('customers', customer_id)
             
             logger.info(f"Deducted {points_to_deduct} points from {customer_id}")
             
@@ -839,11 +885,13 @@ class OnlineTransactionService:
                 {
                     '$set': {
                         'loyalty_points': new_balance,
-                        'last_purchase': datetime.utcnow()
+                        'last_purchase': datetime.utcnow(),
+                        'last_updated': datetime.utcnow()
                     },
                     '$push': {'points_transactions': points_transaction}
                 }
             )
+            change_log_service.record_change('customers', customer_id)
             
             logger.info(f"Awarded {points_to_award} points to {customer_id}")
             
@@ -898,10 +946,11 @@ class OnlineTransactionService:
             self.customers_collection.update_one(
                 {'_id': customer_id},
                 {
-                    '$set': {'loyalty_points': new_balance},
+                    '$set': {'loyalty_points': new_balance, 'last_updated': datetime.utcnow()},
                     '$push': {'points_transactions': points_transaction}
                 }
             )
+            change_log_service.record_change('customers', customer_id)
             
             logger.info(f"Refunded {points_to_refund} points to {customer_id}")
             
@@ -917,6 +966,11 @@ class OnlineTransactionService:
         """
         Create a new online order with FIFO batch deduction and usage_history tracking
         
+        With `order_data['reservation_id']` the order is built from that stock
+        reservation's lines, which were already checked and held when the cart
+        was reserved, so per-line validation is skipped and the hold is
+        committed once the order is stored.
+        
         Args:
             order_data: Dictionary containing order information
             customer_id: Customer ID (CUST-##### format)
@@ -924,6 +978,8 @@ class OnlineTransactionService:
         Returns:
             Dictionary with success status and created order data
         """
+        reservation_id = order_data.get('reservation_id')
+        reservation_claimed = False
         try:
             # Generate order ID
             order_id = self.generate_online_order_id()
@@ -941,21 +997,29 @@ class OnlineTransactionService:
             if not customer:
                 raise ValueError(f"Customer {customer_id} not found")
             
-            # Step 1: Validate stock availability
-            print("Step 1: Validating stock...")
-            stock_validation = self.validate_order_stock(order_data.get('items', []))
-            
-            if not stock_validation['valid']:
-                raise ValueError(f"Stock validation failed: {', '.join(stock_validation['errors'])}")
-            
-            print("✅ Stock validation passed\n")
+            # Step 1: Validate stock availability (or take over a reservation's hold)
+            if reservation_id:
+                print(f"Step 1: Claiming stock reservation {reservation_id}...")
+                reservation = self.reservations.claim_for_checkout(reservation_id, customer_id)
+                reservation_claimed = True
+                order_items = reservation['items']
+                print("✅ Reservation claimed\n")
+            else:
+                print("Step 1: Validating stock...")
+                order_items = order_data.get('items', [])
+                stock_validation = self.validate_order_stock(order_items)
+                
+                if not stock_validation['valid']:
+                    raise ValueError(f"Stock validation failed: {', '.join(stock_validation['errors'])}")
+                
+                print("✅ Stock validation passed\n")
             
             # Step 2: Calculate initial subtotal
             print("Step 2: Calculating pricing...")
             subtotal = 0
             items_with_prices = []
             
-            for item in order_data.get('items', []):
+            for item in order_items:
                 product = self.products_collection.find_one({'_id': item['product_id']})
                 
                 if not product:
@@ -972,7 +1036,8 @@ class OnlineTransactionService:
                     'quantity': quantity,
                     'unit_price': unit_price,
                     'subtotal': item_subtotal,
-                    'is_taxable': product.get('is_taxable', True)
+                    'is_taxable': product.get('is_taxable', True),
+                    'category_id': product.get('category_id')
                 })
                 
                 subtotal += item_subtotal
@@ -1078,7 +1143,9 @@ class OnlineTransactionService:
                 'source': 'online',
                 'created_at': transaction_date,
                 'updated_at': transaction_date,
-                'notes': order_data.get('notes', '')
+                'notes': order_data.get('notes', ''),
+                'reservation_id': reservation_id,
+                'version': 1
             }
             
             # Step 8: Process each item with FIFO batch deduction
@@ -1122,11 +1189,26 @@ class OnlineTransactionService:
                         }
                     }
                 )
+                change_log_service.record_change('products', product_id)
+                stock_state_service.record_stock_levels(
+                    [{**product, 'stock': new_total_stock}],
+                    context={'source': 'online_order', 'order_id': order_id}
+                )
                 
                 print(f"   ✅ Stock updated: {product.get('stock')} → {new_total_stock}\n")
             
-            # Step 9: Insert order record
+            # Step 9: Insert order record with line COGS/margin from the batches just deducted
+            MarginService.apply_costing(order_record)
             self.online_transactions.insert_one(order_record)
+            self.sales_counters.record_sale(order_record, source='online')
+            sales_fact_service.record_transaction(order_record, 'online')
+            report_cache.record_write('online_transactions', order_record.get('transaction_date'))
+            self._apply_status_counts({'pending': 1})
+            
+            # The stock is deducted now, so the hold no longer counts as reserved
+            if reservation_claimed:
+                self.reservations.commit(reservation_id, order_id)
+                reservation_claimed = False
             
             # Step 10: Auto-confirm COD orders
             if payment_method == 'cod':
@@ -1160,6 +1242,13 @@ class OnlineTransactionService:
                 except:
                     pass
             
+            # Rollback: Give the claimed reservation's stock back
+            if reservation_claimed:
+                try:
+                    self.reservations.release(reservation_id, customer_id, reason='checkout_failed')
+                except Exception:
+                    pass
+            
             raise
             
         except Exception as e:
@@ -1174,6 +1263,13 @@ class OnlineTransactionService:
                 except:
                     pass
             
+            # Rollback: Give the claimed reservation's stock back
+            if reservation_claimed:
+                try:
+                    self.reservations.release(reservation_id, customer_id, reason='checkout_failed')
+                except Exception:
+                    pass
+            
             raise Exception(f"Error creating online order: {str(e)}")
     
     # ================================================================
@@ -1210,7 +1306,7 @@ class OnlineTransactionService:
             
             current_status = order['order_status']
             
-            if current_status not in ['pending', 'confirmed']:
+            if 'cancelled' not in ORDER_TRANSITIONS.get(current_status, []):
                 raise ValueError(
                     f"Cannot cancel order in '{current_status}' status. "
                     f"Orders can only be cancelled when 'pending' or 'confirmed'."
@@ -1218,6 +1314,40 @@ class OnlineTransactionService:
             
             print("✅ Order validation passed\n")
             
+            # Step 2: Mark the order cancelled - only if nobody moved it since it was read
+            print("Step 1: Updating order status...")
+            
+            points_refunded = order.get('loyalty_points_used', 0) > 0
+            
+            # Payment is marked for refund if it was paid
+            payment_status_update = {}
+            if order['payment_status'] == 'paid':
+                payment_status_update['payment_status'] = 'refunded'
+            
+            cancellation_data = {
+                'is_cancelled': True,
+                'order_status': 'cancelled',
+                'cancellation_reason': cancellation_reason,
+                'cancelled_by': cancelled_by,
+                'cancelled_at': datetime.utcnow(),
+                'stock_restored': True,
+                'points_refunded': points_refunded,
+                'updated_at': datetime.utcnow(),
+                **payment_status_update
+            }
+            
+            status_history_entry = {
+                'status': 'cancelled',
+                'timestamp': datetime.utcnow(),
+                'updated_by': cancelled_by,
+                'notes': cancellation_reason
+            }
+            
+            if self._compare_and_set_status(order, cancellation_data, status_history_entry) is None:
+                raise ValueError(f"Order {order_id} was modified concurrently, reload it and try again")
+            
+            print("✅ Order marked as cancelled\n")
+            
             # ✅ PREPARE TRANSACTION INFO FOR RESTORATION
             transaction_info = {
                 'transaction_id': f"{order_id}-CANCEL",
@@ -1225,8 +1355,8 @@ class OnlineTransactionService:
                 'reason': f"Order cancelled: {cancellation_reason}"
             }
             
-            # Step 2: Restore stock to batches
-            print("Step 1: Restoring stock to batches...\n")
+            # Step 3: Restore stock to batches
+            print("Step 2: Restoring stock to batches...\n")
             
             for item in order.get('items', []):
                 if 'batches_used' in item:
@@ -1254,16 +1384,19 @@ class OnlineTransactionService:
                                 }
                             }
                         )
+                        change_log_service.record_change('products', item['product_id'])
+                        stock_state_service.record_stock_levels(
+                            [{**product, 'stock': new_stock}],
+                            context={'source': 'online_order_cancel', 'order_id': order_id}
+                        )
                         
                         print(f"      Stock restored: {product.get('stock')} → {new_stock}")
             
             print("\n✅ Stock restored to batches\n")
             
-            # Step 3: Refund loyalty points if used
-            points_refunded = False
-            
-            if order.get('loyalty_points_used', 0) > 0:
-                print(f"Step 2: Refunding {order['loyalty_points_used']} loyalty points...")
+            # Step 4: Refund loyalty points if used
+            if points_refunded:
+                print(f"Step 3: Refunding {order['loyalty_points_used']} loyalty points...")
                 
                 self.refund_customer_points(
                     order['customer_id'],
@@ -1271,46 +1404,12 @@ class OnlineTransactionService:
                     order_id
                 )
                 
-                points_refunded = True
                 print("✅ Points refunded\n")
             
-            # Step 4: Update payment status if paid
-            payment_status_update = {}
-            
-            if order['payment_status'] == 'paid':
-                payment_status_update['payment_status'] = 'refunded'
-                print("Step 3: Marking payment for refund...")
-                print("✅ Payment marked for refund\n")
-            
-            # Step 5: Update order to cancelled
-            print("Step 4: Updating order status...")
-            
-            cancellation_data = {
-                'is_cancelled': True,
-                'order_status': 'cancelled',
-                'cancellation_reason': cancellation_reason,
-                'cancelled_by': cancelled_by,
-                'cancelled_at': datetime.utcnow(),
-                'stock_restored': True,
-                'points_refunded': points_refunded,
-                'updated_at': datetime.utcnow(),
-                **payment_status_update
-            }
-            
-            status_history_entry = {
-                'status': 'cancelled',
-                'timestamp': datetime.utcnow(),
-                'updated_by': cancelled_by,
-                'notes': cancellation_reason
-            }
-            
-            self.online_transactions.update_one(
-                {'_id': order_id},
-                {
-                    '$set': cancellation_data,
-                    '$push': {'status_history': status_history_entry}
-                }
-            )
+            self.sales_counters.record_sale(order, source='online', sign=-1)
+            sales_fact_service.set_voided('online', order_id)
+            report_cache.record_write('online_transactions', order.get('transaction_date'))
+            self._apply_status_counts({current_status: -1, 'cancelled': 1})
             
             print("✅ Order cancelled successfully\n")
             
@@ -1318,7 +1417,7 @@ class OnlineTransactionService:
             print(f"✅ Order {order_id} cancelled successfully")
             print(f"{'='*60}\n")
             
-            # Step 6: Send notifications
+            # Step 5: Send notifications
             self._send_order_notification('order_cancelled', order_id)
             
             return self.get_order_by_id(order_id)
@@ -1357,19 +1456,10 @@ class OnlineTransactionService:
             current_status = order['order_status']
             
             # Validate transition
-            ALLOWED_TRANSITIONS = {
-                'pending': ['confirmed', 'cancelled'],
-                'confirmed': ['processing', 'cancelled'],
-                'processing': ['on_the_way'],
-                'on_the_way': ['completed'],
-                'completed': [],
-                'cancelled': []
-            }
-            
-            if new_status not in ALLOWED_TRANSITIONS[current_status]:
+            if new_status not in ORDER_TRANSITIONS[current_status]:
                 raise ValueError(
                     f"Cannot transition from '{current_status}' to '{new_status}'. "
-                    f"Allowed transitions: {ALLOWED_TRANSITIONS[current_status]}"
+                    f"Allowed transitions: {ORDER_TRANSITIONS[current_status]}"
                 )
             
             print(f"\n{'='*60}")
@@ -1419,19 +1509,9 @@ class OnlineTransactionService:
                     update_data['payment_status'] = 'paid'
                     print("COD payment marked as received")
                 
-                # Award loyalty points (if not already awarded)
+                # Loyalty points are awarded once the status write lands
                 if not order.get('points_awarded', False):
-                    print(f"Awarding {order['loyalty_points_earned']} loyalty points...")
-                    
-                    self.award_loyalty_points(
-                        order['customer_id'],
-                        order['loyalty_points_earned'],
-                        order_id,
-                        order['subtotal_after_discount']
-                    )
-                    
                     update_data['points_awarded'] = True
-                    print("✅ Points awarded")
             
             # Add to status history
             status_history_entry = {
@@ -1441,14 +1521,23 @@ class OnlineTransactionService:
                 'notes': notes
             }
             
-            # Update order
-            self.online_transactions.update_one(
-                {'_id': order_id},
-                {
-                    '$set': update_data,
-                    '$push': {'status_history': status_history_entry}
-                }
-            )
+            # Update order - only if nobody moved it since it was read
+            if self._compare_and_set_status(order, update_data, status_history_entry) is None:
+                raise ValueError(f"Order {order_id} was modified concurrently, reload it and try again")
+            self._apply_status_counts({current_status: -1, new_status: 1})
+            
+            # Award loyalty points (if not already awarded)
+            if update_data.get('points_awarded'):
+                print(f"Awarding {order['loyalty_points_earned']} loyalty points...")
+                
+                self.award_loyalty_points(
+                    order['customer_id'],
+                    order['loyalty_points_earned'],
+                    order_id,
+                    order['subtotal_after_discount']
+                )
+                
+                print("✅ Points awarded")
             
             print(f"\n{'='*60}")
             print(f"✅ Order status updated: {order_id} → {new_status}")
@@ -1503,7 +1592,7 @@ class OnlineTransactionService:
             # Update order
             self.online_transactions.update_one(
                 {'_id': order_id},
-                {'$set': update_data}
+                {'$set': update_data, '$inc': {'version': 1}}
             )
             
             # Auto-confirm order if payment successful and order is pending
@@ -1584,7 +1673,7 @@ class OnlineTransactionService:
             if delivery_person:
                 self.online_transactions.update_one(
                     {'_id': order_id},
-                    {'$set': {'delivery_person': delivery_person}}
+                    {'$set': {'delivery_person': delivery_person}, '$inc': {'version': 1}}
                 )
             
             notes = f"Order delivered successfully"
@@ -1597,6 +1686,403 @@ class OnlineTransactionService:
             logger.error(f"❌ Complete order failed: {str(e)}")
             raise
     
+    # ================================================================
+    # BULK ORDER TRANSITIONS
+    # ================================================================
+    
+    def bulk_transition_orders(self, transitions, updated_by, notes='', cancellation_reason=None):
+        """
+        Move many orders through the state machine in one request
+        
+        Each transition is validated against ORDER_TRANSITIONS and the order's
+        `version` (optimistic concurrency: a stale `expected_version` is a
+        conflict, not an overwrite). Valid ones are applied with a single
+        unordered bulk_write whose filters carry the version guard; side
+        effects (stock restoration, points, counters, notifications) then run
+        only for the orders whose write actually landed.
+        
+        Args:
+            transitions: list of {
+                'order_id': str,
+                'expected_version': int (the `version` the client last saw),
+                'target_status': str,
+                'notes': str (optional),
+                'cancellation_reason': str (optional, required for 'cancelled'
+                    unless given for the whole request)
+            }
+            updated_by: Staff user ID
+            notes: Default status history note
+            cancellation_reason: Default reason for cancellations
+        
+        Returns:
+            dict: per-order results (in request order) and a summary
+        """
+        try:
+            transitions = transitions or []
+            if len(transitions) > BULK_TRANSITION_LIMIT:
+                raise ValueError(f"At most {BULK_TRANSITION_LIMIT} orders per bulk transition")
+            
+            results = []
+            requested = {}
+            
+            for item in transitions:
+                order_id = item.get('order_id')
+                target_status = item.get('target_status')
+                expected_version = item.get('expected_version')
+                result = {'order_id': order_id, 'target_status': target_status}
+                results.append(result)
+                
+                if not order_id:
+                    self._reject_transition(result, 'invalid', "order_id is required")
+                elif target_status not in ORDER_TRANSITIONS:
+                    self._reject_transition(result, 'invalid', f"Unknown status '{target_status}'")
+                elif not isinstance(expected_version, int) or isinstance(expected_version, bool):
+                    self._reject_transition(result, 'invalid', "expected_version must be an integer")
+                elif order_id in requested:
+                    self._reject_transition(result, 'invalid', "Order appears more than once in the request")
+                elif target_status == 'cancelled' and not (item.get('cancellation_reason') or cancellation_reason):
+                    self._reject_transition(result, 'invalid', "Cancellation reason is required")
+                else:
+                    requested[order_id] = (item, result)
+            
+            orders = {
+                order['_id']: order
+                for order in self.online_transactions.find({'_id': {'$in': list(requested)}})
+            } if requested else {}
+            
+            # Step 1: Validate against current state and version
+            candidates = []
+            for order_id, (item, result) in requested.items():
+                order = orders.get(order_id)
+                if not order:
+                    self._reject_transition(result, 'not_found', f"Order {order_id} not found")
+                    continue
+                
+                current_status = order['order_status']
+                current_version = order.get('version', 0)
+                result.update({'from_status': current_status, 'current_version': current_version})
+                
+                if current_version != item['expected_version']:
+                    self._reject_transition(
+                        result, 'conflict',
+                        f"Order changed since version {item['expected_version']} (now {current_version})"
+                    )
+                elif item['target_status'] not in ORDER_TRANSITIONS.get(current_status, []):
+                    self._reject_transition(
+                        result, 'invalid',
+                        f"Cannot transition from '{current_status}' to '{item['target_status']}'. "
+                        f"Allowed transitions: {ORDER_TRANSITIONS.get(current_status, [])}"
+                    )
+                else:
+                    candidates.append((order, item, result))
+            
+            # Step 2: Confirmations still need stock in active batches
+            candidates = self._check_confirmation_stock(candidates)
+            
+            # Step 3: One guarded bulk_write; the token identifies writes that landed
+            token = uuid.uuid4().hex
+            now = datetime.utcnow()
+            operations = []
+            for order, item, result in candidates:
+                update_data, history_entry = self._transition_update(
+                    order, item['target_status'], updated_by,
+                    item.get('notes', notes),
+                    item.get('cancellation_reason') or cancellation_reason,
+                    now
+                )
+                update_data['last_transition_token'] = token
+                operations.append(UpdateOne(
+                    {'_id': order['_id'], 'order_status': order['order_status'], **self._version_guard(order.get('version', 0))},
+                    {
+                        '$set': update_data,
+                        '$push': {'status_history': history_entry},
+                        '$inc': {'version': 1}
+                    }
+                ))
+            
+            applied = {}
+            if operations:
+                self.online_transactions.bulk_write(operations, ordered=False)
+                applied = {
+                    order['_id']: order
+                    for order in self.online_transactions.find({
+                        '_id': {'$in': [order['_id'] for order, _, _ in candidates]},
+                        'last_transition_token': token
+                    })
+                }
+            
+            landed = []
+            for order, item, result in candidates:
+                updated_order = applied.get(order['_id'])
+                if updated_order is None:
+                    self._reject_transition(result, 'conflict', "Order was modified concurrently")
+                    continue
+                result.update({'status': 'applied', 'version': updated_order.get('version')})
+                landed.append((order, updated_order, result))
+            
+            # Step 4: Side effects for the orders that moved
+            if landed:
+                deltas = defaultdict(int)
+                for order, updated_order, _ in landed:
+                    deltas[order['order_status']] -= 1
+                    deltas[updated_order['order_status']] += 1
+                self._apply_status_counts(deltas)
+                self._finish_bulk_transitions(landed, updated_by, token, now)
+            
+            summary = Counter(result['status'] for result in results)
+            logger.info(
+                f"Bulk order transition by {updated_by}: {summary.get('applied', 0)} applied, "
+                f"{summary.get('conflict', 0)} conflicts, "
+                f"{len(results) - summary.get('applied', 0) - summary.get('conflict', 0)} rejected"
+            )
+            
+            return {
+                'results': results,
+                'summary': {
+                    'requested': len(results),
+                    'applied': summary.get('applied', 0),
+                    'conflicts': summary.get('conflict', 0),
+                    'rejected': len(results) - summary.get('applied', 0) - summary.get('conflict', 0)
+                }
+            }
+            
+        except Exception as e:
+            logger.error(f"❌ Bulk order transition failed: {str(e)}")
+            raise
+
+    @staticmethod
+    def _reject_transition(result, status, error):
+        result.update({'status': status, 'error': error})
+    
+    def _compare_and_set_status(self, order, update_data, status_history_entry):
+        """
+        Apply a status change only if the order is still in the status and
+        version it was read at. Returns the updated order, or None when a
+        concurrent write got there first (nothing is written then).
+        """
+        return self.online_transactions.find_one_and_update(
+            {'_id': order['_id'], 'order_status': order['order_status'], **self._version_guard(order.get('version', 0))},
+            {
+                '$set': update_data,
+                '$push': {'status_history': status_history_entry},
+                '$inc': {'version': 1}
+            },
+            return_document=ReturnDocument.AFTER
+        )
+    
+    @staticmethod
+    def _version_guard(expected_version):
+        """Filter matching an order still at `expected_version` (orders created before versioning are 0)"""
+        if expected_version == 0:
+            return {'$or': [{'version': 0}, {'version': {'$exists': False}}]}
+        return {'version': expected_version}
+    
+    def _check_confirmation_stock(self, candidates):
+        """
+        Reject confirmations whose items no longer have enough stock in
+        active batches (same rule as update_order_status), with one
+        aggregation for every product involved.
+        """
+        product_ids = {
+            item['product_id']
+            for order, request_item, _ in candidates
+            if request_item['target_status'] == 'confirmed'
+            for item in order.get('items', [])
+        }
+        if not product_ids:
+            return candidates
+        
+        available = {
+            row['_id']: row['total_stock']
+            for row in self.db.batches.aggregate([
+                {'$match': {
+                    'product_id': {'$in': list(product_ids)},
+                    'status': 'active',
+                    'quantity_remaining': {'$gt': 0}
+                }},
+                {'$group': {'_id': '$product_id', 'total_stock': {'$sum': '$quantity_remaining'}}}
+            ])
+        }
+        
+        accepted = []
+        for order, request_item, result in candidates:
+            if request_item['target_status'] == 'confirmed':
+                short = next(
+                    (item for item in order.get('items', []) if available.get(item['product_id'], 0) < item['quantity']),
+                    None
+                )
+                if short:
+                    self._reject_transition(
+                        result, 'invalid',
+                        f"Insufficient stock for {short['product_name']}. "
+                        f"Available: {available.get(short['product_id'], 0)}, Needed: {short['quantity']}"
+                    )
+                    continue
+            accepted.append((order, request_item, result))
+        return accepted
+    
+    @staticmethod
+    def _transition_update(order, new_status, updated_by, notes, cancellation_reason, now):
+        """`$set` fields and status history entry for one transition (mirrors the single-order paths)"""
+        update_data = {
+            'order_status': new_status,
+            'updated_at': now
+        }
+        
+        if new_status == 'processing':
+            update_data['prepared_by'] = updated_by
+        
+        elif new_status == 'on_the_way':
+            update_data['ready_at'] = now
+        
+        elif new_status == 'completed':
+            update_data['delivered_at'] = now
+            if order['payment_method'] == 'cod':
+                update_data['payment_status'] = 'paid'
+            if not order.get('points_awarded', False):
+                update_data['points_awarded'] = True
+        
+        elif new_status == 'cancelled':
+            update_data.update({
+                'is_cancelled': True,
+                'cancellation_reason': cancellation_reason,
+                'cancelled_by': updated_by,
+                'cancelled_at': now,
+                'stock_restored': True,
+                'points_refunded': order.get('loyalty_points_used', 0) > 0
+            })
+            if order['payment_status'] == 'paid':
+                update_data['payment_status'] = 'refunded'
+            notes = notes or cancellation_reason
+        
+        status_history_entry = {
+            'status': new_status,
+            'timestamp': now,
+            'updated_by': updated_by,
+            'notes': notes
+        }
+        
+        return update_data, status_history_entry
+    
+    def _finish_bulk_transitions(self, landed, updated_by, token, now):
+        """Stock, points, sales counters and notifications for transitions that were written"""
+        cancelled = [(order, result) for order, updated, result in landed if updated['order_status'] == 'cancelled']
+        
+        if cancelled:
+            self._restore_cancelled_stock([order for order, _ in cancelled], updated_by, token, now)
+            sales_fact_service.set_voided('online', [order['_id'] for order, _ in cancelled])
+            report_cache.record_write('online_transactions', [order.get('transaction_date') for order, _ in cancelled])
+        
+        for order, updated_order, result in landed:
+            new_status = updated_order['order_status']
+            try:
+                if new_status == 'cancelled':
+                    if order.get('loyalty_points_used', 0) > 0:
+                        self.refund_customer_points(order['customer_id'], order['loyalty_points_used'], order['_id'])
+                    self.sales_counters.record_sale(order, source='online', sign=-1)
+                
+                elif new_status == 'completed' and not order.get('points_awarded', False):
+                    self.award_loyalty_points(
+                        order['customer_id'],
+                        order['loyalty_points_earned'],
+                        order['_id'],
+                        order['subtotal_after_discount']
+                    )
+            except Exception as e:
+                # The transition itself is committed; report the follow-up failure
+                logger.error(f"Follow-up for {order['_id']} → {new_status} failed: {str(e)}")
+                result['warning'] = str(e)
+            
+            self._send_order_notification(f'order_{new_status}', order['_id'], order=updated_order)
+    
+    def _restore_cancelled_stock(self, orders, cancelled_by, token, now):
+        """
+        Return the stock of many cancelled orders at once: batch quantities
+        are merged per batch into one restoration pass, product stock is
+        incremented with one bulk_write.
+        """
+        merged_batches = {}
+        product_quantities = defaultdict(int)
+        
+        for order in orders:
+            for item in order.get('items', []):
+                if 'batches_used' not in item:
+                    continue
+                product_quantities[item['product_id']] += item['quantity']
+                for batch in item['batches_used']:
+                    entry = merged_batches.setdefault(batch['batch_id'], {**batch, 'quantity_deducted': 0})
+                    entry['quantity_deducted'] += batch['quantity_deducted']
+        
+        if merged_batches:
+            self.batch_service.restore_stock_to_batches(
+                list(merged_batches.values()),
+                now,
+                transaction_info={
+                    'transaction_id': f"BULK-CANCEL-{token[:8]}",
+                    'adjusted_by': cancelled_by,
+                    'reason': f"Orders cancelled: {', '.join(order['_id'] for order in orders)}"
+                }
+            )
+        
+        if product_quantities:
+            self.products_collection.bulk_write([
+                UpdateOne({'_id': product_id}, {'$inc': {'stock': quantity}, '$set': {'updated_at': now}})
+                for product_id, quantity in product_quantities.items()
+            ], ordered=False)
+            change_log_service.record_changes('products', list(product_quantities))
+            stock_state_service.refresh(list(product_quantities), context={'source': 'online_order_bulk_cancel'})
+    
+    # ================================================================
+    # ORDER STATUS COUNTERS
+    # ================================================================
+    
+    def _apply_status_counts(self, deltas):
+        """
+        Apply order-count deltas per status, e.g. {'pending': -1, 'confirmed': 1}.
+        
+        Failures are logged and swallowed - counters must never break an
+        order write; rebuild_order_counters restores them.
+        """
+        try:
+            increments = {f'counts.{status}': delta for status, delta in deltas.items() if status and delta}
+            if increments:
+                self.order_counters.update_one(
+                    {'_id': ORDER_COUNTERS_ID},
+                    {'$inc': increments, '$set': {'updated_at': datetime.utcnow()}},
+                    upsert=True
+                )
+        except Exception as e:
+            logger.error(f"Error updating order status counters: {str(e)}")
+    
+    def get_order_status_counts(self):
+        """Order count per order_status, rebuilt on first use"""
+        counters = self.order_counters.find_one({'_id': ORDER_COUNTERS_ID})
+        if counters is None or counters.get('rebuilt_at') is None:
+            return self.rebuild_order_counters()
+        return {status: count for status, count in counters.get('counts', {}).items() if count}
+    
+    def rebuild_order_counters(self):
+        """Recount orders per status from online_transactions"""
+        try:
+            counts = {
+                row['_id']: row['count']
+                for row in self.online_transactions.aggregate([
+                    {'$group': {'_id': '$order_status', 'count': {'$sum': 1}}}
+                ])
+                if row['_id']
+            }
+            now = datetime.utcnow()
+            self.order_counters.replace_one(
+                {'_id': ORDER_COUNTERS_ID},
+                {'_id': ORDER_COUNTERS_ID, 'counts': counts, 'updated_at': now, 'rebuilt_at': now},
+                upsert=True
+            )
+            return counts
+        
+        except Exception as e:
+            logger.error(f"Error rebuilding order status counters: {str(e)}")
+            raise Exception(f"Error rebuilding order status counters: {str(e)}")
+    
     # ================================================================
     # ORDER RETRIEVAL
     # ================================================================
@@ -1642,6 +2128,36 @@ class OnlineTransactionService:
             logger.error(f"Error fetching customer orders: {str(e)}")
             return []
     
+    @staticmethod
+    def _orders_query(filters=None):
+        """Staff order-list filter (shared with the async read path)"""
+        query = {}
+        
+        if filters:
+            # Status filter
+            if filters.get('status'):
+                query['order_status'] = filters['status']
+            
+            # Payment status filter
+            if filters.get('payment_status'):
+                query['payment_status'] = filters['payment_status']
+            
+            # Customer filter
+            if filters.get('customer_id'):
+                query['customer_id'] = filters['customer_id']
+            
+            # Date range filter
+            if filters.get('start_date') or filters.get('end_date'):
+                query['transaction_date'] = {}
+                
+                if filters.get('start_date'):
+                    query['transaction_date']['$gte'] = filters['start_date']
+                
+                if filters.get('end_date'):
+                    query['transaction_date']['$lte'] = filters['end_date']
+        
+        return query
+    
     def get_all_orders(self, filters=None, limit=100):
         """
         Get all orders with optional filters (for staff)
@@ -1660,30 +2176,7 @@ class OnlineTransactionService:
             List of orders
         """
         try:
-            query = {}
-            
-            if filters:
-                # Status filter
-                if filters.get('status'):
-                    query['order_status'] = filters['status']
-                
-                # Payment status filter
-                if filters.get('payment_status'):
-                    query['payment_status'] = filters['payment_status']
-                
-                # Customer filter
-                if filters.get('customer_id'):
-                    query['customer_id'] = filters['customer_id']
-                
-                # Date range filter
-                if filters.get('start_date') or filters.get('end_date'):
-                    query['transaction_date'] = {}
-                    
-                    if filters.get('start_date'):
-                        query['transaction_date']['$gte'] = filters['start_date']
-                    
-                    if filters.get('end_date'):
-                        query['transaction_date']['$lte'] = filters['end_date']
+            query = self._orders_query(filters)
             
             orders = list(
                 self.online_transactions
@@ -1818,10 +2311,10 @@ class OnlineTransactionService:
     # NOTIFICATION HELPER
     # ================================================================
     
-    def _send_order_notification(self, event_type, order_id):
-        """Send notifications for order events"""
+    def _send_order_notification(self, event_type, order_id, order=None):
+        """Send notifications for order events (pass `order` to skip re-reading it)"""
         try:
-            order = self.get_order_by_id(order_id)
+            order = order or self.get_order_by_id(order_id)
             
             if not order:
                 return
@@ -1,6 +1,14 @@
 from datetime import datetime
 from bson import ObjectId
 from ...database import db_manager
+from ...bson_json import bson_to_json
+from pymongo import ReturnDocument
+from ..shift_totals_service import shift_totals_service
+from ..sales_fact_service import sales_fact_service
+from ..report_cache_service import report_cache
+from ..stock_state_service import (
+    STATE_PROJECTION, WATCHLIST_PROJECTION, StockStateService, stock_state_service
+)
 
 class PromoConnection:
     def __init__(self):
@@ -11,177 +19,53 @@ class PromoConnection:
         self.sales_collection = self.db.sales
 
     def convert_object_id(self, document):
-        """Convert ObjectId to string for JSON serialization - Enhanced version"""
-        if document is None:
-            return document
-        
-        if isinstance(document, list):
-            return [self.convert_object_id(item) for item in document]
-        
-        if isinstance(document, dict):
-            converted = {}
-            for key, value in document.items():
-                if isinstance(value, ObjectId):
-                    converted[key] = str(value)
-                elif isinstance(value, (dict, list)):
-                    converted[key] = self.convert_object_id(value)
-                else:
-                    converted[key] = value
-            return converted
-        
-        if isinstance(document, ObjectId):
-            return str(document)
-        
-        return document
+        """Convert ObjectId to string for JSON serialization (shared iterative converter)"""
+        return bson_to_json(document, datetimes=False)
 
     # ================================================================
     # STOCK NOTIFICATION METHODS
     # ================================================================
 
     def check_low_stock_warnings(self, checkout_data, current_user=None):
-        """Check if any products will go below low stock threshold and send notifications"""
+        """
+        Preview which products this cart would move into low/out of stock.
+
+        Read-only: alerts are sent by the stock state service when the sale
+        actually writes the stock, once per threshold crossing.
+        """
         warnings = []
-        
+        quantities = {}
         for item in checkout_data:
-            product = self.products_collection.find_one({'_id': ObjectId(item['product_id'])})
+            quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+        
+        products = self.products_collection.find(
+            {'_id': {'$in': [ObjectId(product_id) for product_id in quantities]}},
+            STATE_PROJECTION
+        )
+        for product in products:
+            new_stock = product.get('stock', 0) - quantities[str(product['_id'])]
+            state = StockStateService.classify(new_stock, product.get('low_stock_threshold'))
+            if state == product.get('stock_state'):
+                continue
             
-            if product:
-                current_stock = product.get('stock', 0)
-                quantity_sold = item['quantity']
-                low_stock_threshold = product.get('low_stock_threshold', 5)
-                
-                new_stock = current_stock - quantity_sold
-                product_name = product.get('product_name', 'Unknown Product')
-                
-                # Check for different stock warning levels
-                if new_stock <= 0:
-                    warning_msg = f"⚠️ {product_name} will be OUT OF STOCK!"
-                    warnings.append(warning_msg)
-                    
-                    # Send OUT OF STOCK notification
-                    self._send_stock_notification(
-                        'out_of_stock', 
-                        product, 
-                        current_stock, 
-                        new_stock, 
-                        quantity_sold,
-                        current_user
-                    )
-                    
-                elif new_stock <= low_stock_threshold:
-                    warning_msg = f"🔶 {product_name} will be LOW STOCK ({new_stock} remaining)"
-                    warnings.append(warning_msg)
-                    
-                    # Send LOW STOCK notification
-                    self._send_stock_notification(
-                        'low_stock', 
-                        product, 
-                        current_stock, 
-                        new_stock, 
-                        quantity_sold,
-                        current_user
-                    )
+            product_name = product.get('product_name', 'Unknown Product')
+            if state == 'out':
+                warnings.append(f"⚠️ {product_name} will be OUT OF STOCK!")
+            elif state == 'low':
+                warnings.append(f"🔶 {product_name} will be LOW STOCK ({new_stock} remaining)")
         
         return warnings
 
-    def _send_stock_notification(self, alert_type, product, current_stock, new_stock, quantity_sold, current_user=None):
-        """Send notification for stock-related alerts"""
-        try:
-            product_name = product.get('product_name', 'Unknown Product')
-            product_id = str(product.get('_id', ''))
-            low_stock_threshold = product.get('low_stock_threshold', 5)
-            
-            # Configure notification based on alert type
-            if alert_type == 'out_of_stock':
-                title = "⚠️ PRODUCT OUT OF STOCK"
-                message = f"'{product_name}' is now OUT OF STOCK after selling {quantity_sold} units"
-                priority = "urgent"
-                
-            elif alert_type == 'low_stock':
-                title = "🔶 LOW STOCK ALERT"
-                message = f"'{product_name}' is running low on stock. Only {new_stock} units remaining (threshold: {low_stock_threshold})"
-                priority = "high"
-                
-            else:
-                return  # Unknown alert type
-            
-            # Common metadata for both alert types
-            metadata = {
-                "product_id": product_id,
-                "product_name": product_name,
-                "sku": product.get('SKU', ''),
-                "category_id": product.get('category_id', ''),
-                "current_stock": current_stock,
-                "new_stock": new_stock,
-                "quantity_sold": quantity_sold,
-                "low_stock_threshold": low_stock_threshold,
-                "alert_type": alert_type,
-                "action_type": "stock_alert",
-                "cashier_id": current_user.get('_id') if current_user else None,
-                "cashier_name": current_user.get('username') if current_user else None,
-                "cost_price": product.get('cost_price', 0),
-                "selling_price": product.get('selling_price', 0),
-                "supplier_id": product.get('supplier_id'),
-                "reorder_suggested": new_stock <= low_stock_threshold
-            }
-            
-            # Import notification service
-            from notifications.services import notification_service
-            
-            # Send the notification
-            notification_service.create_notification(
-                title=title,
-                message=message,
-                priority=priority,
-                notification_type="inventory",  # Different type for inventory alerts
-                metadata=metadata
-            )
-            
-            print(f"📢 Stock notification sent: {title} for {product_name}")
-            
-        except Exception as notification_error:
-            # Log the notification error but don't fail the main operation
-            print(f"❌ Failed to create {alert_type} notification for product {product.get('product_name', 'Unknown')}: {notification_error}")
-
     def check_all_low_stock_products(self):
-        """Check all products for low stock and send batch notification - Fixed version"""
+        """All products at or below their low stock threshold, served from the stock_state index"""
         try:
-            # Find all products that are at or below their low stock threshold
-            low_stock_products = list(self.products_collection.find({
-                "$expr": {
-                    "$lte": ["$stock", "$low_stock_threshold"]
-                },
-                "isDeleted": {"$ne": True}
-            }))
+            low_stock_products = list(self.products_collection.find(
+                stock_state_service.watchlist_query(),
+                WATCHLIST_PROJECTION
+            ).sort([('stock_state', 1), ('stock', 1)]))
             
             # 🔧 FIX: Convert ObjectIds to strings
-            low_stock_products = [self.convert_object_id(product) for product in low_stock_products]
-            
-            if low_stock_products:
-                # Send batch notification
-                product_names = [p.get('product_name', 'Unknown') for p in low_stock_products]
-                
-                try:
-                    from notifications.services import notification_service
-                    
-                    notification_service.create_notification(
-                        title=f"📊 INVENTORY REPORT: {len(low_stock_products)} Products Need Restocking",
-                        message=f"The following products are running low: {', '.join(product_names[:5])}{'...' if len(product_names) > 5 else ''}",
-                        priority="medium",
-                        notification_type="inventory",
-                        metadata={
-                            "alert_type": "batch_low_stock_report",
-                            "low_stock_count": len(low_stock_products),
-                            "product_ids": [str(p['_id']) for p in low_stock_products],
-                            "product_names": product_names,
-                            "action_type": "inventory_report"
-                        }
-                    )
-                except Exception as notification_error:
-                    print(f"❌ Failed to send notification: {notification_error}")
-                    # Continue without notification
-                    
-            return low_stock_products
+            return [self.convert_object_id(product) for product in low_stock_products]
             
         except Exception as e:
             print(f"❌ Error checking all low stock products: {e}")
@@ -224,9 +108,16 @@ class PromoConnection:
             'timestamp': sales_record['transaction_date']
         }
 
-    def update_inventory(self, checkout_data):
-        """Reduce product quantities after sale"""
+    def update_inventory(self, checkout_data, cashier_id=None):
+        """
+        Reduce product quantities after sale.
+
+        Returns:
+            list: stock state transitions caused by this sale (one alert is
+            sent per crossing by the stock state service)
+        """
         try:
+            updated_products = []
             for item in checkout_data:
                 print(f"🔄 Processing item: {item}")
                 
@@ -237,16 +128,24 @@ class PromoConnection:
                 print(f"📦 Reducing stock for product {product_id} by {quantity_sold}")
                 
                 # Update inventory - use 'stock' field
-                result = self.products_collection.update_one(
+                updated_product = self.products_collection.find_one_and_update(
                     {'_id': ObjectId(product_id)},
-                    {'$inc': {'stock': -quantity_sold}}
+                    {'$inc': {'stock': -quantity_sold}},
+                    projection=STATE_PROJECTION,
+                    return_document=ReturnDocument.AFTER
                 )
                 
                 # Check if update was successful
-                if result.modified_count == 1:
+                if updated_product:
+                    updated_products.append(updated_product)
                     print(f"✅ Stock updated for product {product_id}")
                 else:
                     print(f"⚠️ Warning: Product {product_id} not found or not updated")
+            
+            return stock_state_service.record_stock_levels(
+                updated_products,
+                context={'source': 'pos_checkout', 'cashier_id': cashier_id}
+            )
                     
         except Exception as e:
             print(f"❌ Error updating inventory: {str(e)}")
@@ -277,6 +176,7 @@ class PromoConnection:
                 'promotion_applied': sales_data.get('promotion_applied', None),
                 'payment_method': sales_data.get('payment_method', 'cash'),
                 'cashier_id': sales_data.get('cashier_id', None),
+                'session_id': shift_totals_service.get_open_session_id(sales_data.get('cashier_id')),
                 'customer_id': sales_data.get('customer_id', None),
                 'transaction_date': datetime.utcnow(),
                 'status': 'completed',
@@ -288,6 +188,9 @@ class PromoConnection:
 
             if result.inserted_id:
                 sales_record['_id'] = str(result.inserted_id)
+                shift_totals_service.record_sale(sales_record)
+                sales_fact_service.record_transaction(sales_record, 'pos')
+                report_cache.record_write('sales', sales_record['transaction_date'])
                 print(f"✅ Sales transaction created: {sales_record['sale_id']}")
                 print(f"💰 Total amount: ₱{sales_record['final_amount']}")
                 if sales_record['total_discount'] > 0:
@@ -312,11 +215,6 @@ class PromoConnection:
     def pos_transaction(self, checkout_data, promotion_name=None, cashier_id=None):
         """Complete POS transaction: apply promotions + save sales record + check stock + update inventory"""
         try:
-            # Get current user info for notifications
-            current_user = None
-            if cashier_id:
-                current_user = {'_id': cashier_id, 'username': f'cashier_{cashier_id}'}
-            
             # Step 1: Validate stock availability
             stock_validation = self.validate_stock_availability(checkout_data)
             if not stock_validation['valid']:
@@ -326,10 +224,7 @@ class PromoConnection:
                     'data': None
                 }
             
-            # Step 2: Check for low stock warnings BEFORE processing sale
-            stock_warnings = self.check_low_stock_warnings(checkout_data, current_user)
-            
-            # Step 3: Apply promotions and calculate totals
+            # Step 2: Apply promotions and calculate totals
             if promotion_name:
                 checkoutResult = self.checkout_list(checkout_data, promotion_name)
                 total_amount = checkoutResult['final_total']
@@ -340,7 +235,7 @@ class PromoConnection:
                 discount = 0
                 promo_applied = None
 
-            # Step 4: Prepare sales data
+            # Step 3: Prepare sales data
             sales_data = {
                 'items': checkout_data,
                 'total_amount': sum(item['price'] * item['quantity'] for item in checkout_data),
@@ -351,20 +246,25 @@ class PromoConnection:
                 'payment_method': 'cash'
             }
 
-            # Step 5: Save transaction
+            # Step 4: Save transaction
             sales_result = self.create_sales(sales_data)
 
-            # Step 6: Update inventory after successful sale
+            # Step 5: Update inventory after successful sale; warnings come from the
+            # state crossings of this write, no separate low-stock query
+            stock_warnings = []
             if sales_result['success']:
-                self.update_inventory(checkout_data)
+                transitions = self.update_inventory(checkout_data, cashier_id)
+                stock_warnings = [
+                    warning for warning in map(StockStateService.warning_for, transitions) if warning
+                ]
                 print("📦 Inventory updated successfully")
 
-            # Step 7: Generate receipt
+            # Step 6: Generate receipt
             receipt = None
             if sales_result['success']:
                 receipt = self.generate_receipt(sales_result['data'])
 
-            # Step 8: Prepare response
+            # Step 7: Prepare response
             response = {
                 'success': sales_result["success"],
                 'message': 'Transaction Complete',
@@ -1,7 +1,12 @@
 from datetime import date, time, timedelta, datetime
+import heapq
+import itertools
 from bson import ObjectId
 from ...database import db_manager
+from ...bson_json import bson_to_json
 from .promotionCon import PromoConnection
+from ..analytics_snapshot_service import analytics_engine
+from ..report_cache_service import report_cache
 
 class SalesReport:
     """
@@ -27,9 +32,7 @@ class SalesReport:
 
     def convert_object_id(self, document):
         """Convert ObjectId to string for JSON serialization"""
-        if document and '_id' in document:
-            document['_id'] = str(document['_id'])
-        return document
+        return bson_to_json(document, datetimes=False)
 
     # ================================================================
     # CORE API - 3 ESSENTIAL METHODS ONLY
@@ -63,29 +66,14 @@ class SalesReport:
             get_sales_summary(None, ['manual', 'csv'])
         """
         try:
-            # Build date filter
-            date_filter = {}
-            if date_range:
-                date_filter = {
-                    'transaction_date': {
-                        '$gte': date_range['start'],
-                        '$lte': date_range['end']
-                    }
-                }
-            
-            # Build source filter
-            source_filter = {}
-            if include_source:
-                source_filter = {'source': {'$in': include_source}}
-            
-            # Combine filters
-            query = {}
-            if date_filter and source_filter:
-                query = {'$and': [date_filter, source_filter]}
-            elif date_filter:
-                query = date_filter
-            elif source_filter:
-                query = source_filter
+            # Closed, fully exported ranges are answered from the Parquet snapshots
+            if analytics_engine.covers_range(date_range):
+                totals = analytics_engine.sales_totals(date_range, include_source)
+                return self._summary_payload(
+                    totals['pos'], totals['log'], totals['recent'], date_range, include_source
+                )
+
+            query = self._build_match(date_range, include_source)
     
             # 🐛 DEBUG: Add these lines to see what's happening
             print(f"🔍 DEBUG - Query being used: {query}")
@@ -114,74 +102,82 @@ class SalesReport:
                 total_count = self.sales_log_collection.count_documents({})
                 print(f"🔍 DEBUG - Total documents in sales_log: {total_count}")
 
-            # Get data from both collections
-            pos_sales = list(self.sales_collection.find(query))
-            log_sales = list(self.sales_log_collection.find(query))
-            
-            # Calculate totals
-            pos_totals = self._calculate_pos_totals(pos_sales)
-            log_totals = self._calculate_log_totals(log_sales)
-            
-            # Combine totals
-            combined_totals = {
-                'total_transactions': pos_totals['count'] + log_totals['count'],
-                'total_revenue': round(pos_totals['revenue'] + log_totals['revenue'], 2),
-                'gross_revenue': round(pos_totals['gross'] + log_totals['gross'], 2),
-                'total_discounts': round(pos_totals['discounts'], 2),
-                'average_transaction': 0
-            }
-            
-            # Calculate average
-            if combined_totals['total_transactions'] > 0:
-                combined_totals['average_transaction'] = round(
-                    combined_totals['total_revenue'] / combined_totals['total_transactions'], 2
-                )
-            
-            # Source breakdown
-            source_breakdown = {
-                'pos': {
-                    'count': pos_totals['count'],
-                    'revenue': round(pos_totals['revenue'], 2),
-                    'percentage': 0
-                },
-                'manual_csv': {
-                    'count': log_totals['count'],
-                    'revenue': round(log_totals['revenue'], 2),
-                    'percentage': 0
-                }
-            }
-            
-            # Calculate percentages
-            if combined_totals['total_revenue'] > 0:
-                source_breakdown['pos']['percentage'] = round(
-                    (pos_totals['revenue'] / combined_totals['total_revenue']) * 100, 1
-                )
-                source_breakdown['manual_csv']['percentage'] = round(
-                    (log_totals['revenue'] / combined_totals['total_revenue']) * 100, 1
-                )
-            
-            # Recent transactions preview
-            recent_transactions = []
-            for sale in pos_sales[-10:]:
-                recent_transactions.append(self._normalize_pos_transaction(sale))
-            for sale in log_sales[-10:]:
-                recent_transactions.append(self._normalize_log_transaction(sale))
-            
-            recent_transactions.sort(key=lambda x: x['transaction_date'], reverse=True)
-            
-            return {
-                'summary': combined_totals,
-                'source_breakdown': source_breakdown,
-                'transactions_preview': recent_transactions[:20],
-                'filters_applied': {
-                    'date_range': date_range,
-                    'include_source': include_source
-                }
-            }
+            return self._summarize(pos_sales, log_sales, date_range, include_source)
             
         except Exception as e:
             raise Exception(f"Error getting sales summary: {str(e)}")
 
+    @classmethod
+    def _summarize(cls, pos_sales, log_sales, date_range=None, include_source=None):
+        """Summary payload from already-fetched sales (shared with the async read path)"""
+        # Recent transactions preview
+        recent_transactions = []
+        for sale in pos_sales[-10:]:
+            recent_transactions.append(cls._normalize_pos_transaction(sale))
+        for sale in log_sales[-10:]:
+            recent_transactions.append(cls._normalize_log_transaction(sale))
+        
+        return cls._summary_payload(
+            cls._calculate_pos_totals(pos_sales),
+            cls._calculate_log_totals(log_sales),
+            recent_transactions,
+            date_range,
+            include_source
+        )
+
+    @staticmethod
+    def _summary_payload(pos_totals, log_totals, recent_transactions, date_range=None, include_source=None):
+        """Summary payload from POS and sales_log totals (live or snapshot)"""
+        # Combine totals
+        combined_totals = {
+            'total_transactions': pos_totals['count'] + log_totals['count'],
+            'total_revenue': round(pos_totals['revenue'] + log_totals['revenue'], 2),
+            'gross_revenue': round(pos_totals['gross'] + log_totals['gross'], 2),
+            'total_discounts': round(pos_totals['discounts'], 2),
+            'average_transaction': 0
+        }
+        
+        # Calculate average
+        if combined_totals['total_transactions'] > 0:
+            combined_totals['average_transaction'] = round(
+                combined_totals['total_revenue'] / combined_totals['total_transactions'], 2
+            )
+        
+        # Source breakdown
+        source_breakdown = {
+            'pos': {
+                'count': pos_totals['count'],
+                'revenue': round(pos_totals['revenue'], 2),
+                'percentage': 0
+            },
+            'manual_csv': {
+                'count': log_totals['count'],
+                'revenue': round(log_totals['revenue'], 2),
+                'percentage': 0
+            }
+        }
+        
+        # Calculate percentages
+        if combined_totals['total_revenue'] > 0:
+            source_breakdown['pos']['percentage'] = round(
+                (pos_totals['revenue'] / combined_totals['total_revenue']) * 100, 1
+            )
+            source_breakdown['manual_csv']['percentage'] = round(
+                (log_totals['revenue'] / combined_totals['total_revenue']) * 100, 1
+            )
+        
+        recent_transactions.sort(key=lambda x: x['transaction_date'], reverse=True)
+        
+        return {
+            'summary': combined_totals,
+            'source_breakdown': source_breakdown,
+            'transactions_preview': recent_transactions[:20],
+            'filters_applied': {
+                'date_range': date_range,
+                'include_source': include_source
+            }
+        }
+
     def get_sales_transactions(self, date_range=None, include_source=None, limit=100):
         """
         📋 Get individual transaction records (not summary)
@@ -207,27 +203,31 @@ class SalesReport:
             if limit:
                 all_transactions = all_transactions[:limit]
             
-            # Calculate basic stats
-            total_count = len(all_transactions)
-            total_revenue = sum(txn['total_amount'] for txn in all_transactions)
-            
-            return {
-                'transactions': all_transactions,
-                'summary': {
-                    'total_transactions': total_count,
-                    'total_revenue': round(total_revenue, 2),
-                    'average_transaction': round(total_revenue / total_count, 2) if total_count > 0 else 0,
-                    'limited_to': limit
-                },
-                'filters_applied': {
-                    'date_range': date_range,
-                    'include_source': include_source
-                }
-            }
+            return self._transactions_result(all_transactions, date_range, include_source, limit)
             
         except Exception as e:
             raise Exception(f"Error getting sales transactions: {str(e)}")
 
+    @staticmethod
+    def _transactions_result(transactions, date_range=None, include_source=None, limit=None):
+        """Transactions payload with basic stats (shared with the async read path)"""
+        total_count = len(transactions)
+        total_revenue = sum(txn['total_amount'] for txn in transactions)
+        
+        return {
+            'transactions': transactions,
+            'summary': {
+                'total_transactions': total_count,
+                'total_revenue': round(total_revenue, 2),
+                'average_transaction': round(total_revenue / total_count, 2) if total_count > 0 else 0,
+                'limited_to': limit
+            },
+            'filters_applied': {
+                'date_range': date_range,
+                'include_source': include_source
+            }
+        }
+
     def get_sales_by_period(self, start_date, end_date, period_type='daily', include_source=None):
         """
         📊 Get sales grouped by time periods for charts/trends
@@ -246,6 +246,16 @@ class SalesReport:
             - Trend analysis
             - Period comparisons
         """
+        # Cached; closed ranges stay cached until a past-day sale changes
+        return report_cache.get_or_compute(
+            'sales_by_period',
+            {'start_date': start_date, 'end_date': end_date, 'period_type': period_type, 'include_source': include_source},
+            lambda: self._sales_by_period(start_date, end_date, period_type, include_source),
+            collections=('sales', 'sales_log'),
+            end_date=end_date
+        )
+
+    def _sales_by_period(self, start_date, end_date, period_type='daily', include_source=None):
         try:
             if period_type == 'daily':
                 return self._get_daily_breakdown(start_date, end_date, include_source)
@@ -263,17 +273,17 @@ class SalesReport:
     # CONVENIENCE METHODS (Built on top of core API)
     # ================================================================
 
-    def get_todays_sales(self):
-        """Get today's sales summary"""
+    @staticmethod
+    def _today_range():
         today = date.today()
-        date_range = {
+        return {
             'start': datetime.combine(today, time.min),
             'end': datetime.combine(today, time.max)
         }
-        return self.get_sales_summary(date_range)
 
-    def get_weekly_sales(self):
-        """Get this week's sales summary (Monday to Sunday)"""
+    @staticmethod
+    def _week_range():
+        """This week's range (Monday to Sunday) and its week_info"""
         today = date.today()
         days_since_monday = today.weekday()
         start_of_week = today - timedelta(days=days_since_monday)
@@ -283,17 +293,27 @@ class SalesReport:
             'start': datetime.combine(start_of_week, time.min),
             'end': datetime.combine(end_of_week, time.max)
         }
-        
-        result = self.get_sales_summary(date_range)
-        result['week_info'] = {
+        week_info = {
             'start_date': start_of_week.isoformat(),
             'end_date': end_of_week.isoformat(),
             'week_number': start_of_week.isocalendar()[1]
         }
+        return date_range, week_info
+
+    def get_todays_sales(self):
+        """Get today's sales summary"""
+        return self.get_sales_summary(self._today_range())
+
+    def get_weekly_sales(self):
+        """Get this week's sales summary (Monday to Sunday)"""
+        date_range, week_info = self._week_range()
+        result = self.get_sales_summary(date_range)
+        result['week_info'] = week_info
         return result
 
-    def get_monthly_sales(self):
-        """Get current month's sales summary"""
+    @staticmethod
+    def _month_range():
+        """Current month's range and its month_info"""
         today = date.today()
         start_of_month = date(today.year, today.month, 1)
         
@@ -306,15 +326,20 @@ class SalesReport:
             'start': datetime.combine(start_of_month, time.min),
             'end': datetime.combine(end_of_month, time.max)
         }
-        
-        result = self.get_sales_summary(date_range)
-        result['month_info'] = {
+        month_info = {
             'year': today.year,
             'month': today.month,
             'month_name': today.strftime('%B'),
             'start_date': start_of_month.isoformat(),
             'end_date': end_of_month.isoformat()
         }
+        return date_range, month_info
+
+    def get_monthly_sales(self):
+        """Get current month's sales summary"""
+        date_range, month_info = self._month_range()
+        result = self.get_sales_summary(date_range)
+        result['month_info'] = month_info
         return result
 
     def get_yearly_sales(self):
@@ -450,8 +475,9 @@ class SalesReport:
     # HELPER METHODS (Internal use only)
     # ================================================================
 
-    def _get_all_transactions(self, date_range=None, include_source=None):
-        """Get all individual transactions from both collections"""
+    @staticmethod
+    def _build_match(date_range=None, include_source=None):
+        """Sales/sales_log filter for a date range and source list"""
         match_conditions = []
         
         if date_range:
@@ -467,25 +493,52 @@ class SalesReport:
             source_filter = {"source": {"$in": include_source}}
             match_conditions.append(source_filter)
 
-        match_stage = {"$and": match_conditions} if match_conditions else {}
+        return {"$and": match_conditions} if match_conditions else {}
+
+    def _get_all_transactions(self, date_range=None, include_source=None):
+        """Get all individual transactions from both collections"""
+        match_stage = self._build_match(date_range, include_source)
 
         # Get from both collections
         pos_sales = list(self.sales_collection.find(match_stage))
         sales_log_entries = list(self.sales_log_collection.find(match_stage))
 
-        # Normalize formats
+        return self._unify_transactions(pos_sales, sales_log_entries)
+
+    @classmethod
+    def _unify_transactions(cls, pos_sales, sales_log_entries):
+        """Normalize both collections' sales into one list, newest first"""
         unified_sales = []
         
         for sale in pos_sales:
-            unified_sales.append(self._normalize_pos_sale(sale))
+            unified_sales.append(cls._normalize_pos_sale(sale))
 
         for sale in sales_log_entries:
-            unified_sales.append(self._normalize_sales_log(sale))
+            unified_sales.append(cls._normalize_sales_log(sale))
 
         # Sort by date
         unified_sales.sort(key=lambda x: x['transaction_date'], reverse=True)
         return unified_sales
 
+    def iter_transactions(self, date_range=None, include_source=None, limit=None):
+        """
+        Yield unified transactions newest first without loading them all.
+        Both collections are read with a server-side sort and merged lazily.
+        """
+        match_stage = self._build_match(date_range, include_source)
+
+        pos_sales = (
+            self._normalize_pos_sale(sale)
+            for sale in self.sales_collection.find(match_stage).sort("transaction_date", -1)
+        )
+        log_sales = (
+            self._normalize_sales_log(sale)
+            for sale in self.sales_log_collection.find(match_stage).sort("transaction_date", -1)
+        )
+
+        merged = heapq.merge(pos_sales, log_sales, key=lambda txn: txn['transaction_date'], reverse=True)
+        return itertools.islice(merged, limit) if limit else merged
+
     def _get_daily_breakdown(self, start_date, end_date, include_source=None):
         """Get day-by-day breakdown"""
         if isinstance(start_date, datetime):
@@ -538,8 +591,10 @@ class SalesReport:
         # Implementation for monthly grouping
         return {'period_type': 'monthly', 'breakdown': [], 'period_summary': {}}
 
-    def _calculate_pos_totals(self, pos_sales):
-        """Calculate totals from POS sales"""
+    @staticmethod
+    def _calculate_pos_totals(pos_sales):
+        """Calculate totals from POS sales (fully returned sales are not revenue)"""
+        pos_sales = [sale for sale in pos_sales if sale.get('status') != 'returned']
         count = len(pos_sales)
         revenue = sum(sale.get('final_amount', 0) for sale in pos_sales)
         gross = sum(sale.get('total_amount', 0) for sale in pos_sales)
@@ -552,7 +607,8 @@ class SalesReport:
             'discounts': discounts
         }
     
-    def _calculate_log_totals(self, log_sales):
+    @staticmethod
+    def _calculate_log_totals(log_sales):
         """Calculate totals from sales_log"""
         count = len(log_sales)
         revenue = sum(sale.get('total_amount', 0) for sale in log_sales)
@@ -564,7 +620,8 @@ class SalesReport:
             'gross': gross
         }
     
-    def _normalize_pos_transaction(self, sale):
+    @staticmethod
+    def _normalize_pos_transaction(sale):
         """Convert POS transaction to standard format"""
         return {
             '_id': str(sale['_id']),
@@ -577,7 +634,8 @@ class SalesReport:
             'promotion_applied': sale.get('promotion_applied')
         }
     
-    def _normalize_log_transaction(self, sale):
+    @staticmethod
+    def _normalize_log_transaction(sale):
         """Convert sales_log transaction to standard format"""
         return {
             '_id': str(sale['_id']),
@@ -590,7 +648,8 @@ class SalesReport:
             'sales_type': sale.get('sales_type', 'retail')
         }
 
-    def _normalize_pos_sale(self, pos_sale):
+    @staticmethod
+    def _normalize_pos_sale(pos_sale):
         """Convert POS sale to unified format"""
         return {
             '_id': str(pos_sale['_id']),
@@ -609,7 +668,8 @@ class SalesReport:
             'collection': 'sales'
         }
 
-    def _normalize_sales_log(self, sales_log):
+    @classmethod
+    def _normalize_sales_log(cls, sales_log):
         """Convert sales log to unified format"""
         return {
             '_id': str(sales_log['_id']),
@@ -622,13 +682,14 @@ class SalesReport:
             'cashier_id': str(sales_log['user_id']) if sales_log.get('user_id') else None,
             'user_id': str(sales_log['user_id']) if sales_log.get('user_id') else None,
             'promotion_applied': None,
-            'items': self._convert_item_list_to_items(sales_log.get('item_list', [])),
+            'items': cls._convert_item_list_to_items(sales_log.get('item_list', [])),
             'source': sales_log.get('source', 'manual'),
             'status': sales_log.get('status', 'completed'),
             'collection': 'sales_log'
         }
 
-    def _convert_item_list_to_items(self, item_list):
+    @staticmethod
+    def _convert_item_list_to_items(item_list):
         """Convert sales log item_list to POS items format"""
         items = []
         for item in item_list:
@@ -0,0 +1,300 @@
+from datetime import datetime
+import hashlib
+import logging
+import threading
+
+from django.core.cache import cache
+
+from ..database import db_manager
+from .change_log_service import change_log_service
+
+logger = logging.getLogger(__name__)
+
+CATALOG_ENTITIES = ('products', 'category')
+
+# Shared-store (Django cache) key and lifetime for the full snapshot
+SNAPSHOT_CACHE_KEY = 'pos_catalog_snapshot'
+SNAPSHOT_CACHE_TIMEOUT = 60 * 60
+
+# How long a process trusts its last catalog version before re-checking
+VERSION_CHECK_INTERVAL_SECONDS = 5
+
+# Deltas larger than this tell the terminal to re-download the snapshot
+MAX_DELTA_CHANGES = 2000
+
+# Change-log entries (all entities) checked for completeness per delta request
+DELTA_SCAN_LIMIT = 50000
+
+_local_snapshot = None
+_local_lock = threading.Lock()
+
+
+class POSCatalogSnapshotService:
+    """
+    Versioned, compact POS catalog for terminals.
+
+    One payload carries every active category (with subcategory names) and
+    every sellable product (price and stock flags). The payload version is the
+    latest change-log version that touched a catalog entity when it was built
+    (sales, customers and batches do not move it), so terminals can send it
+    back as an ETag or as `since=<version>` and only re-download what changed.
+    """
+
+    PRODUCT_FIELDS = {
+        'product_name': 1, 'SKU': 1, 'barcode': 1, 'unit': 1,
+        'selling_price': 1, 'category_id': 1, 'subcategory_name': 1,
+        'stock': 1, 'low_stock_threshold': 1, 'is_taxable': 1,
+        'status': 1, 'isDeleted': 1
+    }
+
+    def __init__(self):
+        self.db = db_manager.get_database()
+        self.category_collection = self.db.category
+        self.product_collection = self.db.products
+
+    # ================================================================
+    # COMPACT SERIALIZATION
+    # ================================================================
+
+    def _compact_category(self, category):
+        return {
+            'id': category['_id'],
+            'name': category.get('category_name', ''),
+            'subcategories': [
+                subcategory.get('name')
+                for subcategory in category.get('sub_categories', [])
+                if subcategory.get('name')
+            ]
+        }
+
+    def _compact_product(self, product):
+        stock = product.get('stock', 0) or 0
+        threshold = product.get('low_stock_threshold', 0) or 0
+        return {
+            'id': product['_id'],
+            'name': product.get('product_name', ''),
+            'sku': product.get('SKU'),
+            'barcode': product.get('barcode'),
+            'unit': product.get('unit', ''),
+            'price': product.get('selling_price', 0),
+            'category_id': product.get('category_id'),
+            'subcategory': product.get('subcategory_name'),
+            'stock': stock,
+            'in_stock': stock > 0,
+            'low_stock': 0 < stock <= threshold,
+            'taxable': product.get('is_taxable', True)
+        }
+
+    def _is_sellable_category(self, category):
+        return category.get('status') == 'active' and not category.get('isDeleted')
+
+    def _is_sellable_product(self, product):
+        return product.get('status') == 'active' and not product.get('isDeleted')
+
+    @staticmethod
+    def make_etag(version):
+        return f'"catalog-v{version}"'
+
+    @staticmethod
+    def parse_etag(etag):
+        """Extract the version from an If-None-Match value, or None"""
+        if not etag:
+            return None
+        value = etag.strip()
+        if value.startswith('W/'):
+            value = value[2:]
+        value = value.strip('"')
+        if not value.startswith('catalog-v'):
+            return None
+        try:
+            return int(value[len('catalog-v'):])
+        except ValueError:
+            return None
+
+    @staticmethod
+    def catalog_version(max_age_seconds=0):
+        """Latest change-log version recorded for a catalog entity"""
+        return max(change_log_service.entity_versions(CATALOG_ENTITIES, max_age_seconds))
+
+    # ================================================================
+    # SNAPSHOT
+    # ================================================================
+
+    def build_snapshot(self):
+        """Build the full catalog payload from Mongo (two queries)"""
+        try:
+            # Read the version first: anything written after it shows up in the next delta
+            version = self.catalog_version()
+
+            categories = [
+                self._compact_category(category)
+                for category in self.category_collection.find(
+                    {'status': 'active', 'isDeleted': {'$ne': True}},
+                    {'category_name': 1, 'sub_categories.name': 1}
+                ).sort('category_name', 1)
+            ]
+
+            products = [
+                self._compact_product(product)
+                for product in self.product_collection.find(
+                    {'status': 'active', 'isDeleted': {'$ne': True}},
+                    self.PRODUCT_FIELDS
+                ).sort('product_name', 1)
+            ]
+
+            checksum = hashlib.sha1(
+                ''.join(f"{p['id']}:{p['price']}:{p['stock']}" for p in products).encode()
+            ).hexdigest()
+
+            return {
+                'version': version,
+                'etag': self.make_etag(version),
+                'generated_at': datetime.utcnow().isoformat(),
+                'checksum': checksum,
+                'categories': categories,
+                'products': products,
+                'counts': {
+                    'categories': len(categories),
+                    'products': len(products)
+                }
+            }
+
+        except Exception as e:
+            logger.error(f"POS catalog snapshot build failed: {e}")
+            raise Exception(f"Failed to build POS catalog snapshot: {str(e)}")
+
+    def get_snapshot(self):
+        """
+        Current snapshot: in-process copy, then the shared cache, then Mongo.
+        """
+        global _local_snapshot
+
+        version = self.catalog_version(VERSION_CHECK_INTERVAL_SECONDS)
+
+        snapshot = _local_snapshot
+        if snapshot and snapshot['version'] >= version:
+            return snapshot
+
+        with _local_lock:
+            snapshot = _local_snapshot
+            if snapshot and snapshot['version'] >= version:
+                return snapshot
+
+            shared = cache.get(SNAPSHOT_CACHE_KEY)
+            if shared and shared['version'] >= version:
+                _local_snapshot = shared
+                return shared
+
+            snapshot = self.build_snapshot()
+            cache.set(SNAPSHOT_CACHE_KEY, snapshot, SNAPSHOT_CACHE_TIMEOUT)
+            _local_snapshot = snapshot
+            logger.info(
+                f"POS catalog snapshot v{snapshot['version']} built: "
+                f"{snapshot['counts']['products']} products, {snapshot['counts']['categories']} categories"
+            )
+            return snapshot
+
+    def invalidate(self):
+        """Drop cached snapshots (next request rebuilds)"""
+        global _local_snapshot
+        with _local_lock:
+            _local_snapshot = None
+        cache.delete(SNAPSHOT_CACHE_KEY)
+
+    # ================================================================
+    # DELTA SYNC
+    # ================================================================
+
+    def get_delta(self, since_version):
+        """
+        Changes since `since_version` as upserts/removals per entity.
+
+        Terminals already at the latest catalog version get their own version
+        back without a log scan, so other entities' writes never move it.
+        Otherwise the returned `version` only covers change-log entries that
+        are known to be complete, so a terminal never moves past a change it
+        did not receive; `has_more` asks it to poll again straight away.
+
+        Returns `full_resync: True` when the terminal is too far behind
+        (log trimmed or too many changes) and should fetch the snapshot.
+        """
+        try:
+            since_version = int(since_version)
+            current_version = self.catalog_version()
+
+            result = {
+                'since': since_version,
+                'version': since_version,
+                'etag': self.make_etag(since_version),
+                'full_resync': False,
+                'has_more': False,
+                'categories': {'upserts': [], 'removed': []},
+                'products': {'upserts': [], 'removed': []}
+            }
+
+            if since_version >= current_version:
+                return result
+
+            oldest_version = change_log_service.oldest_version()
+            if since_version < 0 or (oldest_version and since_version < oldest_version - 1):
+                result['full_resync'] = True
+                return result
+
+            through_version, more = change_log_service.committed_version(since_version, limit=DELTA_SCAN_LIMIT)
+            result['version'] = through_version
+            result['etag'] = self.make_etag(through_version)
+            result['has_more'] = more
+            if through_version == since_version:
+                return result
+
+            # Counted before collapsing: a capped read would drop later changes
+            raw_count = change_log_service.count_changes(
+                since_version, through_version, entities=CATALOG_ENTITIES, limit=MAX_DELTA_CHANGES + 1
+            )
+            if raw_count > MAX_DELTA_CHANGES:
+                result['full_resync'] = True
+                return result
+
+            changes = change_log_service.get_changes_since(
+                since_version, entities=CATALOG_ENTITIES, up_to=through_version
+            )
+
+            changed_ids = {entity: [] for entity in CATALOG_ENTITIES}
+            for change in changes:
+                changed_ids[change['entity']].append(change['entity_id'])
+
+            if changed_ids['category']:
+                found = {
+                    category['_id']: category
+                    for category in self.category_collection.find(
+                        {'_id': {'$in': changed_ids['category']}},
+                        {'category_name': 1, 'sub_categories.name': 1, 'status': 1, 'isDeleted': 1}
+                    )
+                }
+                for category_id in changed_ids['category']:
+                    category = found.get(category_id)
+                    if category and self._is_sellable_category(category):
+                        result['categories']['upserts'].append(self._compact_category(category))
+                    else:
+                        result['categories']['removed'].append(category_id)
+
+            if changed_ids['products']:
+                found = {
+                    product['_id']: product
+                    for product in self.product_collection.find(
+                        {'_id': {'$in': changed_ids['products']}},
+                        self.PRODUCT_FIELDS
+                    )
+                }
+                for product_id in changed_ids['products']:
+                    product = found.get(product_id)
+                    if product and self._is_sellable_product(product):
+                        result['products']['upserts'].append(self._compact_product(product))
+                    else:
+                        result['products']['removed'].append(product_id)
+
+            return result
+
+        except Exception as e:
+            logger.error(f"POS catalog delta failed: {e}")
+            raise Exception(f"Failed to get POS catalog delta: {str(e)}")
@@ -23,8 +23,7 @@ class POSCategoryService:
                 [("category_name", 1)],
                 [("category_id", 1)],  # String-based category ID index
                 
-                # For subcategory product lookups
-                [("sub_categories.products.product_id", 1)],
+                # For subcategory lookups
                 [("sub_categories.name", 1)]
             ]
             
@@ -37,7 +36,8 @@ class POSCategoryService:
                 [("product_name", 1)],
                 [("stock_quantity", 1)],
                 [("barcode", 1)],
-                [("product_code", 1)]
+                [("product_code", 1)],
+                [("category_id", 1), ("subcategory_name", 1), ("isDeleted", 1)]
             ]
             
             for index_fields in product_indexes:
@@ -50,7 +50,8 @@ class POSCategoryService:
     def get_pos_catalog_structure(self):
         """
         Get lightweight catalog structure for POS display
-        Returns active categories with subcategories and basic product info
+        Returns active categories with subcategory names (products are
+        fetched per subcategory from the products collection)
         """
         try:
             categories = list(self.category_collection.find(
@@ -61,9 +62,7 @@ class POSCategoryService:
                 {
                     "category_id": 1,  # String ID
                     "category_name": 1,
-                    "sub_categories.name": 1,
-                    "sub_categories.products.product_id": 1,  # String product ID
-                    "sub_categories.products.product_name": 1
+                    "sub_categories.name": 1
                 }
             ).sort("category_name", 1))
             
@@ -124,28 +123,30 @@ class POSCategoryService:
             if not category_id or not category_id.startswith('CTGY-'):
                 raise ValueError("Invalid category ID - must be CTGY-### format")
             
-            # Get the subcategory's product IDs using string-based lookup
             category = self.category_collection.find_one(
                 {
                     'category_id': category_id,  # String ID
                     'status': 'active',
                     'isDeleted': {'$ne': True}
                 },
-                {'sub_categories': 1}
+                {'_id': 1}
             )
-            
+
             if not category:
                 return []
-            
-            # Find the specific subcategory and extract product IDs
-            product_ids = []
-            for subcategory in category.get('sub_categories', []):
-                if subcategory['name'] == subcategory_name:
-                    products = subcategory.get('products', [])
-                    # Handle combined format (product_id + product_name)
-                    if products and isinstance(products[0], dict):
-                        product_ids = [p['product_id'] for p in products]  # String IDs
-                    break
+
+            # Membership lives on the product documents
+            product_ids = [
+                product['_id']
+                for product in self.product_collection.find(
+                    {
+                        'category_id': category_id,
+                        'subcategory_name': subcategory_name,
+                        'isDeleted': {'$ne': True}
+                    },
+                    {'_id': 1}
+                )
+            ]
             
             if not product_ids:
                 return []
@@ -295,17 +296,26 @@ class POSCategoryService:
             
             subcategories_data = []
             
+            # One query for the whole category, grouped by subcategory in memory
+            products_by_subcategory = {}
+            for product in self.product_collection.find(
+                {'category_id': category_id, 'isDeleted': {'$ne': True}},
+                {
+                    'product_id': 1,
+                    'product_name': 1,
+                    'unit_price': 1,
+                    'stock_quantity': 1,
+                    'product_code': 1,
+                    'barcode': 1,
+                    'tax_rate': 1,
+                    'category_id': 1,
+                    'subcategory_name': 1
+                }
+            ):
+                products_by_subcategory.setdefault(product.get('subcategory_name'), []).append(product)
+            
             for subcategory in category.get('sub_categories', []):
-                products_data = []
-                products = subcategory.get('products', [])
-                
-                # Get product IDs from combined format
-                if products and isinstance(products[0], dict):
-                    product_ids = [p['product_id'] for p in products]  # String IDs
-                    
-                    # Fetch full product details for POS
-                    full_products = self.get_products_for_pos_cart(product_ids)
-                    products_data = full_products
+                products_data = products_by_subcategory.get(subcategory['name'], [])
                 
                 subcategories_data.append({
                     'name': subcategory['name'],
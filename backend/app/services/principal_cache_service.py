@@ -0,0 +1,223 @@
+from collections import OrderedDict
+import hashlib
+import logging
+import threading
+import time
+
+from decouple import config
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# How long a resolved principal / an accepted token is trusted without Mongo.
+# Writes through UserService/CustomerService and logouts drop the affected key
+# at once in the shared store (and in the writing process's LRU); in the other
+# workers' LRUs the TTL is the bound on how long a revoked token or a changed
+# principal is still honoured
+PRINCIPAL_CACHE_TTL_SECONDS = config('PRINCIPAL_CACHE_TTL_SECONDS', default=60, cast=int)
+PRINCIPAL_CACHE_MAX_ENTRIES = config('PRINCIPAL_CACHE_MAX_ENTRIES', default=10000, cast=int)
+# Keep entries in the Django cache instead, so every worker sees revocations at
+# once. Needs a cross-process backend (Redis / Memcached, see REDIS_URL in
+# settings/production.py); with a process-local one the LRU is used instead
+PRINCIPAL_CACHE_SHARED = config('PRINCIPAL_CACHE_SHARED', default=False, cast=bool)
+
+SHARED_KEY_PREFIX = 'principal_cache:'
+
+# Django cache backends that keep entries inside one process
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Stored under a revoked token's key so a request that checked the blacklist
+# just before the logout cannot re-accept the token afterwards
+REVOKED = 'revoked'
+
+# Principal types carried in the `ptype` token claim
+PRINCIPAL_USER = 'user'
+PRINCIPAL_CUSTOMER = 'customer'
+
+# Document fields the authentication decorators build the principal from
+PRINCIPAL_FIELDS = ('username', 'email', 'branch_id', 'role')
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+
+
+class PrincipalCacheService:
+    """
+    Bounded TTL cache for the authentication decorators.
+
+    Holds two kinds of entries:
+
+      - principals, keyed by user ID: the principal type ('user' or
+        'customer') and the few document fields the request principal is
+        built from,
+      - accepted tokens, keyed by a hash of the token: the token was checked
+        against `token_blacklist` and not revoked.
+
+    With both warm an authenticated request needs no MongoDB call; the
+    blacklist and the users/customers collections are only read on a miss.
+    Entries live in a bounded in-process LRU or, with PRINCIPAL_CACHE_SHARED
+    and a cross-process Django cache, in that cache, where a logout or a
+    principal write deletes just the affected key for every worker.
+    """
+
+    def __init__(self):
+        self._metrics = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        self._metrics_lock = threading.Lock()
+        self._shared = PRINCIPAL_CACHE_SHARED and self._shared_backend_usable()
+
+    @staticmethod
+    def _shared_backend_usable():
+        backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+        if backend in PROCESS_LOCAL_CACHE_BACKENDS:
+            logger.error(
+                f"PRINCIPAL_CACHE_SHARED needs a cross-process cache, but the default cache is {backend}; "
+                f"using the per-process LRU (revocations reach other workers within "
+                f"{PRINCIPAL_CACHE_TTL_SECONDS}s)"
+            )
+            return False
+        return True
+
+    # ================================================================
+    # STORE
+    # ================================================================
+
+    @staticmethod
+    def _local_get(key):
+        with _lock:
+            entry = _entries.get(key)
+            if not entry:
+                return None
+            if entry['expires_at'] < time.monotonic():
+                _entries.pop(key, None)
+                return None
+            _entries.move_to_end(key)
+            return entry['value']
+
+    @staticmethod
+    def _local_set(key, value):
+        with _lock:
+            _entries[key] = {'value': value, 'expires_at': time.monotonic() + PRINCIPAL_CACHE_TTL_SECONDS}
+            _entries.move_to_end(key)
+            while len(_entries) > PRINCIPAL_CACHE_MAX_ENTRIES:
+                _entries.popitem(last=False)
+
+    def _get(self, key):
+        try:
+            value = cache.get(SHARED_KEY_PREFIX + key) if self._shared else self._local_get(key)
+        except Exception as e:
+            logger.warning(f"Principal cache read failed: {e}")
+            value = None
+        self._count('hits' if value is not None else 'misses')
+        return value
+
+    def _set(self, key, value):
+        try:
+            if self._shared:
+                cache.set(SHARED_KEY_PREFIX + key, value, PRINCIPAL_CACHE_TTL_SECONDS)
+            else:
+                self._local_set(key, value)
+        except Exception as e:
+            logger.warning(f"Principal cache write failed: {e}")
+
+    def _add(self, key, value):
+        """Like _set, but leaves an existing (e.g. revoked) entry alone"""
+        try:
+            if self._shared:
+                cache.add(SHARED_KEY_PREFIX + key, value, PRINCIPAL_CACHE_TTL_SECONDS)
+            elif self._local_get(key) is None:
+                self._local_set(key, value)
+        except Exception as e:
+            logger.warning(f"Principal cache write failed: {e}")
+
+    def _delete(self, keys):
+        with _lock:
+            for key in keys:
+                _entries.pop(key, None)
+        if self._shared:
+            try:
+                cache.delete_many([SHARED_KEY_PREFIX + key for key in keys])
+            except Exception as e:
+                logger.warning(f"Principal cache invalidation failed: {e}")
+
+    def _count(self, outcome):
+        with self._metrics_lock:
+            self._metrics[outcome] += 1
+
+    # ================================================================
+    # PRINCIPALS
+    # ================================================================
+
+    def get_principal(self, user_id):
+        """(principal_type, fields) for a user or customer ID, or None"""
+        return self._get(f'principal:{user_id}')
+
+    def set_principal(self, user_id, principal_type, document):
+        """Cache the principal fields of a freshly read user/customer document"""
+        fields = {field: document.get(field) for field in PRINCIPAL_FIELDS if field in document}
+        self._set(f'principal:{user_id}', (principal_type, fields))
+
+    def invalidate(self, *user_ids):
+        """
+        Drop cached principals after a user/customer is updated, disabled,
+        restored or deleted (the next request re-reads the document)
+        """
+        user_ids = [user_id for user_id in user_ids if user_id]
+        if not user_ids:
+            return
+        self._delete([f'principal:{user_id}' for user_id in user_ids])
+        self._count('invalidations')
+
+    # ================================================================
+    # TOKENS
+    # ================================================================
+
+    @staticmethod
+    def _token_key(token):
+        return 'token:' + hashlib.sha256(token.encode()).hexdigest()
+
+    def is_token_accepted(self, token):
+        """True when the token was recently checked and not revoked"""
+        return self._get(self._token_key(token)) is True
+
+    def accept_token(self, token):
+        self._add(self._token_key(token), True)
+
+    def revoke_token(self, token):
+        """
+        Mark a token revoked (logout, after it was blacklisted) so the
+        blacklist is consulted again and the token cannot be re-accepted
+        from the cache until the entry expires
+        """
+        self._set(self._token_key(token), REVOKED)
+
+    # ================================================================
+    # METRICS
+    # ================================================================
+
+    def metrics(self):
+        """Hit/miss counts of this process, plus the LRU size"""
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        lookups = metrics['hits'] + metrics['misses']
+        with _lock:
+            entries = len(_entries)
+        return {
+            **metrics,
+            'hit_rate': round(metrics['hits'] / lookups, 3) if lookups else 0,
+            'entries': entries,
+            'max_entries': PRINCIPAL_CACHE_MAX_ENTRIES,
+            'ttl_seconds': PRINCIPAL_CACHE_TTL_SECONDS,
+            'shared_store': self._shared
+        }
+
+    @staticmethod
+    def clear():
+        with _lock:
+            _entries.clear()
+
+
+principal_cache = PrincipalCacheService()
@@ -0,0 +1,454 @@
+from collections import defaultdict
+from datetime import date, datetime, time
+import heapq
+import logging
+import uuid
+
+from pymongo import UpdateOne
+
+from ..database import db_manager
+
+logger = logging.getLogger(__name__)
+
+SOURCES = ('pos', 'online', 'sales_log')
+
+# Transactions in these states do not count as sold
+EXCLUDED_SALE_STATUSES = ('voided', 'cancelled', 'returned')
+
+REBUILD_FLUSH_EVERY = 5000
+
+COUNTER_FIELDS = ('quantity', 'revenue', 'transactions')
+
+
+class ProductSalesCounterService:
+    """
+    Per-product, per-day sales counters (line-level quantity and revenue).
+
+    One document per (product, UTC day) in `product_sales_daily`, with totals
+    and a per-source breakdown (pos, online, sales_log). Sale create/void/
+    import paths call `record_*`; top-N for any date range is one aggregation
+    over at most products x days counter documents.
+    """
+
+    def __init__(self):
+        self.db = db_manager.get_database()
+        self.collection = self.db.product_sales_daily
+        self.sales_collection = self.db.sales
+        self.sales_log_collection = self.db.sales_log
+        self.online_transactions_collection = self.db.online_transactions
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        """Create indexes for date-range counter scans"""
+        try:
+            self.collection.create_index([("date", 1), ("product_key", 1)], background=True)
+            self.collection.create_index([("product_key", 1), ("date", 1)], background=True)
+        except Exception as e:
+            logger.warning(f"Could not create product sales counter indexes: {e}")
+
+    # ================================================================
+    # LINE NORMALIZATION
+    # ================================================================
+
+    @staticmethod
+    def _day_start(value):
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+        if isinstance(value, date) and not isinstance(value, datetime):
+            value = datetime.combine(value, time.min)
+        if not isinstance(value, datetime):
+            value = datetime.utcnow()
+        return datetime.combine(value.date(), time.min)
+
+    @staticmethod
+    def _line(product_id, product_name, quantity, revenue):
+        product_id = str(product_id).strip() if product_id else ''
+        product_name = (product_name or '').strip()
+        if not product_id and not product_name:
+            return None
+        return {
+            # Lines without a product id (old imports) are keyed by name
+            'product_key': product_id or f"name:{product_name.lower()}",
+            'product_id': product_id or None,
+            'product_name': product_name,
+            'quantity': float(quantity or 0),
+            'revenue': float(revenue or 0)
+        }
+
+    def lines_from_items(self, items):
+        """POS / online `items[]`: product_id, product_name, quantity, subtotal (or price)"""
+        lines = []
+        for item in items or []:
+            quantity = item.get('quantity', 0) or 0
+            revenue = item.get('subtotal')
+            if revenue is None:
+                revenue = (item.get('unit_price', item.get('price', 0)) or 0) * quantity
+            returned = item.get('returned_quantity', 0) or 0
+            if returned and quantity:
+                # Returned units were never sold
+                if returned >= quantity:
+                    continue
+                revenue = revenue * (quantity - returned) / quantity
+                quantity -= returned
+            line = self._line(item.get('product_id'), item.get('product_name'), quantity, revenue)
+            if line:
+                lines.append(line)
+        return lines
+
+    def lines_from_item_list(self, item_list):
+        """sales_log `item_list[]`: item_code, item_name, quantity, total_price (or unit_price)"""
+        if isinstance(item_list, dict):
+            item_list = [item_list]
+        lines = []
+        for item in item_list or []:
+            quantity = item.get('quantity', 0) or 0
+            revenue = item.get('total_price')
+            if revenue is None:
+                revenue = (item.get('unit_price', 0) or 0) * quantity
+            line = self._line(item.get('item_code'), item.get('item_name'), quantity, revenue)
+            if line:
+                lines.append(line)
+        return lines
+
+    # ================================================================
+    # RECORDING
+    # ================================================================
+
+    def _accumulate(self, totals, lines, day, source, sign=1, sold_at=None, transaction_products=None):
+        """
+        Add one transaction's lines to `totals`. The transaction counts once
+        per product however many lines it has; `transaction_products`
+        (product keys) limits which products' transaction counts move - a
+        partial return only removes the transaction for products the sale no
+        longer holds.
+        """
+        counted = set()
+        for line in lines:
+            key = (line['product_key'], day)
+            entry = totals.get(key)
+            if entry is None:
+                entry = totals[key] = {
+                    'product_id': line['product_id'],
+                    'product_name': line['product_name'],
+                    'sold_at': sold_at,
+                    'sources': defaultdict(lambda: {'quantity': 0.0, 'revenue': 0.0, 'transactions': 0})
+                }
+            bucket = entry['sources'][source]
+            bucket['quantity'] += sign * line['quantity']
+            bucket['revenue'] += sign * line['revenue']
+            if key not in counted and (transaction_products is None or line['product_key'] in transaction_products):
+                counted.add(key)
+                bucket['transactions'] += sign
+            if sold_at and (entry['sold_at'] is None or sold_at > entry['sold_at']):
+                entry['sold_at'] = sold_at
+
+    def _flush(self, totals, collection=None):
+        """Apply accumulated {(product_key, day): entry} as one unordered bulk_write of $inc upserts"""
+        collection = collection if collection is not None else self.collection
+        if not totals:
+            return 0
+
+        now = datetime.utcnow()
+        operations = []
+        for (product_key, day), entry in totals.items():
+            increments = {}
+            for source, bucket in entry['sources'].items():
+                increments['quantity'] = increments.get('quantity', 0) + bucket['quantity']
+                increments['revenue'] = increments.get('revenue', 0) + bucket['revenue']
+                increments['transactions'] = increments.get('transactions', 0) + bucket['transactions']
+                increments[f'sources.{source}.quantity'] = bucket['quantity']
+                increments[f'sources.{source}.revenue'] = bucket['revenue']
+                increments[f'sources.{source}.transactions'] = bucket['transactions']
+
+            update = {
+                '$inc': increments,
+                '$set': {'updated_at': now},
+                '$setOnInsert': {
+                    'product_key': product_key,
+                    'product_id': entry['product_id'],
+                    'date': day,
+                    'day': day.strftime('%Y-%m-%d')
+                }
+            }
+            if entry['product_name']:
+                update['$set']['product_name'] = entry['product_name']
+            if entry['sold_at']:
+                update['$max'] = {'last_sold_at': entry['sold_at']}
+
+            operations.append(UpdateOne({'_id': f"{product_key}|{day.strftime('%Y-%m-%d')}"}, update, upsert=True))
+
+        collection.bulk_write(operations, ordered=False)
+        return len(operations)
+
+    def record_lines(self, lines, transaction_date, source, sign=1):
+        """
+        Add (sign=1) or remove (sign=-1) sold lines on the transaction's day.
+
+        Failures are logged and swallowed - counters must never break a sale;
+        the rebuild command restores them.
+        """
+        try:
+            if not lines:
+                return 0
+            totals = {}
+            sold_at = transaction_date if isinstance(transaction_date, datetime) and sign > 0 else None
+            self._accumulate(totals, lines, self._day_start(transaction_date), source, sign, sold_at)
+            return self._flush(totals)
+        except Exception as e:
+            logger.error(f"Error recording product sales counters ({source}): {str(e)}")
+            return 0
+
+    def record_sale(self, sale, source='pos', sign=1):
+        """POS sale or online order document (`items[]`)"""
+        return self.record_lines(self.lines_from_items(sale.get('items')), sale.get('transaction_date'), source, sign)
+
+    def record_sales(self, sales, source='pos', sign=1):
+        """
+        Many POS sale / online order documents (bulk voids and returns) in one
+        counter bulk_write. A return passes its returned lines as `items` and
+        the products it closed out as `closed_product_ids`.
+        """
+        try:
+            totals = {}
+            for sale in sales:
+                transaction_date = sale.get('transaction_date')
+                transaction_products = None
+                if 'closed_product_ids' in sale:
+                    transaction_products = {str(product_id).strip() for product_id in sale['closed_product_ids'] if product_id}
+                self._accumulate(
+                    totals,
+                    self.lines_from_items(sale.get('items')),
+                    self._day_start(transaction_date),
+                    source,
+                    sign,
+                    transaction_date if isinstance(transaction_date, datetime) and sign > 0 else None,
+                    transaction_products
+                )
+            return self._flush(totals)
+        except Exception as e:
+            logger.error(f"Error recording product sales counters ({source} bulk): {str(e)}")
+            return 0
+
+    def record_sales_log(self, record, sign=1):
+        """sales_log document (`item_list[]`)"""
+        if record.get('status') in EXCLUDED_SALE_STATUSES:
+            return 0
+        return self.record_lines(
+            self.lines_from_item_list(record.get('item_list')),
+            record.get('transaction_date'),
+            'sales_log',
+            sign
+        )
+
+    def record_sales_logs(self, records):
+        """Many sales_log documents (bulk imports) in one counter bulk_write"""
+        try:
+            totals = {}
+            for record in records:
+                if record.get('status') in EXCLUDED_SALE_STATUSES:
+                    continue
+                transaction_date = record.get('transaction_date')
+                self._accumulate(
+                    totals,
+                    self.lines_from_item_list(record.get('item_list')),
+                    self._day_start(transaction_date),
+                    'sales_log',
+                    sold_at=transaction_date if isinstance(transaction_date, datetime) else None
+                )
+            return self._flush(totals)
+        except Exception as e:
+            logger.error(f"Error recording product sales counters (sales_log bulk): {str(e)}")
+            return 0
+
+    # ================================================================
+    # TOP-N
+    # ================================================================
+
+    def _date_match(self, start_date=None, end_date=None):
+        match = {}
+        if start_date:
+            match.setdefault('date', {})['$gte'] = self._day_start(start_date)
+        if end_date:
+            match.setdefault('date', {})['$lte'] = self._day_start(end_date)
+        return match
+
+    def top_items(self, start_date=None, end_date=None, limit=10, sources=None, metric='revenue'):
+        """
+        Top products by `metric` ('revenue' or 'quantity') over the date range.
+
+        Counters are grouped per product in Mongo; the grouped cursor is
+        streamed through a bounded heap, so only `limit` rows are held.
+        `limit=None` returns every product, sorted.
+        """
+        try:
+            sources = [source for source in (sources or SOURCES) if source in SOURCES]
+            if set(sources) == set(SOURCES):
+                quantity_expr = '$quantity'
+                revenue_expr = '$revenue'
+                transactions_expr = '$transactions'
+            else:
+                quantity_expr = {'$add': [{'$ifNull': [f'$sources.{s}.quantity', 0]} for s in sources]}
+                revenue_expr = {'$add': [{'$ifNull': [f'$sources.{s}.revenue', 0]} for s in sources]}
+                transactions_expr = {'$add': [{'$ifNull': [f'$sources.{s}.transactions', 0]} for s in sources]}
+
+            grouped = self.collection.aggregate([
+                {'$match': self._date_match(start_date, end_date)},
+                {
+                    '$group': {
+                        '_id': '$product_key',
+                        'product_id': {'$max': '$product_id'},
+                        'product_name': {'$max': '$product_name'},
+                        'total_quantity': {'$sum': quantity_expr},
+                        'total_revenue': {'$sum': revenue_expr},
+                        'transactions': {'$sum': transactions_expr},
+                        'last_sold_at': {'$max': '$last_sold_at'}
+                    }
+                },
+                {'$match': {'transactions': {'$gt': 0}}}
+            ], allowDiskUse=True)
+
+            sort_field = 'total_quantity' if metric == 'quantity' else 'total_revenue'
+            sort_key = lambda row: (row[sort_field], row.get('product_name') or '')
+
+            if limit:
+                rows = heapq.nlargest(int(limit), grouped, key=sort_key)
+            else:
+                rows = sorted(grouped, key=sort_key, reverse=True)
+
+            return [
+                {
+                    'product_key': row['_id'],
+                    'product_id': row.get('product_id'),
+                    'product_name': row.get('product_name') or '',
+                    'total_quantity': round(row['total_quantity'], 2),
+                    'total_revenue': round(row['total_revenue'], 2),
+                    'transactions': row['transactions'],
+                    'last_sold_at': row.get('last_sold_at')
+                }
+                for row in rows
+            ]
+
+        except Exception as e:
+            logger.error(f"Error getting top selling items: {e}")
+            raise Exception(f"Error getting top selling items: {str(e)}")
+
+    # ================================================================
+    # REBUILD
+    # ================================================================
+
+    def rebuild(self, since=None):
+        """
+        Recompute counters from `sales`, `online_transactions` and `sales_log`
+        (all days, or days from `since`). Returns per-source document counts.
+
+        Live counters are never cleared. The current counters are captured
+        negated in a staging collection, the transactions dated before the
+        rebuild started are added on top, and the resulting correction is
+        $inc-merged into the live counters - so increments from sales made
+        while the rebuild runs are kept. Voids/returns of older transactions
+        made during the rebuild can still be counted off by one.
+        """
+        staging = self.db[f'{self.collection.name}_rebuild_{uuid.uuid4().hex[:8]}']
+        try:
+            started_at = datetime.utcnow()
+            day_filter = {}
+            if since:
+                since = self._day_start(since)
+                day_filter = {'date': {'$gte': since}}
+                transaction_filter = {'transaction_date': {'$gte': since, '$lt': started_at}}
+            else:
+                # Legacy string dates were written long before any rebuild
+                transaction_filter = {'$or': [
+                    {'transaction_date': {'$lt': started_at}},
+                    {'transaction_date': {'$not': {'$type': 'date'}}}
+                ]}
+
+            negated = lambda path: {'$multiply': [-1, {'$ifNull': [path, 0]}]}
+            self.collection.aggregate([
+                {'$match': day_filter},
+                {'$project': {
+                    'product_key': 1, 'product_id': 1, 'product_name': 1, 'date': 1, 'day': 1,
+                    **{field: negated(f'${field}') for field in COUNTER_FIELDS},
+                    'sources': {
+                        source: {field: negated(f'$sources.{source}.{field}') for field in COUNTER_FIELDS}
+                        for source in SOURCES
+                    }
+                }},
+                {'$out': staging.name}
+            ], allowDiskUse=True)
+
+            scanned = {}
+            totals = {}
+
+            sources = [
+                (
+                    'pos',
+                    self.sales_collection,
+                    {**transaction_filter, 'status': {'$nin': list(EXCLUDED_SALE_STATUSES)}, 'is_voided': {'$ne': True}},
+                    {'items': 1, 'transaction_date': 1},
+                    lambda document: self.lines_from_items(document.get('items'))
+                ),
+                (
+                    'online',
+                    self.online_transactions_collection,
+                    {**transaction_filter, 'order_status': {'$ne': 'cancelled'}, 'is_cancelled': {'$ne': True}},
+                    {'items': 1, 'transaction_date': 1},
+                    lambda document: self.lines_from_items(document.get('items'))
+                ),
+                (
+                    'sales_log',
+                    self.sales_log_collection,
+                    {**transaction_filter, 'status': {'$nin': list(EXCLUDED_SALE_STATUSES)}},
+                    {'item_list': 1, 'transaction_date': 1},
+                    lambda document: self.lines_from_item_list(document.get('item_list'))
+                ),
+            ]
+
+            for source, collection, query, projection, to_lines in sources:
+                count = 0
+                for document in collection.find(query, projection).batch_size(2000):
+                    transaction_date = document.get('transaction_date')
+                    self._accumulate(
+                        totals,
+                        to_lines(document),
+                        self._day_start(transaction_date),
+                        source,
+                        sold_at=transaction_date if isinstance(transaction_date, datetime) else None
+                    )
+                    count += 1
+                    if len(totals) >= REBUILD_FLUSH_EVERY:
+                        self._flush(totals, staging)
+                        totals = {}
+                scanned[source] = count
+
+            self._flush(totals, staging)
+
+            added = lambda path: {'$add': [{'$ifNull': [f'${path}', 0]}, {'$ifNull': [f'$$new.{path}', 0]}]}
+            staging.aggregate([
+                {'$merge': {
+                    'into': self.collection.name,
+                    'on': '_id',
+                    'whenMatched': [{'$set': {
+                        **{field: added(field) for field in COUNTER_FIELDS},
+                        **{
+                            f'sources.{source}.{field}': added(f'sources.{source}.{field}')
+                            for source in SOURCES for field in COUNTER_FIELDS
+                        },
+                        'last_sold_at': {'$max': ['$last_sold_at', '$$new.last_sold_at']},
+                        'updated_at': started_at
+                    }}],
+                    'whenNotMatched': 'insert'
+                }}
+            ], allowDiskUse=True)
+
+            # Days/products left with nothing sold
+            self.collection.delete_many({**day_filter, 'transactions': {'$lte': 0}, 'quantity': {'$gt': -1e-6, '$lt': 1e-6}})
+
+            logger.info(f"Product sales counters rebuilt: {scanned}")
+            return scanned
+
+        except Exception as e:
+            logger.error(f"Error rebuilding product sales counters: {e}")
+            raise Exception(f"Error rebuilding product sales counters: {str(e)}")
+        finally:
+            staging.drop()
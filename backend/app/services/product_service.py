@@ -4,6 +4,10 @@ from ..database import db_manager
 from ..models import Product
 from notifications.services import notification_service
 from .batch_service import BatchService
+from .change_log_service import change_log_service
+from .category_membership_service import CategoryMembershipService
+from .sync_engine_service import SyncEngineService
+from .stock_state_service import StockStateService, stock_state_service
 import pandas as pd
 import logging
 import csv
@@ -19,6 +23,7 @@ class ProductService:
         self.supplier_collection = self.db.suppliers
         self.branch_collection = self.db.branches
         self.batch_service = BatchService()
+        self.membership = CategoryMembershipService()
         
     def validate_foreign_keys(self, product_data):
         """Validate that foreign key references exist - using string IDs"""
@@ -169,11 +174,20 @@ class ProductService:
         try:
             sync_log = self.add_sync_log(source=source, status=sync_status)
             
+            # Latest state per source only; what is pending comes from the change log
             result = self.product_collection.update_one(
                 {'_id': product_id},
-                {'$push': {'sync_logs': sync_log}}
+                {'$set': {f'sync_state.{source}': sync_log}}
             )
             
+            # Every local product write flags the product as pending sync;
+            # record it in the change log so catalog readers can catch up
+            if sync_status != 'synced':
+                change_log_service.record_change(
+                    'products', product_id,
+                    'delete' if sync_status == 'pending_deletion' else 'upsert'
+                )
+            
             return result.modified_count > 0
         
         except Exception as e:
@@ -184,41 +198,50 @@ class ProductService:
         """Mark a product as successfully synced"""
         return self.update_sync_status(product_id, sync_status='synced', source=source)
     
+    def _sync_checkpoint_id(self, source):
+        return f"http:{source}:products"
+
     def get_unsynced_products(self, source='local'):
-        """Get products that need to be synced from specified source"""
+        """
+        Products changed since the last sync pass for `source`, read from the
+        change log (cost is proportional to the changes, not the catalog).
+        Does not advance the checkpoint - see `take_unsynced_products`.
+        """
         try:
-            pipeline = [
-                {
-                    '$addFields': {
-                        'latest_sync': {
-                            '$arrayElemAt': [
-                                {
-                                    '$filter': {
-                                        'input': '$sync_logs',
-                                        'cond': {'$eq': ['$$this.source', source]}
-                                    }
-                                },
-                                -1  # Get the latest entry for this source
-                            ]
-                        }
-                    }
-                },
-                {
-                    '$match': {
-                        '$or': [
-                            {'latest_sync': None},  # No sync log for this source
-                            {'latest_sync.status': {'$ne': 'synced'}}  # Not synced
-                        ]
-                    }
-                }
-            ]
-            
-            products = list(self.product_collection.aggregate(pipeline))
+            checkpoint = self.db.sync_checkpoints.find_one({'_id': self._sync_checkpoint_id(source)}) or {}
+            products, _, _ = SyncEngineService.read_change_log(
+                change_log_service, 'products', checkpoint.get('version', 0)
+            )
             return products
         
         except Exception as e:
             raise Exception(f"Error getting unsynced products: {str(e)}")
     
+    def take_unsynced_products(self, source='local'):
+        """
+        Next page of products changed since the last sync pass for `source`,
+        advancing the checkpoint past what is handed out so the following
+        pass continues from there.
+        """
+        try:
+            checkpoint_id = self._sync_checkpoint_id(source)
+            checkpoint = self.db.sync_checkpoints.find_one({'_id': checkpoint_id}) or {}
+            products, _, version = SyncEngineService.read_change_log(
+                change_log_service, 'products', checkpoint.get('version', 0)
+            )
+            
+            # Advance the checkpoint past what was handed out
+            self.db.sync_checkpoints.update_one(
+                {'_id': checkpoint_id},
+                {'$set': {'version': version, 'updated_at': datetime.utcnow()}},
+                upsert=True
+            )
+            
+            return products
+        
+        except Exception as e:
+            raise Exception(f"Error taking unsynced products: {str(e)}")
+    
     def generate_sku(self, product_name, category_id=None):
         """Generate a unique SKU for the product - string-based category lookup"""
         try:
@@ -320,6 +343,7 @@ class ProductService:
                 'unit': product_data.get('unit', ''),
                 'stock': initial_stock,  # Use validated initial_stock
                 'low_stock_threshold': int(product_data.get('low_stock_threshold', 10)),
+                'stock_state': StockStateService.classify(initial_stock, int(product_data.get('low_stock_threshold', 10))),
                 'cost_price': float(product_data.get('cost_price', 0)),
                 'selling_price': float(product_data.get('selling_price', 0)),
                 'status': product_data.get('status', 'active'),
@@ -356,6 +380,8 @@ class ProductService:
             
             # Insert product directly as dict
             self.product_collection.insert_one(product_document)
+            change_log_service.record_change('products', product_id)
+            self.membership.record_added(product_document.get('category_id'), product_document.get('subcategory_name'))
             
             # CREATE INITIAL BATCH IF STOCK WAS PROVIDED
             initial_batch = None
@@ -396,55 +422,118 @@ class ProductService:
         except Exception as e:
             raise Exception(f"Error creating product: {str(e)}")
     
+    @staticmethod
+    def _products_query(filters=None, include_deleted=False):
+        """Product-list filter (shared with the async read path)"""
+        query = {}
+        
+        # By default, exclude deleted products unless specifically requested
+        if not include_deleted:
+            query['isDeleted'] = {'$ne': True}
+        
+        if filters:
+            # Category filter
+            if filters.get('category_id'):
+                query['category_id'] = filters['category_id']
+            
+            # Subcategory filter
+            if filters.get('subcategory_name'):
+                query['subcategory_name'] = filters['subcategory_name']
+            
+            # Status filter
+            if filters.get('status'):
+                query['status'] = filters['status']
+            
+            # Stock level filter
+            if filters.get('stock_level'):
+                if filters['stock_level'] == 'out_of_stock':
+                    query['stock_state'] = 'out'
+                elif filters['stock_level'] == 'low_stock':
+                    query['stock_state'] = {'$in': ['low', 'out']}
+            
+            # Search filter
+            if filters.get('search'):
+                search_regex = {'$regex': filters['search'], '$options': 'i'}
+                query['$or'] = [
+                    {'product_name': search_regex},
+                    {'SKU': search_regex},
+                    {'_id': search_regex}
+                ]
+        
+        return query
+    
+    @staticmethod
+    def _products_projection(include_images=True):
+        """Projection excluding image fields when images are not needed"""
+        projection = None
+        if not include_images:
+            projection = {
+                'image': 0,
+                'image_url': 0,
+                'image_filename': 0,
+                'image_size': 0,
+                'image_type': 0,
+                'image_uploaded_at': 0
+            }
+        return projection
+    
+    @staticmethod
+    def _apply_batch_stock(products, all_batches, now):
+        """Set stock and average cost on each product from its non-expired active batches"""
+        # Group batches by product_id for fast lookup
+        from collections import defaultdict
+        batches_by_product = defaultdict(list)
+        for batch in all_batches:
+            batches_by_product[batch['product_id']].append(batch)
+        
+        # Now enrich each product (no more database queries in the loop!)
+        for product in products:
+            active_batches = batches_by_product.get(product['_id'], [])
+            
+            # Filter out expired batches (handle both datetime and string dates)
+            non_expired_batches = []
+            for batch in active_batches:
+                expiry_date = batch.get('expiry_date')
+                if not expiry_date:
+                    # No expiry date, include the batch
+                    non_expired_batches.append(batch)
+                else:
+                    # Convert to datetime if it's a string
+                    if isinstance(expiry_date, str):
+                        try:
+                            from dateutil import parser
+                            expiry_date = parser.parse(expiry_date)
+                        except Exception:
+                            # If parsing fails, include the batch to be safe
+                            non_expired_batches.append(batch)
+                            continue
+                    
+                    # Check if not expired
+                    if isinstance(expiry_date, datetime) and expiry_date >= now:
+                        non_expired_batches.append(batch)
+            
+            # Calculate total stock from non-expired batches
+            total_stock = sum(batch['quantity_remaining'] for batch in non_expired_batches)
+            product['total_stock'] = total_stock
+            product['stock'] = total_stock  # Keep both fields in sync
+            
+            # Calculate average cost price from non-expired batches
+            if non_expired_batches:
+                total_cost = sum(
+                    batch.get('cost_price', 0) * batch['quantity_remaining']
+                    for batch in non_expired_batches
+                )
+                product['average_cost_price'] = total_cost / total_stock if total_stock > 0 else 0
+            else:
+                product['average_cost_price'] = product.get('cost_price', 0)
+        
+        return products
+    
     def get_all_products(self, filters=None, include_deleted=False, include_images=True):
         """Get all products with optional filters"""
         try:
-            query = {}
-            
-            # By default, exclude deleted products unless specifically requested
-            if not include_deleted:
-                query['isDeleted'] = {'$ne': True}
-            
-            # Define projection to exclude image fields if not needed
-            projection = None
-            if not include_images:
-                projection = {
-                    'image': 0,
-                    'image_url': 0,
-                    'image_filename': 0,
-                    'image_size': 0,
-                    'image_type': 0,
-                    'image_uploaded_at': 0
-                }
-            
-            if filters:
-                # Category filter
-                if filters.get('category_id'):
-                    query['category_id'] = filters['category_id']
-                
-                # Subcategory filter
-                if filters.get('subcategory_name'):
-                    query['subcategory_name'] = filters['subcategory_name']
-                
-                # Status filter
-                if filters.get('status'):
-                    query['status'] = filters['status']
-                
-                # Stock level filter
-                if filters.get('stock_level'):
-                    if filters['stock_level'] == 'out_of_stock':
-                        query['stock'] = 0
-                    elif filters['stock_level'] == 'low_stock':
-                        query['$expr'] = {'$lte': ['$stock', '$low_stock_threshold']}
-                
-                # Search filter
-                if filters.get('search'):
-                    search_regex = {'$regex': filters['search'], '$options': 'i'}
-                    query['$or'] = [
-                        {'product_name': search_regex},
-                        {'SKU': search_regex},
-                        {'_id': search_regex}
-                    ]
+            query = self._products_query(filters, include_deleted)
+            projection = self._products_projection(include_images)
             
             # Apply projection if images should be excluded
             if projection:
@@ -466,52 +555,7 @@ class ProductService:
                 'quantity_remaining': {'$gt': 0}
             }))
             
-            # Group batches by product_id for fast lookup
-            from collections import defaultdict
-            batches_by_product = defaultdict(list)
-            for batch in all_batches:
-                batches_by_product[batch['product_id']].append(batch)
-            
-            # Now enrich each product (no more database queries in the loop!)
-            for product in products:
-                active_batches = batches_by_product.get(product['_id'], [])
-                
-                # Filter out expired batches (handle both datetime and string dates)
-                non_expired_batches = []
-                for batch in active_batches:
-                    expiry_date = batch.get('expiry_date')
-                    if not expiry_date:
-                        # No expiry date, include the batch
-                        non_expired_batches.append(batch)
-                    else:
-                        # Convert to datetime if it's a string
-                        if isinstance(expiry_date, str):
-                            try:
-                                from dateutil import parser
-                                expiry_date = parser.parse(expiry_date)
-                            except Exception:
-                                # If parsing fails, include the batch to be safe
-                                non_expired_batches.append(batch)
-                                continue
-                        
-                        # Check if not expired
-                        if isinstance(expiry_date, datetime) and expiry_date >= now:
-                            non_expired_batches.append(batch)
-                
-                # Calculate total stock from non-expired batches
-                total_stock = sum(batch['quantity_remaining'] for batch in non_expired_batches)
-                product['total_stock'] = total_stock
-                product['stock'] = total_stock  # Keep both fields in sync
-                
-                # Calculate average cost price from non-expired batches
-                if non_expired_batches:
-                    total_cost = sum(
-                        batch.get('cost_price', 0) * batch['quantity_remaining']
-                        for batch in non_expired_batches
-                    )
-                    product['average_cost_price'] = total_cost / total_stock if total_stock > 0 else 0
-                else:
-                    product['average_cost_price'] = product.get('cost_price', 0)
+            self._apply_batch_stock(products, all_batches, now)
             
             return products
         
@@ -584,6 +628,15 @@ class ProductService:
                 
                 updated_product = self.product_collection.find_one({'_id': product_id})
                 
+                if 'stock' in product_data or 'low_stock_threshold' in product_data:
+                    stock_state_service.record_stock_levels([updated_product], context={'source': 'product_update'})
+                
+                if 'category_id' in product_data or 'subcategory_name' in product_data:
+                    self.membership.record_moved(
+                        existing_product.get('category_id'), existing_product.get('subcategory_name'),
+                        updated_product.get('category_id'), updated_product.get('subcategory_name')
+                    )
+                
                 # Send notification
                 product_name = updated_product.get("product_name", updated_product.get("SKU", "Unknown Product"))
                 
@@ -620,6 +673,12 @@ class ProductService:
                 result = self.product_collection.delete_one({'_id': product_id})
                 
                 if result.deleted_count > 0:
+                    change_log_service.record_change('products', product_id, 'delete')
+                    if not product_to_delete.get('isDeleted'):
+                        self.membership.record_removed(
+                            product_to_delete.get('category_id'), product_to_delete.get('subcategory_name')
+                        )
+                    
                     # Send notification for hard deletion
                     product_name = product_to_delete.get("product_name", product_to_delete.get("SKU", "Unknown Product"))
                     
@@ -663,6 +722,9 @@ class ProductService:
                 if result.modified_count > 0:
                     # Mark as needing sync since product was deleted
                     self.update_sync_status(product_id, sync_status='pending_deletion', source='cloud')
+                    self.membership.record_removed(
+                        product_to_delete.get('category_id'), product_to_delete.get('subcategory_name')
+                    )
                     
                     # Send notification for soft deletion
                     product_name = product_to_delete.get("product_name", product_to_delete.get("SKU", "Unknown Product"))
@@ -722,6 +784,9 @@ class ProductService:
                 
                 # Get restored product and send notification
                 restored_product = self.product_collection.find_one({'_id': product_id})
+                self.membership.record_added(
+                    restored_product.get('category_id'), restored_product.get('subcategory_name')
+                )
                 product_name = restored_product.get("product_name", restored_product.get("SKU", "Unknown Product"))
                 
                 self._send_product_notification(
@@ -811,15 +876,19 @@ class ProductService:
                 
                 updated_product = self.product_collection.find_one({'_id': product_id})
                 
+                # The notification below reports the crossing, so the state service sends none
+                transitions = stock_state_service.record_stock_levels([updated_product], notify=False)
+                crossed_into = transitions[0]['state'] if transitions else None
+                
                 # Prepare notification data
                 product_name = updated_product.get("product_name", updated_product.get("SKU", "Unknown Product"))
                 low_stock_threshold = updated_product.get('low_stock_threshold', 0)
                 
-                # Determine notification type and create operation-specific message
-                if new_stock == 0:
+                # Warn only when this update moved the product into low/out, not on every adjustment
+                if crossed_into == 'out':
                     action_type = 'stock_out'
                     message_suffix = " - OUT OF STOCK!"
-                elif new_stock <= low_stock_threshold and new_stock > 0:
+                elif crossed_into == 'low':
                     action_type = 'stock_low' 
                     message_suffix = " - LOW STOCK WARNING!"
                 else:
@@ -1007,12 +1076,9 @@ class ProductService:
             raise Exception(f"Error getting deleted products: {str(e)}")
     
     def get_low_stock_products(self, branch_id=None):
-        """Get products with low stock (excluding deleted)"""
+        """Get products with low stock (excluding deleted), served from the stock_state index"""
         try:
-            query = {
-                '$expr': {'$lte': ['$stock', '$low_stock_threshold']},
-                'isDeleted': {'$ne': True}
-            }
+            query = stock_state_service.watchlist_query()
             
             if branch_id:
                 query['branch_id'] = branch_id
@@ -1050,20 +1116,22 @@ class ProductService:
     def get_expiring_products(self, days_ahead=30):
         """Get products with expiring batches within specified days"""
         try:
-            from datetime import timedelta
+            entries = self.batch_service.expiry_calendar.get_calendar_entries(days_ahead)
             
-            future_date = datetime.utcnow() + timedelta(days=days_ahead)
+            # Entries are sorted by expiry, so first occurrence = soonest expiry
+            product_ids = list(dict.fromkeys(entry['product_id'] for entry in entries))
+            if not product_ids:
+                return []
             
-            query = {
-                'oldest_batch_expiry': {
-                    '$lte': future_date,
-                    '$gte': datetime.utcnow()
-                },
-                'isDeleted': {'$ne': True}
+            products_by_id = {
+                product['_id']: product
+                for product in self.product_collection.find({
+                    '_id': {'$in': product_ids},
+                    'isDeleted': {'$ne': True}
+                })
             }
             
-            products = list(self.product_collection.find(query).sort('oldest_batch_expiry', 1))
-            return products
+            return [products_by_id[product_id] for product_id in product_ids if product_id in products_by_id]
         
         except Exception as e:
             raise Exception(f"Error getting expiring products: {str(e)}")
@@ -1166,6 +1234,9 @@ class ProductService:
                                     product_data[field] = float(clean_price)
                             except (ValueError, TypeError):
                                 product_data[field] = 0
+                    product_data['stock_state'] = StockStateService.classify(
+                        product_data.get('stock', initial_stock), product_data.get('low_stock_threshold')
+                    )
                     
                     validated_products.append(product_data)
                     logger.debug(f"Product {i+1} validated and ready for creation")
@@ -1193,6 +1264,13 @@ class ProductService:
                 logger.info(f"Inserting {len(validated_products)} validated products...")
                 
                 insert_result = self.product_collection.insert_many(validated_products, ordered=False)
+                change_log_service.record_changes('products', [product['_id'] for product in validated_products])
+                
+                membership_deltas = {}
+                for product in validated_products:
+                    membership_key = (product.get('category_id'), product.get('subcategory_name'))
+                    membership_deltas[membership_key] = membership_deltas.get(membership_key, 0) + 1
+                self.membership.apply_count_deltas(membership_deltas)
                 
                 # Get inserted products
                 inserted_products = list(self.product_collection.find({
@@ -1269,11 +1347,11 @@ class ProductService:
     
     def prepare_for_sync_to_local(self):
         """Get all products that need to be synced to local database"""
-        return self.get_unsynced_products(source='cloud')
+        return self.take_unsynced_products(source='cloud')
     
     def prepare_for_sync_to_cloud(self):
         """Get all products that need to be synced to cloud database"""
-        return self.get_unsynced_products(source='local')
+        return self.take_unsynced_products(source='local')
     
     def sync_from_local(self, local_products):
         """Sync products from local database to cloud"""
@@ -1308,14 +1386,7 @@ class ProductService:
     def sync_to_local(self):
         """Prepare cloud products for sync to local database"""
         try:
-            # Get all products that need to be synced
-            products_to_sync = self.prepare_for_sync_to_local()
-            
-            # Mark them as synced once they're prepared for sync
-            for product in products_to_sync:
-                self.mark_as_synced(product['_id'], source='cloud')
-            
-            return products_to_sync
+            return self.take_unsynced_products(source='cloud')
         
         except Exception as e:
             raise Exception(f"Error preparing sync to local: {str(e)}")
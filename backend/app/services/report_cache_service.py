@@ -0,0 +1,272 @@
+from collections import OrderedDict
+import copy
+from datetime import date, datetime, time as day_time
+import hashlib
+import logging
+import threading
+import time
+
+from decouple import config
+from django.core.cache import cache
+
+from ..database import db_manager
+
+logger = logging.getLogger(__name__)
+
+# Bounded in-process LRU; results are also shared through the Django cache when enabled
+REPORT_CACHE_MAX_ENTRIES = config('REPORT_CACHE_MAX_ENTRIES', default=256, cast=int)
+REPORT_CACHE_SHARED = config('REPORT_CACHE_SHARED', default=False, cast=bool)
+
+# Ranges touching today are recomputed after any sale write; this only bounds
+# staleness from inputs that aren't versioned (stock, product/category names)
+LIVE_TTL_SECONDS = config('REPORT_CACHE_LIVE_TTL_SECONDS', default=300, cast=int)
+# Closed ranges are only invalidated by writes to past days; the long TTL
+# just lets renamed products/categories show up eventually
+CLOSED_TTL_SECONDS = config('REPORT_CACHE_CLOSED_TTL_SECONDS', default=24 * 60 * 60, cast=int)
+
+# How long a process trusts its last read of the write versions
+VERSION_CHECK_INTERVAL_SECONDS = 5
+
+SHARED_KEY_PREFIX = 'report_cache:'
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+
+
+class ReportCacheService:
+    """
+    Result cache for read-heavy sales reports.
+
+    Results are keyed by report name and normalized parameters and stamped
+    with per-collection write versions kept in `report_versions`:
+
+      - `version` is bumped by every sale/invoice/order write,
+      - `history_version` only by writes to transactions dated before today
+        (late voids, edited or backdated invoices, imports).
+
+    A range ending before today is "closed" and checked against
+    `history_version` only, so it stays cached while checkout traffic
+    continues; a range touching today (or open-ended) is checked against
+    `version` and recomputed after the next sale. Stale entries are never
+    purged explicitly - the stamp simply stops matching.
+
+    Entries live in a bounded LRU in each process and, with
+    REPORT_CACHE_SHARED, in the Django cache so several workers share one
+    computation. Hits and misses are counted per report.
+    """
+
+    def __init__(self):
+        self.db = db_manager.get_database()
+        self.versions_collection = self.db.report_versions
+        self._versions = {}
+        self._versions_read_at = 0.0
+        self._metrics = {}
+        self._metrics_lock = threading.Lock()
+
+    # ================================================================
+    # WRITE VERSIONS
+    # ================================================================
+
+    @staticmethod
+    def _as_datetime(value):
+        if isinstance(value, str):
+            try:
+                value = datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+            except ValueError:
+                return None
+        if isinstance(value, date) and not isinstance(value, datetime):
+            value = datetime.combine(value, day_time.max)
+        return value if isinstance(value, datetime) else None
+
+    @classmethod
+    def _today_start(cls):
+        return datetime.combine(datetime.utcnow().date(), day_time.min)
+
+    def record_write(self, collection_name, transaction_dates=None):
+        """
+        Bump a collection's write version after a sale/invoice/order write.
+
+        Args:
+            collection_name: 'sales', 'sales_log' or 'online_transactions'
+            transaction_dates: transaction date(s) of the written documents;
+                any date before today also bumps the history version
+
+        Failures are logged and swallowed - the cache must never break the
+        write that triggered it.
+        """
+        try:
+            if transaction_dates is None or isinstance(transaction_dates, (datetime, date, str)):
+                transaction_dates = [transaction_dates]
+            today = self._today_start()
+            touches_history = any(
+                moment is not None and moment < today
+                for moment in (self._as_datetime(value) for value in transaction_dates)
+            )
+
+            increments = {'version': 1}
+            if touches_history:
+                increments['history_version'] = 1
+            self.versions_collection.update_one({'_id': collection_name}, {'$inc': increments}, upsert=True)
+
+            # Seen by this process on its next lookup; other processes within the check interval
+            self._versions_read_at = 0.0
+        except Exception as e:
+            logger.error(f"Error bumping report version for {collection_name}: {str(e)}")
+
+    def record_history_write(self, collection_names):
+        """Invalidate closed ranges too (e.g. after rebuilding derived sales data)"""
+        for collection_name in collection_names:
+            self.record_write(collection_name, datetime.min)
+
+    def _current_versions(self):
+        if time.monotonic() - self._versions_read_at >= VERSION_CHECK_INTERVAL_SECONDS:
+            self._versions = {
+                document['_id']: document for document in self.versions_collection.find({})
+            }
+            self._versions_read_at = time.monotonic()
+        return self._versions
+
+    def _stamp(self, collections, closed):
+        field = 'history_version' if closed else 'version'
+        versions = self._current_versions()
+        return tuple((name, versions.get(name, {}).get(field, 0)) for name in sorted(collections))
+
+    # ================================================================
+    # KEYS
+    # ================================================================
+
+    @classmethod
+    def _normalize(cls, value):
+        """Stable, hashable form of report parameters"""
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, str):
+            parsed = cls._as_datetime(value.strip())
+            return parsed.isoformat() if parsed else value.strip()
+        if isinstance(value, dict):
+            return tuple(sorted((str(key), cls._normalize(item)) for key, item in value.items()))
+        if isinstance(value, (list, tuple, set)):
+            return tuple(sorted((cls._normalize(item) for item in value), key=repr))
+        return value
+
+    def is_closed(self, end_date):
+        """A range is closed when it ends before today (open-ended ranges include today)"""
+        end_date = self._as_datetime(end_date)
+        return end_date is not None and end_date < self._today_start()
+
+    # ================================================================
+    # LOOKUP
+    # ================================================================
+
+    def _count(self, report, outcome, seconds=None):
+        with self._metrics_lock:
+            metrics = self._metrics.setdefault(report, {
+                'hits': 0, 'shared_hits': 0, 'misses': 0, 'compute_seconds': 0.0
+            })
+            metrics[outcome] += 1
+            if seconds is not None:
+                metrics['compute_seconds'] += seconds
+
+    @staticmethod
+    def _local_get(key, stamp):
+        with _lock:
+            entry = _entries.get(key)
+            if not entry:
+                return None
+            if entry['stamp'] != stamp or entry['expires_at'] < time.monotonic():
+                _entries.pop(key, None)
+                return None
+            _entries.move_to_end(key)
+            return entry
+
+    @staticmethod
+    def _local_set(key, entry):
+        with _lock:
+            _entries[key] = entry
+            _entries.move_to_end(key)
+            while len(_entries) > REPORT_CACHE_MAX_ENTRIES:
+                _entries.popitem(last=False)
+
+    def get_or_compute(self, report, params, compute, collections, end_date=None):
+        """
+        Cached report result.
+
+        Args:
+            report: report name (key prefix and metrics bucket)
+            params: the report's parameters (normalized into the key)
+            compute: zero-argument callable producing the result
+            collections: collections whose writes change the result
+            end_date: range end; ranges ending before today stay cached
+                until a write touches a past day
+
+        Returns:
+            a copy of the cached or freshly computed result
+        """
+        closed = self.is_closed(end_date)
+        key = (report, self._normalize(params), closed)
+
+        try:
+            stamp = self._stamp(collections, closed)
+        except Exception as e:
+            logger.warning(f"Report cache bypassed for {report}: {e}")
+            return compute()
+
+        entry = self._local_get(key, stamp)
+        if entry:
+            self._count(report, 'hits')
+            return copy.deepcopy(entry['value'])
+
+        shared_key = None
+        if REPORT_CACHE_SHARED:
+            shared_key = SHARED_KEY_PREFIX + hashlib.sha1(repr(key).encode()).hexdigest()
+            shared = cache.get(shared_key)
+            if shared and shared['stamp'] == stamp:
+                self._count(report, 'shared_hits')
+                ttl = CLOSED_TTL_SECONDS if closed else LIVE_TTL_SECONDS
+                self._local_set(key, {**shared, 'expires_at': time.monotonic() + ttl})
+                return copy.deepcopy(shared['value'])
+
+        started = time.monotonic()
+        value = compute()
+        self._count(report, 'misses', time.monotonic() - started)
+
+        ttl = CLOSED_TTL_SECONDS if closed else LIVE_TTL_SECONDS
+        self._local_set(key, {'stamp': stamp, 'value': copy.deepcopy(value), 'expires_at': time.monotonic() + ttl})
+        if shared_key:
+            try:
+                cache.set(shared_key, {'stamp': stamp, 'value': value}, ttl)
+            except Exception as e:
+                logger.warning(f"Could not share cached report {report}: {e}")
+        return value
+
+    # ================================================================
+    # METRICS
+    # ================================================================
+
+    def metrics(self):
+        """Per-report hit/miss counts of this process, plus the LRU size"""
+        with self._metrics_lock:
+            reports = {}
+            for report, metrics in self._metrics.items():
+                lookups = metrics['hits'] + metrics['shared_hits'] + metrics['misses']
+                reports[report] = {
+                    **metrics,
+                    'compute_seconds': round(metrics['compute_seconds'], 3),
+                    'hit_rate': round((metrics['hits'] + metrics['shared_hits']) / lookups, 3) if lookups else 0
+                }
+        with _lock:
+            entries = len(_entries)
+        return {
+            'reports': reports,
+            'entries': entries,
+            'max_entries': REPORT_CACHE_MAX_ENTRIES,
+            'shared_store': REPORT_CACHE_SHARED
+        }
+
+    @staticmethod
+    def clear():
+        with _lock:
+            _entries.clear()
+
+
+report_cache = ReportCacheService()
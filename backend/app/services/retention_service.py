@@ -0,0 +1,396 @@
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+from bson import json_util
+from decouple import config
+from pymongo.errors import OperationFailure
+
+from ..database import db_manager
+from .auth_services import ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_DAYS
+from .change_log_service import ChangeLogService
+from notifications.services import notification_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_ROOT = config('RETENTION_ARCHIVE_DIR', default=os.path.join('exports', 'archive'))
+DEFAULT_CHUNK_SIZE = 1000
+
+# A blacklisted token only has to be remembered until it would have expired anyway
+TOKEN_BLACKLIST_TTL_SECONDS = max(ACCESS_TOKEN_EXPIRE_MINUTES * 60, REFRESH_TOKEN_EXPIRE_DAYS * 86400)
+
+# Declarative retention policies.
+#   date_field   - age is measured on this field
+#   days         - documents older than this are archived then deleted
+#   filter       - extra condition a document must meet to be aged out
+#   ttl_seconds  - let MongoDB expire documents itself (TTL index, no archive)
+#   trim         - delete without archiving, only below the lowest sync checkpoint
+RETENTION_POLICIES = {
+    'notifications': {
+        'date_field': 'created_at',
+        'days': 90,
+        # Unread notifications stay until someone has seen them
+        'filter': {'$or': [{'is_read': True}, {'archived': True}]},
+    },
+    'session_logs': {
+        'date_field': 'login_time',
+        'days': 180,
+    },
+    'audit_logs': {
+        'date_field': 'timestamp',
+        'days': 365,
+    },
+    'change_log': {
+        'date_field': 'changed_at',
+        'days': 30,
+        # Derived data - nothing to archive, but sync still has to read past an entry
+        'trim': True,
+    },
+    'token_blacklist': {
+        'date_field': 'blacklisted_at',
+        'ttl_seconds': TOKEN_BLACKLIST_TTL_SECONDS,
+    },
+}
+
+INDEX_CONFLICT_CODES = (85, 86)  # IndexOptionsConflict, IndexKeySpecsConflict
+
+
+class RetentionService:
+    """
+    Keeps hot collections small: TTL indexes for data that can simply expire,
+    and chunked cold archival for data that must be kept.
+
+    Archival reads the oldest eligible documents in chunks, writes each chunk
+    to gzip-compressed JSONL files partitioned by day
+    (<root>/<collection>/YYYY/MM/DD/...jsonl.gz), appends one line per file to
+    <root>/<collection>/index.jsonl, and only then deletes the chunk by _id.
+    A crash between writing and deleting re-archives that chunk on the next
+    run, so lookups may see the same document twice but nothing is lost.
+
+    The change log is only trimmed, never archived: entries past the policy
+    age go once every sync checkpoint has read beyond them.
+    """
+
+    def __init__(self, archive_root=None):
+        self.db = db_manager.get_database()
+        self.archive_root = archive_root or ARCHIVE_ROOT
+
+    def _policy(self, collection_name):
+        policy = RETENTION_POLICIES.get(collection_name)
+        if not policy:
+            raise ValueError(f"No retention policy for collection '{collection_name}'")
+        return policy
+
+    # ================================================================
+    # INDEXES
+    # ================================================================
+
+    def ensure_indexes(self):
+        """Create TTL indexes and the date indexes archival scans rely on"""
+        results = {}
+        for collection_name, policy in RETENTION_POLICIES.items():
+            collection = self.db[collection_name]
+            date_field = policy['date_field']
+            try:
+                if policy.get('ttl_seconds'):
+                    self._ensure_ttl_index(collection, date_field, policy['ttl_seconds'])
+                    results[collection_name] = f"ttl {policy['ttl_seconds']}s on {date_field}"
+                else:
+                    collection.create_index([(date_field, 1)], background=True)
+                    results[collection_name] = f"index on {date_field}"
+            except Exception as e:
+                logger.warning(f"Retention index warning for {collection_name}: {e}")
+                results[collection_name] = f"error: {e}"
+
+        try:
+            # verify_token looks the blacklist up by token on every authenticated request
+            self.db.token_blacklist.create_index([('token', 1)], background=True)
+        except Exception as e:
+            logger.warning(f"Token blacklist index warning: {e}")
+
+        return results
+
+    def _ensure_ttl_index(self, collection, field, ttl_seconds):
+        try:
+            collection.create_index([(field, 1)], expireAfterSeconds=ttl_seconds, background=True)
+        except OperationFailure as e:
+            if e.code not in INDEX_CONFLICT_CODES:
+                raise
+            # An index on the field already exists with other options - retune it in place
+            self.db.command(
+                'collMod',
+                collection.name,
+                index={'keyPattern': {field: 1}, 'expireAfterSeconds': ttl_seconds}
+            )
+
+    # ================================================================
+    # ARCHIVAL
+    # ================================================================
+
+    def _eligible_query(self, policy, cutoff):
+        query = {policy['date_field']: {'$lt': cutoff}}
+        if policy.get('filter'):
+            query = {'$and': [query, policy['filter']]}
+        return query
+
+    def policy_cutoff(self, collection_name, now=None):
+        """Oldest date the policy keeps for `collection_name`"""
+        policy = self._policy(collection_name)
+        return (now or datetime.utcnow()) - timedelta(days=policy['days'])
+
+    def archive_collection(self, collection_name, cutoff=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                           max_chunks=None, dry_run=False, since=None):
+        """
+        Archive and delete documents older than the policy cutoff (or `cutoff`),
+        optionally only those dated on/after `since`.
+
+        Returns:
+            dict: eligible/archived/deleted counts and the files written
+        """
+        policy = self._policy(collection_name)
+        if policy.get('ttl_seconds'):
+            return {'collection': collection_name, 'mode': 'ttl', 'archived': 0, 'deleted': 0, 'files': []}
+
+        cutoff = cutoff or datetime.utcnow() - timedelta(days=policy['days'])
+        if policy.get('trim'):
+            return self._trim_change_log(cutoff, dry_run=dry_run)
+
+        collection = self.db[collection_name]
+        date_field = policy['date_field']
+        query = self._eligible_query(policy, cutoff)
+        if since:
+            query = {'$and': [query, {date_field: {'$gte': since}}]}
+
+        stats = {
+            'collection': collection_name,
+            'cutoff': cutoff.isoformat(),
+            'eligible': collection.count_documents(query),
+            'archived': 0,
+            'deleted': 0,
+            'chunks': 0,
+            'files': [],
+            'dry_run': dry_run,
+        }
+        if dry_run or not stats['eligible']:
+            return stats
+
+        run_stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+        try:
+            while max_chunks is None or stats['chunks'] < max_chunks:
+                chunk = list(collection.find(query).sort(date_field, 1).limit(chunk_size))
+                if not chunk:
+                    break
+
+                files = self._write_chunk(collection_name, date_field, chunk, run_stamp, stats['chunks'])
+                stats['files'].extend(files)
+                stats['archived'] += len(chunk)
+
+                ids = [doc['_id'] for doc in chunk]
+                result = collection.delete_many({'$and': [{'_id': {'$in': ids}}, query]})
+                stats['deleted'] += result.deleted_count
+                stats['chunks'] += 1
+
+                self._after_purge(collection_name, chunk, result.deleted_count)
+
+                if len(chunk) < chunk_size:
+                    break
+
+            logger.info(
+                f"Retention: archived {stats['archived']} and deleted {stats['deleted']} "
+                f"{collection_name} documents older than {stats['cutoff']}"
+            )
+            return stats
+
+        except Exception as e:
+            logger.error(f"Error archiving {collection_name}: {str(e)}")
+            raise Exception(f"Error archiving {collection_name}: {str(e)}")
+
+    def lowest_sync_checkpoint(self):
+        """
+        Lowest change-log version a change_log-mode sync checkpoint still reads
+        from (engine and HTTP product sync), or None when nothing tails the log.
+        Change-stream checkpoints hold a resume token instead and don't count.
+        """
+        lowest = self.db.sync_checkpoints.find_one(
+            {'version': {'$type': 'number'}},
+            {'version': 1},
+            sort=[('version', 1)]
+        )
+        return lowest['version'] if lowest else None
+
+    def _trim_change_log(self, cutoff, dry_run=False):
+        """
+        Delete change-log entries older than `cutoff` that every sync
+        checkpoint has already read past. A checkpoint that never advances
+        holds the log back; the sync engine resyncs any collection whose
+        checkpoint does fall behind the trimmed log anyway.
+        """
+        checkpoint = self.lowest_sync_checkpoint()
+        removed = ChangeLogService(self.db).trim_before(cutoff, max_version=checkpoint, dry_run=dry_run)
+        stats = {
+            'collection': 'change_log',
+            'mode': 'trim',
+            'cutoff': cutoff.isoformat(),
+            'lowest_checkpoint': checkpoint,
+            'eligible': removed,
+            'archived': 0,
+            'deleted': 0 if dry_run else removed,
+            'files': [],
+            'dry_run': dry_run,
+        }
+        if not dry_run:
+            logger.info(
+                f"Retention: trimmed {removed} change_log entries older than {stats['cutoff']}"
+                f" at or below checkpoint version {checkpoint}"
+            )
+        return stats
+
+    def _after_purge(self, collection_name, chunk, deleted_count):
+        """Keep derived state in step with documents removed by archival"""
+        if collection_name != 'notifications':
+            return
+        if deleted_count == len(chunk):
+            notification_service.record_purged(chunk)
+        else:
+            # Some documents changed under us - recount rather than guess
+            notification_service.rebuild_counters()
+
+    def _write_chunk(self, collection_name, date_field, chunk, run_stamp, chunk_number):
+        """Write a chunk as one gzip JSONL file per day and register each file in the index"""
+        by_day = {}
+        for doc in chunk:
+            by_day.setdefault(doc[date_field].strftime('%Y-%m-%d'), []).append(doc)
+
+        written = []
+        for day, docs in by_day.items():
+            relative_dir = os.path.join(collection_name, *day.split('-'))
+            filename = f"{collection_name}-{day.replace('-', '')}-{run_stamp}-{chunk_number:04d}.jsonl.gz"
+            relative_path = os.path.join(relative_dir, filename)
+            full_path = os.path.join(self.archive_root, relative_path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+            temp_path = f"{full_path}.tmp"
+            with gzip.open(temp_path, 'wt', encoding='utf-8') as archive_file:
+                for doc in docs:
+                    archive_file.write(json_util.dumps(doc, json_options=json_util.RELAXED_JSON_OPTIONS))
+                    archive_file.write('\n')
+                archive_file.flush()
+            os.replace(temp_path, full_path)
+
+            ids = sorted(str(doc['_id']) for doc in docs)
+            dates = [doc[date_field] for doc in docs]
+            self._append_index(collection_name, {
+                'file': relative_path,
+                'day': day,
+                'count': len(docs),
+                'min_id': ids[0],
+                'max_id': ids[-1],
+                'min_date': min(dates).isoformat(),
+                'max_date': max(dates).isoformat(),
+                'archived_at': datetime.utcnow().isoformat(),
+            })
+            written.append(relative_path)
+
+        return written
+
+    def _index_path(self, collection_name):
+        return os.path.join(self.archive_root, collection_name, 'index.jsonl')
+
+    def _append_index(self, collection_name, entry):
+        index_path = self._index_path(collection_name)
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        with open(index_path, 'a', encoding='utf-8') as index_file:
+            index_file.write(json.dumps(entry) + '\n')
+            index_file.flush()
+            os.fsync(index_file.fileno())
+
+    def run(self, collections=None, dry_run=False, chunk_size=DEFAULT_CHUNK_SIZE, max_chunks=None):
+        """Apply every archival policy (or the named ones) and return per-collection stats"""
+        results = {}
+        for collection_name in collections or list(RETENTION_POLICIES):
+            try:
+                results[collection_name] = self.archive_collection(
+                    collection_name,
+                    chunk_size=chunk_size,
+                    max_chunks=max_chunks,
+                    dry_run=dry_run
+                )
+            except Exception as e:
+                results[collection_name] = {'collection': collection_name, 'error': str(e)}
+        return results
+
+    # ================================================================
+    # LOOKUP AND STATUS
+    # ================================================================
+
+    def read_index(self, collection_name):
+        index_path = self._index_path(collection_name)
+        if not os.path.exists(index_path):
+            return []
+        with open(index_path, encoding='utf-8') as index_file:
+            return [json.loads(line) for line in index_file if line.strip()]
+
+    def find_archived(self, collection_name, doc_id=None, day=None, limit=100):
+        """
+        Look documents up in the archive. The index narrows the files to read
+        by day and by the _id range each file holds.
+        """
+        self._policy(collection_name)
+        doc_id = str(doc_id) if doc_id is not None else None
+
+        candidates = [
+            entry for entry in self.read_index(collection_name)
+            if (day is None or entry['day'] == day)
+            and (doc_id is None or entry['min_id'] <= doc_id <= entry['max_id'])
+        ]
+
+        found = []
+        for entry in candidates:
+            full_path = os.path.join(self.archive_root, entry['file'])
+            if not os.path.exists(full_path):
+                logger.warning(f"Archive file listed in index is missing: {full_path}")
+                continue
+            with gzip.open(full_path, 'rt', encoding='utf-8') as archive_file:
+                for line in archive_file:
+                    doc = json_util.loads(line)
+                    if doc_id is None or str(doc['_id']) == doc_id:
+                        found.append(doc)
+                        if len(found) >= limit:
+                            return found
+        return found
+
+    def get_status(self):
+        """Hot collection sizes, pending archival backlog and archive totals per policy"""
+        status = []
+        for collection_name, policy in RETENTION_POLICIES.items():
+            collection = self.db[collection_name]
+            entry = {
+                'collection': collection_name,
+                'hot_documents': collection.estimated_document_count(),
+            }
+            if policy.get('ttl_seconds'):
+                entry['mode'] = 'ttl'
+                entry['ttl_seconds'] = policy['ttl_seconds']
+            elif policy.get('trim'):
+                cutoff = datetime.utcnow() - timedelta(days=policy['days'])
+                checkpoint = self.lowest_sync_checkpoint()
+                entry.update({
+                    'mode': 'trim',
+                    'retention_days': policy['days'],
+                    'lowest_checkpoint': checkpoint,
+                    'pending_trim': ChangeLogService(self.db).trim_before(cutoff, max_version=checkpoint, dry_run=True),
+                })
+            else:
+                cutoff = datetime.utcnow() - timedelta(days=policy['days'])
+                index = self.read_index(collection_name)
+                entry.update({
+                    'mode': 'archive',
+                    'retention_days': policy['days'],
+                    'pending_archive': collection.count_documents(self._eligible_query(policy, cutoff)),
+                    'archived_documents': sum(item['count'] for item in index),
+                    'archive_files': len(index),
+                })
+            status.append(entry)
+        return status
@@ -1,175 +1,82 @@
 from datetime import datetime, timedelta
-from collections import defaultdict
 from ..database import db_manager
+from .analytics_snapshot_service import analytics_engine
+from .report_cache_service import report_cache
+from .sales_fact_service import sales_fact_service
 
 
 class SalesByCategoryService:
     def __init__(self):
         self.db = db_manager.get_database()
-        self.sales_collection = self.db.sales
-        self.sales_log_collection = self.db.sales_log  # ✅ Added missing collection
-        self.online_transactions_collection = self.db.online_transactions
-        self.products_collection = self.db.products
         self.categories_collection = self.db.category
 
     def get_sales_by_category_with_date_filter(self, start_date=None, end_date=None, include_voided=False):
         """
         Fetch total sales and quantities grouped by category
-        Includes both POS and online transactions with proper date filtering
+        Includes POS, sales log and online lines, from one `sales_facts` aggregation
+        (cached; closed ranges stay cached until a past-day sale changes)
         """
+        return report_cache.get_or_compute(
+            'sales_by_category',
+            {'start_date': start_date, 'end_date': end_date, 'include_voided': include_voided},
+            lambda: self._sales_by_category(start_date, end_date, include_voided),
+            collections=('sales', 'sales_log', 'online_transactions'),
+            end_date=end_date
+        )
+
+    def _sales_by_category(self, start_date=None, end_date=None, include_voided=False):
         try:
-            query_filter = {}
-
-            # ✅ Filter by date range
-            if start_date or end_date:
-                date_filter = {}
-                if start_date:
-                    if isinstance(start_date, str):
-                        start_date = datetime.fromisoformat(start_date.replace("Z", "+00:00"))
-                    date_filter["$gte"] = start_date
-                if end_date:
-                    if isinstance(end_date, str):
-                        end_date = datetime.fromisoformat(end_date.replace("Z", "+00:00"))
-                    end_date = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-                    date_filter["$lte"] = end_date
-                query_filter["transaction_date"] = date_filter
-
-            # ✅ Exclude voided sales unless requested
-            if not include_voided:
-                query_filter["status"] = {"$ne": "voided"}
-
-            # 🔍 Fetch all sales data (POS + Sales Log + Online)
-            pos_sales = list(self.sales_collection.find(query_filter))
-            sales_log_sales = list(self.sales_log_collection.find(query_filter))
-            online_sales = list(self.online_transactions_collection.find(query_filter))
-            
-            # Normalize sales_log format to match POS format
-            normalized_sales_log = []
-            for sale in sales_log_sales:
-                # Convert item_list to items format
-                items = []
-                for item in sale.get('item_list', []):
-                    items.append({
-                        'product_id': item.get('item_code', ''),
-                        'product_name': item.get('item_name', ''),
-                        'quantity': item.get('quantity', 0),
-                        'price': item.get('unit_price', 0),
-                        'subtotal': item.get('total_price', 0) or (item.get('unit_price', 0) * item.get('quantity', 0)),
-                        'unit': item.get('unit_of_measure', 'pc')
-                    })
-                # Create normalized sale
-                normalized_sale = sale.copy()
-                normalized_sale['items'] = items
-                normalized_sales_log.append(normalized_sale)
-            
-            all_sales = pos_sales + normalized_sales_log + online_sales
-            
-            print(f"📊 Found {len(pos_sales)} POS sales, {len(sales_log_sales)} sales_log sales, and {len(online_sales)} online sales in range")
-
-            # Fetch all products and categories once (exclude deleted)
-            products = list(self.products_collection.find({'isDeleted': {'$ne': True}}))
-            categories = list(self.categories_collection.find({'isDeleted': {'$ne': True}}))
-
-            # 🔗 Build lookup maps with proper ID handling
-            product_id_to_category = {}
-            for product in products:
-                product_id = product.get('_id') or product.get('product_id')
-                category_id = product.get('category_id')
-                if product_id and category_id:
-                    product_id_to_category[str(product_id)] = str(category_id)
-
-            category_id_to_name = {}
-            for category in categories:
-                category_id = str(category.get('_id'))
-                category_name = category.get('category_name', 'Unknown Category')
-                category_id_to_name[category_id] = category_name
-
-            # 🧮 Initialize aggregation containers
-            category_aggregate = defaultdict(lambda: {
-                "total_sales": 0.0, 
-                "total_items_sold": 0, 
-                "product_count": set(),
-                "transaction_count": 0
-            })
-
-            # 🧩 Accumulate sales per category from all transactions
-            # Track unique transactions per category for accurate counting
-            category_transactions = defaultdict(set)  # category_id -> set of transaction IDs
-            
-            for sale in all_sales:
-                # Skip voided entries unless explicitly allowed
-                if not include_voided and sale.get("status") == "voided":
-                    continue
-                
-                # Get transaction ID for unique counting
-                transaction_id = str(sale.get("_id", ""))
-                
-                # Handle both 'items' (POS format) and 'item_list' (sales_log format)
-                items = sale.get("items", [])
-                if not items and sale.get("item_list"):
-                    # Convert item_list to items format if needed
-                    items = []
-                    for item in sale.get("item_list", []):
-                        items.append({
-                            'product_id': item.get('item_code', item.get('product_id', '')),
-                            'quantity': item.get('quantity', 0),
-                            'subtotal': item.get('total_price', 0) or (item.get('unit_price', 0) * item.get('quantity', 0)),
-                            'price': item.get('unit_price', 0)
-                        })
-
-                for item in items:
-                    # Handle both product_id (POS) and item_code (sales_log)
-                    product_id = str(item.get("product_id") or item.get("item_code", ""))
-                    if not product_id:
-                        continue
-                        
-                    quantity = float(item.get("quantity", 0))
-                    # Calculate subtotal: prefer subtotal, then total_price, then price * quantity
-                    subtotal = float(
-                        item.get("subtotal") or 
-                        item.get("total_price") or 
-                        (item.get("price", 0) * quantity) or
-                        (item.get("unit_price", 0) * quantity)
-                    )
-
-                    category_id = product_id_to_category.get(product_id)
-                    if not category_id:
-                        continue
-
-                    category_aggregate[category_id]["total_sales"] += subtotal
-                    category_aggregate[category_id]["total_items_sold"] += int(quantity)
-                    category_aggregate[category_id]["product_count"].add(product_id)
-                    # Track unique transactions per category
-                    category_transactions[category_id].add(transaction_id)
+            # ✅ Normalize the date range (end date covers the whole day)
+            if isinstance(start_date, str):
+                start_date = datetime.fromisoformat(start_date.replace("Z", "+00:00"))
+            if end_date:
+                if isinstance(end_date, str):
+                    end_date = datetime.fromisoformat(end_date.replace("Z", "+00:00"))
+                end_date = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
+
+            # 🔍 Closed, fully exported ranges come from the Parquet snapshots, others from Mongo
+            summarize_by = (
+                analytics_engine.summarize_by if analytics_engine.covers(start_date, end_date)
+                else sales_fact_service.summarize_by
+            )
+
+            # Lines without a category are left out, as before
+            rows = summarize_by(
+                'category',
+                start_date=start_date,
+                end_date=end_date,
+                include_voided=include_voided,
+                sort_by='gross_amount',
+                category_id={'$ne': None}
+            )
+
+            category_id_to_name = {
+                str(category['_id']): category.get('category_name', 'Unknown Category')
+                for category in self.categories_collection.find(
+                    {'_id': {'$in': [row['category'] for row in rows]}, 'isDeleted': {'$ne': True}},
+                    {'category_name': 1}
+                )
+            }
 
             # 🧾 Build final results with enhanced metrics
             results = []
-            for category_id, data in category_aggregate.items():
-                category_name = category_id_to_name.get(category_id, "Unknown Category")
-                total_sales = round(data["total_sales"], 2)
-                total_items = data["total_items_sold"]
-                product_count = len(data["product_count"])
-                # Use unique transaction count from the set
-                transaction_count = len(category_transactions.get(category_id, set()))
-                
-                # Calculate averages
-                avg_sale_per_transaction = round(total_sales / transaction_count, 2) if transaction_count > 0 else 0
-                avg_items_per_transaction = round(total_items / transaction_count, 2) if transaction_count > 0 else 0
+            for row in rows:
+                category_id = str(row['category'])
+                total_sales = row['gross_amount']
+                total_items = int(row['quantity'])
+                transaction_count = row['transaction_count']
 
                 results.append({
                     "category_id": category_id,
-                    "category_name": category_name,
+                    "category_name": category_id_to_name.get(category_id, "Unknown Category"),
                     "total_sales": total_sales,
                     "total_items_sold": total_items,
-                    "product_count": product_count,
+                    "product_count": row['product_count'],
                     "transaction_count": transaction_count,
-                    "avg_sale_per_transaction": avg_sale_per_transaction,
-                    "avg_items_per_transaction": avg_items_per_transaction
+                    "avg_sale_per_transaction": round(total_sales / transaction_count, 2) if transaction_count > 0 else 0,
+                    "avg_items_per_transaction": round(total_items / transaction_count, 2) if transaction_count > 0 else 0
                 })
 
-            # Sort by total_sales desc
-            results.sort(key=lambda x: x["total_sales"], reverse=True)
-
             print(f"✅ Aggregated {len(results)} categories with enhanced metrics")
             return results
 
@@ -3,6 +3,10 @@ from ..models import SalesLog
 import bcrypt
 from notifications.services import notification_service
 from .pos.SalesService import SalesService
+from .product_sales_counter_service import ProductSalesCounterService
+from .analytics_snapshot_service import analytics_engine
+from .report_cache_service import report_cache
+from .sales_fact_service import sales_fact_service
 from collections import defaultdict
 from datetime import datetime, timedelta
 
@@ -11,43 +15,40 @@ class SalesDisplayService():
         self.db = db_manager.get_database()  
         self.sales_collection = self.db.sales  
         self.online_transactions_collection = self.db.online_transactions 
+        self.sales_counters = ProductSalesCounterService()
 
     def get_sales_by_item_with_date_filter(self, start_date=None, end_date=None, include_voided=False):
         """
         Get sales by item with proper date filtering using transaction_date
         Includes option to filter out voided transactions
+
+        Cached; the rows carry current stock, so every range is treated as
+        live and recomputed after the next sale
         """
+        return report_cache.get_or_compute(
+            'sales_by_item',
+            {'start_date': start_date, 'end_date': end_date, 'include_voided': include_voided},
+            lambda: self._sales_by_item(start_date, end_date, include_voided),
+            collections=('sales', 'online_transactions')
+        )
+
+    def _sales_by_item(self, start_date=None, end_date=None, include_voided=False):
         try:
-            # Build query filter
-            query_filter = {}
-            
             # Date filtering
-            if start_date or end_date:
-                date_filter = {}
-                if start_date:
-                    # Convert string to datetime if needed
-                    if isinstance(start_date, str):
-                        start_date = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-                    date_filter['$gte'] = start_date
-                if end_date:
-                    if isinstance(end_date, str):
-                        end_date = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-                    # Include entire end date by setting to end of day
-                    end_date = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-                    date_filter['$lte'] = end_date
-                
-                if date_filter:
-                    query_filter['transaction_date'] = date_filter
-            
-            # Exclude voided transactions unless specifically included
-            if not include_voided:
-                query_filter['status'] = {'$ne': 'voided'}
-            
-            print(f"🔍 Query filter: {query_filter}")
-            
-            # Fetch sales data with the filter
-            sales = list(self.sales_collection.find(query_filter))
-            print(f"📊 Found {len(sales)} sales records")
+            if isinstance(start_date, str):
+                start_date = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
+            if end_date:
+                if isinstance(end_date, str):
+                    end_date = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
+                # Include entire end date by setting to end of day
+                end_date = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
+
+            # POS line totals per product in one sales_facts aggregation
+            sold = sales_fact_service.summarize_by(
+                'product', start_date=start_date, end_date=end_date,
+                sources=['pos'], include_voided=include_voided
+            )
+            print(f"📊 Found sales for {len(sold)} products")
             
             # Process products, categories, batches (keep your existing logic)
             products = self.fetch_all_products()
@@ -67,24 +68,8 @@ class SalesDisplayService():
                 if product_id:
                     product_id_to_stock_remaining[product_id] += qty_remaining
 
-            # Aggregate sales items for the filtered period
-            product_id_to_sold_qty = defaultdict(int)
-            product_id_to_total_sales = defaultdict(float)
-
-            def accumulate_items(container):
-                for doc in container:
-                    # Skip voided transactions unless included
-                    if not include_voided and doc.get('status') == 'voided':
-                        continue
-                    
-                    for item in doc.get('items', []):
-                        pid = item.get('product_id')
-                        if not pid:
-                            continue
-                        product_id_to_sold_qty[pid] += item.get('quantity', 0)
-                        product_id_to_total_sales[pid] += item.get('subtotal', 0.0)
-
-            accumulate_items(sales)
+            product_id_to_sold_qty = {row['product_id'] or row['product']: row['quantity'] for row in sold}
+            product_id_to_total_sales = {row['product_id'] or row['product']: row['gross_amount'] for row in sold}
 
             # Build display list per product
             display_rows = []
@@ -120,40 +105,27 @@ class SalesDisplayService():
         Get summary statistics for a date range
         """
         try:
-            query_filter = {
-                'transaction_date': {
-                    '$gte': datetime.fromisoformat(start_date.replace('Z', '+00:00')),
-                    '$lte': datetime.fromisoformat(end_date.replace('Z', '+00:00')).replace(hour=23, minute=59, second=59, microsecond=999999)
-                },
-                'status': {'$ne': 'voided'}
-            }
-            
-            sales = list(self.sales_collection.find(query_filter))
+            rows = sales_fact_service.summarize_by(
+                'voided',
+                start_date=datetime.fromisoformat(start_date.replace('Z', '+00:00')),
+                end_date=datetime.fromisoformat(end_date.replace('Z', '+00:00')).replace(hour=23, minute=59, second=59, microsecond=999999),
+                sources=['pos'],
+                include_voided=True
+            )
+            completed = next((row for row in rows if not row['voided']), None) or {}
+            voided = next((row for row in rows if row['voided']), None) or {}
             
             summary = {
-                'total_sales_count': len(sales),
-                'total_revenue': 0,
-                'total_items_sold': 0,
+                'total_sales_count': completed.get('transaction_count', 0),
+                'total_revenue': completed.get('net_amount', 0),
+                'total_items_sold': completed.get('quantity', 0),
                 'average_transaction_value': 0,
-                'voided_transactions': 0
+                'voided_transactions': voided.get('transaction_count', 0)
             }
             
-            for sale in sales:
-                summary['total_revenue'] += sale.get('total_amount', 0)
-                for item in sale.get('items', []):
-                    summary['total_items_sold'] += item.get('quantity', 0)
-            
             if summary['total_sales_count'] > 0:
                 summary['average_transaction_value'] = round(summary['total_revenue'] / summary['total_sales_count'], 2)
             
-            # Count voided transactions in the period
-            voided_query = {
-                'transaction_date': query_filter['transaction_date'],
-                'status': 'voided'
-            }
-            voided_count = self.sales_collection.count_documents(voided_query)
-            summary['voided_transactions'] = voided_count
-            
             return summary
             
         except Exception as e:
@@ -162,42 +134,46 @@ class SalesDisplayService():
 
     # Keep your existing methods but update them to use transaction_date
     def top_selling_items(self, start_date=None, end_date=None, limit=10):
-        """Updated to use transaction_date and exclude voided by default"""
+        """Top POS + online products from the per-day sales counters (voided/cancelled excluded)"""
         try:
-            query_filter = {'status': {'$ne': 'voided'}}
-            
-            if start_date or end_date:
-                date_filter = {}
-                if start_date:
-                    if isinstance(start_date, str):
-                        start_date = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-                    date_filter['$gte'] = start_date
-                if end_date:
-                    if isinstance(end_date, str):
-                        end_date = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-                    end_date = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-                    date_filter['$lte'] = end_date
-                
-                if date_filter:
-                    query_filter['transaction_date'] = date_filter
-            
-            sales = list(self.sales_collection.find(query_filter))
-            online_transactions = list(self.online_transactions_collection.find(query_filter))
-            
-            # Rest of your existing logic...
-            item_totals = defaultdict(lambda: {"product_name": "", "total_quantity": 0, "total_sales": 0.0})
-            for sale in sales + online_transactions:
-                for item in sale.get("items", []):
-                    pid = item["product_id"]
-                    item_totals[pid]["product_name"] = item.get("product_name", "")
-                    item_totals[pid]["total_quantity"] += item.get("quantity", 0)
-                    item_totals[pid]["total_sales"] += item.get("subtotal", 0)
-            
-            result = sorted([
-                {"product_id": pid, **data}
-                for pid, data in item_totals.items()
-            ], key=lambda x: x["total_sales"], reverse=True)
-            return result[:limit]
+            # Counters cover whole days; closed, fully exported ranges come from the Parquet snapshots
+            if isinstance(start_date, datetime) and isinstance(end_date, datetime):
+                day_end = end_date.replace(hour=23, minute=59, second=59, microsecond=999000)
+                if analytics_engine.covers(start_date, day_end, datasets=('lines',)):
+                    rows = analytics_engine.summarize_by(
+                        'product',
+                        start_date=start_date.replace(hour=0, minute=0, second=0, microsecond=0),
+                        end_date=day_end,
+                        sources=['pos', 'online'],
+                        sort_by='gross_amount',
+                        limit=limit
+                    )
+                    return [
+                        {
+                            "product_id": row['product_id'] or row['product'],
+                            "product_name": row['product_name'],
+                            "total_quantity": row['quantity'],
+                            "total_sales": row['gross_amount']
+                        }
+                        for row in rows
+                    ]
+
+            rows = self.sales_counters.top_items(
+                start_date=start_date,
+                end_date=end_date,
+                limit=limit,
+                sources=['pos', 'online']
+            )
+            
+            return [
+                {
+                    "product_id": row['product_id'] or row['product_key'],
+                    "product_name": row['product_name'],
+                    "total_quantity": row['total_quantity'],
+                    "total_sales": row['total_revenue']
+                }
+                for row in rows
+            ]
             
         except Exception as e:
             print(f"❌ Error in top_selling_items: {str(e)}")
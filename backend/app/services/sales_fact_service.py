@@ -0,0 +1,412 @@
+from datetime import date, datetime, time
+import logging
+
+from pymongo import ReplaceOne
+
+from ..database import db_manager
+
+logger = logging.getLogger(__name__)
+
+SOURCES = ('pos', 'online', 'sales_log')
+
+# Source -> (collection, line array field)
+SOURCE_COLLECTIONS = {
+    'pos': ('sales', 'items'),
+    'online': ('online_transactions', 'items'),
+    'sales_log': ('sales_log', 'item_list'),
+}
+
+# Report groupings -> fact field
+GROUP_FIELDS = {
+    'product': 'product_key',
+    'category': 'category_id',
+    'day': 'date',
+    'hour': 'hour',
+    'source': 'source',
+    'cashier': 'cashier_id',
+    'customer': 'customer_id',
+    'voided': 'voided',
+}
+
+WRITE_CHUNK = 2000
+
+
+class SalesFactService:
+    """
+    One flat, typed `sales_facts` document per sold line.
+
+    POS sales (`items`), online orders (`items`) and sales_log invoices
+    (`item_list` with item_code / unit_price / total_price) are normalized
+    once, when they are written, into the same shape: date and hour, source,
+    cashier, customer, product, category, quantity, gross / discount / net
+    amount, COGS and a voided flag. Every sale path calls `record_*`, voids
+    and cancellations flip `voided`, and reports are single-collection
+    aggregations over `sales_facts` instead of re-normalizing the three
+    collections in Python on every request. `rebuild` regenerates the facts
+    (backfill and repair).
+    """
+
+    def __init__(self):
+        self.db = db_manager.get_database()
+        self.collection = self.db.sales_facts
+        self.product_collection = self.db.products
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        """Indexes for the common report groupings (all lead with the filter field, then date)"""
+        try:
+            self.collection.create_index([("transaction_date", 1), ("voided", 1)], background=True)
+            self.collection.create_index([("product_key", 1), ("transaction_date", 1)], background=True)
+            self.collection.create_index([("category_id", 1), ("transaction_date", 1)], background=True)
+            self.collection.create_index([("cashier_id", 1), ("transaction_date", 1)], background=True)
+            self.collection.create_index([("customer_id", 1), ("transaction_date", 1)], background=True)
+            self.collection.create_index([("source", 1), ("transaction_id", 1)], background=True)
+            # Days changed since the last analytics export
+            self.collection.create_index([("updated_at", 1)], background=True)
+        except Exception as e:
+            logger.warning(f"Could not create sales fact indexes: {e}")
+
+    # ================================================================
+    # NORMALIZATION
+    # ================================================================
+
+    @staticmethod
+    def _as_datetime(value):
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+        if isinstance(value, date) and not isinstance(value, datetime):
+            value = datetime.combine(value, time.min)
+        return value if isinstance(value, datetime) else None
+
+    @staticmethod
+    def _number(value):
+        try:
+            return float(value or 0)
+        except (TypeError, ValueError):
+            return 0.0
+
+    @staticmethod
+    def is_voided(document, source):
+        if source == 'online':
+            return bool(document.get('is_cancelled')) or document.get('order_status') == 'cancelled'
+        return bool(document.get('is_voided')) or document.get('status') in ('voided', 'cancelled', 'returned')
+
+    def _raw_lines(self, document, source):
+        """(product_id, product_name, quantity, unit_price, gross, net, cogs, category_id) per line"""
+        if source == 'sales_log':
+            item_list = document.get('item_list') or []
+            if isinstance(item_list, dict):
+                item_list = [item_list]
+            for item in item_list:
+                quantity = self._number(item.get('quantity'))
+                unit_price = self._number(item.get('unit_price'))
+                gross = item.get('total_price')
+                gross = self._number(gross) if gross is not None else unit_price * quantity
+                yield (item.get('item_code'), item.get('item_name'), quantity, unit_price,
+                       gross, gross, None, item.get('category_id'))
+            return
+
+        subtotal = self._number(document.get('subtotal'))
+        after_discount = document.get('subtotal_after_discount')
+        ratio = (self._number(after_discount) / subtotal) if subtotal and after_discount is not None else 1
+        for item in document.get('items') or []:
+            quantity = self._number(item.get('quantity'))
+            unit_price = self._number(item.get('unit_price', item.get('price')))
+            gross = item.get('subtotal')
+            gross = self._number(gross) if gross is not None else unit_price * quantity
+            net = item.get('net_amount')
+            net = self._number(net) if net is not None else gross * ratio
+            cogs = item.get('cogs')
+            returned = self._number(item.get('returned_quantity'))
+            if returned and quantity:
+                # Partially returned POS lines count only what the customer kept
+                # (stored net_amount/cogs already cover only the kept units)
+                kept = max(quantity - returned, 0) / quantity
+                quantity, gross = quantity * kept, gross * kept
+                if item.get('net_amount') is None:
+                    net = net * kept
+            yield (item.get('product_id'), item.get('product_name'), quantity, unit_price,
+                   gross, net, cogs, item.get('category_id'))
+
+    def facts_from(self, document, source, categories=None):
+        """
+        Fact documents for one transaction.
+
+        Args:
+            document: sales / online_transactions / sales_log document
+            source: 'pos', 'online' or 'sales_log'
+            categories: product_id -> category_id for lines that carry none
+        """
+        transaction_id = str(document['_id'])
+        transaction_date = self._as_datetime(document.get('transaction_date')) or datetime.utcnow()
+        cashier_id = document.get('cashier_id') or document.get('user_id')
+        customer_id = document.get('customer_id')
+        voided = self.is_voided(document, source)
+        now = datetime.utcnow()
+
+        facts = []
+        for line_no, (product_id, product_name, quantity, unit_price, gross, net, cogs, category_id) in enumerate(
+            self._raw_lines(document, source)
+        ):
+            product_id = str(product_id).strip() if product_id else None
+            product_name = (product_name or '').strip()
+            if not product_id and not product_name:
+                continue
+            net = round(net, 2)
+            fact = {
+                '_id': f"{source}:{transaction_id}:{line_no}",
+                'transaction_id': transaction_id,
+                'line_no': line_no,
+                'source': source,
+                'transaction_date': transaction_date,
+                'date': datetime.combine(transaction_date.date(), time.min),
+                'hour': transaction_date.hour,
+                'cashier_id': str(cashier_id) if cashier_id else None,
+                'customer_id': str(customer_id) if customer_id else None,
+                # Lines without a product id (old imports) are keyed by name
+                'product_key': product_id or f"name:{product_name.lower()}",
+                'product_id': product_id,
+                'product_name': product_name,
+                'category_id': category_id or (categories or {}).get(product_id),
+                'quantity': quantity,
+                'unit_price': round(unit_price, 2),
+                'gross_amount': round(gross, 2),
+                'discount': round(gross - net, 2),
+                'net_amount': net,
+                'cogs': round(self._number(cogs), 2) if cogs is not None else None,
+                'gross_margin': round(net - self._number(cogs), 2) if cogs is not None else None,
+                'voided': voided,
+                'updated_at': now
+            }
+            facts.append(fact)
+        return facts
+
+    def _categories_for(self, documents, source):
+        """One products query for the category of every line that doesn't carry one"""
+        product_ids = set()
+        for document in documents:
+            for product_id, _, _, _, _, _, _, category_id in self._raw_lines(document, source):
+                if product_id and not category_id:
+                    product_ids.add(str(product_id).strip())
+        if not product_ids:
+            return {}
+        return {
+            product['_id']: product.get('category_id')
+            for product in self.product_collection.find({'_id': {'$in': list(product_ids)}}, {'category_id': 1})
+        }
+
+    # ================================================================
+    # RECORDING
+    # ================================================================
+
+    def record_transaction(self, document, source):
+        """
+        Write (or rewrite, after an edit) the facts of one transaction.
+
+        Failures are logged and swallowed - facts must never break a sale;
+        the rebuild command restores them.
+        """
+        return self.record_transactions([document], source)
+
+    def record_transactions(self, documents, source):
+        """Write the facts of many transactions of one source (bulk imports)"""
+        try:
+            documents = [document for document in documents if document and document.get('_id') is not None]
+            if not documents:
+                return 0
+            categories = self._categories_for(documents, source)
+            facts = [fact for document in documents for fact in self.facts_from(document, source, categories)]
+
+            self.collection.delete_many({
+                'source': source,
+                'transaction_id': {'$in': [str(document['_id']) for document in documents]}
+            })
+            self._upsert_facts(facts)
+            return len(facts)
+        except Exception as e:
+            logger.error(f"Error recording sales facts ({source}): {str(e)}")
+            return 0
+
+    def set_voided(self, source, transaction_ids, voided=True):
+        """Flag the facts of voided sales / cancelled orders (one id or a list)"""
+        try:
+            if not isinstance(transaction_ids, (list, tuple, set)):
+                transaction_ids = [transaction_ids]
+            result = self.collection.update_many(
+                {'source': source, 'transaction_id': {'$in': [str(transaction_id) for transaction_id in transaction_ids]}},
+                {'$set': {'voided': voided, 'updated_at': datetime.utcnow()}}
+            )
+            return result.modified_count
+        except Exception as e:
+            logger.error(f"Error flagging voided sales facts ({source}): {str(e)}")
+            return 0
+
+    def remove_transaction(self, source, transaction_id):
+        """Drop the facts of a deleted transaction"""
+        try:
+            return self.collection.delete_many({'source': source, 'transaction_id': str(transaction_id)}).deleted_count
+        except Exception as e:
+            logger.error(f"Error removing sales facts ({source}): {str(e)}")
+            return 0
+
+    # ================================================================
+    # REPORTS
+    # ================================================================
+
+    @staticmethod
+    def match(start_date=None, end_date=None, sources=None, include_voided=False, **filters):
+        """Fact filter; extra keyword filters are matched as-is (e.g. category_id=...)"""
+        match = {}
+        if start_date or end_date:
+            match['transaction_date'] = {}
+            if start_date:
+                match['transaction_date']['$gte'] = start_date
+            if end_date:
+                match['transaction_date']['$lte'] = end_date
+        if not include_voided:
+            match['voided'] = False
+        if sources:
+            match['source'] = {'$in': list(sources)}
+        match.update({field: value for field, value in filters.items() if value is not None})
+        return match
+
+    def summarize_by(self, group_by, start_date=None, end_date=None, sources=None, include_voided=False,
+                     sort_by='net_amount', limit=None, **filters):
+        """
+        Totals per group in one aggregation over `sales_facts`.
+
+        Distinct product and transaction counts come from grouping in stages
+        (line -> transaction/product -> transaction -> group/product -> group)
+        and summing, so no per-group set of ids is ever held in memory.
+
+        Args:
+            group_by: key of GROUP_FIELDS ('product', 'category', 'day', 'hour', ...)
+
+        Returns:
+            list: one row per group with quantity, gross/discount/net amount,
+            COGS, margin, line count, distinct products and transactions
+        """
+        try:
+            field = GROUP_FIELDS[group_by]
+            measures = ('quantity', 'gross_amount', 'discount', 'net_amount', 'cogs', 'line_count')
+            labels = ('product_name', 'product_id', 'category_id')
+            # A transaction's totals are carried only on its first product after the unwind
+            first_product = {'$lte': [{'$ifNull': ['$product_index', 0]}, 0]}
+            pipeline = [
+                {'$match': self.match(start_date, end_date, sources, include_voided, **filters)},
+                # 1. One row per group, transaction and product
+                {'$group': {
+                    '_id': {'group': f'${field}', 'source': '$source', 'transaction': '$transaction_id', 'product': '$product_key'},
+                    **{measure: {'$sum': '$' + measure} for measure in measures[:-1]},
+                    'line_count': {'$sum': 1},
+                    **{label: {'$last': '$' + label} for label in labels}
+                }},
+                # 2. One row per group and transaction, with its (already distinct) products
+                {'$group': {
+                    '_id': {'group': '$_id.group', 'source': '$_id.source', 'transaction': '$_id.transaction'},
+                    **{measure: {'$sum': '$' + measure} for measure in measures},
+                    'products': {'$push': '$_id.product'},
+                    **{label: {'$last': '$' + label} for label in labels}
+                }},
+                {'$unwind': {'path': '$products', 'includeArrayIndex': 'product_index', 'preserveNullAndEmptyArrays': True}},
+                # 3. One row per group and product; each transaction counted once
+                {'$group': {
+                    '_id': {'group': '$_id.group', 'product': '$products'},
+                    **{measure: {'$sum': {'$cond': [first_product, '$' + measure, 0]}} for measure in measures},
+                    'transaction_count': {'$sum': {'$cond': [first_product, 1, 0]}},
+                    **{label: {'$last': '$' + label} for label in labels}
+                }},
+                # 4. One row per group
+                {'$group': {
+                    '_id': '$_id.group',
+                    **{measure: {'$sum': '$' + measure} for measure in measures},
+                    'transaction_count': {'$sum': '$transaction_count'},
+                    'product_count': {'$sum': 1},
+                    **{label: {'$last': '$' + label} for label in labels}
+                }}
+            ]
+
+            rows = []
+            for row in self.collection.aggregate(pipeline, allowDiskUse=True):
+                net_amount = round(row['net_amount'], 2)
+                cogs = round(row['cogs'], 2)
+                rows.append({
+                    group_by: row['_id'],
+                    'product_id': row.get('product_id'),
+                    'product_name': row.get('product_name'),
+                    'category_id': row.get('category_id'),
+                    'quantity': round(row['quantity'], 2),
+                    'gross_amount': round(row['gross_amount'], 2),
+                    'discount': round(row['discount'], 2),
+                    'net_amount': net_amount,
+                    'cogs': cogs,
+                    'gross_margin': round(net_amount - cogs, 2),
+                    'line_count': row['line_count'],
+                    'product_count': row['product_count'],
+                    'transaction_count': row['transaction_count']
+                })
+
+            rows.sort(key=lambda row: row.get(sort_by) or 0, reverse=True)
+            return rows[:limit] if limit else rows
+
+        except Exception as e:
+            logger.error(f"Error summarizing sales facts by {group_by}: {str(e)}")
+            raise Exception(f"Error summarizing sales facts by {group_by}: {str(e)}")
+
+    # ================================================================
+    # REBUILD
+    # ================================================================
+
+    def rebuild(self, since=None, sources=None):
+        """
+        Regenerate facts from `sales`, `online_transactions` and `sales_log`
+        (all transactions, or those from `since`). Returns per-source counts.
+        """
+        try:
+            counts = {}
+            for source in sources or SOURCES:
+                collection_name, _ = SOURCE_COLLECTIONS[source]
+                query = {'transaction_date': {'$gte': since}} if since else {}
+
+                self.collection.delete_many({'source': source, **query})
+
+                transactions, facts, batch = 0, 0, []
+                for document in self.db[collection_name].find(query).batch_size(2000):
+                    batch.append(document)
+                    transactions += 1
+                    if len(batch) >= WRITE_CHUNK:
+                        facts += self._insert_batch(batch, source)
+                        batch = []
+                facts += self._insert_batch(batch, source)
+
+                counts[source] = {'transactions': transactions, 'facts': facts}
+
+            logger.info(f"Sales facts rebuilt: {counts}")
+            return counts
+
+        except Exception as e:
+            logger.error(f"Error rebuilding sales facts: {str(e)}")
+            raise Exception(f"Error rebuilding sales facts: {str(e)}")
+
+    def _insert_batch(self, documents, source):
+        if not documents:
+            return 0
+        categories = self._categories_for(documents, source)
+        facts = [fact for document in documents for fact in self.facts_from(document, source, categories)]
+        self._upsert_facts(facts)
+        return len(facts)
+
+    def _upsert_facts(self, facts):
+        """
+        Write facts by their deterministic _id. Upserts rather than inserts, so
+        a rebuild and the live sale hooks writing the same lines at the same
+        time both succeed instead of failing on duplicate keys.
+        """
+        for start in range(0, len(facts), WRITE_CHUNK):
+            self.collection.bulk_write(
+                [ReplaceOne({'_id': fact['_id']}, fact, upsert=True) for fact in facts[start:start + WRITE_CHUNK]],
+                ordered=False
+            )
+
+
+sales_fact_service = SalesFactService()
@@ -0,0 +1,669 @@
+from datetime import datetime, timedelta
+import io
+import logging
+import re
+import threading
+
+import gridfs
+import pandas as pd
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from ..database import db_manager
+from .audit_service import AuditLogService
+from .change_log_service import change_log_service
+from .product_sales_counter_service import ProductSalesCounterService
+from .sales_fact_service import sales_fact_service
+from .report_cache_service import report_cache
+from notifications.services import notification_service
+
+logger = logging.getLogger(__name__)
+
+# Rows per insert_many / checkpoint
+CHUNK_SIZE = 5000
+
+# A running job without a heartbeat for this long is treated as crashed and can be resumed
+STALE_AFTER = timedelta(minutes=10)
+
+DEFAULT_CUSTOMER_ID = ObjectId("6841a20f37eca0bad1552dd5")
+DEFAULT_USER_ID = ObjectId("6841a20f37eca0bad1552dd5")
+
+# Item code validation
+CODE_MIN_LENGTH = 2
+CODE_MAX_LENGTH = 20
+CODE_PATTERN = r'^[A-Za-z0-9_-]{2,20}$'
+
+# Field -> accepted CSV headers (first present header wins)
+COLUMN_ALIASES = {
+    'code': ('Code', 'code'),
+    'product': ('Product', 'product'),
+    'quantity': ('Quantity', 'quantity'),
+    'uom': ('UOM', 'uom'),
+    'total_before_tax': ('Total before tax', 'total_before_tax'),
+    'total': ('Total', 'total'),
+    'transaction_date': ('Date', 'date', 'Transaction Date', 'transaction_date'),
+}
+
+RESUMABLE_STATUSES = ('queued', 'failed')
+
+
+class SalesImportService:
+    """
+    Background bulk ingestion of CSV sales exports into `sales_log`.
+
+    The upload is stored in GridFS and tracked by a job document in
+    `sales_import_jobs`. Rows are mapped and validated column-wise with
+    pandas, written in chunks with unordered insert_many (ObjectIds are
+    allocated client-side) and checkpointed after every chunk. A unique
+    (import_job_id, import_row) index makes replaying a chunk after a crash
+    idempotent, so a failed or stale job resumes from its last checkpoint.
+    One summary notification and one audit record are written per import.
+
+    Rows are inserted flagged `aggregates_pending` and the flag is cleared
+    once counters, facts and caches include them. Rows still flagged after a
+    crash are reconciled when the job resumes (or by `reconcile_aggregates`):
+    their facts are rewritten and the counters of their days are rebuilt
+    from the stored transactions, so nothing is counted twice or missed.
+    """
+
+    def __init__(self):
+        self.db = db_manager.get_database()
+        self.jobs_collection = self.db.sales_import_jobs
+        self.errors_collection = self.db.sales_import_errors
+        self.sales_log_collection = self.db.sales_log
+        self.files = gridfs.GridFS(self.db, collection='sales_import_files')
+        self.sales_counters = ProductSalesCounterService()
+        self.audit_service = AuditLogService()
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        """Create job, row error and import idempotency indexes"""
+        try:
+            self.sales_log_collection.create_index(
+                [("import_job_id", 1), ("import_row", 1)],
+                unique=True,
+                partialFilterExpression={"import_job_id": {"$exists": True}},
+                background=True
+            )
+            self.sales_log_collection.create_index(
+                [("import_job_id", 1)],
+                partialFilterExpression={"aggregates_pending": True},
+                name="import_aggregates_pending",
+                background=True
+            )
+            self.jobs_collection.create_index([("created_at", -1)], background=True)
+            self.errors_collection.create_index([("job_id", 1), ("row", 1)], background=True)
+        except Exception as e:
+            logger.warning(f"Could not create sales import indexes: {e}")
+
+    # ================================================================
+    # JOBS
+    # ================================================================
+
+    def create_job(self, file_bytes, filename, current_user=None):
+        """Store the uploaded CSV and register a queued import job"""
+        try:
+            job_id = str(ObjectId())
+            now = datetime.utcnow()
+
+            file_id = self.files.put(file_bytes, filename=filename, job_id=job_id, content_type='text/csv')
+
+            current_user = current_user or {}
+            job = {
+                '_id': job_id,
+                'status': 'queued',
+                'source': 'csv',
+                'filename': filename,
+                'file_id': file_id,
+                'file_size': len(file_bytes),
+                'total_rows': None,
+                'processed_rows': 0,
+                'inserted': 0,
+                'duplicates_skipped': 0,
+                'failed': 0,
+                'warnings': [],
+                'attempts': 0,
+                'error': None,
+                'created_by': {
+                    'user_id': current_user.get('user_id', 'system'),
+                    'username': current_user.get('username', 'system')
+                },
+                'created_at': now,
+                'started_at': None,
+                'heartbeat_at': None,
+                'finished_at': None
+            }
+            self.jobs_collection.insert_one(job)
+
+            logger.info(f"Sales import job {job_id} created for '{filename}'")
+            return self._serialize_job(job)
+
+        except Exception as e:
+            logger.error(f"Error creating sales import job: {e}")
+            raise Exception(f"Error creating sales import job: {str(e)}")
+
+    def start_job(self, job_id, background=True):
+        """
+        Claim a queued, failed or stale job and run it from its checkpoint.
+
+        Raises ValueError when the job does not exist or is already running
+        or completed.
+        """
+        now = datetime.utcnow()
+        job = self.jobs_collection.find_one_and_update(
+            {
+                '_id': job_id,
+                '$or': [
+                    {'status': {'$in': list(RESUMABLE_STATUSES)}},
+                    {'status': 'running', 'heartbeat_at': {'$lt': now - STALE_AFTER}}
+                ]
+            },
+            {
+                '$set': {'status': 'running', 'started_at': now, 'heartbeat_at': now, 'error': None},
+                '$inc': {'attempts': 1}
+            },
+            return_document=ReturnDocument.AFTER
+        )
+
+        if not job:
+            existing = self.jobs_collection.find_one({'_id': job_id}, {'status': 1})
+            if not existing:
+                raise ValueError(f"Import job {job_id} not found")
+            raise ValueError(f"Import job {job_id} is {existing['status']} and cannot be started")
+
+        if background:
+            threading.Thread(
+                target=self._run_job,
+                args=(job,),
+                name=f"sales-import-{job_id}",
+                daemon=True
+            ).start()
+        else:
+            self._run_job(job)
+
+        return self._serialize_job(job)
+
+    def get_job(self, job_id, errors_limit=50, errors_skip=0):
+        """Job progress plus a page of per-row errors"""
+        try:
+            job = self.jobs_collection.find_one({'_id': job_id})
+            if not job:
+                return None
+
+            result = self._serialize_job(job)
+            result['errors'] = [
+                {'row': error['row'], 'data': error.get('data'), 'error': error['error']}
+                for error in self.errors_collection.find({'job_id': job_id})
+                .sort('row', 1)
+                .skip(int(errors_skip))
+                .limit(int(errors_limit))
+            ]
+            return result
+
+        except Exception as e:
+            logger.error(f"Error getting sales import job {job_id}: {e}")
+            raise Exception(f"Error getting sales import job: {str(e)}")
+
+    def list_jobs(self, limit=20):
+        """Most recent import jobs"""
+        try:
+            return [
+                self._serialize_job(job)
+                for job in self.jobs_collection.find({}).sort('created_at', -1).limit(int(limit))
+            ]
+        except Exception as e:
+            logger.error(f"Error listing sales import jobs: {e}")
+            raise Exception(f"Error listing sales import jobs: {str(e)}")
+
+    def _serialize_job(self, job):
+        result = dict(job)
+        result['job_id'] = result.pop('_id')
+        if isinstance(result.get('file_id'), ObjectId):
+            result['file_id'] = str(result['file_id'])
+        for field in ('created_at', 'started_at', 'heartbeat_at', 'finished_at'):
+            if isinstance(result.get(field), datetime):
+                result[field] = result[field].isoformat()
+
+        total_rows = result.get('total_rows')
+        result['progress_percent'] = (
+            round(result.get('processed_rows', 0) / total_rows * 100, 2) if total_rows else 0
+        )
+        return result
+
+    # ================================================================
+    # ENGINE
+    # ================================================================
+
+    def _run_job(self, job):
+        job_id = job['_id']
+        try:
+            frame = self._read_csv(job['file_id'])
+            total_rows = len(frame)
+            if total_rows == 0:
+                raise ValueError('CSV file contains no data rows')
+
+            mapped = self.map_rows(frame, default_date=job['created_at'])
+
+            # An earlier attempt may have crashed between inserting rows and counting them
+            self.reconcile_aggregates(job_id)
+
+            job_update = {'total_rows': total_rows}
+            if job.get('processed_rows', 0) == 0:
+                job_update['warnings'] = self.validate_rows(frame)
+            self.jobs_collection.update_one({'_id': job_id}, {'$set': job_update})
+
+            imported_at = datetime.utcnow()
+            start = job.get('processed_rows', 0)
+            logger.info(f"Sales import job {job_id}: rows {start}-{total_rows} in chunks of {CHUNK_SIZE}")
+
+            for chunk_start in range(start, total_rows, CHUNK_SIZE):
+                chunk = mapped.iloc[chunk_start:chunk_start + CHUNK_SIZE]
+                valid = chunk[chunk['error'] == '']
+                invalid = chunk[chunk['error'] != '']
+
+                documents = [
+                    self._build_document(row, job_id, imported_at)
+                    for row in valid.to_dict('records')
+                ]
+                inserted, duplicates = self._write_documents(documents)
+                self._write_errors(job_id, invalid)
+
+                self.jobs_collection.update_one(
+                    {'_id': job_id},
+                    {
+                        '$set': {
+                            'processed_rows': chunk_start + len(chunk),
+                            'heartbeat_at': datetime.utcnow()
+                        },
+                        '$inc': {
+                            'inserted': inserted,
+                            'duplicates_skipped': duplicates,
+                            'failed': len(invalid)
+                        }
+                    }
+                )
+
+            job = self.jobs_collection.find_one_and_update(
+                {'_id': job_id},
+                {'$set': {'status': 'completed', 'finished_at': datetime.utcnow()}},
+                return_document=ReturnDocument.AFTER
+            )
+            logger.info(
+                f"Sales import job {job_id} completed: {job['inserted']} inserted, "
+                f"{job['failed']} failed, {job['duplicates_skipped']} already imported"
+            )
+            self._finalize(job)
+
+        except Exception as e:
+            logger.error(f"Sales import job {job_id} failed: {e}")
+            self.jobs_collection.update_one(
+                {'_id': job_id},
+                {'$set': {'status': 'failed', 'error': str(e), 'finished_at': datetime.utcnow()}}
+            )
+
+    def _read_csv(self, file_id):
+        data = self.files.get(file_id).read()
+        return pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False, encoding='utf-8-sig')
+
+    def _write_documents(self, documents):
+        """Unordered insert_many; rows already imported by an earlier attempt are skipped"""
+        if not documents:
+            return 0, 0
+
+        for document in documents:
+            document['aggregates_pending'] = True
+        try:
+            self.sales_log_collection.insert_many(documents, ordered=False)
+            inserted_documents = documents
+        except BulkWriteError as e:
+            write_errors = e.details.get('writeErrors', [])
+            if any(error.get('code') != 11000 for error in write_errors):
+                raise
+            skipped = {error['index'] for error in write_errors}
+            inserted_documents = [document for index, document in enumerate(documents) if index not in skipped]
+
+        self._apply_aggregates(inserted_documents)
+        self.sales_counters.record_sales_logs(inserted_documents)
+        self._clear_pending(inserted_documents)
+        return len(inserted_documents), len(documents) - len(inserted_documents)
+
+    def _apply_aggregates(self, documents):
+        """Facts, report cache and change log for imported rows (safe to repeat)"""
+        sales_fact_service.record_transactions(documents, 'sales_log')
+        report_cache.record_write('sales_log', [document.get('transaction_date') for document in documents])
+        change_log_service.record_changes('sales_log', [document['_id'] for document in documents])
+
+    def _clear_pending(self, documents):
+        if documents:
+            self.sales_log_collection.update_many(
+                {'_id': {'$in': [document['_id'] for document in documents]}},
+                {'$unset': {'aggregates_pending': ''}}
+            )
+
+    def reconcile_aggregates(self, job_id=None):
+        """
+        Count imported rows whose aggregates were not confirmed (crash
+        between the insert and the counter update) - for one job, or every
+        job that is not running.
+
+        Counter increments are not idempotent, so instead of re-applying
+        them the counters of the affected days are rebuilt from the stored
+        transactions. Returns the number of rows reconciled.
+        """
+        if job_id is None:
+            stale_before = datetime.utcnow() - STALE_AFTER
+            job_ids = [
+                job['_id']
+                for job in self.jobs_collection.find(
+                    {'_id': {'$in': self.sales_log_collection.distinct('import_job_id', {'aggregates_pending': True})}},
+                    {'status': 1, 'heartbeat_at': 1}
+                )
+                if job.get('status') != 'running' or (job.get('heartbeat_at') or stale_before) <= stale_before
+            ]
+            return sum(self.reconcile_aggregates(pending_job_id) for pending_job_id in job_ids)
+
+        documents = list(self.sales_log_collection.find({'import_job_id': job_id, 'aggregates_pending': True}))
+        if not documents:
+            return 0
+
+        logger.warning(f"Sales import job {job_id}: reconciling aggregates of {len(documents)} row(s)")
+        self._apply_aggregates(documents)
+        dates = [document['transaction_date'] for document in documents if isinstance(document.get('transaction_date'), datetime)]
+        self.sales_counters.rebuild(since=min(dates) if dates else None)
+        self._clear_pending(documents)
+        return len(documents)
+
+    def _write_errors(self, job_id, invalid):
+        if invalid.empty:
+            return
+
+        errors = [
+            {
+                '_id': f"{job_id}:{row['row_number']}",
+                'job_id': job_id,
+                'row': row['row_number'],
+                'data': {
+                    'Code': row['raw_code'],
+                    'Product': row['product'],
+                    'Quantity': row['raw_quantity'],
+                    'Total': row['raw_total']
+                },
+                'error': row['error']
+            }
+            for row in invalid.to_dict('records')
+        ]
+        try:
+            self.errors_collection.insert_many(errors, ordered=False)
+        except BulkWriteError as e:
+            # Errors already recorded by an earlier attempt
+            if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+                raise
+
+    def _finalize(self, job):
+        """One summary notification and one audit record per import"""
+        inserted = job.get('inserted', 0)
+        failed = job.get('failed', 0)
+
+        try:
+            message = f"Imported {inserted} of {job.get('total_rows', 0)} rows from {job.get('filename')}"
+            if failed:
+                message += f" ({failed} rows failed)"
+
+            notification_service.create_notification(
+                title="CSV Sales Import Completed",
+                message=message,
+                priority="medium" if failed else "low",
+                notification_type="sales",
+                metadata={
+                    "import_job_id": job['_id'],
+                    "inserted": inserted,
+                    "failed": failed,
+                    "duplicates_skipped": job.get('duplicates_skipped', 0),
+                    "source": "csv",
+                    "action_type": "csv_import_completed"
+                }
+            )
+        except Exception as notification_error:
+            logger.error(f"Failed to create import notification: {notification_error}")
+
+        try:
+            self.audit_service.log_bulk_operation(
+                job.get('created_by') or {},
+                'import',
+                'sales_log',
+                inserted,
+                failed,
+                target_ids=[job['_id']]
+            )
+        except Exception as audit_error:
+            logger.error(f"Audit logging failed: {audit_error}")
+
+    # ================================================================
+    # ROW MAPPING (column-wise)
+    # ================================================================
+
+    @staticmethod
+    def _column(frame, field, default=''):
+        for name in COLUMN_ALIASES[field]:
+            if name in frame.columns:
+                return frame[name].astype(str)
+        return pd.Series(default, index=frame.index, dtype=object)
+
+    @staticmethod
+    def parse_numbers(series):
+        """Vectorized number parsing: strips currency/thousands, (x) is negative, bad values -> 0"""
+        cleaned = series.astype(str).str.strip().str.replace(r'[,$\s₱]', '', regex=True)
+        negative = cleaned.str.startswith('(') & cleaned.str.endswith(')')
+        cleaned = cleaned.where(~negative, '-' + cleaned.str.slice(1, -1))
+        cleaned = cleaned.str.replace(r'[^\d.-]', '', regex=True)
+        # Keep only the last decimal point
+        cleaned = cleaned.str.replace(r'\.(?=.*\.)', '', regex=True)
+        return pd.to_numeric(cleaned, errors='coerce').fillna(0.0).astype(float)
+
+    @staticmethod
+    def generate_item_code(product_name, row_number):
+        """Generate item code from product name"""
+        clean_name = re.sub(r'[^a-zA-Z0-9]', '', product_name)
+
+        if len(clean_name) >= 3:
+            words = re.findall(r'[A-Z][a-z]*|[a-z]+|\d+', product_name)
+
+            if len(words) >= 2:
+                prefix = (words[0][:2] + words[1][:2]).upper()
+            else:
+                prefix = clean_name[:4].upper()
+            code = f"{prefix}{row_number:02d}"
+        else:
+            code = f"ITEM{row_number:03d}"
+
+        if len(code) > CODE_MAX_LENGTH:
+            code = code[:CODE_MAX_LENGTH - 2] + f"{row_number:02d}"
+
+        return code
+
+    def process_item_codes(self, raw_codes, products, row_numbers):
+        """Uppercase valid codes, strip invalid characters, generate codes for blanks"""
+        fixed = raw_codes.str.replace(r'[^A-Za-z0-9_-]', '', regex=True).str.slice(0, CODE_MAX_LENGTH)
+        fixed = fixed.str.pad(CODE_MIN_LENGTH, side='right', fillchar='X').str.upper()
+
+        generate = (raw_codes == '') | ~fixed.str.match(CODE_PATTERN)
+        codes = fixed.where(~generate, '')
+        if generate.any():
+            codes.loc[generate] = [
+                self.generate_item_code(product, row_number)
+                for product, row_number in zip(products[generate], row_numbers[generate])
+            ]
+        return codes, generate
+
+    def map_rows(self, frame, default_date=None):
+        """
+        Map CSV rows to sales_log fields column-wise.
+
+        Returns a DataFrame with one row per CSV row, the computed invoice
+        fields and an `error` column ('' for importable rows).
+        """
+        default_date = default_date or datetime.utcnow()
+        row_numbers = pd.Series(range(1, len(frame) + 1), index=frame.index)
+
+        raw_code = self._column(frame, 'code').str.strip()
+        product = self._column(frame, 'product').str.strip()
+        uom = self._column(frame, 'uom', 'pc').str.strip()
+        raw_quantity = self._column(frame, 'quantity', '1')
+        raw_total = self._column(frame, 'total')
+
+        quantity = self.parse_numbers(raw_quantity)
+        quantity = quantity.where(quantity > 0, 1.0)
+        total_before_tax = self.parse_numbers(self._column(frame, 'total_before_tax'))
+        total = self.parse_numbers(raw_total)
+        total = total.where(~((total == 0) & (total_before_tax > 0)), total_before_tax)
+
+        tax_amount = (total - total_before_tax).clip(lower=0)
+        tax_rate = (tax_amount / total_before_tax.where(total_before_tax > 0)).fillna(0.0)
+
+        item_code, code_was_generated = self.process_item_codes(raw_code, product, row_numbers)
+
+        raw_date = self._column(frame, 'transaction_date').str.strip()
+        # Parsed per distinct value: exports repeat the same few dates, and formats may be mixed
+        parsed_dates = {
+            value: pd.to_datetime(value, errors='coerce', utc=True)
+            for value in raw_date[raw_date != ''].unique()
+        }
+        transaction_date = pd.to_datetime(raw_date.map(parsed_dates), utc=True).dt.tz_localize(None)
+        bad_date = (raw_date != '') & transaction_date.isna()
+        transaction_date = transaction_date.fillna(pd.Timestamp(default_date))
+
+        error = pd.Series('', index=frame.index, dtype=object)
+        error = error.mask(bad_date, 'Invalid date: ' + raw_date)
+        error = error.mask(total <= 0, 'Invalid total amount: ' + total.astype(str))
+        error = error.mask(product == '', 'Product name is required')
+
+        return pd.DataFrame({
+            'row_number': row_numbers,
+            'raw_code': raw_code,
+            'raw_quantity': raw_quantity,
+            'raw_total': raw_total,
+            'item_code': item_code,
+            'code_was_generated': code_was_generated,
+            'product': product,
+            'uom': uom,
+            'quantity': quantity,
+            'total_before_tax': total_before_tax,
+            'total': total,
+            'tax_amount': tax_amount,
+            'tax_rate': tax_rate,
+            'transaction_date': transaction_date,
+            'error': error
+        })
+
+    def _build_document(self, row, job_id, imported_at):
+        quantity = float(row['quantity'])
+        total_before_tax = float(row['total_before_tax'])
+        tax_amount = float(row['tax_amount'])
+        row_number = int(row['row_number'])
+        was_generated = bool(row['code_was_generated'])
+
+        return {
+            # Allocated client-side: no per-row ID round trip
+            '_id': ObjectId(),
+            'customer_id': DEFAULT_CUSTOMER_ID,
+            'user_id': DEFAULT_USER_ID,
+            'transaction_date': row['transaction_date'].to_pydatetime(),
+            'total_amount': round(float(row['total']), 2),
+            'status': 'completed',
+            'payment_method': 'cash',
+            'sales_type': 'dine_in',
+            'tax_rate': round(float(row['tax_rate']), 4),
+            'tax_amount': round(tax_amount, 2),
+            'is_taxable': tax_amount > 0,
+            'notes': f"Code: {row['item_code']} | {row['product']}",
+            'item_list': [{
+                'item_code': row['item_code'],
+                'item_name': row['product'],
+                'quantity': quantity,
+                'unit_of_measure': row['uom'],
+                'unit_price': round(total_before_tax / quantity, 2) if quantity > 0 else 0,
+                'total_price': round(total_before_tax, 2),
+                'tax_amount': round(tax_amount, 2),
+                'imported_from_csv': True,
+                'original_code': row['raw_code'],
+                'code_was_generated': was_generated,
+                'import_row_number': row_number
+            }],
+            'source': 'csv',
+            'import_job_id': job_id,
+            'import_row': row_number,
+            'sync_logs': [{
+                'source': 'csv',
+                'import_job_id': job_id,
+                'imported_at': imported_at.isoformat(),
+                'csv_code': row['raw_code'],
+                'processed_code': row['item_code'],
+                'csv_product': row['product'],
+                'csv_row': row_number,
+                'code_generated': was_generated
+            }]
+        }
+
+    # ================================================================
+    # PRE-VALIDATION WARNINGS
+    # ================================================================
+
+    def validate_rows(self, frame):
+        """Duplicate codes, missing fields and invalid codes as import warnings"""
+        warnings = []
+        row_numbers = pd.Series(range(1, len(frame) + 1), index=frame.index)
+        raw_code = self._column(frame, 'code').str.strip()
+
+        codes = raw_code.str.upper()
+        present = codes != ''
+        repeated = present & codes.duplicated(keep='first')
+        if repeated.any():
+            first_rows = row_numbers[present & ~codes.duplicated(keep='first')]
+            first_row_by_code = pd.Series(first_rows.values, index=codes[first_rows.index].values)
+            duplicates = [
+                {'code': code, 'rows': [int(first_row_by_code[code]), int(row_number)]}
+                for code, row_number in zip(codes[repeated].head(5), row_numbers[repeated].head(5))
+            ]
+            warnings.append({
+                'type': 'duplicate_codes',
+                'count': int(repeated.sum()),
+                'message': f"Found {int(repeated.sum())} duplicate item codes",
+                'details': duplicates
+            })
+
+        missing_product = self._column(frame, 'product').str.strip() == ''
+        missing_quantity = self._column(frame, 'quantity') == ''
+        missing_total = (self._column(frame, 'total') == '') & (self._column(frame, 'total_before_tax') == '')
+        missing_any = missing_product | missing_quantity | missing_total
+        if missing_any.any():
+            details = []
+            for index in missing_any[missing_any].index[:5]:
+                missing = []
+                if missing_product[index]:
+                    missing.append('Product')
+                if missing_quantity[index]:
+                    missing.append('Quantity')
+                if missing_total[index]:
+                    missing.append('Total')
+                details.append({'row': int(row_numbers[index]), 'missing_fields': missing})
+            warnings.append({
+                'type': 'missing_fields',
+                'count': int(missing_any.sum()),
+                'message': f"Found {int(missing_any.sum())} rows with missing required fields",
+                'details': details
+            })
+
+        invalid = present & ~raw_code.str.match(CODE_PATTERN)
+        if invalid.any():
+            warnings.append({
+                'type': 'invalid_codes',
+                'count': int(invalid.sum()),
+                'message': f"Found {int(invalid.sum())} rows with invalid item codes",
+                'details': [
+                    {'row': int(row_number), 'invalid_code': code}
+                    for row_number, code in zip(row_numbers[invalid].head(5), raw_code[invalid].head(5))
+                ]
+            })
+
+        return warnings
@@ -1,10 +1,14 @@
 from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, time
 from ..database import db_manager 
 from ..models import SalesLog
 import bcrypt
 from notifications.services import notification_service
 from .pos.SalesService import SalesService
+from .product_sales_counter_service import ProductSalesCounterService
+from .report_cache_service import report_cache
+from .sales_fact_service import sales_fact_service
+from .change_log_service import change_log_service
 
 class SalesLogService():
     def __init__(self):
@@ -130,12 +134,24 @@ class SalesLogService():
             # Remove _id from update_data if present
             update_data.pop('_id', None)
             
+            previous = self.sales_log_collection.find_one({"_id": invoice_id})
+            
             result = self.sales_log_collection.update_one(
                 {"_id": invoice_id},
                 {"$set": update_data}
             )
             
             if result.modified_count > 0:
+                if previous and {'item_list', 'transaction_date', 'status'} & set(update_data):
+                    current = self.sales_log_collection.find_one({"_id": invoice_id})
+                    sales_counters = self.sales_service.sales_counters
+                    sales_counters.record_sales_log(previous, sign=-1)
+                    sales_counters.record_sales_log(current)
+                    sales_fact_service.record_transaction(current, 'sales_log')
+                report_cache.record_write(
+                    'sales_log', [(previous or {}).get('transaction_date'), update_data.get('transaction_date')]
+                )
+                change_log_service.record_change('sales_log', invoice_id)
                 return self.get_invoice_by_id(invoice_id)
             else:
                 return None
@@ -149,8 +165,15 @@ class SalesLogService():
             if isinstance(invoice_id, str):
                 invoice_id = ObjectId(invoice_id)
             
+            previous = self.sales_log_collection.find_one({"_id": invoice_id})
             result = self.sales_log_collection.delete_one({"_id": invoice_id})
             
+            if result.deleted_count > 0 and previous:
+                self.sales_service.sales_counters.record_sales_log(previous, sign=-1)
+                sales_fact_service.remove_transaction('sales_log', invoice_id)
+                report_cache.record_write('sales_log', previous.get('transaction_date'))
+                change_log_service.record_change('sales_log', invoice_id, 'delete')
+            
             return result.deleted_count > 0
             
         except Exception as e:
@@ -319,6 +342,7 @@ class SalesTopItem():
     def __init__(self):
         self.db = db_manager.get_database()  
         self.sales_log_collection = self.db.sales_log
+        self.sales_counters = ProductSalesCounterService()
 
     def convert_object_id(self, document):
         """Convert ObjectId to string for JSON serialization"""
@@ -334,50 +358,28 @@ class SalesTopItem():
                 document['transaction_date'] = document['transaction_date'].isoformat()
         return document
 
+    def _to_top_item(self, row):
+        """Shape a product sales counter row like the legacy sales_log top item"""
+        quantity = row['total_quantity']
+        latest_date = row.get('last_sold_at')
+        return {
+            "item_name": row['product_name'] or row['product_id'],
+            "total_amount": row['total_revenue'],
+            "total_quantity": quantity,
+            "unit_price": round(row['total_revenue'] / quantity, 2) if quantity else 0,
+            "latest_transaction_date": latest_date.isoformat() if hasattr(latest_date, 'isoformat') else latest_date
+        }
+
     def fetch_top_item(self, limit=5):
         try:
-            projection = {
-                "item_list.item_name": 1,
-                "total_amount": 1
-            }
-            
-            invoices = list(self.sales_log_collection.find({}, projection))
-            total_count = self.sales_log_collection.count_documents({})
+            # Line-level revenue from the per-day counters (no invoice scan)
+            rows = self.sales_counters.top_items(limit=limit, sources=['sales_log'])
+            total_count = self.sales_log_collection.estimated_document_count()
             
-            item_totals = {}
-            
-            for invoice in invoices:
-                # Check if invoice has item_list and total_amount
-                if 'item_list' in invoice and 'total_amount' in invoice:
-                    total_amount = invoice['total_amount']
-                    
-                    # Handle case where item_list might be a list of items
-                    if isinstance(invoice['item_list'], list):
-                        for item in invoice['item_list']:
-                            if 'item_name' in item:
-                                item_name = item['item_name']
-                                if item_name in item_totals:
-                                    item_totals[item_name] += total_amount
-                                else:
-                                    item_totals[item_name] = total_amount
-                    
-                    # Handle case where item_list has direct item_name
-                    elif 'item_name' in invoice['item_list']:
-                        item_name = invoice['item_list']['item_name']
-                        if item_name in item_totals:
-                            item_totals[item_name] += total_amount
-                        else:
-                            item_totals[item_name] = total_amount
-            
-            # Convert to list of dictionaries and sort by total amount (descending)
-            result = [
-                {"item_name": name, "total_amount": amount} 
-                for name, amount in item_totals.items()
+            top_items = [
+                {"item_name": item['item_name'], "total_amount": item['total_amount']}
+                for item in (self._to_top_item(row) for row in rows)
             ]
-            result.sort(key=lambda x: x['total_amount'], reverse=True)
-            
-            # Limit the results to the specified number
-            top_items = result[:limit]
             
             return {
                 "items": top_items,
@@ -390,143 +392,45 @@ class SalesTopItem():
         
 
     def fetch_all_top_item(self, start_date=None, end_date=None, frequency='monthly'):
+        """Top sales_log items over a date range (cached per range)"""
+        return report_cache.get_or_compute(
+            'sales_log_top_items',
+            {'start_date': start_date, 'end_date': end_date, 'frequency': frequency},
+            lambda: self._all_top_items(start_date, end_date, frequency),
+            collections=('sales_log',),
+            end_date=end_date
+        )
+
+    def _all_top_items(self, start_date=None, end_date=None, frequency='monthly'):
         try:
-            projection = {
-                "item_list.item_name": 1,
-                "item_list.quantity": 1,
-                "item_list.unit_price": 1,
-                "total_amount": 1,
-                "transaction_date": 1,
-            }
+            from django.utils.dateparse import parse_date
+            
+            if isinstance(start_date, str):
+                start_date = parse_date(start_date)
+            if isinstance(end_date, str):
+                end_date = parse_date(end_date)
             
-            # Build date filter query
+            # Build date filter query (only used for the invoice count)
             date_filter = {}
             if start_date or end_date:
                 date_filter["transaction_date"] = {}
                 if start_date:
-                    # Convert date to datetime for proper MongoDB querying
-                    from datetime import datetime, time
-                    if isinstance(start_date, str):
-                        from django.utils.dateparse import parse_date
-                        start_date = parse_date(start_date)
-                    if start_date:  # Check if parsing was successful
-                        start_datetime = datetime.combine(start_date, time.min)
-                        date_filter["transaction_date"]["$gte"] = start_datetime
+                    date_filter["transaction_date"]["$gte"] = datetime.combine(start_date, time.min)
                 if end_date:
-                    # Convert date to datetime for proper MongoDB querying
-                    if isinstance(end_date, str):
-                        from django.utils.dateparse import parse_date
-                        end_date = parse_date(end_date)
-                    if end_date:  # Check if parsing was successful
-                        end_datetime = datetime.combine(end_date, time.max)
-                        date_filter["transaction_date"]["$lte"] = end_datetime
-            
-            # Apply the filter to the query
-            query_filter = date_filter if date_filter else {}
-            
-            print(f"MongoDB Query Filter: {query_filter}")  # Debug log
-            print(f"Date range: {start_date} to {end_date}, Frequency: {frequency}")  # Debug log
-            
-            invoices = list(self.sales_log_collection.find(query_filter, projection))
-            total_count = self.sales_log_collection.count_documents(query_filter)
-            
-            print(f"Found {len(invoices)} invoices matching date filter")  # Debug log
+                    date_filter["transaction_date"]["$lte"] = datetime.combine(end_date, time.max)
             
-            item_totals = {}
-            
-            for invoice in invoices:
-                # Check if invoice has item_list and total_amount
-                if 'item_list' in invoice and 'total_amount' in invoice:
-                    total_amount = invoice['total_amount']
-                    transaction_date = invoice.get('transaction_date')
-                    
-                    # Handle case where item_list might be a list of items
-                    if isinstance(invoice['item_list'], list):
-                        for item in invoice['item_list']:
-                            if 'item_name' in item:
-                                item_name = item['item_name']
-                                quantity = item.get('quantity', 0)
-                                unit_price = item.get('unit_price', 0)
-                                
-                                if item_name in item_totals:
-                                    item_totals[item_name]['total_amount'] += total_amount
-                                    item_totals[item_name]['total_quantity'] += quantity
-                                    # For unit_price, we might want to track average or just keep the latest
-                                    # Here I'm keeping the most recent unit_price
-                                    item_totals[item_name]['unit_price'] = unit_price
-                                    # Keep the most recent transaction date
-                                    if transaction_date and (not item_totals[item_name]['latest_transaction_date'] or 
-                                                        transaction_date > item_totals[item_name]['latest_transaction_date']):
-                                        item_totals[item_name]['latest_transaction_date'] = transaction_date
-                                else:
-                                    item_totals[item_name] = {
-                                        'total_amount': total_amount,
-                                        'total_quantity': quantity,
-                                        'unit_price': unit_price,
-                                        'latest_transaction_date': transaction_date
-                                    }
-                    
-                    # Handle case where item_list has direct item_name
-                    elif 'item_name' in invoice['item_list']:
-                        item_name = invoice['item_list']['item_name']
-                        quantity = invoice['item_list'].get('quantity', 0)
-                        unit_price = invoice['item_list'].get('unit_price', 0)
-                        
-                        if item_name in item_totals:
-                            item_totals[item_name]['total_amount'] += total_amount
-                            item_totals[item_name]['total_quantity'] += quantity
-                            item_totals[item_name]['unit_price'] = unit_price
-                            # Keep the most recent transaction date
-                            if transaction_date and (not item_totals[item_name]['latest_transaction_date'] or 
-                                                transaction_date > item_totals[item_name]['latest_transaction_date']):
-                                item_totals[item_name]['latest_transaction_date'] = transaction_date
-                        else:
-                            item_totals[item_name] = {
-                                'total_amount': total_amount,
-                                'total_quantity': quantity,
-                                'unit_price': unit_price,
-                                'latest_transaction_date': transaction_date
-                            }
+            rows = self.sales_counters.top_items(
+                start_date=start_date,
+                end_date=end_date,
+                limit=None,
+                sources=['sales_log']
+            )
+            result = [self._to_top_item(row) for row in rows]
             
-            # Convert to list of dictionaries and sort by total amount (descending)
-            # Handle None values in latest_transaction_date
-            result = []
-            for name, data in item_totals.items():
-                # Handle None transaction date by converting to string
-                latest_date = data['latest_transaction_date']
-                if latest_date:
-                    if hasattr(latest_date, 'isoformat'):
-                        latest_date_str = latest_date.isoformat()
-                    else:
-                        latest_date_str = str(latest_date)
-                else:
-                    latest_date_str = None
-                
-                result.append({
-                    "item_name": name, 
-                    "total_amount": data['total_amount'],
-                    "total_quantity": data['total_quantity'],
-                    "unit_price": data['unit_price'],
-                    "latest_transaction_date": latest_date_str
-                })
-            
-            result.sort(key=lambda x: x['total_amount'], reverse=True)
-            
-            # Prepare safe date strings for response
-            start_date_str = None
-            end_date_str = None
-            
-            if start_date:
-                if hasattr(start_date, 'isoformat'):
-                    start_date_str = start_date.isoformat()
-                else:
-                    start_date_str = str(start_date)
-                    
-            if end_date:
-                if hasattr(end_date, 'isoformat'):
-                    end_date_str = end_date.isoformat()
-                else:
-                    end_date_str = str(end_date)
+            if date_filter:
+                total_count = self.sales_log_collection.count_documents(date_filter)
+            else:
+                total_count = self.sales_log_collection.estimated_document_count()
             
             return {
                 "items": result,
@@ -535,8 +439,8 @@ class SalesTopItem():
                 "date_filter_applied": bool(start_date or end_date),
                 "frequency": frequency,
                 "date_range": {
-                    "start_date": start_date_str,
-                    "end_date": end_date_str
+                    "start_date": start_date.isoformat() if start_date else None,
+                    "end_date": end_date.isoformat() if end_date else None
                 }
             }
             
@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 from bson import ObjectId
 from ..database import db_manager  # ✅ Updated import
+from .retention_service import RetentionService
 
 ##THIS IS FOR LEGACY USE AND FOR TESTING
 class SessionManagementService:
@@ -88,15 +89,18 @@ class SessionManagementService:
     def cleanup_old_sessions(self, days_old=30):
         """Clean up sessions older than specified days"""
         try:
-            cutoff_date = datetime.utcnow() - timedelta(days=days_old)
-            
-            result = self.session_collection.delete_many(
-                {"login_time": {"$lt": cutoff_date}}
+            # Archive through the session_logs policy rather than deleting outright
+            retention = RetentionService()
+            cutoff_date = min(
+                datetime.utcnow() - timedelta(days=days_old),
+                retention.policy_cutoff("session_logs")
             )
+            result = retention.archive_collection("session_logs", cutoff=cutoff_date)
             
             return {
-                "message": f"Cleaned up {result.deleted_count} old sessions",
-                "sessions_deleted": result.deleted_count
+                "message": f"Cleaned up {result['deleted']} old sessions",
+                "sessions_deleted": result["deleted"],
+                "sessions_archived": result["archived"]
             }
         except Exception as e:
             raise Exception(f"Error cleaning up sessions: {str(e)}")
@@ -1,9 +1,9 @@
-import csv
-import os
 from datetime import datetime, timedelta
 from ..database import db_manager
 from notifications.services import notification_service
 from notifications.shift_summary_service import shift_summary_service
+from .retention_service import RetentionService
+from .shift_totals_service import shift_totals_service
 import logging
 import threading
 import time
@@ -185,6 +185,9 @@ class SessionLogService:
                 }
             )
             
+            # Stop charging sales to the closed sessions' running totals
+            shift_totals_service.close_open_sessions(user_id, status="replaced")
+            
             # Send notifications for closed sessions
             total_closed = expired_result.modified_count + replaced_result.modified_count
             if total_closed > 0:
@@ -233,6 +236,7 @@ class SessionLogService:
             }
 
             result = self.collection.insert_one(log_data)
+            shift_totals_service.open_session(log_data)
             
             # Send login notification
             self._send_session_notification("login", log_data)
@@ -282,6 +286,8 @@ class SessionLogService:
             )
 
             if update_result.modified_count > 0:
+                shift_totals_service.close_session(session["_id"], logout_time)
+                
                 # Prepare session data with logout info
                 session_with_logout = {
                     "_id": session["_id"],
@@ -406,26 +412,23 @@ class SessionLogService:
             } 
 
     def cleanup_old_sessions(self, days_old=30):
-        """Clean up sessions older than specified days"""
+        """Archive and delete sessions older than `days_old` days, never past the session_logs policy"""
         try:
-            cutoff_date = datetime.utcnow() - timedelta(days=days_old)
-            result = self.collection.delete_many({
-                "login_time": {"$lt": cutoff_date},
-                "status": {"$in": ["completed", "expired", "replaced"]}
-            })
+            result, cutoff_date, _ = self._archive_sessions(datetime.utcnow() - timedelta(days=days_old))
             
-            if result.deleted_count > 0:
+            if result["deleted"] > 0:
                 # Send bulk cleanup notification
                 self._send_session_notification("bulk_cleanup", {
                     "username": "System",
                     "_id": "BULK-CLEANUP"
                 }, {
-                    "deleted_count": result.deleted_count,
+                    "deleted_count": result["deleted"],
+                    "archived_count": result["archived"],
                     "cutoff_date": cutoff_date.isoformat()
                 })
             
-            logger.info(f"Cleaned up {result.deleted_count} old sessions")
-            return result.deleted_count
+            logger.info(f"Cleaned up {result['deleted']} old sessions")
+            return result["deleted"]
         except Exception as e:
             logger.error(f"Error cleaning up old sessions: {e}")
             return 0
@@ -455,6 +458,9 @@ class SessionLogService:
                 }
             )
             
+            for user_id in user_ids:
+                shift_totals_service.close_open_sessions(user_id, status="expired")
+            
             if result.modified_count > 0:
                 self._send_session_notification("bulk_cleanup", {
                     "username": "System",
@@ -499,17 +505,17 @@ class SessionLogService:
                 {"_id": 1, "username": 1, "user_id": 1, "login_time": 1}
             ).limit(5))
             
-            # Delete old sessions
-            result = self.collection.delete_many({
-                "login_time": {"$lt": cutoff_date}
-            })
+            # Archive old sessions to cold storage, then delete them in bounded chunks
+            result = RetentionService().archive_collection("session_logs", cutoff=cutoff_date)
             
             # Send comprehensive notification
             self._send_session_notification("auto_cleanup", {
                 "username": "System AutoCleanup",
                 "_id": "AUTO-CLEANUP-6M"
             }, {
-                "deleted_count": result.deleted_count,
+                "deleted_count": result["deleted"],
+                "archived_count": result["archived"],
+                "archive_files": len(result["files"]),
                 "cutoff_date": cutoff_date.isoformat(),
                 "months_old": months_old,
                 "cleanup_type": "automatic_6_month",
@@ -524,11 +530,12 @@ class SessionLogService:
                 "total_sessions_before": sessions_to_delete
             })
             
-            logger.info(f"Auto-cleanup: Deleted {result.deleted_count} sessions older than {months_old} months")
+            logger.info(f"Auto-cleanup: Archived and deleted {result['deleted']} sessions older than {months_old} months")
             
             return {
                 "success": True,
-                "deleted_count": result.deleted_count,
+                "deleted_count": result["deleted"],
+                "archived_count": result["archived"],
                 "cutoff_date": cutoff_date.isoformat(),
                 "months_old": months_old
             }
@@ -679,30 +686,22 @@ class SessionLogService:
             }
 
     def manual_cleanup_with_date_range(self, start_date=None, end_date=None, dry_run=False):
-        """Manual cleanup with specific date range (useful for testing or custom cleanup)"""
+        """
+        Manual cleanup of a login_time range (useful for testing or custom cleanup).
+
+        Goes through the session_logs retention policy like every other
+        cleanup: sessions are archived before deletion, and an end date newer
+        than the policy allows is pulled back to the policy cutoff.
+        """
         try:
-            if not start_date and not end_date:
-                # Default to 6 months ago if no dates specified
-                end_date = datetime.utcnow() - timedelta(days=180)
-                start_date = datetime(2020, 1, 1)  # Very old date to catch all old sessions
-            else:
-                if start_date:
-                    start_date = datetime.fromisoformat(start_date) if isinstance(start_date, str) else start_date
-                if end_date:
-                    end_date = datetime.fromisoformat(end_date) if isinstance(end_date, str) else end_date
-            
-            query = {}
-            if start_date and end_date:
-                query["login_time"] = {"$gte": start_date, "$lte": end_date}
-            elif start_date:
-                query["login_time"] = {"$gte": start_date}
-            elif end_date:
-                query["login_time"] = {"$lte": end_date}
+            if start_date:
+                start_date = datetime.fromisoformat(start_date) if isinstance(start_date, str) else start_date
+            if end_date:
+                end_date = datetime.fromisoformat(end_date) if isinstance(end_date, str) else end_date
             
-            # Count sessions that would be affected
-            sessions_count = self.collection.count_documents(query)
+            result, cutoff, clamped = self._archive_sessions(end_date, since=start_date, dry_run=dry_run)
             
-            if sessions_count == 0:
+            if not result["eligible"]:
                 return {
                     "success": True,
                     "deleted_count": 0,
@@ -710,41 +709,31 @@ class SessionLogService:
                     "dry_run": dry_run
                 }
             
-            # Get sample sessions for reporting - FIXED: use _id instead of session_id
-            sample_sessions = list(self.collection.find(
-                query,
-                {"_id": 1, "username": 1, "login_time": 1, "status": 1}
-            ).limit(10))
-            
-            deleted_count = 0
             if not dry_run:
-                # Actually delete the sessions
-                result = self.collection.delete_many(query)
-                deleted_count = result.deleted_count
-                
-                # Send notification - FIXED: use _id
                 self._send_session_notification("manual_cleanup", {
                     "username": "Manual Cleanup",
                     "_id": "MANUAL-CLEANUP"
                 }, {
-                    "deleted_count": deleted_count,
+                    "deleted_count": result["deleted"],
+                    "archived_count": result["archived"],
                     "start_date": start_date.isoformat() if start_date else None,
-                    "end_date": end_date.isoformat() if end_date else None,
-                    "cleanup_type": "manual_date_range",
-                    "sample_sessions": sample_sessions
+                    "end_date": cutoff.isoformat(),
+                    "cleanup_type": "manual_date_range"
                 })
             
-            logger.info(f"Manual cleanup ({'DRY RUN' if dry_run else 'EXECUTED'}): {sessions_count} sessions {'would be' if dry_run else 'were'} deleted")
+            logger.info(f"Manual cleanup ({'DRY RUN' if dry_run else 'EXECUTED'}): {result['eligible']} sessions {'would be' if dry_run else 'were'} archived and deleted")
             
             return {
                 "success": True,
-                "sessions_found": sessions_count,
-                "deleted_count": deleted_count if not dry_run else 0,
-                "sample_sessions": sample_sessions,
+                "sessions_found": result["eligible"],
+                "deleted_count": result["deleted"],
+                "archived_count": result["archived"],
+                "archive_files": result["files"],
                 "dry_run": dry_run,
                 "date_range": {
                     "start_date": start_date.isoformat() if start_date else None,
-                    "end_date": end_date.isoformat() if end_date else None
+                    "end_date": cutoff.isoformat(),
+                    "end_date_clamped_to_policy": clamped
                 }
             }
             
@@ -962,8 +951,33 @@ class SessionLogService:
             }
     
     
+    def _archive_sessions(self, cutoff, since=None, archive_root=None, dry_run=False):
+        """
+        Archive and delete sessions through the session_logs retention policy.
+
+        The cutoff is never newer than the policy's, so manual and scheduled
+        cleanups can't remove sessions the policy still keeps, and everything
+        removed lands in the same JSONL archive the retention job writes.
+
+        Returns:
+            tuple: (archive stats, effective cutoff, whether the cutoff was clamped)
+        """
+        retention = RetentionService(archive_root=archive_root)
+        policy_cutoff = retention.policy_cutoff("session_logs")
+        clamped = cutoff is None or cutoff > policy_cutoff
+        effective_cutoff = policy_cutoff if clamped else cutoff
+        stats = retention.archive_collection("session_logs", cutoff=effective_cutoff, since=since, dry_run=dry_run)
+        stats["index_file"] = retention._index_path("session_logs")
+        return stats, effective_cutoff, clamped
+
     def manual_cleanup_with_export(self, start_date=None, end_date=None, export_path=None, dry_run=False):
-        """Manual cleanup with automatic CSV export of affected data before deletion"""
+        """
+        Manual cleanup of a login_time range, archived to cold JSONL storage
+        before deletion (same policy and archive as the retention job).
+
+        `export_path` overrides the archive root directory. An end date newer
+        than the session_logs policy allows is pulled back to the policy cutoff.
+        """
         try:
             # Parse and validate dates
             if start_date:
@@ -971,24 +985,11 @@ class SessionLogService:
             if end_date:
                 end_date = datetime.fromisoformat(end_date) if isinstance(end_date, str) else end_date
             
-            # Default to 6 months ago if no dates specified
-            if not start_date and not end_date:
-                end_date = datetime.utcnow() - timedelta(days=180)
-                start_date = datetime(2020, 1, 1)
-            
-            # Build query
-            query = {}
-            if start_date and end_date:
-                query["login_time"] = {"$gte": start_date, "$lte": end_date}
-            elif start_date:
-                query["login_time"] = {"$gte": start_date}
-            elif end_date:
-                query["login_time"] = {"$lte": end_date}
-            
-            # Get all sessions that will be affected
-            sessions_to_export = list(self.collection.find(query).sort("login_time", -1))
+            result, cutoff, clamped = self._archive_sessions(
+                end_date, since=start_date, archive_root=export_path, dry_run=dry_run
+            )
             
-            if not sessions_to_export:
+            if not result["eligible"]:
                 return {
                     "success": True,
                     "deleted_count": 0,
@@ -998,58 +999,33 @@ class SessionLogService:
                     "export_file": None
                 }
             
-            # Generate export filename if not provided
-            if not export_path:
-                timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-                date_range = f"{start_date.strftime('%Y%m%d') if start_date else 'start'}_to_{end_date.strftime('%Y%m%d') if end_date else 'end'}"
-                export_filename = f"session_cleanup_export_{date_range}_{timestamp}.csv"
-                export_path = os.path.join("exports", export_filename)
-            
-            # Ensure export directory exists
-            os.makedirs(os.path.dirname(export_path), exist_ok=True)
-            
-            # Export data to CSV before deletion
-            export_result = self._export_sessions_to_csv(sessions_to_export, export_path)
-            
-            if not export_result["success"]:
-                return {
-                    "success": False,
-                    "error": f"Failed to export data: {export_result['error']}",
-                    "deleted_count": 0,
-                    "exported_count": 0
-                }
-            
-            deleted_count = 0
             if not dry_run:
-                # Actually delete the sessions after successful export
-                delete_result = self.collection.delete_many(query)
-                deleted_count = delete_result.deleted_count
-                
-                # Send notification with export info - FIXED: use _id
                 self._send_session_notification("manual_cleanup_with_export", {
                     "username": "Manual Cleanup with Export",
                     "_id": "MANUAL-CLEANUP-EXPORT"
                 }, {
-                    "deleted_count": deleted_count,
-                    "exported_count": len(sessions_to_export),
-                    "export_file": export_path,
+                    "deleted_count": result["deleted"],
+                    "exported_count": result["archived"],
+                    "export_file": result["index_file"],
                     "start_date": start_date.isoformat() if start_date else None,
-                    "end_date": end_date.isoformat() if end_date else None,
+                    "end_date": cutoff.isoformat(),
                     "cleanup_type": "manual_with_export"
                 })
             
-            logger.info(f"Manual cleanup with export ({'DRY RUN' if dry_run else 'EXECUTED'}): {len(sessions_to_export)} sessions {'would be' if dry_run else 'were'} deleted, exported to {export_path}")
+            logger.info(f"Manual cleanup with export ({'DRY RUN' if dry_run else 'EXECUTED'}): {result['eligible']} sessions {'would be' if dry_run else 'were'} archived and deleted")
             
             return {
                 "success": True,
-                "sessions_found": len(sessions_to_export),
-                "deleted_count": deleted_count if not dry_run else 0,
-                "exported_count": len(sessions_to_export),
-                "export_file": export_path,
+                "sessions_found": result["eligible"],
+                "deleted_count": result["deleted"],
+                "exported_count": result["archived"],
+                "export_file": result["index_file"],
+                "archive_files": result["files"],
                 "dry_run": dry_run,
                 "date_range": {
                     "start_date": start_date.isoformat() if start_date else None,
-                    "end_date": end_date.isoformat() if end_date else None
+                    "end_date": cutoff.isoformat(),
+                    "end_date_clamped_to_policy": clamped
                 }
             }
             
@@ -1057,64 +1033,17 @@ class SessionLogService:
             logger.error(f"Error in manual cleanup with export: {e}")
             return {"success": False, "error": str(e)}
 
-    def _export_sessions_to_csv(self, sessions_data, export_path):
-        """Export session data to CSV file"""
-        try:
-            # Removed 'ip_address' and 'user_agent' from fieldnames
-            fieldnames = [
-                'session_id', 'user_id', 'username', 'branch_id',
-                'login_time', 'logout_time', 'session_duration', 'status',
-                'logout_reason', 'source'
-            ]
-            
-            with open(export_path, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                
-                for session in sessions_data:
-                    # No conversion needed - _id is already string
-                    
-                    # Format datetime fields for CSV - FIXED: use _id for session_id
-                    row_data = {
-                        'session_id': session.get('_id', ''),  # FIXED: use _id
-                        'user_id': session.get('user_id', ''),
-                        'username': session.get('username', ''),
-                        'branch_id': session.get('branch_id', ''),
-                        'login_time': session.get('login_time').isoformat() if session.get('login_time') else '',
-                        'logout_time': session.get('logout_time').isoformat() if session.get('logout_time') else '',
-                        'session_duration': session.get('session_duration', ''),
-                        'status': session.get('status', ''),
-                        'logout_reason': session.get('logout_reason', ''),
-                        'source': session.get('source', '')
-                    }
-                    writer.writerow(row_data)
-            
-            logger.info(f"Successfully exported {len(sessions_data)} sessions to {export_path}")
-            return {
-                "success": True,
-                "exported_count": len(sessions_data),
-                "export_path": export_path
-            }
-            
-        except Exception as e:
-            logger.error(f"Error exporting sessions to CSV: {e}")
-            return {
-                "success": False,
-                "error": str(e)
-            }
-
     def scheduled_cleanup_with_export(self, retention_months=6, export_enabled=True):
-        """Enhanced automatic cleanup that exports data before deletion"""
+        """
+        Automatic cleanup through the session_logs retention policy. Sessions
+        are always archived before deletion; `export_enabled` is kept for
+        callers but no longer skips the archive.
+        """
         try:
-            cutoff_date = datetime.utcnow() - timedelta(days=retention_months * 30)
-            
-            # Get sessions to be deleted
-            sessions_to_delete = list(self.collection.find(
-                {"login_time": {"$lt": cutoff_date}}
-            ).sort("login_time", -1))
+            result, cutoff, _ = self._archive_sessions(datetime.utcnow() - timedelta(days=retention_months * 30))
             
-            if not sessions_to_delete:
-                logger.info("No sessions older than 6 months found for cleanup")
+            if not result["eligible"]:
+                logger.info("No sessions older than the retention cutoff found for cleanup")
                 return {
                     "success": True,
                     "deleted_count": 0,
@@ -1122,47 +1051,26 @@ class SessionLogService:
                     "message": "No sessions to cleanup"
                 }
             
-            export_path = None
-            if export_enabled:
-                # Generate automatic export filename
-                timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-                export_filename = f"auto_cleanup_export_{retention_months}months_{timestamp}.csv"
-                export_path = os.path.join("exports", "auto_cleanup", export_filename)
-                
-                # Export before deletion
-                export_result = self._export_sessions_to_csv(sessions_to_delete, export_path)
-                
-                if not export_result["success"]:
-                    logger.error(f"Failed to export data before cleanup: {export_result['error']}")
-                    # Continue with cleanup even if export fails, but log the issue
-                    export_path = None
-            
-            # Delete old sessions
-            result = self.collection.delete_many({
-                "login_time": {"$lt": cutoff_date}
-            })
-            
-            # Send notification - FIXED: use _id
             self._send_session_notification("auto_cleanup_with_export", {
                 "username": "System AutoCleanup",
                 "_id": "AUTO-CLEANUP-EXPORT"
             }, {
-                "deleted_count": result.deleted_count,
-                "exported_count": len(sessions_to_delete),
-                "export_file": export_path,
-                "cutoff_date": cutoff_date.isoformat(),
+                "deleted_count": result["deleted"],
+                "exported_count": result["archived"],
+                "export_file": result["index_file"],
+                "cutoff_date": cutoff.isoformat(),
                 "retention_months": retention_months,
                 "export_enabled": export_enabled
             })
             
-            logger.info(f"Auto-cleanup with export: Deleted {result.deleted_count} sessions, exported to {export_path}")
+            logger.info(f"Auto-cleanup with export: archived and deleted {result['deleted']} sessions older than {cutoff.isoformat()}")
             
             return {
                 "success": True,
-                "deleted_count": result.deleted_count,
-                "exported_count": len(sessions_to_delete),
-                "export_file": export_path,
-                "cutoff_date": cutoff_date.isoformat(),
+                "deleted_count": result["deleted"],
+                "exported_count": result["archived"],
+                "export_file": result["index_file"],
+                "cutoff_date": cutoff.isoformat(),
                 "retention_months": retention_months
             }
             
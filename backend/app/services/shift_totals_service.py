@@ -0,0 +1,298 @@
+from datetime import datetime
+import logging
+
+from pymongo import ReturnDocument
+
+from ..database import db_manager
+
+logger = logging.getLogger(__name__)
+
+# Money fields are rounded to centavos when reported
+MONEY_FIELDS = ('gross_sales', 'total_discounts', 'void_amount', 'return_amount')
+
+
+class ShiftTotalsService:
+    """
+    Per-session running totals for cashier shifts.
+
+    One document per session in `shift_totals` (keyed by the session_logs
+    _id), opened at login and closed at logout. POS sale paths stamp the
+    cashier's open session on the sale and `$inc` its totals; voids and
+    partial returns are charged back to the session the sale was made in. The shift summary at
+    logout is a single document read; `reconcile_session` recomputes the same
+    figures from `sales` via the (cashier_id, transaction_date) index.
+    """
+
+    def __init__(self):
+        self.db = db_manager.get_database()
+        self.collection = self.db.shift_totals
+        self.sales_collection = self.db.sales
+        self.session_collection = self.db.session_logs
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        """Create indexes for open-session lookups and reconciliation"""
+        try:
+            self.collection.create_index([("cashier_id", 1), ("status", 1), ("login_time", -1)], background=True)
+            self.sales_collection.create_index([("cashier_id", 1), ("transaction_date", 1)], background=True)
+        except Exception as e:
+            logger.warning(f"Could not create shift totals indexes: {e}")
+
+    @staticmethod
+    def _empty_totals():
+        return {
+            'sales_count': 0,
+            'gross_sales': 0.0,
+            'total_discounts': 0.0,
+            'void_count': 0,
+            'void_amount': 0.0,
+            'return_count': 0,
+            'return_amount': 0.0,
+            'payment_methods': {}
+        }
+
+    @staticmethod
+    def _sale_figures(sale):
+        """Amount, discount and payment method as the shift summary counts them"""
+        amount = sale.get('final_amount', sale.get('total_amount', 0)) or 0
+        discount = sale.get('total_discount', sale.get('points_discount', 0)) or 0
+        payment_method = str(sale.get('payment_method') or 'unknown').replace('.', '_').replace('$', '_')
+        return float(amount), float(discount), payment_method
+
+    # ================================================================
+    # SESSION LIFECYCLE
+    # ================================================================
+
+    def open_session(self, session):
+        """Start an empty running total for a new login session"""
+        try:
+            self.collection.update_one(
+                {'_id': session['_id']},
+                {
+                    '$setOnInsert': {
+                        'cashier_id': session.get('user_id'),
+                        'username': session.get('username'),
+                        'branch_id': session.get('branch_id'),
+                        'login_time': session.get('login_time'),
+                        'status': 'open',
+                        **self._empty_totals(),
+                        'created_at': datetime.utcnow()
+                    }
+                },
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Error opening shift totals for {session.get('_id')}: {e}")
+
+    def close_session(self, session_id, logout_time=None, status='closed'):
+        """Close a session's running total and return the final document (or None)"""
+        try:
+            return self.collection.find_one_and_update(
+                {'_id': session_id},
+                {'$set': {
+                    'status': status,
+                    'logout_time': logout_time or datetime.utcnow(),
+                    'updated_at': datetime.utcnow()
+                }},
+                return_document=ReturnDocument.AFTER
+            )
+        except Exception as e:
+            logger.error(f"Error closing shift totals for {session_id}: {e}")
+            return None
+
+    def close_open_sessions(self, cashier_id, status='closed'):
+        """Close every open running total of a cashier (sessions replaced or expired by a new login)"""
+        try:
+            self.collection.update_many(
+                {'cashier_id': cashier_id, 'status': 'open'},
+                {'$set': {'status': status, 'logout_time': datetime.utcnow(), 'updated_at': datetime.utcnow()}}
+            )
+        except Exception as e:
+            logger.error(f"Error closing open shift totals for {cashier_id}: {e}")
+
+    def get_open_session_id(self, cashier_id):
+        """Session the cashier's sales are currently charged to, or None"""
+        if not cashier_id:
+            return None
+        try:
+            shift = self.collection.find_one(
+                {'cashier_id': str(cashier_id), 'status': 'open'},
+                {'_id': 1},
+                sort=[('login_time', -1)]
+            )
+            return shift['_id'] if shift else None
+        except Exception as e:
+            logger.error(f"Error resolving open shift for {cashier_id}: {e}")
+            return None
+
+    # ================================================================
+    # RUNNING TOTALS
+    # ================================================================
+
+    def record_sale(self, sale):
+        """Add a completed sale to its session (sale must carry `session_id`)"""
+        session_id = sale.get('session_id')
+        if not session_id:
+            return
+        try:
+            amount, discount, payment_method = self._sale_figures(sale)
+            self.collection.update_one(
+                {'_id': session_id},
+                {
+                    '$inc': {
+                        'sales_count': 1,
+                        'gross_sales': amount,
+                        'total_discounts': discount,
+                        f'payment_methods.{payment_method}.count': 1,
+                        f'payment_methods.{payment_method}.amount': amount
+                    },
+                    '$set': {'last_sale_at': sale.get('transaction_date') or datetime.utcnow()}
+                }
+            )
+        except Exception as e:
+            # Totals can be reconciled later - never fail the sale over them
+            logger.error(f"Error recording sale in shift totals for {session_id}: {e}")
+
+    def record_void(self, sale):
+        """Charge a voided sale back to the session it was made in"""
+        session_id = sale.get('session_id')
+        if not session_id:
+            return
+        try:
+            amount, _, _ = self._sale_figures(sale)
+            self.collection.update_one(
+                {'_id': session_id},
+                {'$inc': {'void_count': 1, 'void_amount': amount}}
+            )
+        except Exception as e:
+            logger.error(f"Error recording void in shift totals for {session_id}: {e}")
+
+    def record_return(self, sale, amount):
+        """Charge a partial return back to the session the sale was made in"""
+        session_id = sale.get('session_id')
+        if not session_id:
+            return
+        try:
+            self.collection.update_one(
+                {'_id': session_id},
+                {'$inc': {'return_count': 1, 'return_amount': float(amount or 0)}}
+            )
+        except Exception as e:
+            logger.error(f"Error recording return in shift totals for {session_id}: {e}")
+
+    def get_totals(self, session_id):
+        """Running totals for a session, rounded for display (None if not tracked)"""
+        shift = self.collection.find_one({'_id': session_id})
+        if not shift:
+            return None
+        return self._format_totals(shift)
+
+    def _format_totals(self, totals):
+        formatted = {**self._empty_totals(), **totals}
+        for field in MONEY_FIELDS:
+            formatted[field] = round(float(formatted[field] or 0), 2)
+        formatted['net_sales'] = round(formatted['gross_sales'] - formatted['void_amount'] - formatted['return_amount'], 2)
+        formatted['payment_methods'] = {
+            method: {'count': split.get('count', 0), 'amount': round(float(split.get('amount', 0)), 2)}
+            for method, split in (formatted.get('payment_methods') or {}).items()
+        }
+        return formatted
+
+    # ================================================================
+    # RECONCILIATION
+    # ================================================================
+
+    def aggregate_window(self, cashier_id, start, end):
+        """
+        Recompute shift figures from `sales` for a cashier and time window.
+        Uses the (cashier_id, transaction_date) index; voids are attributed
+        to the window the sale was made in, like the running totals.
+        """
+        amount = {'$ifNull': ['$final_amount', {'$ifNull': ['$total_amount', 0]}]}
+        discount = {'$ifNull': ['$total_discount', {'$ifNull': ['$points_discount', 0]}]}
+        is_void = {'$or': [{'$eq': ['$is_voided', True]}, {'$eq': ['$status', 'voided']}]}
+
+        pipeline = [
+            {'$match': {'cashier_id': cashier_id, 'transaction_date': {'$gte': start, '$lte': end}}},
+            {'$group': {
+                '_id': {'$ifNull': ['$payment_method', 'unknown']},
+                'count': {'$sum': 1},
+                'amount': {'$sum': amount},
+                'discounts': {'$sum': discount},
+                'void_count': {'$sum': {'$cond': [is_void, 1, 0]}},
+                'void_amount': {'$sum': {'$cond': [is_void, amount, 0]}},
+                'return_count': {'$sum': {'$size': {'$ifNull': ['$returns', []]}}},
+                'return_amount': {'$sum': {'$ifNull': ['$returned_amount', 0]}}
+            }}
+        ]
+
+        totals = self._empty_totals()
+        for row in self.sales_collection.aggregate(pipeline):
+            totals['sales_count'] += row['count']
+            totals['gross_sales'] += row['amount']
+            totals['total_discounts'] += row['discounts']
+            totals['void_count'] += row['void_count']
+            totals['void_amount'] += row['void_amount']
+            totals['return_count'] += row['return_count']
+            totals['return_amount'] += row['return_amount']
+            totals['payment_methods'][str(row['_id'])] = {'count': row['count'], 'amount': row['amount']}
+        return self._format_totals(totals)
+
+    def reconcile_session(self, session_id, fix=False):
+        """
+        Compare a session's running totals with the sales it covers.
+
+        Returns:
+            dict: maintained and recomputed totals, and the fields that differ
+        """
+        try:
+            session = self.session_collection.find_one({'_id': session_id})
+            if not session:
+                raise ValueError(f"Session {session_id} not found")
+
+            end = session.get('logout_time') or datetime.utcnow()
+            recomputed = self.aggregate_window(session.get('user_id'), session.get('login_time'), end)
+            maintained = self.get_totals(session_id)
+
+            differences = [
+                field for field in ('sales_count', 'gross_sales', 'total_discounts', 'void_count', 'void_amount',
+                                    'return_count', 'return_amount')
+                if maintained is None or abs(float(maintained[field]) - float(recomputed[field])) > 0.005
+            ]
+
+            if fix and differences:
+                self.collection.update_one(
+                    {'_id': session_id},
+                    {
+                        '$set': {
+                            **{key: recomputed[key] for key in self._empty_totals()},
+                            'reconciled_at': datetime.utcnow()
+                        },
+                        '$setOnInsert': {
+                            'cashier_id': session.get('user_id'),
+                            'username': session.get('username'),
+                            'branch_id': session.get('branch_id'),
+                            'login_time': session.get('login_time'),
+                            'status': 'open' if session.get('status') == 'active' else 'closed'
+                        }
+                    },
+                    upsert=True
+                )
+
+            return {
+                'session_id': session_id,
+                'maintained': maintained,
+                'recomputed': recomputed,
+                'differences': differences,
+                'fixed': bool(fix and differences)
+            }
+
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Error reconciling shift totals for {session_id}: {e}")
+            raise Exception(f"Error reconciling shift totals: {str(e)}")
+
+
+# Singleton instance
+shift_totals_service = ShiftTotalsService()
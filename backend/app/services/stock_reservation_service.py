@@ -0,0 +1,439 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+import logging
+import uuid
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from ..database import db_manager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOLD_MINUTES = 15
+MAX_HOLD_MINUTES = 60
+# A checkout that claimed a hold but never committed or released it
+# (crashed worker) is released this long after the hold expired
+COMMIT_GRACE_MINUTES = 10
+# Finished reservations are kept this long for auditing, then the TTL index drops them
+PURGE_AFTER_DAYS = 7
+
+# Reservation states that still count towards the reserved quantities
+OPEN_STATUSES = ['held', 'committing']
+
+
+class StockReservationService:
+    """
+    TTL-based stock holds for online carts and checkout.
+
+    A reservation (`stock_reservations`) holds quantities of one or more
+    products for a customer until `expires_at`. Per-product totals of open
+    holds live in `reserved_stock` and are raised/lowered atomically with
+    conditional `$inc`, so two carts can never both reserve the last units:
+    availability is on-hand (active batches) minus reserved.
+
+    Lifecycle:
+        reserve -> held
+        claim_for_checkout -> committing (can no longer expire or be released by the job)
+        commit -> committed (stock has been deducted FIFO by the order)
+        release / release_expired -> released
+
+    Releasing and committing flip the reservation first and lower the
+    totals second, so a crash in between over-reserves (never oversells);
+    `rebuild_reserved_quantities` repairs that drift.
+    """
+
+    def __init__(self):
+        self.db = db_manager.get_database()
+        self.reservations = self.db.stock_reservations
+        self.reserved_stock = self.db.reserved_stock
+        self.products_collection = self.db.products
+        self.batch_collection = self.db.batches
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        """Indexes for the expiry sweep, per-owner lookups and TTL purge"""
+        try:
+            self.reservations.create_index([("status", 1), ("expires_at", 1)], background=True)
+            self.reservations.create_index([("owner_id", 1), ("status", 1)], background=True)
+            self.reservations.create_index("release_token", sparse=True, background=True)
+            # Only finished reservations get purge_at, so open holds are never dropped by TTL
+            self.reservations.create_index("purge_at", expireAfterSeconds=0, background=True)
+        except Exception as e:
+            logger.warning(f"Could not create stock reservation indexes: {e}")
+
+    # ================================================================
+    # AVAILABILITY
+    # ================================================================
+
+    def get_on_hand(self, product_ids):
+        """product_id -> quantity remaining in active batches (one aggregation)"""
+        return {
+            row['_id']: row['on_hand']
+            for row in self.batch_collection.aggregate([
+                {'$match': {
+                    'product_id': {'$in': list(product_ids)},
+                    'status': 'active',
+                    'quantity_remaining': {'$gt': 0}
+                }},
+                {'$group': {'_id': '$product_id', 'on_hand': {'$sum': '$quantity_remaining'}}}
+            ])
+        }
+
+    def get_reserved(self, product_ids):
+        """product_id -> quantity held by open reservations"""
+        return {
+            doc['_id']: max(doc.get('reserved', 0), 0)
+            for doc in self.reserved_stock.find({'_id': {'$in': list(product_ids)}})
+        }
+
+    def get_availability(self, product_ids):
+        """product_id -> {on_hand, reserved, available}"""
+        product_ids = list(product_ids)
+        on_hand = self.get_on_hand(product_ids)
+        reserved = self.get_reserved(product_ids)
+        return {
+            product_id: {
+                'on_hand': on_hand.get(product_id, 0),
+                'reserved': reserved.get(product_id, 0),
+                'available': max(on_hand.get(product_id, 0) - reserved.get(product_id, 0), 0)
+            }
+            for product_id in product_ids
+        }
+
+    # ================================================================
+    # RESERVE
+    # ================================================================
+
+    @staticmethod
+    def _normalize_items(items):
+        """Merge duplicate lines; quantities must be positive integers"""
+        quantities = defaultdict(int)
+        for item in items or []:
+            product_id = item.get('product_id')
+            quantity = item.get('quantity')
+            if not product_id:
+                raise ValueError("Each item requires a product_id")
+            if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+                raise ValueError(f"Invalid quantity for {product_id}: {quantity}")
+            quantities[product_id] += quantity
+        if not quantities:
+            raise ValueError("At least one item is required")
+        return [{'product_id': product_id, 'quantity': quantity} for product_id, quantity in quantities.items()]
+
+    def _hold_line(self, product_id, quantity, on_hand):
+        """Atomically add `quantity` to the product's reserved total if it still fits in `on_hand`"""
+        try:
+            self.reserved_stock.update_one({'_id': product_id}, {'$setOnInsert': {'reserved': 0}}, upsert=True)
+        except DuplicateKeyError:
+            pass  # another cart created the total concurrently
+        return self.reserved_stock.update_one(
+            {'_id': product_id, 'reserved': {'$lte': on_hand - quantity}},
+            {'$inc': {'reserved': quantity}, '$set': {'updated_at': datetime.utcnow()}}
+        ).modified_count == 1
+
+    def _unreserve(self, items):
+        """Lower the reserved totals for released/committed lines"""
+        if not items:
+            return
+        now = datetime.utcnow()
+        quantities = defaultdict(int)
+        for item in items:
+            quantities[item['product_id']] += item['quantity']
+        self.reserved_stock.bulk_write([
+            UpdateOne({'_id': product_id}, {'$inc': {'reserved': -quantity}, '$set': {'updated_at': now}})
+            for product_id, quantity in quantities.items()
+        ], ordered=False)
+        # Clamp totals a missed increment could have pushed below zero
+        self.reserved_stock.update_many(
+            {'_id': {'$in': list(quantities)}, 'reserved': {'$lt': 0}},
+            {'$set': {'reserved': 0}}
+        )
+
+    def _release_owner_holds(self, owner_id, reason):
+        """Release every unclaimed hold of `owner_id`; returns how many were released"""
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        released = self.reservations.update_many(
+            {'owner_id': owner_id, 'status': 'held'},
+            {'$set': {
+                'status': 'released',
+                'release_reason': reason,
+                'release_token': token,
+                'released_at': now,
+                'updated_at': now,
+                'purge_at': now + timedelta(days=PURGE_AFTER_DAYS)
+            }}
+        )
+        if released.modified_count:
+            self._unreserve([
+                item
+                for reservation in self.reservations.find({'release_token': token}, {'items': 1})
+                for item in reservation.get('items', [])
+            ])
+        return released.modified_count
+
+    def reserve(self, owner_id, items, hold_minutes=None):
+        """
+        Hold stock for a cart.
+
+        A customer has a single open cart hold: the owner's previous holds
+        are released first (so their units count as available again) and
+        replaced by this one. Holds already claimed for checkout are kept.
+
+        Args:
+            owner_id: customer (or cart) the hold belongs to
+            items: list of {'product_id': str, 'quantity': int}
+            hold_minutes: hold duration (default 15, max 60)
+
+        Returns:
+            dict: success flag and the reservation, or the errors and
+            per-product availability when any line cannot be held (nothing
+            is held in that case)
+        """
+        try:
+            if not owner_id:
+                raise ValueError("owner_id is required")
+            items = self._normalize_items(items)
+            hold_minutes = min(int(hold_minutes or DEFAULT_HOLD_MINUTES), MAX_HOLD_MINUTES)
+            if hold_minutes <= 0:
+                raise ValueError("hold_minutes must be positive")
+
+            self._release_owner_holds(owner_id, reason='replaced')
+
+            product_ids = [item['product_id'] for item in items]
+            products = {
+                product['_id']: product
+                for product in self.products_collection.find(
+                    {'_id': {'$in': product_ids}, 'isDeleted': {'$ne': True}},
+                    {'product_name': 1}
+                )
+            }
+            on_hand = self.get_on_hand(product_ids)
+
+            errors, held = [], []
+            for item in items:
+                product = products.get(item['product_id'])
+                if not product:
+                    errors.append(f"Product {item['product_id']} not found")
+                    break
+                if not self._hold_line(item['product_id'], item['quantity'], on_hand.get(item['product_id'], 0)):
+                    errors.append(f"Insufficient stock for {product.get('product_name', item['product_id'])}")
+                    break
+                held.append(item)
+
+            if errors:
+                # All or nothing: give back the lines already held
+                self._unreserve(held)
+                return {
+                    'success': False,
+                    'errors': errors,
+                    'availability': self.get_availability(product_ids)
+                }
+
+            now = datetime.utcnow()
+            reservation = {
+                '_id': f"RSV-{uuid.uuid4().hex[:16].upper()}",
+                'owner_id': owner_id,
+                'items': [
+                    {**item, 'product_name': products[item['product_id']].get('product_name')}
+                    for item in items
+                ],
+                'status': 'held',
+                'order_id': None,
+                'expires_at': now + timedelta(minutes=hold_minutes),
+                'created_at': now,
+                'updated_at': now
+            }
+            try:
+                self.reservations.insert_one(reservation)
+            except Exception:
+                self._unreserve(items)
+                raise
+
+            return {'success': True, 'data': reservation}
+
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Error reserving stock: {str(e)}")
+            raise Exception(f"Error reserving stock: {str(e)}")
+
+    def get_reservation(self, reservation_id):
+        return self.reservations.find_one({'_id': reservation_id})
+
+    # ================================================================
+    # CHECKOUT
+    # ================================================================
+
+    def claim_for_checkout(self, reservation_id, owner_id):
+        """
+        Lock an unexpired hold for checkout (held -> committing).
+
+        Raises:
+            ValueError: the reservation is missing, belongs to someone else,
+            expired or was already released/committed
+        """
+        now = datetime.utcnow()
+        reservation = self.reservations.find_one_and_update(
+            {'_id': reservation_id, 'owner_id': owner_id, 'status': 'held', 'expires_at': {'$gt': now}},
+            {'$set': {'status': 'committing', 'claimed_at': now, 'updated_at': now}},
+            return_document=ReturnDocument.AFTER
+        )
+        if reservation:
+            return reservation
+
+        existing = self.reservations.find_one({'_id': reservation_id}, {'owner_id': 1, 'status': 1, 'expires_at': 1})
+        if not existing or existing.get('owner_id') != owner_id:
+            raise ValueError(f"Reservation {reservation_id} not found")
+        if existing['status'] == 'held':
+            raise ValueError(f"Reservation {reservation_id} has expired")
+        raise ValueError(f"Reservation {reservation_id} is already {existing['status']}")
+
+    def commit(self, reservation_id, order_id):
+        """Mark a claimed hold as fulfilled by `order_id` and drop it from the reserved totals"""
+        try:
+            now = datetime.utcnow()
+            reservation = self.reservations.find_one_and_update(
+                {'_id': reservation_id, 'status': 'committing'},
+                {'$set': {
+                    'status': 'committed',
+                    'order_id': order_id,
+                    'committed_at': now,
+                    'updated_at': now,
+                    'purge_at': now + timedelta(days=PURGE_AFTER_DAYS)
+                }}
+            )
+            if reservation:
+                self._unreserve(reservation['items'])
+            return reservation is not None
+
+        except Exception as e:
+            # The order exists at this point; leftover holds expire via the sweep
+            logger.error(f"Failed to commit reservation {reservation_id}: {e}")
+            return False
+
+    def release(self, reservation_id, owner_id, reason='released'):
+        """
+        Give back an open (held or claimed) reservation's stock; False if it
+        was not open or does not belong to `owner_id`
+        """
+        if not owner_id:
+            raise ValueError("owner_id is required")
+        try:
+            now = datetime.utcnow()
+            reservation = self.reservations.find_one_and_update(
+                {'_id': reservation_id, 'owner_id': owner_id, 'status': {'$in': OPEN_STATUSES}},
+                {'$set': {
+                    'status': 'released',
+                    'release_reason': reason,
+                    'released_at': now,
+                    'updated_at': now,
+                    'purge_at': now + timedelta(days=PURGE_AFTER_DAYS)
+                }}
+            )
+            if reservation:
+                self._unreserve(reservation['items'])
+            return reservation is not None
+
+        except Exception as e:
+            logger.error(f"Error releasing reservation {reservation_id}: {str(e)}")
+            raise Exception(f"Error releasing reservation: {str(e)}")
+
+    # ================================================================
+    # EXPIRY SWEEP & RECONCILIATION
+    # ================================================================
+
+    def release_expired(self, now=None):
+        """
+        Release every expired hold in bulk: one update claims them under a
+        token, one read collects their lines and one bulk write lowers the
+        reserved totals.
+
+        Returns:
+            dict: reservations released and units returned per product
+        """
+        try:
+            now = now or datetime.utcnow()
+            token = uuid.uuid4().hex
+            claimed = self.reservations.update_many(
+                {'$or': [
+                    {'status': 'held', 'expires_at': {'$lte': now}},
+                    {'status': 'committing', 'expires_at': {'$lte': now - timedelta(minutes=COMMIT_GRACE_MINUTES)}}
+                ]},
+                {'$set': {
+                    'status': 'released',
+                    'release_reason': 'expired',
+                    'release_token': token,
+                    'released_at': now,
+                    'updated_at': now,
+                    'purge_at': now + timedelta(days=PURGE_AFTER_DAYS)
+                }}
+            )
+            if not claimed.modified_count:
+                return {'released_count': 0, 'units_released': {}}
+
+            items = [
+                item
+                for reservation in self.reservations.find({'release_token': token}, {'items': 1})
+                for item in reservation.get('items', [])
+            ]
+            self._unreserve(items)
+
+            units = defaultdict(int)
+            for item in items:
+                units[item['product_id']] += item['quantity']
+
+            logger.info(f"Released {claimed.modified_count} expired stock reservation(s)")
+            return {'released_count': claimed.modified_count, 'units_released': dict(units)}
+
+        except Exception as e:
+            logger.error(f"Error releasing expired reservations: {str(e)}")
+            raise Exception(f"Error releasing expired reservations: {str(e)}")
+
+    def rebuild_reserved_quantities(self, dry_run=False):
+        """
+        Recompute `reserved_stock` from the open reservations and overwrite
+        the totals that drifted.
+
+        Returns:
+            dict: product_id -> {'stored', 'expected'} for each drifted product
+        """
+        try:
+            expected = {
+                row['_id']: row['reserved']
+                for row in self.reservations.aggregate([
+                    {'$match': {'status': {'$in': OPEN_STATUSES}}},
+                    {'$unwind': '$items'},
+                    {'$group': {'_id': '$items.product_id', 'reserved': {'$sum': '$items.quantity'}}}
+                ])
+            }
+            stored = {doc['_id']: doc.get('reserved', 0) for doc in self.reserved_stock.find({}, {'reserved': 1})}
+
+            drifted = {
+                product_id: {'stored': stored.get(product_id, 0), 'expected': expected.get(product_id, 0)}
+                for product_id in set(expected) | set(stored)
+                if stored.get(product_id, 0) != expected.get(product_id, 0)
+            }
+
+            if drifted and not dry_run:
+                now = datetime.utcnow()
+                self.reserved_stock.bulk_write([
+                    UpdateOne(
+                        {'_id': product_id},
+                        {'$set': {'reserved': counts['expected'], 'updated_at': now, 'reconciled_at': now}},
+                        upsert=True
+                    )
+                    for product_id, counts in drifted.items()
+                ], ordered=False)
+
+            if drifted:
+                logger.info(f"Reserved stock drifted for {len(drifted)} product(s){' (dry run)' if dry_run else ''}")
+            return drifted
+
+        except Exception as e:
+            logger.error(f"Error rebuilding reserved quantities: {str(e)}")
+            raise Exception(f"Error rebuilding reserved quantities: {str(e)}")
+
+
+stock_reservation_service = StockReservationService()
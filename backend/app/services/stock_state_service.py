@@ -0,0 +1,294 @@
+from datetime import datetime
+import logging
+
+from pymongo import UpdateOne
+
+from ..database import db_manager
+
+logger = logging.getLogger(__name__)
+
+STOCK_STATES = ('ok', 'low', 'out')
+WATCHLIST_STATES = ['low', 'out']
+
+STATE_PROJECTION = {
+    'product_name': 1, 'SKU': 1, 'category_id': 1, 'stock': 1,
+    'low_stock_threshold': 1, 'stock_state': 1, 'cost_price': 1,
+    'selling_price': 1, 'supplier_id': 1,
+}
+
+WATCHLIST_PROJECTION = {
+    **STATE_PROJECTION,
+    'subcategory_name': 1, 'status': 1, 'unit': 1, 'stock_state_changed_at': 1,
+}
+
+# `classify` as an aggregation expression, so updates classify the stored stock
+STATE_EXPRESSION = {
+    '$switch': {
+        'branches': [
+            {'case': {'$lte': [{'$ifNull': ['$stock', 0]}, 0]}, 'then': 'out'},
+            {'case': {'$lte': [{'$ifNull': ['$stock', 0]}, {'$ifNull': ['$low_stock_threshold', 0]}]}, 'then': 'low'},
+        ],
+        'default': 'ok'
+    }
+}
+
+# State a product crossed into -> (alert_type, title, priority)
+ALERTS = {
+    'low': ('low_stock', "🔶 LOW STOCK ALERT", 'high'),
+    'out': ('out_of_stock', "⚠️ PRODUCT OUT OF STOCK", 'urgent'),
+    'ok': ('stock_recovered', "✅ STOCK RECOVERED", 'low'),
+}
+
+
+class StockStateService:
+    """
+    Maintained `stock_state` (ok / low / out) on every product.
+
+    Stock-changing writes pass the product as it is after the write to
+    `record_stock_levels` (or its id to `refresh`). A product's state only
+    changes through an atomic compare-and-set that classifies the stored
+    stock (not the caller's copy) against the stored state, so exactly
+    one writer observes each crossing and exactly one alert is sent for it,
+    however many sales land on an already-low product. Low-stock listings
+    are an indexed match on `stock_state` instead of a `$expr` scan.
+    """
+
+    def __init__(self):
+        self.db = db_manager.get_database()
+        self.product_collection = self.db.products
+        self._ensure_indexes()
+        self._ensure_seeded()
+
+    def _ensure_indexes(self):
+        """Index for the watchlist (state, then lowest stock first)"""
+        try:
+            self.product_collection.create_index([("stock_state", 1), ("stock", 1)], background=True)
+        except Exception as e:
+            logger.warning(f"Could not create stock state indexes: {e}")
+
+    def _ensure_seeded(self):
+        """Classify products that predate stock_state (first run, imports, sync)"""
+        try:
+            if self.product_collection.find_one({'stock_state': {'$exists': False}}, {'_id': 1}):
+                self.rebuild()
+        except Exception as e:
+            logger.warning(f"Stock state seeding warning: {e}")
+
+    # ================================================================
+    # CLASSIFICATION & CROSSING DETECTION
+    # ================================================================
+
+    @staticmethod
+    def classify(stock, low_stock_threshold):
+        """ok / low / out for a stock level (missing threshold: only empty counts)"""
+        stock = stock or 0
+        if stock <= 0:
+            return 'out'
+        if stock <= (low_stock_threshold or 0):
+            return 'low'
+        return 'ok'
+
+    def record_stock_levels(self, products, notify=True, context=None):
+        """
+        Move products whose stock now falls in another state.
+
+        Args:
+            products: product documents written to (need _id; name etc. for the
+                alert) - the state is classified from the stock stored now
+            notify: send the crossing alert (False when the caller reports it itself)
+            context: extra alert metadata, e.g. {'source': 'pos_sale', 'cashier_id': ...}
+
+        Returns:
+            list: one transition dict per product that crossed
+
+        Failures are logged and swallowed - the state must never break the
+        stock write (the reconcile command repairs drift).
+        """
+        transitions = []
+        try:
+            now = datetime.utcnow()
+            for product in products:
+                if not product:
+                    continue
+                # Atomic compare-and-set classified from the stored stock (the caller's
+                # copy may already be stale when a concurrent write lands); returns the
+                # document before the change, or None when the state already matches
+                before = self.product_collection.find_one_and_update(
+                    {'_id': product['_id'], '$expr': {'$ne': ['$stock_state', STATE_EXPRESSION]}},
+                    [{'$set': {'stock_state': STATE_EXPRESSION, 'stock_state_changed_at': now}}],
+                    projection={'stock_state': 1, 'stock': 1, 'low_stock_threshold': 1}
+                )
+                if not before:
+                    continue
+                previous = before.get('stock_state')
+                state = self.classify(before.get('stock'), before.get('low_stock_threshold'))
+
+                transition = {
+                    'product_id': product['_id'],
+                    'product_name': product.get('product_name'),
+                    'previous_state': previous,
+                    'state': state,
+                    'stock': before.get('stock', 0),
+                    'low_stock_threshold': before.get('low_stock_threshold'),
+                }
+                transitions.append(transition)
+
+                # First classification is a seed, not a crossing
+                if notify and previous:
+                    self._send_crossing_alert(transition, product, context)
+
+        except Exception as e:
+            logger.error(f"Failed to record stock states: {e}")
+        return transitions
+
+    def refresh(self, product_ids, notify=True, context=None):
+        """Re-read products after a write that did not return them and record crossings"""
+        try:
+            products = list(self.product_collection.find({'_id': {'$in': list(product_ids)}}, STATE_PROJECTION))
+        except Exception as e:
+            logger.error(f"Failed to read products for stock states: {e}")
+            return []
+        return self.record_stock_levels(products, notify=notify, context=context)
+
+    @staticmethod
+    def warning_for(transition):
+        """Checkout-facing warning text for a crossing into low/out"""
+        if transition['state'] == 'out':
+            return f"⚠️ {transition['product_name']} is now OUT OF STOCK!"
+        if transition['state'] == 'low':
+            return f"🔶 {transition['product_name']} is now LOW STOCK ({transition['stock']} remaining)"
+        return None
+
+    def _send_crossing_alert(self, transition, product, context=None):
+        try:
+            alert_type, title, priority = ALERTS[transition['state']]
+            product_name = transition['product_name'] or 'Unknown Product'
+            threshold = transition['low_stock_threshold'] or 0
+
+            if alert_type == 'out_of_stock':
+                message = f"'{product_name}' is now OUT OF STOCK"
+            elif alert_type == 'low_stock':
+                message = f"'{product_name}' is running low on stock. Only {transition['stock']} units remaining (threshold: {threshold})"
+            else:
+                message = f"'{product_name}' is back in stock ({transition['stock']} units)"
+
+            metadata = {
+                "product_id": str(transition['product_id']),
+                "product_name": product_name,
+                "sku": product.get('SKU', ''),
+                "category_id": product.get('category_id', ''),
+                "current_stock": transition['stock'],
+                "low_stock_threshold": threshold,
+                "previous_state": transition['previous_state'],
+                "stock_state": transition['state'],
+                "alert_type": alert_type,
+                "action_type": "stock_alert",
+                "cost_price": product.get('cost_price', 0),
+                "selling_price": product.get('selling_price', 0),
+                "supplier_id": product.get('supplier_id'),
+                "reorder_suggested": transition['state'] != 'ok',
+                **(context or {})
+            }
+
+            from notifications.services import notification_service
+
+            notification_service.create_notification(
+                title=title,
+                message=message,
+                priority=priority,
+                notification_type="inventory",
+                metadata=metadata
+            )
+
+        except Exception as e:
+            logger.error(f"Failed to send stock state alert for {transition.get('product_id')}: {e}")
+
+    # ================================================================
+    # WATCHLIST
+    # ================================================================
+
+    def watchlist_query(self, states=None, category_id=None):
+        query = {
+            'stock_state': {'$in': list(states or WATCHLIST_STATES)},
+            'isDeleted': {'$ne': True}
+        }
+        if category_id:
+            query['category_id'] = category_id
+        return query
+
+    def get_watchlist(self, states=None, category_id=None, limit=100, skip=0):
+        """
+        Products in the given states (default low + out), lowest stock first.
+
+        Returns:
+            dict: products, total matching and the per-state counts
+        """
+        try:
+            query = self.watchlist_query(states, category_id)
+            products = list(
+                self.product_collection.find(query, WATCHLIST_PROJECTION)
+                .sort([('stock_state', 1), ('stock', 1)])
+                .skip(skip)
+                .limit(limit)
+            )
+            return {
+                'products': products,
+                'total': self.product_collection.count_documents(query),
+                'counts': self.get_state_counts(category_id),
+                'limit': limit,
+                'skip': skip
+            }
+
+        except Exception as e:
+            logger.error(f"Error getting stock watchlist: {str(e)}")
+            raise Exception(f"Error getting stock watchlist: {str(e)}")
+
+    def get_state_counts(self, category_id=None):
+        """Non-deleted product count per stock state (indexed counts)"""
+        counts = {}
+        for state in STOCK_STATES:
+            query = {'stock_state': state, 'isDeleted': {'$ne': True}}
+            if category_id:
+                query['category_id'] = category_id
+            counts[state] = self.product_collection.count_documents(query)
+        return counts
+
+    # ================================================================
+    # RECONCILIATION
+    # ================================================================
+
+    def rebuild(self, dry_run=False):
+        """
+        Reclassify every product and fix states that drifted, without alerts.
+
+        Returns:
+            dict: products checked and the drifted product ids
+        """
+        try:
+            now = datetime.utcnow()
+            checked, drifted, operations = 0, [], []
+            for product in self.product_collection.find({}, {'stock': 1, 'low_stock_threshold': 1, 'stock_state': 1}):
+                checked += 1
+                state = self.classify(product.get('stock'), product.get('low_stock_threshold'))
+                if state == product.get('stock_state'):
+                    continue
+                drifted.append(product['_id'])
+                operations.append(UpdateOne(
+                    {'_id': product['_id']},
+                    {'$set': {'stock_state': state, 'stock_state_changed_at': now}}
+                ))
+
+            if operations and not dry_run:
+                for start in range(0, len(operations), 1000):
+                    self.product_collection.bulk_write(operations[start:start + 1000], ordered=False)
+
+            if drifted:
+                logger.info(f"Stock state drifted for {len(drifted)} product(s){' (dry run)' if dry_run else ''}")
+            return {'products_checked': checked, 'drifted_product_ids': drifted, 'dry_run': dry_run}
+
+        except Exception as e:
+            logger.error(f"Error rebuilding stock states: {str(e)}")
+            raise Exception(f"Error rebuilding stock states: {str(e)}")
+
+
+stock_state_service = StockStateService()
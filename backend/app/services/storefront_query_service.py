@@ -0,0 +1,307 @@
+from collections import OrderedDict
+import logging
+import re
+import threading
+import time
+
+from ..database import db_manager
+from .change_log_service import change_log_service
+
+logger = logging.getLogger(__name__)
+
+# Cached results live at most this long, and are dropped earlier when a
+# product or category change is recorded after they were computed
+RESULT_CACHE_TTL_SECONDS = 120
+RESULT_CACHE_MAX_ENTRIES = 512
+VERSION_CHECK_INTERVAL_SECONDS = 5
+
+# Upper bounds of the storefront price bands (last band is open-ended)
+PRICE_BAND_BOUNDARIES = [0, 50, 100, 200, 500, 1000]
+
+SORTABLE_FIELDS = ('product_name', 'selling_price', 'date_received')
+
+# Change-log entities storefront results depend on; writes to anything else
+# (sales, customers, batches) leave the cache alone
+STOREFRONT_ENTITIES = ('products', 'category')
+
+_result_cache = OrderedDict()
+_result_cache_lock = threading.Lock()
+
+
+class StorefrontQueryService:
+    """
+    Read-optimized product queries for the customer storefront.
+
+    Filters are normalized into a stable cache key; page results, total
+    counts, facet counts and the category name map are cached in-process
+    with a TTL and stamped with the products/category change-log versions,
+    so product and category writes invalidate them without any explicit
+    purge.
+    """
+
+    BASE_QUERY = {
+        'status': 'active',
+        'isDeleted': {'$ne': True},
+        'total_stock': {'$gt': 0}
+    }
+
+    def __init__(self):
+        self.db = db_manager.get_database()
+        self.product_collection = self.db.products
+        self.category_collection = self.db.category
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        """Compound indexes matching the storefront filter/sort combinations"""
+        try:
+            storefront_indexes = [
+                # Default listing and search, sorted by name
+                [("status", 1), ("isDeleted", 1), ("product_name", 1), ("total_stock", 1)],
+                # Category / subcategory listings
+                [("status", 1), ("isDeleted", 1), ("category_id", 1), ("product_name", 1), ("total_stock", 1)],
+                [("status", 1), ("isDeleted", 1), ("category_id", 1), ("subcategory_name", 1), ("product_name", 1)],
+                # Price sort and price range filters
+                [("status", 1), ("isDeleted", 1), ("selling_price", 1), ("total_stock", 1)],
+                [("status", 1), ("isDeleted", 1), ("category_id", 1), ("selling_price", 1)],
+                # Newest / featured
+                [("status", 1), ("isDeleted", 1), ("date_received", -1)],
+            ]
+
+            for index_fields in storefront_indexes:
+                self.product_collection.create_index(index_fields, background=True)
+        except Exception as e:
+            logger.warning(f"Could not create storefront indexes: {e}")
+
+    # ================================================================
+    # RESULT CACHE
+    # ================================================================
+
+    def _cache_get(self, key, version):
+        with _result_cache_lock:
+            entry = _result_cache.get(key)
+            if not entry:
+                return None
+            if entry['version'] != version or entry['expires_at'] < time.monotonic():
+                _result_cache.pop(key, None)
+                return None
+            _result_cache.move_to_end(key)
+            return entry['value']
+
+    def _cache_set(self, key, version, value):
+        with _result_cache_lock:
+            _result_cache[key] = {
+                'version': version,
+                'expires_at': time.monotonic() + RESULT_CACHE_TTL_SECONDS,
+                'value': value
+            }
+            _result_cache.move_to_end(key)
+            while len(_result_cache) > RESULT_CACHE_MAX_ENTRIES:
+                _result_cache.popitem(last=False)
+
+    def _cached(self, key, compute):
+        version = change_log_service.entity_versions(STOREFRONT_ENTITIES, VERSION_CHECK_INTERVAL_SECONDS)
+        value = self._cache_get(key, version)
+        if value is None:
+            value = compute()
+            self._cache_set(key, version, value)
+        return value
+
+    @staticmethod
+    def clear_cache():
+        with _result_cache_lock:
+            _result_cache.clear()
+
+    # ================================================================
+    # QUERY BUILDING
+    # ================================================================
+
+    def normalize_filters(self, filters=None):
+        """Canonical filter dict: stripped strings, floats for prices, no empties"""
+        normalized = {}
+        filters = filters or {}
+
+        for field in ('category_id', 'subcategory_name'):
+            value = filters.get(field)
+            if value and str(value).strip():
+                normalized[field] = str(value).strip()
+
+        search = filters.get('search')
+        if search and str(search).strip():
+            normalized['search'] = str(search).strip().lower()
+
+        for field in ('min_price', 'max_price'):
+            value = filters.get(field)
+            if value not in (None, ''):
+                normalized[field] = float(value)
+
+        return normalized
+
+    def build_query(self, normalized_filters):
+        query = dict(self.BASE_QUERY)
+
+        if normalized_filters.get('category_id'):
+            query['category_id'] = normalized_filters['category_id']
+        if normalized_filters.get('subcategory_name'):
+            # Products carry their subcategory as a plain field
+            query['subcategory_name'] = normalized_filters['subcategory_name']
+        if normalized_filters.get('search'):
+            pattern = {'$regex': re.escape(normalized_filters['search']), '$options': 'i'}
+            query['$or'] = [
+                {'product_name': pattern},
+                {'SKU': pattern}
+            ]
+
+        price_range = {}
+        if 'min_price' in normalized_filters:
+            price_range['$gte'] = normalized_filters['min_price']
+        if 'max_price' in normalized_filters:
+            price_range['$lte'] = normalized_filters['max_price']
+        if price_range:
+            query['selling_price'] = price_range
+
+        return query
+
+    def _filter_key(self, normalized_filters):
+        return tuple(sorted(normalized_filters.items()))
+
+    # ================================================================
+    # LISTINGS
+    # ================================================================
+
+    def count_products(self, normalized_filters):
+        """Total matching products, cached per normalized filter"""
+        key = ('count', self._filter_key(normalized_filters))
+        return self._cached(
+            key,
+            lambda: self.product_collection.count_documents(self.build_query(normalized_filters))
+        )
+
+    def find_products(self, filters=None, page=1, limit=20, sort_by='product_name', sort_order='asc'):
+        """
+        One page of storefront products plus pagination info.
+
+        Returns raw product documents; the caller formats them.
+        """
+        normalized_filters = self.normalize_filters(filters)
+        page = max(int(page), 1)
+        limit = max(int(limit), 1)
+        sort_field = sort_by if sort_by in SORTABLE_FIELDS else 'product_name'
+        sort_direction = 1 if sort_order == 'asc' else -1
+
+        def compute_page():
+            skip = (page - 1) * limit
+            return list(
+                self.product_collection.find(self.build_query(normalized_filters))
+                .sort(sort_field, sort_direction)
+                .skip(skip)
+                .limit(limit)
+            )
+
+        key = ('page', self._filter_key(normalized_filters), page, limit, sort_field, sort_direction)
+        products = self._cached(key, compute_page)
+        total = self.count_products(normalized_filters)
+
+        total_pages = (total + limit - 1) // limit
+        pagination = {
+            'current_page': page,
+            'total_pages': total_pages,
+            'total_items': total,
+            'items_per_page': limit,
+            'has_next': page < total_pages,
+            'has_previous': page > 1
+        }
+
+        return products, pagination
+
+    def find_newest_products(self, limit=10):
+        key = ('newest', int(limit))
+        return self._cached(
+            key,
+            lambda: list(
+                self.product_collection.find(dict(self.BASE_QUERY)).sort('date_received', -1).limit(int(limit))
+            )
+        )
+
+    def get_category_names(self):
+        """category _id -> category_name, cached"""
+        def compute():
+            return {
+                category['_id']: category.get('category_name', 'Unknown')
+                for category in self.category_collection.find({}, {'category_name': 1})
+            }
+        return self._cached(('category_names',), compute)
+
+    # ================================================================
+    # FACETS
+    # ================================================================
+
+    def get_facets(self, filters=None):
+        """
+        Product counts per category and per price band for the current filter.
+
+        Category and price filters are left out of their own facet so the
+        storefront can show the alternatives.
+        """
+        normalized_filters = self.normalize_filters(filters)
+
+        def compute():
+            category_filters = {
+                key: value for key, value in normalized_filters.items()
+                if key not in ('category_id', 'subcategory_name')
+            }
+            price_filters = {
+                key: value for key, value in normalized_filters.items()
+                if key not in ('min_price', 'max_price')
+            }
+
+            category_counts = list(self.product_collection.aggregate([
+                {'$match': self.build_query(category_filters)},
+                {'$group': {'_id': '$category_id', 'count': {'$sum': 1}}},
+                {'$sort': {'count': -1}}
+            ]))
+
+            price_counts = list(self.product_collection.aggregate([
+                {'$match': self.build_query(price_filters)},
+                {
+                    '$bucket': {
+                        'groupBy': '$selling_price',
+                        'boundaries': PRICE_BAND_BOUNDARIES + [float('inf')],
+                        'default': 'other',
+                        'output': {'count': {'$sum': 1}}
+                    }
+                }
+            ]))
+
+            category_names = self.get_category_names()
+            categories = [
+                {
+                    'category_id': bucket['_id'],
+                    'category_name': category_names.get(bucket['_id'], 'Unknown'),
+                    'count': bucket['count']
+                }
+                for bucket in category_counts
+            ]
+
+            bands = []
+            for bucket in price_counts:
+                if bucket['_id'] == 'other':
+                    continue
+                lower = bucket['_id']
+                index = PRICE_BAND_BOUNDARIES.index(lower)
+                upper = PRICE_BAND_BOUNDARIES[index + 1] if index + 1 < len(PRICE_BAND_BOUNDARIES) else None
+                bands.append({
+                    'min_price': lower,
+                    'max_price': upper,
+                    'count': bucket['count']
+                })
+
+            return {
+                'categories': categories,
+                'price_bands': bands
+            }
+
+        return self._cached(('facets', self._filter_key(normalized_filters)), compute)
+
+
+# Singleton instance (indexes are ensured once, at import)
+storefront_query_service = StorefrontQueryService()
@@ -5,6 +5,7 @@ from ..models import Supplier
 from notifications.services import NotificationService
 import logging
 from .audit_service import AuditLogService
+from .supplier_stats_service import supplier_stats_service
 
 logger = logging.getLogger(__name__)
 
@@ -176,6 +177,7 @@ class SupplierService:
                 'created_at': current_time,
                 'updated_at': current_time,
                 'created_by': user_id,
+                'batch_stats': {**supplier_stats_service.empty_stats(), 'updated_at': current_time},
                 'sync_logs': [
                     self.add_sync_log(source='cloud', status='pending', details={'action': 'created'})
                 ]
@@ -224,36 +226,14 @@ class SupplierService:
             skip = (page - 1) * per_page
             total_count = self.supplier_collection.count_documents(query)
             
-            # Aggregate to include batch statistics
-            pipeline = [
-                {'$match': query},
-                {'$lookup': {
-                    'from': 'batches',
-                    'localField': '_id',
-                    'foreignField': 'supplier_id',
-                    'as': 'batches'
-                }},
-                {'$addFields': {
-                    'total_batches': {'$size': '$batches'},
-                    'active_batches': {
-                        '$size': {
-                            '$filter': {
-                                'input': '$batches',
-                                'as': 'batch',
-                                'cond': {'$eq': ['$$batch.status', 'active']}
-                            }
-                        }
-                    }
-                }},
-                {'$project': {
-                    'batches': 0  # Remove the full batches array from response
-                }},
-                {'$sort': {'supplier_name': 1}},
-                {'$skip': skip},
-                {'$limit': per_page}
-            ]
-            
-            suppliers = list(self.supplier_collection.aggregate(pipeline))
+            # Batch statistics are maintained counters on the supplier document
+            suppliers = list(
+                self.supplier_collection.find(query)
+                .sort('supplier_name', 1)
+                .skip(skip)
+                .limit(per_page)
+            )
+            self._attach_batch_stats(suppliers)
             
             return {
                 'suppliers': suppliers,
@@ -280,48 +260,36 @@ class SupplierService:
                 query['isDeleted'] = {'$ne': True}
             
             if include_batch_stats:
-                pipeline = [
-                    {'$match': query},
-                    {'$lookup': {
-                        'from': 'batches',
-                        'localField': '_id',
-                        'foreignField': 'supplier_id',
-                        'as': 'batches'
-                    }},
-                    {'$addFields': {
-                        'total_batches': {'$size': '$batches'},
-                        'active_batches': {
-                            '$size': {
-                                '$filter': {
-                                    'input': '$batches',
-                                    'as': 'batch',
-                                    'cond': {'$eq': ['$$batch.status', 'active']}
-                                }
-                            }
-                        },
-                        'depleted_batches': {
-                            '$size': {
-                                '$filter': {
-                                    'input': '$batches',
-                                    'as': 'batch',
-                                    'cond': {'$eq': ['$$batch.status', 'depleted']}
-                                }
-                            }
-                        }
-                    }},
-                    {'$project': {
-                        'batches': 0
-                    }}
-                ]
-                
-                result = list(self.supplier_collection.aggregate(pipeline))
-                return result[0] if result else None
+                supplier = self.supplier_collection.find_one(query)
+                if supplier:
+                    self._attach_batch_stats([supplier], fields=('total_batches', 'active_batches', 'depleted_batches'))
+                return supplier
             else:
                 return self.supplier_collection.find_one(query)
         
         except Exception as e:
             raise Exception(f"Error getting supplier: {str(e)}")
     
+    def _attach_batch_stats(self, suppliers, fields=('total_batches', 'active_batches')):
+        """Expose maintained batch counters at the top level, as the old $lookup did"""
+        missing = [supplier['_id'] for supplier in suppliers if 'batch_stats' not in supplier]
+        if missing:
+            # Suppliers created before counters existed - compute them once
+            supplier_stats_service.rebuild(missing)
+            rebuilt = {
+                supplier['_id']: supplier.get('batch_stats')
+                for supplier in self.supplier_collection.find({'_id': {'$in': missing}}, {'batch_stats': 1})
+            }
+            for supplier in suppliers:
+                if supplier['_id'] in rebuilt:
+                    supplier['batch_stats'] = rebuilt[supplier['_id']]
+
+        for supplier in suppliers:
+            stats = supplier.pop('batch_stats', None) or {}
+            for field in fields:
+                supplier[field] = stats.get(field, 0)
+        return suppliers
+
     def get_supplier_batches(self, supplier_id, filters=None):
         """Get all batches for a specific supplier"""
         try:
@@ -374,51 +342,13 @@ class SupplierService:
             if not supplier_id or not isinstance(supplier_id, str):
                 raise ValueError("Invalid supplier ID")
             
-            pipeline = [
-                {'$match': {'supplier_id': supplier_id}},
-                {'$group': {
-                    '_id': None,
-                    'total_batches': {'$sum': 1},
-                    'active_batches': {
-                        '$sum': {'$cond': [{'$eq': ['$status', 'active']}, 1, 0]}
-                    },
-                    'depleted_batches': {
-                        '$sum': {'$cond': [{'$eq': ['$status', 'depleted']}, 1, 0]}
-                    },
-                    'expired_batches': {
-                        '$sum': {'$cond': [{'$eq': ['$status', 'expired']}, 1, 0]}
-                    },
-                    'total_quantity_received': {'$sum': '$quantity_received'},
-                    'total_quantity_remaining': {'$sum': '$quantity_remaining'},
-                    'total_cost_value': {
-                        '$sum': {'$multiply': ['$quantity_remaining', '$cost_price']}
-                    },
-                    'unique_products': {'$addToSet': '$product_id'}
-                }},
-                {'$addFields': {
-                    'unique_products_count': {'$size': '$unique_products'}
-                }},
-                {'$project': {
-                    '_id': 0,
-                    'unique_products': 0
-                }}
-            ]
+            stats = supplier_stats_service.get_stats(supplier_id)
+            if stats is None:
+                stats = supplier_stats_service.empty_stats()
             
-            result = list(self.batch_collection.aggregate(pipeline))
-            
-            if result:
-                return result[0]
-            else:
-                return {
-                    'total_batches': 0,
-                    'active_batches': 0,
-                    'depleted_batches': 0,
-                    'expired_batches': 0,
-                    'total_quantity_received': 0,
-                    'total_quantity_remaining': 0,
-                    'total_cost_value': 0,
-                    'unique_products_count': 0
-                }
+            # Served by the (supplier_id, product_id) index
+            stats['unique_products_count'] = len(self.batch_collection.distinct('product_id', {'supplier_id': supplier_id}))
+            return stats
         
         except Exception as e:
             raise Exception(f"Error getting supplier statistics: {str(e)}")
@@ -0,0 +1,228 @@
+from collections import defaultdict
+from datetime import datetime
+import logging
+
+from pymongo import UpdateOne
+
+from ..database import db_manager
+
+logger = logging.getLogger(__name__)
+
+# Batch status -> counter field; other statuses only count towards total_batches
+STATUS_COUNTERS = {
+    'active': 'active_batches',
+    'pending': 'pending_batches',
+    'depleted': 'depleted_batches',
+    'expired': 'expired_batches',
+}
+
+COUNTER_FIELDS = (
+    'total_batches',
+    'active_batches',
+    'pending_batches',
+    'depleted_batches',
+    'expired_batches',
+    'total_quantity_received',
+    'total_quantity_remaining',
+    'total_cost_value',
+)
+
+BATCH_STATS_PROJECTION = {'supplier_id': 1, 'status': 1, 'quantity_received': 1, 'quantity_remaining': 1, 'cost_price': 1}
+
+
+class SupplierStatsService:
+    """
+    Per-supplier batch counters, embedded in each supplier as `batch_stats`.
+
+    Every batch write path (create, update, activate, FIFO deduct/restore,
+    expiry) passes the batch as it was before and after the write; the
+    difference is applied with `$inc`, so listing suppliers is a plain
+    indexed find instead of a `$lookup` over every batch. Counters cover all
+    batches of the supplier regardless of status, as the old on-the-fly
+    statistics did. `rebuild` recomputes them from `batches` (reconciliation
+    job and repair after out-of-band writes).
+    """
+
+    def __init__(self):
+        self.db = db_manager.get_database()
+        self.supplier_collection = self.db.suppliers
+        self.batch_collection = self.db.batches
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        """Create indexes for the supplier list and per-supplier batch scans"""
+        try:
+            self.supplier_collection.create_index([("isDeleted", 1), ("supplier_name", 1)], background=True)
+            self.batch_collection.create_index([("supplier_id", 1), ("status", 1)], background=True)
+            self.batch_collection.create_index([("supplier_id", 1), ("product_id", 1)], background=True)
+        except Exception as e:
+            logger.warning(f"Could not create supplier stats indexes: {e}")
+
+    # ================================================================
+    # DELTAS
+    # ================================================================
+
+    @staticmethod
+    def empty_stats():
+        return {field: 0 for field in COUNTER_FIELDS}
+
+    @staticmethod
+    def _contribution(batch):
+        """What one batch adds to its supplier's counters"""
+        quantity_remaining = batch.get('quantity_remaining') or 0
+        contribution = {
+            'total_batches': 1,
+            'total_quantity_received': batch.get('quantity_received') or 0,
+            'total_quantity_remaining': quantity_remaining,
+            'total_cost_value': quantity_remaining * (batch.get('cost_price') or 0),
+        }
+        status_field = STATUS_COUNTERS.get(batch.get('status'))
+        if status_field:
+            contribution[status_field] = 1
+        return contribution
+
+    def _deltas_for(self, changes):
+        """supplier_id -> counter deltas for (before, after) batch pairs (None = absent)"""
+        deltas = defaultdict(lambda: defaultdict(float))
+        for before, after in changes:
+            for batch, sign in ((before, -1), (after, 1)):
+                if not batch or not batch.get('supplier_id'):
+                    continue
+                supplier_deltas = deltas[batch['supplier_id']]
+                for field, value in self._contribution(batch).items():
+                    supplier_deltas[field] += sign * value
+        return deltas
+
+    # ================================================================
+    # RECORDING
+    # ================================================================
+
+    def record_batch_changes(self, changes):
+        """
+        Apply counter deltas for batch writes.
+
+        Args:
+            changes: iterable of (before, after) batch documents; `before` is
+                None for a new batch, `after` None for a removed one
+
+        Failures are logged and swallowed - counters must never break the
+        batch write that triggered them (the reconciliation job repairs drift).
+        """
+        try:
+            deltas = self._deltas_for(changes)
+            now = datetime.utcnow()
+            operations = []
+            for supplier_id, supplier_deltas in deltas.items():
+                increments = {}
+                for field, value in supplier_deltas.items():
+                    value = round(value, 4) if field == 'total_cost_value' else int(value)
+                    if value:
+                        increments[f'batch_stats.{field}'] = value
+                if increments:
+                    # Suppliers never counted yet are left alone; their first read rebuilds them
+                    operations.append(UpdateOne(
+                        {'_id': supplier_id, 'batch_stats': {'$exists': True}},
+                        {'$inc': increments, '$set': {'batch_stats.updated_at': now}}
+                    ))
+
+            if operations:
+                self.supplier_collection.bulk_write(operations, ordered=False)
+            return len(operations)
+
+        except Exception as e:
+            logger.error(f"Failed to record supplier batch stats: {e}")
+            return 0
+
+    def record_batch_created(self, batch):
+        return self.record_batch_changes([(None, batch)])
+
+    def record_batch_updated(self, before, updates):
+        """`updates` is the `$set` applied to `before`"""
+        return self.record_batch_changes([(before, {**before, **updates})])
+
+    # ================================================================
+    # RECONCILIATION
+    # ================================================================
+
+    def compute_stats(self, supplier_ids=None):
+        """supplier_id -> counters recomputed from the batches collection"""
+        match = {'supplier_id': {'$in': list(supplier_ids)} if supplier_ids is not None else {'$nin': [None, '']}}
+        group = {
+            '_id': '$supplier_id',
+            'total_batches': {'$sum': 1},
+            'total_quantity_received': {'$sum': {'$ifNull': ['$quantity_received', 0]}},
+            'total_quantity_remaining': {'$sum': {'$ifNull': ['$quantity_remaining', 0]}},
+            'total_cost_value': {'$sum': {'$multiply': [
+                {'$ifNull': ['$quantity_remaining', 0]},
+                {'$ifNull': ['$cost_price', 0]}
+            ]}},
+        }
+        for status, field in STATUS_COUNTERS.items():
+            group[field] = {'$sum': {'$cond': [{'$eq': ['$status', status]}, 1, 0]}}
+
+        stats = {}
+        for row in self.batch_collection.aggregate([{'$match': match}, {'$group': group}], allowDiskUse=True):
+            supplier_id = row.pop('_id')
+            row['total_cost_value'] = round(row['total_cost_value'], 4)
+            stats[supplier_id] = {**self.empty_stats(), **row}
+        return stats
+
+    def rebuild(self, supplier_ids=None, dry_run=False):
+        """
+        Recompute `batch_stats` for the given suppliers (default: all) and
+        overwrite the ones that drifted.
+
+        Returns:
+            dict: suppliers checked, suppliers corrected and the drifted ids
+        """
+        try:
+            query = {'_id': {'$in': list(supplier_ids)}} if supplier_ids is not None else {}
+            suppliers = list(self.supplier_collection.find(query, {'batch_stats': 1}))
+            expected = self.compute_stats([supplier['_id'] for supplier in suppliers])
+
+            now = datetime.utcnow()
+            drifted, operations = [], []
+            for supplier in suppliers:
+                stats = expected.get(supplier['_id'], self.empty_stats())
+                stored = supplier.get('batch_stats') or {}
+                if all(abs((stored.get(field) or 0) - stats[field]) < 0.01 for field in COUNTER_FIELDS) \
+                        and 'batch_stats' in supplier:
+                    continue
+                drifted.append(supplier['_id'])
+                operations.append(UpdateOne(
+                    {'_id': supplier['_id']},
+                    {'$set': {'batch_stats': {**stats, 'updated_at': now, 'reconciled_at': now}}}
+                ))
+
+            if operations and not dry_run:
+                self.supplier_collection.bulk_write(operations, ordered=False)
+
+            if drifted:
+                logger.info(f"Supplier batch stats drifted for {len(drifted)} supplier(s){' (dry run)' if dry_run else ''}")
+
+            return {
+                'suppliers_checked': len(suppliers),
+                'suppliers_corrected': 0 if dry_run else len(drifted),
+                'drifted_supplier_ids': drifted,
+                'dry_run': dry_run
+            }
+
+        except Exception as e:
+            logger.error(f"Error rebuilding supplier batch stats: {str(e)}")
+            raise Exception(f"Error rebuilding supplier batch stats: {str(e)}")
+
+    def get_stats(self, supplier_id):
+        """Stored counters for one supplier, rebuilt on the spot if never computed"""
+        supplier = self.supplier_collection.find_one({'_id': supplier_id}, {'batch_stats': 1})
+        if supplier is None:
+            return None
+        if 'batch_stats' not in supplier:
+            self.rebuild([supplier_id])
+            supplier = self.supplier_collection.find_one({'_id': supplier_id}, {'batch_stats': 1}) or {}
+        stats = {**self.empty_stats(), **(supplier.get('batch_stats') or {})}
+        stats.pop('updated_at', None)
+        stats.pop('reconciled_at', None)
+        return stats
+
+
+supplier_stats_service = SupplierStatsService()
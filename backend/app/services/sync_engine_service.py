@@ -0,0 +1,408 @@
+from datetime import datetime
+import logging
+import time
+
+from pymongo import DeleteOne, ReplaceOne
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from ..database import db_manager
+from .change_log_service import ChangeLogService
+
+logger = logging.getLogger(__name__)
+
+# Synced collection -> timestamp compared on conflict (newer document wins).
+# None means last writer wins.
+SYNC_COLLECTIONS = {
+    'products': 'updated_at',
+    'batches': 'updated_at',
+    'customers': 'last_updated',
+    'sales': 'updated_at',
+    'sales_log': None,
+}
+
+DIRECTIONS = ('to_cloud', 'to_local')
+
+# Changes per bulk_write / checkpoint
+BATCH_SIZE = 500
+
+# Change-log entries (all entities) checked for completeness per read
+COMMIT_SCAN_LIMIT = 50000
+
+# How long one change stream getMore waits for new events
+STREAM_AWAIT_MS = 1000
+
+# $changeStream on a standalone server (no oplog)
+CHANGE_STREAM_UNSUPPORTED_CODES = (40573,)
+
+# Resume token no longer in the oplog (ChangeStreamHistoryLost, ChangeStreamFatalError)
+HISTORY_LOST_CODES = (286, 280)
+
+SYNC_ORIGIN = 'sync'
+
+
+class SyncEngineService:
+    """
+    Incremental one-way sync between the local MongoDB and Atlas.
+
+    Each synced collection is tailed from a checkpoint persisted in the
+    local `sync_checkpoints` collection:
+
+    - `change_stream` mode (replica sets): a change stream resumed from the
+      stored resume token.
+    - `change_log` mode (standalone local nodes): the source's `change_log`
+      entries after the stored version, which the service write paths record.
+
+    Changes are collapsed per document and shipped as one unordered
+    bulk_write of guarded ReplaceOne upserts / DeleteOnes per batch, so cost
+    is proportional to the number of changes. A full copy only happens for a
+    collection's first run or when the stream/log history it needs is gone.
+    """
+
+    def __init__(self, direction='to_cloud'):
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Invalid sync direction '{direction}'. Use 'to_cloud' or 'to_local'")
+
+        self.direction = direction
+        local_db = db_manager.get_local_database()
+        cloud_db = db_manager.get_cloud_database()
+        if direction == 'to_cloud':
+            self.source_db, self.target_db = local_db, cloud_db
+        else:
+            self.source_db, self.target_db = cloud_db, local_db
+
+        # Checkpoints live with the node that runs the engine
+        self.checkpoints_collection = local_db.sync_checkpoints
+        self.source_change_log = ChangeLogService(self.source_db)
+        self.target_change_log = ChangeLogService(self.target_db)
+
+    # ================================================================
+    # CHECKPOINTS
+    # ================================================================
+
+    def _checkpoint_id(self, collection_name):
+        return f"{self.direction}:{collection_name}"
+
+    def get_checkpoint(self, collection_name):
+        return self.checkpoints_collection.find_one({'_id': self._checkpoint_id(collection_name)})
+
+    def _save_checkpoint(self, collection_name, **fields):
+        self.checkpoints_collection.update_one(
+            {'_id': self._checkpoint_id(collection_name)},
+            {
+                '$set': {**fields, 'updated_at': datetime.utcnow()},
+                '$setOnInsert': {'direction': self.direction, 'collection': collection_name}
+            },
+            upsert=True
+        )
+
+    def get_status(self):
+        """Checkpoint state per synced collection for this direction"""
+        try:
+            checkpoints = {
+                checkpoint['collection']: checkpoint
+                for checkpoint in self.checkpoints_collection.find({'direction': self.direction})
+            }
+
+            status = []
+            for collection_name in SYNC_COLLECTIONS:
+                checkpoint = checkpoints.get(collection_name) or {}
+                status.append({
+                    'collection': collection_name,
+                    'mode': checkpoint.get('mode'),
+                    'version': checkpoint.get('version'),
+                    'has_resume_token': bool(checkpoint.get('resume_token')),
+                    'needs_resync': checkpoint.get('needs_resync', checkpoint == {}),
+                    'last_synced_at': checkpoint.get('last_synced_at'),
+                    'last_resync_at': checkpoint.get('last_resync_at'),
+                    'last_error': checkpoint.get('last_error')
+                })
+            return status
+
+        except Exception as e:
+            logger.error(f"Error getting sync status: {e}")
+            raise Exception(f"Error getting sync status: {str(e)}")
+
+    def _current_position(self, collection_name):
+        """Where the source is now: a resume token, or the change log version"""
+        try:
+            with self.source_db[collection_name].watch(max_await_time_ms=1) as stream:
+                stream.try_next()
+                return {'mode': 'change_stream', 'resume_token': stream.resume_token, 'version': None}
+        except OperationFailure as e:
+            if e.code not in CHANGE_STREAM_UNSUPPORTED_CODES:
+                raise
+
+        counter = self.source_db.counters.find_one({'_id': ChangeLogService.COUNTER_ID})
+        return {'mode': 'change_log', 'resume_token': None, 'version': counter['seq'] if counter else 0}
+
+    # ================================================================
+    # RUNNING
+    # ================================================================
+
+    def run_once(self, collections=None, max_changes=None, initial_copy=True):
+        """
+        Ship pending changes for each collection. A failure in one
+        collection is recorded on its checkpoint and does not stop the rest.
+        """
+        results = {}
+        for collection_name in collections or SYNC_COLLECTIONS:
+            if collection_name not in SYNC_COLLECTIONS:
+                results[collection_name] = {'error': 'Not a synced collection'}
+                continue
+            try:
+                results[collection_name] = self.sync_collection(collection_name, max_changes, initial_copy)
+            except Exception as e:
+                logger.error(f"Sync {self.direction} failed for {collection_name}: {e}")
+                self._save_checkpoint(collection_name, last_error=str(e))
+                results[collection_name] = {'error': str(e)}
+        return results
+
+    def run_forever(self, collections=None, interval_seconds=5):
+        """Keep shipping changes; on restart the checkpoints pick up where this left off"""
+        logger.info(f"Sync engine {self.direction} started")
+        while True:
+            results = self.run_once(collections)
+            shipped = sum(result.get('changes', 0) for result in results.values())
+            if not shipped:
+                time.sleep(interval_seconds)
+
+    def sync_collection(self, collection_name, max_changes=None, initial_copy=True):
+        checkpoint = self.get_checkpoint(collection_name)
+
+        if checkpoint is None or checkpoint.get('needs_resync'):
+            if initial_copy or checkpoint is not None:
+                return self.resync_collection(collection_name)
+            # Start from now without copying existing documents
+            self._save_checkpoint(collection_name, needs_resync=False, **self._current_position(collection_name))
+            checkpoint = self.get_checkpoint(collection_name)
+
+        if checkpoint.get('mode') == 'change_stream':
+            return self._sync_from_change_stream(collection_name, checkpoint, max_changes)
+        return self._sync_from_change_log(collection_name, checkpoint, max_changes)
+
+    def resync_collection(self, collection_name):
+        """Full copy, then continue from the position captured before the copy"""
+        position = self._current_position(collection_name)
+        stats = self._new_stats()
+        target = self.target_db[collection_name]
+        conflict_field = SYNC_COLLECTIONS[collection_name]
+
+        logger.info(f"Sync {self.direction}: full copy of {collection_name}")
+
+        batch = []
+        for document in self.source_db[collection_name].find({}).batch_size(BATCH_SIZE):
+            batch.append(document)
+            if len(batch) >= BATCH_SIZE:
+                self._ship(collection_name, target, batch, [], conflict_field, stats)
+                batch = []
+        self._ship(collection_name, target, batch, [], conflict_field, stats)
+
+        now = datetime.utcnow()
+        self._save_checkpoint(
+            collection_name,
+            needs_resync=False,
+            last_resync_at=now,
+            last_synced_at=now,
+            last_error=None,
+            **position
+        )
+        stats['resynced'] = True
+        return stats
+
+    # ================================================================
+    # SOURCES
+    # ================================================================
+
+    def _sync_from_change_stream(self, collection_name, checkpoint, max_changes=None):
+        stats = self._new_stats()
+        target = self.target_db[collection_name]
+        conflict_field = SYNC_COLLECTIONS[collection_name]
+
+        try:
+            with self.source_db[collection_name].watch(
+                pipeline=[{'$match': {'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}}}],
+                full_document='updateLookup',
+                resume_after=checkpoint.get('resume_token'),
+                max_await_time_ms=STREAM_AWAIT_MS
+            ) as stream:
+                while True:
+                    # document id -> latest full document (None = deleted)
+                    pending = {}
+                    while len(pending) < BATCH_SIZE:
+                        change = stream.try_next()
+                        if change is None:
+                            break
+                        document_id = change['documentKey']['_id']
+                        pending.pop(document_id, None)
+                        pending[document_id] = (
+                            None if change['operationType'] == 'delete' else change.get('fullDocument')
+                        )
+
+                    documents = [document for document in pending.values() if document is not None]
+                    delete_ids = [document_id for document_id, document in pending.items() if document is None]
+                    self._ship(collection_name, target, documents, delete_ids, conflict_field, stats)
+
+                    # Saved even when idle so the token never ages out of the oplog
+                    self._save_checkpoint(
+                        collection_name,
+                        resume_token=stream.resume_token,
+                        last_synced_at=datetime.utcnow(),
+                        last_error=None
+                    )
+
+                    if not pending or (max_changes and stats['changes'] >= max_changes):
+                        break
+
+        except OperationFailure as e:
+            if e.code not in HISTORY_LOST_CODES:
+                raise
+            logger.warning(f"Sync {self.direction}: {collection_name} resume token expired, resyncing")
+            self._save_checkpoint(collection_name, needs_resync=True)
+            return self.resync_collection(collection_name)
+
+        return stats
+
+    def _sync_from_change_log(self, collection_name, checkpoint, max_changes=None):
+        stats = self._new_stats()
+        target = self.target_db[collection_name]
+        conflict_field = SYNC_COLLECTIONS[collection_name]
+        version = checkpoint.get('version') or 0
+
+        oldest = self.source_db.change_log.find_one({}, {'_id': 1}, sort=[('_id', 1)])
+        if version and oldest and oldest['_id'] > version + 1:
+            # Entries after the checkpoint were trimmed; only a full copy is safe
+            logger.warning(f"Sync {self.direction}: {collection_name} change log trimmed past checkpoint, resyncing")
+            self._save_checkpoint(collection_name, needs_resync=True)
+            return self.resync_collection(collection_name)
+
+        while True:
+            documents, delete_ids, last_version = self.read_change_log(self.source_change_log, collection_name, version)
+            if last_version == version:
+                break
+
+            self._ship(collection_name, target, documents, delete_ids, conflict_field, stats)
+            version = last_version
+            self._save_checkpoint(
+                collection_name,
+                version=version,
+                last_synced_at=datetime.utcnow(),
+                last_error=None
+            )
+
+            if max_changes and stats['changes'] >= max_changes:
+                break
+
+        return stats
+
+    @staticmethod
+    def read_change_log(change_log, collection_name, version, limit=BATCH_SIZE):
+        """
+        Documents changed after `version` in a ChangeLogService's log (writes
+        applied by the sync engine itself are skipped).
+
+        Only entries up to `committed_version()` are read: versions are
+        allocated before their entries are inserted, so a checkpoint moved
+        past an entry still being written would skip it for good.
+
+        Returns (documents, deleted_ids, version_to_checkpoint). Ids whose
+        document no longer exists are reported as deleted; soft deletes are
+        shipped as the document's current state.
+        """
+        version = int(version or 0)
+        through_version, _ = change_log.committed_version(version, limit=COMMIT_SCAN_LIMIT)
+        if through_version == version:
+            return [], [], version
+
+        db = change_log.db
+        entries = list(
+            db.change_log.find(
+                {
+                    'entity': collection_name,
+                    'version': {'$gt': version, '$lte': through_version},
+                    'origin': {'$ne': SYNC_ORIGIN}
+                },
+                {'entity_id': 1, 'version': 1}
+            ).sort('version', 1).limit(limit)
+        )
+        if len(entries) == limit:
+            # More of this collection's entries follow; continue after the last one read
+            through_version = entries[-1]['version']
+        if not entries:
+            return [], [], through_version
+
+        document_ids = list(dict.fromkeys(entry['entity_id'] for entry in entries))
+        documents = list(db[collection_name].find({'_id': {'$in': document_ids}}))
+        found = {document['_id'] for document in documents}
+
+        return documents, [document_id for document_id in document_ids if document_id not in found], through_version
+
+    # ================================================================
+    # SHIPPING
+    # ================================================================
+
+    @staticmethod
+    def _new_stats():
+        return {'changes': 0, 'upserted': 0, 'updated': 0, 'deleted': 0, 'conflicts': 0}
+
+    def _ship(self, collection_name, target, documents, delete_ids, conflict_field, stats):
+        if not documents and not delete_ids:
+            return
+
+        result = self.apply_changes(target, documents, delete_ids, conflict_field)
+        for key, value in result.items():
+            stats[key] += value
+        stats['changes'] += len(documents) + len(delete_ids)
+
+        # Let caches on the target (catalog snapshots etc.) see the shipped changes
+        shipped_ids = [document['_id'] for document in documents]
+        if shipped_ids:
+            self.target_change_log.record_changes(collection_name, shipped_ids, origin=SYNC_ORIGIN)
+        if delete_ids:
+            self.target_change_log.record_changes(collection_name, delete_ids, 'delete', origin=SYNC_ORIGIN)
+
+    @staticmethod
+    def apply_changes(target_collection, documents, delete_ids=None, conflict_field=None):
+        """
+        Apply documents as ReplaceOne upserts and ids as DeleteOnes in one
+        unordered bulk_write.
+
+        With `conflict_field`, the replace only matches a target document
+        whose field is not newer than the incoming one; a newer target makes
+        the upsert collide on _id, which is counted as a conflict and the
+        target document is kept.
+        """
+        operations = []
+        for document in documents:
+            stamp = document.get(conflict_field) if conflict_field else None
+            if isinstance(stamp, datetime):
+                query = {
+                    '_id': document['_id'],
+                    '$or': [
+                        {conflict_field: {'$lte': stamp}},
+                        {conflict_field: {'$exists': False}}
+                    ]
+                }
+            else:
+                query = {'_id': document['_id']}
+            operations.append(ReplaceOne(query, document, upsert=True))
+
+        for document_id in delete_ids or []:
+            operations.append(DeleteOne({'_id': document_id}))
+
+        stats = {'upserted': 0, 'updated': 0, 'deleted': 0, 'conflicts': 0}
+        if not operations:
+            return stats
+
+        try:
+            details = target_collection.bulk_write(operations, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+            write_errors = details.get('writeErrors', [])
+            if any(error.get('code') != 11000 for error in write_errors):
+                raise
+            stats['conflicts'] = len(write_errors)
+
+        stats['upserted'] = details.get('nUpserted', 0)
+        stats['updated'] = details.get('nModified', 0)
+        stats['deleted'] = details.get('nRemoved', 0)
+        return stats
@@ -5,6 +5,7 @@ from ..models import User
 import bcrypt
 import logging
 from .audit_service import AuditLogService
+from .principal_cache_service import principal_cache
 from notifications.services import  NotificationService
 from notifications.email_verification_service import email_verification_service
 logger = logging.getLogger(__name__)
@@ -117,6 +118,7 @@ class UserService:
             )
             
             if result.modified_count > 0:
+                principal_cache.invalidate(user_id)
                 updated_user = self.collection.find_one({'_id': user_id})
                 
                 # Send appropriate notification
@@ -332,6 +334,7 @@ class UserService:
             )
             
             if result.modified_count > 0:
+                principal_cache.invalidate(user_id)
                 # Send notification
                 user_name = user_to_delete.get('full_name', user_to_delete.get('username', 'User'))
                 self._send_user_notification('soft_deleted', user_name, user_id)
@@ -386,6 +389,7 @@ class UserService:
             )
             
             if result.modified_count > 0:
+                principal_cache.invalidate(user_id)
                 user_name = deleted_user.get('full_name', deleted_user.get('username', 'User'))
                 self._send_user_notification('restored', user_name, user_id)
                 
@@ -421,6 +425,7 @@ class UserService:
             result = self.collection.delete_one({'_id': user_id})
             
             if result.deleted_count > 0:
+                principal_cache.invalidate(user_id)
                 user_name = user_to_delete.get('full_name', user_to_delete.get('username', 'User'))
                 
                 # Critical notification
@@ -28,6 +28,8 @@ from .kpi_views.user_views import (
     DeletedUsersView,       
 )
 
+from .kpi_views import async_read_views
+
 from .kpi_views.customer_views import (
     CustomerListView,
     CustomerDetailView,
@@ -86,6 +88,7 @@ from .kpi_views.product_views import (
     
     # Product reports views
     LowStockProductsView,
+    StockWatchlistView,
     ExpiringProductsView,
     ProductsByCategoryView,
     DeletedProductsView,
@@ -116,6 +119,11 @@ from .kpi_views.batch_views import (
     SupplierBatchesView,  # NEW: Get batches by supplier
     ExpiringBatchesView,
     ProductsWithExpirySummaryView,
+    ExpiryCalendarView,
+    InventoryValuationView,
+    InventoryValuationHistoryView,
+    InventoryValuationDeltaView,
+    ReorderSuggestionView,
     
     # Batch operations
     ProcessSaleFIFOView,
@@ -156,6 +164,8 @@ from .kpi_views.category_pos_views import (
     POSStockCheckView,
     POSLowStockView,
     POSSubcategoryProductsView,  
+    POSCatalogSnapshotView,
+    POSCatalogDeltaView,
 )
 
 # Display/Export Operations
@@ -175,6 +185,8 @@ from .kpi_views.saleslog_views import (
 
 from .kpi_views.sales_bulk_views import (
     SalesLogBulkImportView,
+    SalesImportJobView,
+    SalesImportJobResumeView,
     SalesLogTemplateView,
     SalesLogExportView,
 )
@@ -203,7 +215,10 @@ from .kpi_views.pos.salesReportView import (
     SalesTransactionsView,
     SalesByPeriodView,
     DashboardSummaryView,
+    DashboardKpiView,
     SalesComparisonView,
+    SalesMarginView,
+    ReportCacheStatsView,
 )
 
 from .kpi_views.pos.promotionConView import (
@@ -229,6 +244,8 @@ from .kpi_views.enhanced_pos_sales_views import (
     CreateEnhancedPOSSaleView,
     GetEnhancedSaleView,
     VoidEnhancedSaleView,
+    VoidAndReturnSalesView,
+    ReturnSaleItemsView,
     ValidatePointsRedemptionView,
     CalculateLoyaltyPointsView,
     CalculatePointsDiscountView,
@@ -253,6 +270,7 @@ from .kpi_views.online_transaction_views import (
     GetCustomerOrdersView,
     GetAllOrdersView,
     UpdateOrderStatusView,
+    BulkOrderTransitionView,
     UpdatePaymentStatusView,
     MarkReadyForDeliveryView,
     CompleteOrderView,
@@ -265,6 +283,9 @@ from .kpi_views.online_transaction_views import (
     GetOrdersByStatusView,
     GetOrderSummaryView,
     ValidateOrderStockView,
+    StockReservationView,
+    StockReservationDetailView,
+    StockAvailabilityView,
     ValidatePointsRedemptionView,
     CalculateServiceFeeView,
     CalculateLoyaltyPointsView,
@@ -403,6 +424,7 @@ urlpatterns = [
     
     # Product reports
     path('products/reports/low-stock/', LowStockProductsView.as_view(), name='low-stock-products'),
+    path('products/reports/stock-watchlist/', StockWatchlistView.as_view(), name='stock-watchlist'),
     path('products/reports/expiring/', ExpiringProductsView.as_view(), name='expiring-products'),
     path('products/reports/by-category/<str:category_id>/', ProductsByCategoryView.as_view(), name='products-by-category'),
     
@@ -426,7 +448,12 @@ urlpatterns = [
     path('batches/', BatchListView.as_view(), name='batch-list'),
     path('batches/create/', CreateBatchView.as_view(), name='batch-create'),
     path('batches/expiring/', ExpiringBatchesView.as_view(), name='expiring-batches'),
+    path('batches/expiry-calendar/', ExpiryCalendarView.as_view(), name='expiry-calendar'),
     path('batches/statistics/', BatchStatisticsView.as_view(), name='batch-statistics'),
+    path('inventory/valuation/', InventoryValuationView.as_view(), name='inventory-valuation'),
+    path('inventory/valuation/history/', InventoryValuationHistoryView.as_view(), name='inventory-valuation-history'),
+    path('inventory/valuation/delta/', InventoryValuationDeltaView.as_view(), name='inventory-valuation-delta'),
+    path('inventory/reorder-suggestions/', ReorderSuggestionView.as_view(), name='inventory-reorder-suggestions'),
 
     # Batch operations
     path('batches/process-sale/', ProcessSaleFIFOView.as_view(), name='process-sale-fifo'),
@@ -472,6 +499,8 @@ urlpatterns = [
 
     # ========== POS OPERATIONS ==========
     path('pos/catalog/', POSCatalogView.as_view(), name='pos-catalog'),
+    path('pos/catalog/snapshot/', POSCatalogSnapshotView.as_view(), name='pos-catalog-snapshot'),
+    path('pos/catalog/delta/', POSCatalogDeltaView.as_view(), name='pos-catalog-delta'),
     path('pos/products/batch/', POSProductBatchView.as_view(), name='pos-product-batch'),
     path('pos/search/', POSSearchView.as_view(), name='pos-search'),
     path('pos/barcode/<str:barcode>/', POSBarcodeView.as_view(), name='pos-barcode'),
@@ -483,6 +512,8 @@ urlpatterns = [
     # Sales log operations
     path('invoices/', SalesLogView.as_view(), name='invoice-list-create'),
     path('invoices/bulk-import/', SalesLogBulkImportView.as_view(), name='invoice-bulk-import'),
+    path('invoices/bulk-import/<str:job_id>/', SalesImportJobView.as_view(), name='invoice-bulk-import-job'),
+    path('invoices/bulk-import/<str:job_id>/resume/', SalesImportJobResumeView.as_view(), name='invoice-bulk-import-resume'),
     path('invoices/export/', SalesLogExportView.as_view(), name='invoice-export'),
     path('invoices/stats/', SalesLogStatsView.as_view(), name='invoice-stats'),
     path('invoices/<str:invoice_id>/', SalesLogView.as_view(), name='invoice-detail'),
@@ -497,7 +528,10 @@ urlpatterns = [
     path('sales-report/transactions/', SalesTransactionsView.as_view(), name='sales_transactions'), 
     path('sales-report/by-period/', SalesByPeriodView.as_view(), name='sales_by_period'),
     path('sales-report/dashboard/', DashboardSummaryView.as_view(), name='dashboard_summary'),
+    path('dashboard/kpis/', DashboardKpiView.as_view(), name='dashboard_kpis'),
     path('sales-report/comparison/', SalesComparisonView.as_view(), name='sales_comparison'),
+    path('sales-report/margins/', SalesMarginView.as_view(), name='sales_margins'),
+    path('sales-report/cache-stats/', ReportCacheStatsView.as_view(), name='report_cache_stats'),
     
     # Sales services
     path('sales/create/', SalesServiceView.as_view(), name='create_unified_sale'),
@@ -509,8 +543,10 @@ urlpatterns = [
     # ========== ENHANCED POS SALES ==========
     # Enhanced POS Sales Management
     path('pos-sales/enhanced/', CreateEnhancedPOSSaleView.as_view(), name='create-enhanced-pos-sale'),
+    path('pos-sales/enhanced/void-return/', VoidAndReturnSalesView.as_view(), name='void-return-enhanced-sales'),
     path('pos-sales/enhanced/<str:sale_id>/', GetEnhancedSaleView.as_view(), name='get-enhanced-sale'),
     path('pos-sales/enhanced/<str:sale_id>/void/', VoidEnhancedSaleView.as_view(), name='void-enhanced-sale'),
+    path('pos-sales/enhanced/<str:sale_id>/return/', ReturnSaleItemsView.as_view(), name='return-enhanced-sale-items'),
     path('pos-sales/enhanced/customer/<str:customer_id>/', GetCustomerEnhancedSalesView.as_view(), name='get-customer-enhanced-sales'),
     path('pos-sales/enhanced/recent/', GetRecentEnhancedSalesView.as_view(), name='get-recent-enhanced-sales'),
     path('pos-sales/enhanced/by-date/', GetEnhancedSalesByDateRangeView.as_view(), name='get-enhanced-sales-by-date'),
@@ -571,6 +607,7 @@ urlpatterns = [
     # ========== ONLINE TRANSACTIONS ==========
     # Order Management
     path('online-orders/', CreateOnlineOrderView.as_view(), name='create-online-order'),
+    path('online-orders/bulk-status/', BulkOrderTransitionView.as_view(), name='bulk-order-transition'),
     path('online-orders/<str:order_id>/', GetOnlineOrderView.as_view(), name='get-online-order'),
     path('online-orders/customer/<str:customer_id>/', GetCustomerOrdersView.as_view(), name='get-customer-orders'),
     path('online-orders/all/', GetAllOrdersView.as_view(), name='get-all-orders'),
@@ -597,6 +634,9 @@ urlpatterns = [
     
     # Utility Functions
     path('online-orders/validate-stock/', ValidateOrderStockView.as_view(), name='validate-order-stock'),
+    path('stock-reservations/', StockReservationView.as_view(), name='stock-reservation-create'),
+    path('stock-reservations/availability/', StockAvailabilityView.as_view(), name='stock-availability'),
+    path('stock-reservations/<str:reservation_id>/', StockReservationDetailView.as_view(), name='stock-reservation-detail'),
     path('online-orders/validate-points/', ValidatePointsRedemptionView.as_view(), name='validate-points-redemption'),
     path('online-orders/calculate-fee/', CalculateServiceFeeView.as_view(), name='calculate-service-fee'),
     path('online-orders/calculate-points/', CalculateLoyaltyPointsView.as_view(), name='calculate-loyalty-points'),
@@ -605,4 +645,16 @@ urlpatterns = [
     path("sales/category/", SalesByCategoryView.as_view(), name="sales-by-category"),
     path("sales/category/top/", TopCategoriesView.as_view(), name="top-categories"),
     path("sales/category/<str:category_id>/", CategoryPerformanceDetailView.as_view(), name="category-performance-detail"),
+
+    # ========== ASYNC READ ENDPOINTS (Motor, served under ASGI) ==========
+    path('async/sales-report/summary/', async_read_views.sales_summary, name='async-sales-summary'),
+    path('async/sales-report/transactions/', async_read_views.sales_transactions, name='async-sales-transactions'),
+    path('async/products/', async_read_views.product_list, name='async-product-list'),
+    path('async/customers/', async_read_views.customer_list, name='async-customer-list'),
+    path('async/customers/<str:customer_id>/', async_read_views.customer_detail, name='async-customer-detail'),
+    path('async/notifications/', async_read_views.notification_list, name='async-notification-list'),
+    path('async/notifications/counts/', async_read_views.notification_counts, name='async-notification-counts'),
+    path('async/online-orders/all/', async_read_views.order_list, name='async-order-list'),
+    path('async/online-orders/customer/<str:customer_id>/', async_read_views.customer_orders, name='async-customer-orders'),
+    path('async/online-orders/<str:order_id>/', async_read_views.order_detail, name='async-order-detail'),
 ]
\ No newline at end of file
@@ -0,0 +1,87 @@
+# notifications/broadcaster.py
+import asyncio
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationBroadcaster:
+    """
+    In-process fan-out of notification events to stream/long-poll subscribers.
+
+    Each subscriber gets a bounded queue - a thread-safe queue.Queue from
+    subscribe(), or an asyncio.Queue bound to the caller's event loop from
+    subscribe_async(). A subscriber registered with a recipient_id only
+    receives events for that recipient plus broadcast notifications (no
+    recipient); one registered without a recipient_id receives everything.
+    Every counter write publishes a 'counters' event, so streams re-read the
+    counters only when told to.
+
+    Events only reach subscribers in the same worker process. A write made in
+    another worker shows up when the stream reconnects (STREAM_MAX_SECONDS),
+    which re-reads the counters and replays from Last-Event-ID.
+    """
+
+    MAX_QUEUE_SIZE = 100
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, recipient_id=None):
+        """Register a blocking subscriber and return its queue"""
+        subscriber = queue.Queue(maxsize=self.MAX_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[subscriber] = (str(recipient_id) if recipient_id else None, None)
+        return subscriber
+
+    def subscribe_async(self, recipient_id=None):
+        """Register a subscriber on the running event loop and return its asyncio queue"""
+        subscriber = asyncio.Queue(maxsize=self.MAX_QUEUE_SIZE)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._subscribers[subscriber] = (str(recipient_id) if recipient_id else None, loop)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.pop(subscriber, None)
+
+    def publish(self, event, data, recipient_id=None):
+        """Deliver an event to every interested subscriber without blocking the writer"""
+        recipient_id = str(recipient_id) if recipient_id else None
+        with self._lock:
+            targets = [
+                (subscriber, loop) for subscriber, (subscribed_to, loop) in self._subscribers.items()
+                if subscribed_to is None or recipient_id is None or subscribed_to == recipient_id
+            ]
+
+        for subscriber, loop in targets:
+            if loop is None:
+                self._deliver(subscriber, event, data)
+                continue
+            try:
+                # asyncio queues are not thread-safe - hand the put to the subscriber's loop
+                loop.call_soon_threadsafe(self._deliver, subscriber, event, data)
+            except RuntimeError:
+                # Loop already closed - the stream is gone and unsubscribes on its way out
+                pass
+
+    @staticmethod
+    def _deliver(subscriber, event, data):
+        try:
+            subscriber.put_nowait((event, data))
+        except (queue.Full, asyncio.QueueFull):
+            # Slow consumer - drop the event, it catches up from the database on reconnect
+            logger.warning(f"Notification subscriber queue full, dropping {event} event")
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+# Singleton instance
+notification_broadcaster = NotificationBroadcaster()
@@ -1,13 +1,42 @@
 # notifications/services.py
+import logging
 from datetime import datetime, timedelta
 from django.contrib.auth.models import User
 from django.http import JsonResponse
+from pymongo import UpdateOne, ReturnDocument
 from app.database import db_manager
+from .broadcaster import notification_broadcaster
+
+logger = logging.getLogger(__name__)
+
+# Counter scope holding system-wide totals; per-recipient scopes are keyed by recipient_id
+ALL_SCOPE = '__all__'
+COUNTER_BUCKETS = ('active_unread', 'active_read', 'archived_unread', 'archived_read')
+STATE_PROJECTION = {'recipient_id': 1, 'is_read': 1, 'archived': 1}
 
 class NotificationService:
     def __init__(self):
         self.db = db_manager.get_database()
         self.collection = self.db.notifications
+        self.counters = self.db.notification_counters
+        self._ensure_indexes()
+        self._ensure_counters()
+    
+    def _ensure_indexes(self):
+        """Indexes for stream catch-up and per-recipient listing"""
+        try:
+            self.collection.create_index([('created_at', -1)], background=True)
+            self.collection.create_index([('recipient_id', 1), ('created_at', -1)], background=True)
+        except Exception as e:
+            logger.warning(f"Notification index creation warning: {e}")
+    
+    def _ensure_counters(self):
+        """Seed the counters from the notifications collection on first run"""
+        try:
+            if self.counters.find_one({'_id': ALL_SCOPE}) is None:
+                self.rebuild_counters()
+        except Exception as e:
+            logger.warning(f"Notification counter seeding warning: {e}")
     
     # ================================================================
     # ID GENERATION METHOD
@@ -77,6 +106,15 @@ class NotificationService:
                 })
             
             self.collection.insert_one(notification_doc)
+            self._apply_counter_deltas(self._deltas_for([(None, notification_doc)]))
+            
+            recipient_id = notification_doc.get('recipient_id')
+            notification_broadcaster.publish(
+                'notification',
+                self._format_notification(dict(notification_doc)),
+                recipient_id=recipient_id
+            )
+            self._publish_counters(recipient_id)
             
             return notification_doc
             
@@ -106,8 +144,9 @@ class NotificationService:
     # NOTIFICATION RETRIEVAL METHODS
     # ================================================================
     
-    def get_notifications(self, recipient_id=None, notification_type=None, is_read=None, limit=50, include_archived=False):
-        """Get notifications with filters"""
+    @staticmethod
+    def _notifications_query(recipient_id=None, notification_type=None, is_read=None, include_archived=False):
+        """Notification-list filter (shared with the async read path)"""
         query = {}
         
         # Exclude archived notifications by default
@@ -121,6 +160,12 @@ class NotificationService:
         if is_read is not None:
             query['is_read'] = is_read
         
+        return query
+    
+    def get_notifications(self, recipient_id=None, notification_type=None, is_read=None, limit=50, include_archived=False):
+        """Get notifications with filters"""
+        query = self._notifications_query(recipient_id, notification_type, is_read, include_archived)
+        
         notifications = list(self.collection.find(query)
                         .sort('created_at', -1)
                         .limit(limit))
@@ -169,8 +214,9 @@ class NotificationService:
             if not include_archived:
                 query['archived'] = {'$ne': True}
             
-            # Get total count for pagination
-            total_count = self.collection.count_documents(query)
+            # Get total count for pagination from the maintained counters
+            badge = self.get_badge_counts()
+            total_count = badge['total'] if include_archived else badge['unread'] + badge['read']
             
             # Get notifications with pagination
             notifications = list(self.collection.find(query)
@@ -259,16 +305,66 @@ class NotificationService:
     
     def get_unread_count(self, recipient_id=None, include_archived=False):
         """Get count of unread notifications for a user or all notifications"""
-        query = {'is_read': False}
+        counters = self.get_counters(recipient_id)
         
         # Exclude archived notifications by default
-        if not include_archived:
-            query['archived'] = {'$ne': True}
+        if include_archived:
+            return counters['active_unread'] + counters['archived_unread']
+        return counters['active_unread']
+    
+    def get_counters(self, recipient_id=None):
+        """
+        Maintained notification counters for a recipient (or system-wide)
+        
+        Returns:
+            dict: active_unread, active_read, archived_unread, archived_read
+        """
+        doc = self.counters.find_one({'_id': self._counter_scope(recipient_id)}) or {}
+        return self._counters_from_doc(doc)
+    
+    @staticmethod
+    def _counter_scope(recipient_id=None):
+        return str(recipient_id) if recipient_id else ALL_SCOPE
+    
+    @staticmethod
+    def _counters_from_doc(doc):
+        return {bucket: max(int(doc.get(bucket, 0)), 0) for bucket in COUNTER_BUCKETS}
+    
+    def get_badge_counts(self, recipient_id=None):
+        """Unread/archived/total figures for notification badges"""
+        counters = self.get_counters(recipient_id)
+        return {
+            'unread': counters['active_unread'],
+            'read': counters['active_read'],
+            'archived': counters['archived_unread'] + counters['archived_read'],
+            'total': sum(counters.values())
+        }
+    
+    def get_notifications_since(self, since_id=None, recipient_id=None, limit=50):
+        """
+        Notifications created after `since_id` (oldest first), for stream and long-poll catch-up.
+        Recipient-scoped reads include broadcast notifications that have no recipient.
+        """
+        query = {}
+        if since_id:
+            anchor = self.collection.find_one({'_id': since_id}, {'created_at': 1})
+            if not anchor:
+                return []
+            query['created_at'] = {'$gt': anchor['created_at']}
         
         if recipient_id:
-            query['recipient_id'] = str(recipient_id)
+            query['$or'] = [
+                {'recipient_id': str(recipient_id)},
+                {'recipient_id': {'$exists': False}}
+            ]
         
-        return self.collection.count_documents(query)
+        if since_id:
+            notifications = list(self.collection.find(query).sort('created_at', 1).limit(limit))
+        else:
+            notifications = list(self.collection.find(query).sort('created_at', -1).limit(limit))
+            notifications.reverse()
+        
+        return self._format_notifications(notifications)
     
     # ================================================================
     # NOTIFICATION STATUS UPDATE METHODS
@@ -277,8 +373,8 @@ class NotificationService:
     def mark_as_read(self, notification_id):
         """Mark notification as read"""
         try:
-            result = self.collection.update_one(
-                {'_id': notification_id},  # String ID now
+            return self._transition_one(
+                notification_id,
                 {
                     '$set': {
                         'is_read': True,
@@ -286,7 +382,6 @@ class NotificationService:
                     }
                 }
             )
-            return result.modified_count > 0
         except Exception:
             return False
 
@@ -315,8 +410,8 @@ class NotificationService:
     def mark_as_unread(self, notification_id):
         """Mark notification as unread"""
         try:
-            result = self.collection.update_one(
-                {'_id': notification_id},  # String ID now
+            return self._transition_one(
+                notification_id,
                 {
                     '$set': {
                         'is_read': False,
@@ -324,7 +419,6 @@ class NotificationService:
                     }
                 }
             )
-            return result.modified_count > 0
         except Exception:
             return False
     
@@ -345,7 +439,7 @@ class NotificationService:
             if recipient_id:
                 query['recipient_id'] = str(recipient_id)
             
-            result = self.collection.update_many(
+            return self._transition_many(
                 query,
                 {
                     '$set': {
@@ -355,8 +449,6 @@ class NotificationService:
                 }
             )
             
-            return result.modified_count
-            
         except Exception as e:
             raise Exception(f"Error marking notifications as read: {str(e)}")
 
@@ -395,7 +487,7 @@ class NotificationService:
             if recipient_id:
                 query['recipient_id'] = str(recipient_id)
             
-            result = self.collection.update_many(
+            return self._transition_many(
                 query,
                 {
                     '$set': {
@@ -405,8 +497,6 @@ class NotificationService:
                 }
             )
             
-            return result.modified_count
-            
         except Exception as e:
             raise Exception(f"Error marking notifications as unread: {str(e)}")
     
@@ -425,8 +515,8 @@ class NotificationService:
             bool: True if notification was archived successfully
         """
         try:
-            result = self.collection.update_one(
-                {'_id': notification_id},  # String ID now
+            return self._transition_one(
+                notification_id,
                 {
                     '$set': {
                         'archived': True,
@@ -435,7 +525,6 @@ class NotificationService:
                     }
                 }
             )
-            return result.modified_count > 0
         except Exception as e:
             raise Exception(f"Error archiving notification: {str(e)}")
 
@@ -472,8 +561,8 @@ class NotificationService:
             bool: True if notification was unarchived successfully
         """
         try:
-            result = self.collection.update_one(
-                {'_id': notification_id},  # String ID now
+            return self._transition_one(
+                notification_id,
                 {
                     '$set': {
                         'archived': False,
@@ -484,7 +573,6 @@ class NotificationService:
                     }
                 }
             )
-            return result.modified_count > 0
         except Exception as e:
             raise Exception(f"Error unarchiving notification: {str(e)}")
 
@@ -526,7 +614,7 @@ class NotificationService:
             if recipient_id:
                 query['recipient_id'] = str(recipient_id)
             
-            result = self.collection.update_many(
+            return self._transition_many(
                 query,
                 {
                     '$set': {
@@ -537,8 +625,6 @@ class NotificationService:
                 }
             )
             
-            return result.modified_count
-            
         except Exception as e:
             raise Exception(f"Error archiving read notifications: {str(e)}")
     
@@ -560,8 +646,8 @@ class NotificationService:
             if recipient_id:
                 query['recipient_id'] = str(recipient_id)
             
-            # Get total count for pagination
-            total_count = self.collection.count_documents(query)
+            # Get total count for pagination from the maintained counters
+            total_count = self.get_badge_counts(recipient_id)['archived']
             
             # Get notifications with pagination
             notifications = list(self.collection.find(query)
@@ -583,8 +669,16 @@ class NotificationService:
     def delete_notification(self, notification_id):
         """Delete a notification"""
         try:
-            result = self.collection.delete_one({'_id': notification_id})  # String ID now
-            return result.deleted_count > 0
+            deleted = self.collection.find_one_and_delete(
+                {'_id': notification_id},  # String ID now
+                projection=STATE_PROJECTION
+            )
+            if not deleted:
+                return False
+            
+            self._apply_counter_deltas(self._deltas_for([(deleted, None)]))
+            self._publish_counters(deleted.get('recipient_id'))
+            return True
         except Exception:
             return False
 
@@ -629,8 +723,7 @@ class NotificationService:
             if notification_type:
                 query['notification_type'] = notification_type
             
-            result = self.collection.delete_many(query)
-            return result.deleted_count
+            return self._delete_many(query)
             
         except Exception as e:
             raise Exception(f"Error deleting notifications: {str(e)}")
@@ -651,8 +744,7 @@ class NotificationService:
             if recipient_id:
                 query['recipient_id'] = str(recipient_id)
             
-            result = self.collection.delete_many(query)
-            return result.deleted_count
+            return self._delete_many(query)
             
         except Exception as e:
             raise Exception(f"Error deleting read notifications: {str(e)}")
@@ -673,8 +765,7 @@ class NotificationService:
             if recipient_id:
                 query['recipient_id'] = str(recipient_id)
             
-            result = self.collection.delete_many(query)
-            return result.deleted_count
+            return self._delete_many(query)
             
         except Exception as e:
             raise Exception(f"Error deleting archived notifications: {str(e)}")
@@ -683,19 +774,200 @@ class NotificationService:
     # UTILITY METHODS
     # ================================================================
     
-    def _format_notification(self, notification):
+    @staticmethod
+    def _format_notification(notification):
         """Format a single notification for JSON serialization"""
         if notification:
             # _id is already a string, no conversion needed
             notification['id'] = notification['_id']  # Add id field for consistency
         return notification
     
-    def _format_notifications(self, notifications):
+    @classmethod
+    def _format_notifications(cls, notifications):
         """Format multiple notifications for JSON serialization"""
         for notification in notifications:
-            self._format_notification(notification)
+            cls._format_notification(notification)
         return notifications
 
+    # ================================================================
+    # COUNTER MAINTENANCE METHODS
+    # ================================================================
+    
+    def _bucket(self, notification):
+        """Counter bucket a notification currently falls into"""
+        prefix = 'archived' if notification.get('archived') else 'active'
+        suffix = 'read' if notification.get('is_read') else 'unread'
+        return f"{prefix}_{suffix}"
+    
+    def _deltas_for(self, transitions):
+        """
+        Counter deltas for (before, after) state pairs.
+        `before` is None for an insert and `after` is None for a delete.
+        """
+        deltas = {}
+        for before, after in transitions:
+            source = before if before is not None else after
+            recipient_id = source.get('recipient_id')
+            scopes = [ALL_SCOPE, str(recipient_id)] if recipient_id else [ALL_SCOPE]
+            
+            for scope in scopes:
+                scope_deltas = deltas.setdefault(scope, {})
+                if before is not None:
+                    bucket = self._bucket(before)
+                    scope_deltas[bucket] = scope_deltas.get(bucket, 0) - 1
+                if after is not None:
+                    bucket = self._bucket(after)
+                    scope_deltas[bucket] = scope_deltas.get(bucket, 0) + 1
+        return deltas
+    
+    def _apply_counter_deltas(self, deltas):
+        """Apply {scope: {bucket: delta}} with one atomic $inc per scope"""
+        operations = []
+        now = datetime.utcnow()
+        for scope, scope_deltas in deltas.items():
+            increments = {bucket: delta for bucket, delta in scope_deltas.items() if delta}
+            if increments:
+                operations.append(UpdateOne(
+                    {'_id': scope},
+                    {'$inc': increments, '$set': {'updated_at': now}},
+                    upsert=True
+                ))
+        if operations:
+            self.counters.bulk_write(operations, ordered=False)
+    
+    def _transition_one(self, notification_id, update):
+        """Update one notification and move it between counter buckets"""
+        before = self.collection.find_one_and_update(
+            {'_id': notification_id},
+            update,
+            projection=STATE_PROJECTION,
+            return_document=ReturnDocument.BEFORE
+        )
+        if not before:
+            return False
+        
+        after = {**before, **{key: value for key, value in update.get('$set', {}).items() if key in STATE_PROJECTION}}
+        self._apply_counter_deltas(self._deltas_for([(before, after)]))
+        self._publish_counters(before.get('recipient_id'))
+        return True
+    
+    def _transition_many(self, query, update):
+        """
+        Bulk update notifications matching `query` and adjust counters by the
+        moved documents. If a concurrent writer changed any of them between the
+        read and the update, the affected scopes are recounted instead.
+        """
+        matched = list(self.collection.find(query, STATE_PROJECTION))
+        if not matched:
+            return 0
+        
+        result = self.collection.update_many(
+            {**query, '_id': {'$in': [doc['_id'] for doc in matched]}},
+            update
+        )
+        
+        state_changes = {key: value for key, value in update.get('$set', {}).items() if key in STATE_PROJECTION}
+        self._reconcile_counters(
+            matched,
+            result.modified_count,
+            [(doc, {**doc, **state_changes}) for doc in matched]
+        )
+        return result.modified_count
+    
+    def _delete_many(self, query):
+        """Bulk delete notifications matching `query` and decrement their counters"""
+        matched = list(self.collection.find(query, STATE_PROJECTION))
+        if not matched:
+            return 0
+        
+        result = self.collection.delete_many({**query, '_id': {'$in': [doc['_id'] for doc in matched]}})
+        self._reconcile_counters(matched, result.deleted_count, [(doc, None) for doc in matched])
+        return result.deleted_count
+    
+    def _reconcile_counters(self, matched, affected_count, transitions):
+        recipient_ids = {doc.get('recipient_id') for doc in matched}
+        if affected_count == len(matched):
+            self._apply_counter_deltas(self._deltas_for(transitions))
+        else:
+            self._recount_scopes([ALL_SCOPE] + [str(r) for r in recipient_ids if r])
+        
+        for recipient_id in recipient_ids:
+            self._publish_counters(recipient_id)
+    
+    def _recount_scopes(self, scopes):
+        """Recompute counters for specific scopes from the notifications collection"""
+        for scope in scopes:
+            match = {} if scope == ALL_SCOPE else {'recipient_id': scope}
+            counts = self._count_buckets(match)
+            self.counters.replace_one(
+                {'_id': scope},
+                {'_id': scope, **counts.get(scope, dict.fromkeys(COUNTER_BUCKETS, 0)), 'updated_at': datetime.utcnow()},
+                upsert=True
+            )
+    
+    def _count_buckets(self, match=None):
+        """Bucket counts per scope ({scope: {bucket: count}}) for notifications matching `match`"""
+        pipeline = [
+            {'$match': match or {}},
+            {'$group': {
+                '_id': {
+                    'recipient_id': '$recipient_id',
+                    'archived': {'$eq': ['$archived', True]},
+                    'is_read': {'$eq': ['$is_read', True]}
+                },
+                'count': {'$sum': 1}
+            }}
+        ]
+        
+        counts = {}
+        for row in self.collection.aggregate(pipeline):
+            bucket = self._bucket(row['_id'])
+            recipient_id = row['_id'].get('recipient_id')
+            scopes = [ALL_SCOPE, str(recipient_id)] if recipient_id else [ALL_SCOPE]
+            for scope in scopes:
+                scope_counts = counts.setdefault(scope, dict.fromkeys(COUNTER_BUCKETS, 0))
+                scope_counts[bucket] += row['count']
+        return counts
+    
+    def rebuild_counters(self):
+        """
+        Recompute every counter from the notifications collection
+        
+        Returns:
+            int: Number of counter scopes written
+        """
+        try:
+            counts = self._count_buckets()
+            counts.setdefault(ALL_SCOPE, dict.fromkeys(COUNTER_BUCKETS, 0))
+            now = datetime.utcnow()
+            
+            for scope, scope_counts in counts.items():
+                self.counters.replace_one(
+                    {'_id': scope},
+                    {'_id': scope, **scope_counts, 'updated_at': now},
+                    upsert=True
+                )
+            self.counters.delete_many({'_id': {'$nin': list(counts)}})
+            
+            logger.info(f"Rebuilt notification counters for {len(counts)} scopes")
+            return len(counts)
+            
+        except Exception as e:
+            logger.error(f"Error rebuilding notification counters: {str(e)}")
+            raise Exception(f"Error rebuilding notification counters: {str(e)}")
+    
+    def record_purged(self, notifications):
+        """Decrement counters for notifications removed outside this service (retention archival)"""
+        if not notifications:
+            return
+        self._apply_counter_deltas(self._deltas_for([(notification, None) for notification in notifications]))
+        for recipient_id in {notification.get('recipient_id') for notification in notifications}:
+            self._publish_counters(recipient_id)
+
+    def _publish_counters(self, recipient_id=None):
+        """Tell stream subscribers their counters changed; they re-read their own scope"""
+        notification_broadcaster.publish('counters', None, recipient_id=recipient_id)
+    
     def _get_recipient(self, recipient_id=None, recipient_username=None):
         """Helper method to get recipient User object"""
         if recipient_id:
@@ -725,14 +997,15 @@ class NotificationService:
             if not include_archived:
                 base_query['archived'] = {'$ne': True}
             
-            total = self.collection.count_documents(base_query)
-            unread = self.collection.count_documents({**base_query, 'is_read': False})
-            read = self.collection.count_documents({**base_query, 'is_read': True})
-            
-            # Get archived count separately
-            archived_query = dict(base_query)
-            archived_query['archived'] = True
-            archived = self.collection.count_documents(archived_query)
+            # Totals come from the maintained counters instead of collection scans
+            counters = self.get_counters(recipient_id)
+            archived = counters['archived_unread'] + counters['archived_read']
+            unread = counters['active_unread']
+            read = counters['active_read']
+            if include_archived:
+                unread += counters['archived_unread']
+                read += counters['archived_read']
+            total = unread + read
             
             # Get counts by type
             type_pipeline = [
@@ -6,7 +6,7 @@ import logging
 from datetime import datetime, timedelta
 from app.database import db_manager
 from notifications.email_service import email_service
-from app.services.pos.SalesService import SalesService
+from app.services.shift_totals_service import shift_totals_service
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +16,7 @@ class ShiftSummaryService:
     def __init__(self):
         self.db = db_manager.get_database()
         self.user_collection = self.db.users
-        self.sales_service = SalesService()
+        self.shift_totals = shift_totals_service
     
     def get_admin_emails(self):
         """
@@ -47,7 +47,7 @@ class ShiftSummaryService:
             logger.error(f"Error getting admin emails: {e}")
             return []
     
-    def get_shift_sales_data(self, user_id, shift_start, shift_end):
+    def get_shift_sales_data(self, user_id, shift_start, shift_end, session_id=None):
         """
         Get sales data for a shift period
         
@@ -55,30 +55,27 @@ class ShiftSummaryService:
             user_id (str): User ID of the cashier
             shift_start (datetime): Shift start time
             shift_end (datetime): Shift end time
+            session_id (str, optional): Session whose running totals to read
         
         Returns:
             dict: Sales summary data
         """
         try:
-            # Get sales from both collections for the shift period
-            sales = self.sales_service.get_sales_by_date_range(shift_start, shift_end)
+            # Running totals are maintained per session on every sale - a single document read
+            totals = self.shift_totals.get_totals(session_id) if session_id else None
             
-            # Filter by cashier if user_id is provided
-            if user_id:
-                sales = [sale for sale in sales if sale.get('cashier_id') == user_id]
-            
-            # Calculate totals
-            total_sales = sum(float(sale.get('final_amount', sale.get('total_amount', 0))) for sale in sales)
-            total_transactions = len(sales)
-            
-            # Calculate discounts if available
-            total_discounts = sum(float(sale.get('total_discount', 0)) for sale in sales)
+            # Sessions opened before totals were tracked fall back to an indexed aggregation
+            if totals is None:
+                totals = self.shift_totals.aggregate_window(user_id, shift_start, shift_end)
             
             return {
-                'total_sales': total_sales,
-                'total_transactions': total_transactions,
-                'total_discounts': total_discounts,
-                'transactions': sales
+                'total_sales': totals['gross_sales'],
+                'total_transactions': totals['sales_count'],
+                'total_discounts': totals['total_discounts'],
+                'net_sales': totals['net_sales'],
+                'void_count': totals['void_count'],
+                'void_amount': totals['void_amount'],
+                'payment_methods': totals['payment_methods']
             }
         
         except Exception as e:
@@ -87,7 +84,10 @@ class ShiftSummaryService:
                 'total_sales': 0,
                 'total_transactions': 0,
                 'total_discounts': 0,
-                'transactions': []
+                'net_sales': 0,
+                'void_count': 0,
+                'void_amount': 0,
+                'payment_methods': {}
             }
     
     def format_duration(self, seconds):
@@ -150,6 +150,10 @@ class ShiftSummaryService:
                 'total_sales': sales_data.get('total_sales', 0),
                 'total_transactions': sales_data.get('total_transactions', 0),
                 'total_discounts': sales_data.get('total_discounts', 0),
+                'net_sales': sales_data.get('net_sales', 0),
+                'void_count': sales_data.get('void_count', 0),
+                'void_amount': sales_data.get('void_amount', 0),
+                'payment_methods': sales_data.get('payment_methods', {}),
                 'branch_id': session_data.get('branch_id', 'N/A')
             }
         
@@ -198,7 +202,7 @@ class ShiftSummaryService:
             if isinstance(shift_end, str):
                 shift_end = datetime.fromisoformat(shift_end.replace('Z', '+00:00'))
             
-            sales_data = self.get_shift_sales_data(user_id, shift_start, shift_end)
+            sales_data = self.get_shift_sales_data(user_id, shift_start, shift_end, session_data.get('_id'))
             
             # Generate shift summary
             shift_summary = self.generate_shift_summary(session_data, sales_data)
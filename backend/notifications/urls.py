@@ -18,6 +18,9 @@ urlpatterns = [
     path('all/', views.all_notifications, name='all'),
     path('archived/', views.get_archived_notifications, name='archived'),
     path('stats/', views.notification_stats, name='stats'),
+    path('counters/', views.notification_counters, name='counters'),
+    path('stream/', views.notification_stream, name='stream'),
+    path('poll/', views.poll_notifications, name='poll'),
     
     # ================================================================
     # EMAIL VERIFICATION ENDPOINTS
@@ -1,11 +1,20 @@
 # notifications/views.py
+import asyncio
+import json
+import queue
+import time
+from asgiref.sync import sync_to_async
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET
 from app.decorators.authenticationDecorator import get_authenticated_user_from_jwt
 from .services import notification_service
+from .broadcaster import notification_broadcaster
 from .email_verification_service import email_verification_service
 
 # ================================================================
@@ -669,6 +678,156 @@ def notification_stats(request):
             'message': f'Error retrieving notification statistics: {str(e)}'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['GET'])
+def notification_counters(request):
+    """Badge counts (unread/read/archived/total) from the maintained counters"""
+    try:
+        recipient_id = request.query_params.get('recipient_id')
+        
+        return Response({
+            'success': True,
+            'data': notification_service.get_badge_counts(recipient_id)
+        })
+        
+    except Exception as e:
+        return Response({
+            'success': False,
+            'message': f'Error retrieving notification counters: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+# ================================================================
+# PUSH DELIVERY (SSE STREAM AND LONG-POLL)
+# ================================================================
+
+STREAM_HEARTBEAT_SECONDS = 15
+STREAM_MAX_SECONDS = 300  # Recycle the connection so cross-worker writes are picked up on reconnect
+STREAM_RETRY_MS = 3000
+LONG_POLL_DEFAULT_SECONDS = 25
+LONG_POLL_MAX_SECONDS = 55
+
+def _sse_event(event, data, event_id=None):
+    """Format a single server-sent event"""
+    lines = []
+    if event_id:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, cls=DjangoJSONEncoder)}')
+    return '\n'.join(lines) + '\n\n'
+
+async def _notification_event_stream(recipient_id, since_id):
+    # Subscribe before the catch-up read so nothing created in between is missed
+    subscriber = notification_broadcaster.subscribe_async(recipient_id)
+    get_badge_counts = sync_to_async(notification_service.get_badge_counts, thread_sensitive=False)
+    try:
+        yield f'retry: {STREAM_RETRY_MS}\n\n'
+        
+        counters = await get_badge_counts(recipient_id)
+        yield _sse_event('counters', counters)
+        
+        delivered = set()
+        if since_id:
+            missed = await sync_to_async(notification_service.get_notifications_since, thread_sensitive=False)(since_id, recipient_id)
+            for notification in missed:
+                delivered.add(notification['id'])
+                yield _sse_event('notification', notification, event_id=notification['id'])
+        
+        deadline = time.monotonic() + STREAM_MAX_SECONDS
+        while time.monotonic() < deadline:
+            try:
+                event, data = await asyncio.wait_for(subscriber.get(), timeout=STREAM_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # Idle heartbeats touch nothing but the socket
+                yield ': heartbeat\n\n'
+                continue
+            
+            if event == 'notification' and data['id'] not in delivered:
+                delivered.add(data['id'])
+                yield _sse_event('notification', data, event_id=data['id'])
+            elif event == 'counters':
+                latest = await get_badge_counts(recipient_id)
+                if latest != counters:
+                    counters = latest
+                    yield _sse_event('counters', counters)
+    finally:
+        notification_broadcaster.unsubscribe(subscriber)
+
+@require_GET
+async def notification_stream(request):
+    """
+    Server-sent events stream of new notifications and counter changes.
+    
+    Query params: recipient_id (optional, also receives broadcast notifications),
+    since (optional notification ID to replay from; Last-Event-ID takes precedence).
+    Kept as a plain Django view because DRF content negotiation rejects text/event-stream.
+    
+    Async so an open tab costs a suspended coroutine on the ASGI event loop, not
+    a worker thread; Mongo is only read on connect and on 'counters' events.
+    Under WSGI Django drains the async iterator synchronously, pinning one
+    worker thread per open tab for up to STREAM_MAX_SECONDS - serve /stream/
+    from the ASGI app (posbackend.asgi) in production.
+    """
+    recipient_id = request.GET.get('recipient_id')
+    since_id = request.headers.get('Last-Event-ID') or request.GET.get('since')
+    
+    response = StreamingHttpResponse(
+        _notification_event_stream(recipient_id, since_id),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+    return response
+
+@api_view(['GET'])
+def poll_notifications(request):
+    """
+    Long-poll fallback for clients without EventSource support.
+    Returns immediately when notifications newer than `since` exist, otherwise
+    waits up to `timeout` seconds for the next one.
+    """
+    try:
+        recipient_id = request.query_params.get('recipient_id')
+        since_id = request.query_params.get('since')
+        timeout = min(max(int(request.query_params.get('timeout', LONG_POLL_DEFAULT_SECONDS)), 0), LONG_POLL_MAX_SECONDS)
+        
+        subscriber = notification_broadcaster.subscribe(recipient_id)
+        try:
+            notifications = []
+            if since_id:
+                notifications = notification_service.get_notifications_since(since_id, recipient_id)
+            
+            deadline = time.monotonic() + timeout
+            while not notifications:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event, data = subscriber.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if event == 'notification':
+                    notifications.append(data)
+        finally:
+            notification_broadcaster.unsubscribe(subscriber)
+        
+        return Response({
+            'success': True,
+            'count': len(notifications),
+            'data': notifications,
+            'counters': notification_service.get_badge_counts(recipient_id),
+            'last_id': notifications[-1]['id'] if notifications else since_id
+        })
+        
+    except ValueError:
+        return Response({
+            'success': False,
+            'message': 'timeout must be an integer number of seconds'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({
+            'success': False,
+            'message': f'Error polling notifications: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 # ================================================================
 # EMAIL VERIFICATION ENDPOINTS
 # ================================================================
@@ -23,6 +23,7 @@ from app.kpi_views.customer_product_views import (
     CustomerProductSearchView,
     CustomerProductByCategoryView,
     CustomerFeaturedProductsView,
+    CustomerProductFacetsView,
 )
 
 urlpatterns = [
@@ -33,6 +34,7 @@ urlpatterns = [
     path('api/v1/customer/products/', CustomerProductListView.as_view(), name='customer-products'),
     path('api/v1/customer/products/search/', CustomerProductSearchView.as_view(), name='customer-products-search'),
     path('api/v1/customer/products/featured/', CustomerFeaturedProductsView.as_view(), name='customer-products-featured'),
+    path('api/v1/customer/products/facets/', CustomerProductFacetsView.as_view(), name='customer-products-facets'),
     path('api/v1/customer/products/category/<str:category_id>/', CustomerProductByCategoryView.as_view(), name='customer-products-by-category'),
     path('api/v1/customer/products/<str:product_id>/', CustomerProductDetailView.as_view(), name='customer-product-detail'),
     path('', lambda request: HttpResponse("POS System API is running!")),